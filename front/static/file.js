@@ -1,5 +1,6 @@
 import { renderFileList, renderCurrentPath } from './ui.js';
 import { showErrorModal } from './modal.js';
+import { modeQuery } from './utils.js';
 // 文件操作相关逻辑
 export let currentPath = null;
 export let dirListCache = [];
@@ -41,11 +42,7 @@ export function fetchFileList(path = null, save = true) {
     }
     
     let url = '/api/list?path=' + encodeURIComponent(path);
-    if (isRemote) {
-        url += '&mode=remote';
-    } else {
-        url += '&mode=local';
-    }
+    url += '&' + modeQuery(isRemote);
     
     fetch(url)
         .then(res => {
@@ -99,8 +96,7 @@ function fetchDefaultDir() {
     const isRemote = fileMode === 'remote';
     
     let url = '/api/default_dir';
-    if (isRemote) url += '?mode=remote';
-    else url += '?mode=local';
+    url += '?' + modeQuery(isRemote);
     
     return fetch(url)
         .then(res => res.json())
@@ -131,11 +127,7 @@ export function calculateFolderSize() {
     }
     
     let url = `/api/calculate_size?path=${encodeURIComponent(path)}`;
-    if (isRemote) {
-        url += '&mode=remote';
-    } else {
-        url += '&mode=local';
-    }
+    url += '&' + modeQuery(isRemote);
     
     fetch(url)
         .then(res => {
@@ -196,11 +188,7 @@ export function fetchFileListWithSizes(path = null) {
     }
     
     let url = `/api/list_with_sizes?path=${encodeURIComponent(path)}`;
-    if (isRemote) {
-        url += '&mode=remote';
-    } else {
-        url += '&mode=local';
-    }
+    url += '&' + modeQuery(isRemote);
     
     fetch(url)
         .then(res => {
@@ -256,6 +244,235 @@ export function fetchFileListWithSizes(path = null) {
         });
 }
 
+// 分块上传参数：大文件切成固定大小的分块，多个分块并发上传以占满带宽
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const CHUNK_CONCURRENCY = 4;
+const CHUNK_RETRIES = 3;
+// 同时上传的文件数
+const FILE_CONCURRENCY = 2;
+
+// 用于断点续传的会话键：同一服务器、同一目录下同名、同大小、同修改时间视为同一个文件
+function uploadResumeKey(path, name, file, mode) {
+    return `chunkedUpload:${mode}:${path}:${name}:${file.size}:${file.lastModified}`;
+}
+
+function parseJsonResponse(res) {
+    return res.json().catch(() => ({})).then(data => {
+        if (!res.ok || data.error) {
+            const err = new Error(processErrorMessage(data.error) || `服务器返回错误(${res.status})`);
+            err.status = res.status;
+            throw err;
+        }
+        return data;
+    });
+}
+
+// 小文件仍然一次性表单上传
+function uploadWholeFile(file, name, path, mode) {
+    const formData = new FormData();
+    formData.append('file', file, name);
+    const url = `/api/upload?path=${encodeURIComponent(path)}&${mode}`;
+    return fetch(url, { method: 'POST', body: formData }).then(res => {
+        if (res.status === 409) {
+            return res.json().then(() => { alert('文件已存在: ' + name); });
+        }
+        return res.json();
+    });
+}
+
+// 获取可续传的会话；服务器已不认识该会话时重新创建
+function openUploadSession(file, name, path, mode) {
+    const key = uploadResumeKey(path, name, file, mode);
+    const savedId = localStorage.getItem(key);
+    const create = () => fetch(`/api/upload/chunked/init?path=${encodeURIComponent(path)}&${mode}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: name, size: file.size, chunk_size: CHUNK_SIZE })
+    }).then(parseJsonResponse).then(session => {
+        localStorage.setItem(key, session.upload_id);
+        return session;
+    });
+    if (!savedId) return create();
+    return fetch(`/api/upload/chunked/${savedId}`)
+        .then(parseJsonResponse)
+        .catch(() => {
+            localStorage.removeItem(key);
+            return create();
+        });
+}
+
+function uploadChunk(session, index, file, attempt = 0) {
+    const start = index * session.chunk_size;
+    const blob = file.slice(start, Math.min(start + session.chunk_size, file.size));
+    return fetch(`/api/upload/chunked/${session.upload_id}/${index}`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream' },
+        body: blob
+    }).then(parseJsonResponse).catch(err => {
+        if (attempt + 1 >= CHUNK_RETRIES || err.status === 404) throw err;
+        // 网络抖动时退避重试，已上传的分块不受影响
+        return new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)))
+            .then(() => uploadChunk(session, index, file, attempt + 1));
+    });
+}
+
+function uploadFileChunked(file, name, path, mode) {
+    const key = uploadResumeKey(path, name, file, mode);
+    return openUploadSession(file, name, path, mode).then(session => {
+        const received = new Set(session.received);
+        const pending = [];
+        for (let i = 0; i < session.total_chunks; i++) {
+            if (!received.has(i)) pending.push(i);
+        }
+        const worker = () => {
+            const index = pending.shift();
+            if (index === undefined) return Promise.resolve();
+            return uploadChunk(session, index, file).then(worker);
+        };
+        const workers = [];
+        for (let i = 0; i < Math.min(CHUNK_CONCURRENCY, pending.length); i++) {
+            workers.push(worker());
+        }
+        return Promise.all(workers)
+            .then(() => fetch(`/api/upload/chunked/${session.upload_id}/commit`, { method: 'POST' }))
+            .then(parseJsonResponse)
+            .then(result => {
+                localStorage.removeItem(key);
+                return result;
+            });
+    });
+}
+
+function uploadOne(file, name, path, mode) {
+    if (file.size > CHUNK_SIZE) {
+        return uploadFileChunked(file, name, path, mode);
+    }
+    return uploadWholeFile(file, name, path, mode);
+}
+
+// 按 FILE_CONCURRENCY 限制并发上传一批文件，返回失败的文件名
+function uploadEntries(entries, path, mode) {
+    const queue = entries.slice();
+    const failed = [];
+    const worker = () => {
+        const entry = queue.shift();
+        if (!entry) return Promise.resolve();
+        return uploadOne(entry.file, entry.name, path, mode)
+            .catch(err => {
+                console.error('上传失败:', entry.name, err);
+                failed.push(entry.name);
+            })
+            .then(worker);
+    };
+    const workers = [];
+    for (let i = 0; i < Math.min(FILE_CONCURRENCY, queue.length); i++) {
+        workers.push(worker());
+    }
+    return Promise.all(workers).then(() => failed);
+}
+
+function finishUpload(path, failed) {
+    fetchFileList(path, true);
+    if (failed.length) {
+        alert('上传失败: ' + failed.join(', ') + '\n重新选择相同文件上传可从中断处继续');
+    }
+}
+
+// 小文件按批合并为一个 multipart 请求上传，后端在同一条会话中依次写入，省去逐文件的请求和连接开销
+const BATCH_FILES = 200;
+const BATCH_BYTES = 32 * 1024 * 1024;
+// 文件夹上传的 tar 快速通道：小文件按批打包成一个请求，由后端经一次 exec 交给远程 tar 解包
+const TAR_BATCH_FILES = 2000;
+const TAR_BATCH_BYTES = 64 * 1024 * 1024;
+
+// 按文件数和总字节数把文件分成若干批
+function splitBatches(entries, maxFiles, maxBytes) {
+    const batches = [];
+    let batch = [];
+    let bytes = 0;
+    for (const entry of entries) {
+        if (batch.length && (batch.length >= maxFiles || bytes + entry.file.size > maxBytes)) {
+            batches.push(batch);
+            batch = [];
+            bytes = 0;
+        }
+        batch.push(entry);
+        bytes += entry.file.size;
+    }
+    if (batch.length) batches.push(batch);
+    return batches;
+}
+
+// 一个请求上传一批文件，返回失败的文件名；请求整体失败时退回逐个上传
+function postBatch(batch, path, mode) {
+    const formData = new FormData();
+    batch.forEach(entry => formData.append('file', entry.file, entry.name));
+    return fetch(`/api/upload/batch?path=${encodeURIComponent(path)}&${mode}`, { method: 'POST', body: formData })
+        .then(parseJsonResponse)
+        .then(result => {
+            const results = result.results || [];
+            const done = new Set(results.filter(item => item.success).map(item => item.name));
+            if (!results.length && !result.success) throw new Error(result.error || '批量上传失败');
+            return batch.filter(entry => !done.has(entry.name)).map(entry => entry.name);
+        })
+        .catch(err => {
+            console.warn('批量上传失败，改为逐个上传:', err);
+            return uploadEntries(batch, path, mode);
+        });
+}
+
+// 小文件分批、大文件分块上传，返回失败的文件名
+function uploadGrouped(entries, path, mode) {
+    const large = entries.filter(entry => entry.file.size > CHUNK_SIZE);
+    const small = entries.filter(entry => entry.file.size <= CHUNK_SIZE);
+    const failed = [];
+    const uploadSmall = splitBatches(small, BATCH_FILES, BATCH_BYTES).reduce((chain, batch) => chain.then(() =>
+        postBatch(batch, path, mode).then(names => failed.push(...names))
+    ), Promise.resolve());
+    return Promise.all([uploadSmall, uploadEntries(large, path, mode).then(names => failed.push(...names))])
+        .then(() => failed);
+}
+
+// 上传一批文件，全部结束后刷新列表
+function uploadBatch(entries, path, isRemote) {
+    return uploadGrouped(entries, path, modeQuery(isRemote)).then(failed => finishUpload(path, failed));
+}
+
+function uploadTarBatch(batch, path, mode) {
+    // 清单必须在文件之前，后端据此在收到数据前写出 tar 头
+    const manifest = batch.map(entry => ({
+        name: entry.name,
+        size: entry.file.size,
+        mtime: Math.floor(entry.file.lastModified / 1000)
+    }));
+    const formData = new FormData();
+    formData.append('manifest', JSON.stringify(manifest));
+    batch.forEach(entry => formData.append('file', entry.file, entry.name));
+    return fetch(`/api/upload/tar?path=${encodeURIComponent(path)}&${mode}`, { method: 'POST', body: formData })
+        .then(parseJsonResponse)
+        .then(result => {
+            if (!result.success) throw new Error(result.error || 'tar 上传失败');
+            return result;
+        });
+}
+
+function uploadFolderTar(entries, path) {
+    const mode = modeQuery(true);
+    // 大文件仍走可续传的分块上传
+    const large = entries.filter(entry => entry.file.size > CHUNK_SIZE);
+    const small = entries.filter(entry => entry.file.size <= CHUNK_SIZE);
+    const failed = [];
+    const uploadSmall = splitBatches(small, TAR_BATCH_FILES, TAR_BATCH_BYTES).reduce((chain, batch) => chain.then(() =>
+        uploadTarBatch(batch, path, mode).catch(err => {
+            // 远程没有 tar 等情况下退回批量上传
+            console.warn('tar 上传失败，改为批量上传:', err);
+            return uploadGrouped(batch, path, mode).then(names => failed.push(...names));
+        })
+    ), Promise.resolve());
+    return Promise.all([uploadSmall, uploadEntries(large, path, mode).then(names => failed.push(...names))])
+        .then(() => finishUpload(path, failed));
+}
+
 // 上传文件
 export function uploadFiles() {
     const input = document.getElementById('file-upload');
@@ -268,31 +485,8 @@ export function uploadFiles() {
     const fileMode = localStorage.getItem('fileMode');
     const isRemote = fileMode === 'remote';
     
-    for (let i = 0; i < files.length; i++) {
-        const formData = new FormData();
-        formData.append('file', files[i]);
-        let url = `/api/upload?path=${encodeURIComponent(path)}`;
-        if (isRemote) {
-            url += '&mode=remote';
-        } else {
-            url += '&mode=local';
-        }
-        
-        fetch(url, {
-            method: 'POST',
-            body: formData
-        }).then(res => {
-            if (res.status === 409) {
-                return res.json().then(data => { alert('文件已存在: ' + files[i].name); });
-            }
-            return res.json();
-        }).then(() => {
-            fetchFileList(path, true);
-        }).catch(err => {
-            console.error('上传失败:', err);
-            alert('上传失败');
-        });
-    }
+    const entries = Array.from(files).map(file => ({ file, name: file.name }));
+    uploadBatch(entries, path, isRemote);
 }
 
 // 上传文件夹
@@ -307,31 +501,44 @@ export function uploadFolders() {
     const fileMode = localStorage.getItem('fileMode');
     const isRemote = fileMode === 'remote';
     
-    for (let i = 0; i < files.length; i++) {
-        const formData = new FormData();
-        formData.append('file', files[i], files[i].webkitRelativePath || files[i].name);
-        let url = `/api/upload?path=${encodeURIComponent(path)}`;
-        if (isRemote) {
-            url += '&mode=remote';
-        } else {
-            url += '&mode=local';
-        }
-        
-        fetch(url, {
-            method: 'POST',
-            body: formData
-        }).then(res => {
-            if (res.status === 409) {
-                return res.json().then(data => { alert('文件已存在: ' + files[i].name); });
-            }
-            return res.json();
-        }).then(() => {
-            fetchFileList(path, true);
-        }).catch(err => {
-            console.error('上传失败:', err);
-            alert('上传失败');
-        });
+    const entries = Array.from(files).map(file => ({ file, name: file.webkitRelativePath || file.name }));
+    if (isRemote) {
+        uploadFolderTar(entries, path);
+    } else {
+        uploadBatch(entries, path, isRemote);
+    }
+}
+
+// 打包下载：用表单 POST 提交，选中项较多时不受 URL 长度限制，浏览器直接按附件保存
+export function downloadArchive(path, names) {
+    const isRemote = localStorage.getItem('fileMode') === 'remote';
+    const format = document.getElementById('archive-format')?.value || 'zip';
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = `/api/download/archive?${modeQuery(isRemote)}`;
+    form.style.display = 'none';
+    const fields = [['path', path], ['format', format], ...names.map(name => ['name', name])];
+    fields.forEach(([key, value]) => {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = key;
+        input.value = value;
+        form.appendChild(input);
+    });
+    document.body.appendChild(form);
+    form.submit();
+    form.remove();
+}
+
+// 打包下载当前目录中勾选的文件和文件夹
+export function downloadSelected() {
+    const names = Array.from(document.querySelectorAll('#file-list .select-entry:checked'))
+        .map(input => input.dataset.name);
+    if (!names.length) {
+        alert('请先勾选要下载的文件或文件夹');
+        return;
     }
+    downloadArchive(currentPath || '/', names);
 }
 
 // 格式化文件大小
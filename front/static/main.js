@@ -5,7 +5,7 @@ import './ui.js';
 import './utils.js';
 import './modal.js';
 import { setupFileListClick } from './ui.js';
-import { uploadFiles, uploadFolders, fetchFileList, calculateFolderSize } from './file.js';
+import { uploadFiles, uploadFolders, fetchFileList, calculateFolderSize, downloadSelected } from './file.js';
 
 // 设置事件监听
 document.addEventListener('DOMContentLoaded', function() {
@@ -23,6 +23,8 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('upload-folders-btn')?.addEventListener('click', uploadFolders);
     // 添加统计大小按钮事件监听
     document.getElementById('calculate-size-btn')?.addEventListener('click', calculateFolderSize);
+    // 打包下载所选文件
+    document.getElementById('download-selected-btn')?.addEventListener('click', downloadSelected);
 });
 
 function initIndexPage() {
@@ -2,6 +2,15 @@
 export let selectedServer = null;
 export let serverList = [];
 
+// 下拉列表中服务器名称后附加的健康状态
+function healthLabel(health) {
+    if (!health || health.status === 'unknown') return '';
+    if (health.status === 'down') return '（不可达）';
+    const rtt = health.rtt_ms !== null ? ` ${Math.round(health.rtt_ms)}ms` : '';
+    if (health.status === 'unstable') return `（不稳定${rtt}）`;
+    return rtt ? `（${rtt.trim()}）` : '';
+}
+
 export function loadServerList(autoConnect = false) {
     fetch('/api/remote_servers').then(res => res.json()).then(data => {
         serverList = data.remote_server_list || [];
@@ -14,12 +23,15 @@ export function loadServerList(autoConnect = false) {
         serverList.forEach((srv, idx) => {
             const option = document.createElement('option');
             option.value = idx;
-            option.textContent = srv.server_name || (srv.config && srv.config.host_ip) || '未命名服务器';
+            option.textContent = (srv.server_name || (srv.config && srv.config.host_ip) || '未命名服务器') + healthLabel(srv.health);
             select.appendChild(option);
         });
         if (serverList.length > 0) {
-            select.selectedIndex = 0;
-            selectedServer = serverList[0];
+            // 默认选中第一台未被判定为不可用的服务器
+            const firstHealthy = serverList.findIndex(srv => !srv.health || srv.health.status !== 'down');
+            const index = firstHealthy >= 0 ? firstHealthy : 0;
+            select.selectedIndex = index;
+            selectedServer = serverList[index];
             if (autoConnect) {
                 // 自动连接第一个服务器
                 const pwd = selectedServer.config.user_pwd || '';
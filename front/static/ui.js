@@ -11,7 +11,7 @@ export function renderCurrentPath() {
     container.appendChild(currentPathSpan);
 }
 
-import { formatSize, formatDate } from './utils.js';
+import { formatSize, formatDate, modeQuery } from './utils.js';
 import { fetchFileList } from './file.js';
 
 // 事件委托：监听文件夹点击和删除按钮点击
@@ -33,6 +33,14 @@ export function setupFileListClick() {
             return;
         }
         
+        // 处理目录打包下载按钮点击
+        if (e.target.classList.contains('archive-btn')) {
+            import('./file.js').then(module => {
+                module.downloadArchive(e.target.dataset.archivepath, []);
+            });
+            return;
+        }
+        
         // 处理删除按钮点击
         if (e.target.classList.contains('delete-btn')) {
             const filePath = e.target.dataset.filepath;
@@ -40,11 +48,7 @@ export function setupFileListClick() {
                 const fileMode = localStorage.getItem('fileMode');
                 const isRemote = fileMode === 'remote';
                 let url = `/api/delete?path=${encodeURIComponent(filePath)}`;
-                if (isRemote) {
-                    url += '&mode=remote';
-                } else {
-                    url += '&mode=local';
-                }
+                url += '&' + modeQuery(isRemote);
                 
                 fetch(url, {
                     method: 'POST'
@@ -123,7 +127,15 @@ export function renderFileList(data) {
     data.dirs.forEach(dir => {
         const dirPath = joinPath(path, dir.name);
         const sizeDisplay = dir.size === null ? '-' : formatSize(dir.size);
-        html += `<tr class="${rowIdx % 2 === 0 ? '' : 'row-alt'}"><td><a href="#" data-dirpath="${dirPath}">${dir.name}/</a></td><td>${sizeDisplay}</td><td>${formatDate(dir.mtime)}</td></tr>`;
+        html += `<tr class="${rowIdx % 2 === 0 ? '' : 'row-alt'}">
+            <td>
+                <input type="checkbox" class="select-entry" data-name="${dir.name}">
+                <a href="#" data-dirpath="${dirPath}">${dir.name}/</a>
+                <button class="archive-btn" data-archivepath="${dirPath}">打包下载</button>
+            </td>
+            <td>${sizeDisplay}</td>
+            <td>${formatDate(dir.mtime)}</td>
+        </tr>`;
         rowIdx++;
     });
     data.files.forEach(file => {
@@ -132,13 +144,10 @@ export function renderFileList(data) {
         const fileMode = localStorage.getItem('fileMode');
         const isRemote = fileMode === 'remote';
         let downloadUrl = `/api/download?path=${encodeURIComponent(filePath)}`;
-        if (isRemote) {
-            downloadUrl += '&mode=remote';
-        } else {
-            downloadUrl += '&mode=local';
-        }
+        downloadUrl += '&' + modeQuery(isRemote);
         html += `<tr class="${rowIdx % 2 === 0 ? '' : 'row-alt'}">
             <td>
+                <input type="checkbox" class="select-entry" data-name="${file.name}">
                 <a href="${downloadUrl}">${file.name}</a>
                 <button class="delete-btn" data-filepath="${filePath}">删除</button>
             </td>
@@ -10,4 +10,19 @@ export function formatDate(ts) {
     if (!ts) return '-';
     const d = new Date(ts * 1000);
     return d.getFullYear() + '-' + String(d.getMonth()+1).padStart(2,'0') + '-' + String(d.getDate()).padStart(2,'0') + ' ' + String(d.getHours()).padStart(2,'0') + ':' + String(d.getMinutes()).padStart(2,'0');
-} 
\ No newline at end of file
+} 
+
+// 远程模式的查询参数：同时带上所选服务器，后端按请求区分不同用户选择的服务器
+export function modeQuery(isRemote) {
+    if (!isRemote) return 'mode=local';
+    let query = 'mode=remote';
+    try {
+        const server = JSON.parse(localStorage.getItem('selectedServer') || 'null');
+        if (server && server.server_name) {
+            query += '&server=' + encodeURIComponent(server.server_name);
+        }
+    } catch (e) {
+        console.warn('读取所选服务器失败', e);
+    }
+    return query;
+}
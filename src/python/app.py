@@ -1,18 +1,41 @@
 from flask import (
     Flask,
+    Response,
+    g,
     jsonify,
     render_template,
     request,
     send_file,
+    session,
 )
 from flask_cors import CORS
+import math
+import mimetypes
 import os
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
 
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified
+
+from utils.archive_stream import ARCHIVE_FORMATS
+from utils.bulk_delete import DELETE_METHODS
 from utils.constants import FRONT_DIR,PROJECT_ROOT
+from utils.dir_sync import SYNC_DIRECTIONS
+from utils.fan_out import MAX_FAN_OUT_TIMEOUT
+from utils.file_search import DEFAULT_FIND_LIMIT, MAX_FIND_LIMIT
+from utils.http_range import make_etag, resolve_range
+from utils.job_registry import default_job_registry as jobs
 from utils.log_util import default_logger as logger
+from utils.multipart_stream import iter_file_chunks, iter_multipart
+from utils.tar_stream import parse_manifest as parse_tar_manifest
+from utils.upload_session import UploadSessionManager
 
 from service.impl.local_file_service import LocalFileService
-from service.impl.remote_file_service import RemoteFileService
+from service.impl.remote_file_service import (
+    DELTA_DIRECTIONS, FAN_OUT_OPERATIONS, TRANSFER_METHODS, RemoteFileService,
+)
 logger.info("[app] Starting Flask application")
 logger.info("FRONT_DIR: %s", FRONT_DIR)
 logger.info("PROJECT_ROOT: %s", PROJECT_ROOT)
@@ -25,14 +48,81 @@ app = Flask(
 app.config['JSON_AS_ASCII'] = False  # 确保JSON响应中的非ASCII字符不会被转义
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False  # 禁用美化输出，减少响应大小
 app.json.ensure_ascii = False  # 确保JSON不会将中文等字符转换为Unicode转义序列
+# 会话 cookie 记录每个浏览器所选的服务器；未配置密钥时每次启动随机生成
+app.secret_key = os.environ.get("DOWNLOADTOOL_SECRET_KEY") or os.urandom(32)
 CORS(app)
 
 local_service = LocalFileService()
 remote_service = RemoteFileService()
+upload_sessions = UploadSessionManager()
 
 def get_service(mode: str):
     return remote_service if mode == "remote" else local_service
 
+@app.before_request
+def select_request_server():
+    """按请求选择服务器：显式的 server 参数优先，其次是浏览器会话中记录的服务器"""
+    server_name = request.args.get("server") or session.get("server_name")
+    g.server_token = remote_service.select_server(server_name)
+
+@app.teardown_request
+def reset_request_server(exc=None):
+    token = g.pop("server_token", None)
+    if token is not None:
+        remote_service.reset_server(token)
+
+def attachment_headers(filename: str) -> dict:
+    """生成下载附件的 Content-Disposition，非 ASCII 文件名按 RFC 5987 编码"""
+    try:
+        filename.encode("ascii")
+        disposition = f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        disposition = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return {"Content-Disposition": disposition}
+
+def stream_remote_download(rel_path: str):
+    """
+    远程文件边读边发：响应体直接来自 SFTP，不经过本地临时文件
+
+    支持 Range/If-Range 断点续传（206），以及基于 ETag/Last-Modified 的 304
+    """
+    stream = remote_service.open_download_stream("remote", rel_path)
+    if stream is None:
+        logger.warning(f"[app] /api/download file not found: {rel_path}")
+        return jsonify({"error": "文件不存在".encode('utf-8').decode('utf-8')}), 404
+    etag = make_etag(stream.size, stream.mtime)
+    last_modified = datetime.fromtimestamp(int(stream.mtime), tz=timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        stream.close()
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
+    try:
+        byte_range = resolve_range(request, stream.size, etag, stream.mtime)
+    except RequestedRangeNotSatisfiable as e:
+        stream.close()
+        logger.warning(f"[app] /api/download range not satisfiable: {request.headers.get('Range')} size={stream.size}")
+        return e
+
+    filename = os.path.basename(stream.path)
+    headers = attachment_headers(filename)
+    headers["Accept-Ranges"] = "bytes"
+    status = 200
+    if byte_range is not None:
+        stream.set_range(*byte_range)
+        headers["Content-Range"] = f"bytes {stream.start}-{stream.end - 1}/{stream.size}"
+        headers["Content-Length"] = str(stream.length)
+        status = 206
+    else:
+        headers["Content-Length"] = str(stream.size)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    logger.info(f"[app] DOWNLOAD (stream) {stream.path} size={stream.size} range={byte_range}")
+    response = Response(stream, status=status, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
 @app.route("/")
 def index():
     logger.info("[app] index page requested")
@@ -70,34 +160,24 @@ def api_list_dir_with_sizes():
         if "error" in result:
             return jsonify(result), 400
         
-        # 计算当前目录总大小
-        size_result = service.calculate_folder_size(mode, rel_path)
+        # 一次调用算出当前目录及所有子目录的大小，远程模式只需一次 exec
+        size_result = service.calculate_child_sizes(mode, result["path"])
         
-        if "success" in size_result and size_result["success"]:
+        if size_result.get("success"):
             # 更新目录信息
             result["dir_info"] = {
                 "total_size": size_result.get("total_size", 0),
                 "file_count": size_result.get("file_count", 0),
-                "is_complete": True
+                "is_complete": size_result.get("is_complete", True)
             }
             
-            # 计算每个子目录大小
-            for i, dir_entry in enumerate(result["dirs"]):
-                # 构造子目录路径，适应不同模式
-                current_path = result["path"]
-                if current_path.endswith('/'):
-                    dir_path = current_path + dir_entry["name"]
-                else:
-                    dir_path = current_path + '/' + dir_entry["name"]
-                    
-                try:
-                    dir_size = service.calculate_folder_size(mode, dir_path)
-                    if "success" in dir_size and dir_size["success"]:
-                        result["dirs"][i]["size"] = dir_size.get("total_size", 0)
-                except Exception as e:
-                    logger.warning(f"[app] Failed to calculate size for directory: {dir_path}, error: {str(e)}")
-                    # 子目录大小计算失败不影响整体结果
-                    result["dirs"][i]["size"] = None
+            children = size_result.get("children", {})
+            for dir_entry in result["dirs"]:
+                child = children.get(dir_entry["name"])
+                # 子目录大小计算失败（例如无权限）不影响整体结果
+                dir_entry["size"] = child["total_size"] if child else None
+        else:
+            logger.warning(f"[app] Failed to calculate sizes for: {rel_path}, error: {size_result.get('error')}")
         
         logger.info(f"[app] /api/list_with_sizes completed for path: {rel_path}")
         return jsonify(result)
@@ -115,6 +195,8 @@ def api_download_file():
         return jsonify({"error": "路径参数缺失".encode('utf-8').decode('utf-8')}), 400
     
     try:
+        if mode == "remote":
+            return stream_remote_download(rel_path)
         service = get_service(mode)
         file_path = service.download_file(mode, rel_path)
         if not file_path or not os.path.exists(file_path):
@@ -123,12 +205,40 @@ def api_download_file():
         
         filename = os.path.basename(rel_path)
         logger.info(f"[app] DOWNLOAD {file_path}")
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        # conditional=True：由 Werkzeug 处理 Range/If-Range 与 ETag/Last-Modified
+        return send_file(file_path, as_attachment=True, download_name=filename, conditional=True)
     except Exception as e:
         logger.error(f"[app] /api/download error: {str(e)}")
         error_message = f"下载文件失败: {str(e)}"
         return jsonify({"error": error_message.encode('utf-8').decode('utf-8')}), 500
 
+@app.route("/api/download/archive", methods=["GET", "POST"])
+def api_download_archive():
+    """
+    打包下载目录或多个文件
+
+    path 为目录（未选择 name 时打包 path 本身），name 可重复，表示 path 下选中的文件或子目录；
+    选择较多时可用 POST 表单提交 name。format 为 zip、tar、tar.gz 或 tar.zst，压缩包边生成边发送。
+    """
+    mode = request.args.get("mode")
+    rel_path = request.values.get("path")
+    fmt = request.values.get("format", "zip")
+    names = request.values.getlist("name")
+    if not rel_path:
+        logger.warning("[app] /api/download/archive missing path parameter")
+        return jsonify({"error": "路径参数缺失"}), 400
+    if fmt not in ARCHIVE_FORMATS:
+        return jsonify({"error": f"不支持的压缩格式: {fmt}"}), 400
+    result = get_service(mode).open_archive_stream(mode, rel_path, names, fmt)
+    if not result.get("success"):
+        logger.warning(f"[app] /api/download/archive failed: {result}")
+        status = 404 if "不存在" in result.get("error", "") else 400
+        return jsonify({"error": result.get("error")}), status
+    stream = result["stream"]
+    logger.info(f"[app] DOWNLOAD (archive) {rel_path} names={names} file={stream.filename}")
+    return Response(stream, mimetype=stream.mimetype, headers=attachment_headers(stream.filename),
+                    direct_passthrough=True)
+
 @app.route("/api/calculate_size", methods=["GET"])
 def api_calculate_size():
     mode = request.args.get("mode")
@@ -152,6 +262,34 @@ def api_calculate_size():
         error_message = f"计算文件夹大小失败: {str(e)}"
         return jsonify({"error": error_message.encode('utf-8').decode('utf-8')}), 500
 
+@app.route("/api/search", methods=["GET"])
+def api_search():
+    """
+    在 path 下按文件名通配符查找（不区分大小写）
+
+    参数 pattern（如 *.log）、kind（file/dir，默认都要）、limit（最多返回条数）
+    """
+    mode = request.args.get("mode")
+    rel_path = request.args.get("path")
+    pattern = request.args.get("pattern")
+    kind = request.args.get("kind") or None
+    if not rel_path or not pattern:
+        logger.warning("[app] /api/search missing path or pattern parameter")
+        return jsonify({"error": "路径或查找条件参数缺失"}), 400
+    try:
+        limit = int(request.args.get("limit", DEFAULT_FIND_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit 参数无效"}), 400
+    if not 1 <= limit <= MAX_FIND_LIMIT:
+        return jsonify({"error": f"limit 必须在 1 到 {MAX_FIND_LIMIT} 之间"}), 400
+    result = get_service(mode).search_files(mode, rel_path, pattern, kind, limit)
+    if not result.get("success"):
+        logger.warning(f"[app] /api/search failed: {result}")
+        return jsonify({"error": result.get("error")}), 400
+    logger.info(f"[app] /api/search {rel_path} pattern={pattern} found={len(result['entries'])} "
+                f"truncated={result['truncated']}")
+    return jsonify(result)
+
 @app.route("/api/upload", methods=["POST"])
 def api_upload_file():
     mode = request.args.get("mode")
@@ -159,6 +297,8 @@ def api_upload_file():
     if not rel_path:
         logger.warning("[app] /api/upload missing path parameter")
         return jsonify({"error": "路径参数缺失"}), 400
+    if mode == "remote" and request.mimetype == "multipart/form-data":
+        return stream_remote_upload(rel_path)
     if "file" not in request.files:
         logger.warning("[app] /api/upload no file selected")
         return jsonify({"error": "未选择文件"}), 400
@@ -168,17 +308,273 @@ def api_upload_file():
     logger.info(f"[app] /api/upload result: {result}")
     return jsonify(result)
 
+def stream_remote_upload(rel_path: str):
+    """远程上传边收边写：请求体中的文件数据直接写入 SFTP，不经过 request.files 的临时文件"""
+    try:
+        for part in iter_multipart(request.stream, request.content_type):
+            if part.name != "file" or not part.is_file:
+                continue
+            result = remote_service.upload_stream("remote", rel_path, part.filename, part)
+            logger.info(f"[app] /api/upload result: {result}")
+            return jsonify(result)
+    except ValueError as e:
+        logger.warning(f"[app] /api/upload bad multipart body: {e}")
+        return jsonify({"error": str(e)}), 400
+    logger.warning("[app] /api/upload no file selected")
+    return jsonify({"error": "未选择文件"}), 400
+
+@app.route("/api/upload/tar", methods=["POST"])
+def api_upload_tar():
+    """
+    文件夹上传的 tar 快速通道（仅远程模式）
+
+    multipart 请求体的第一个字段 manifest 为 JSON 数组 [{name, size, mtime?}]，其后按相同顺序
+    是各个 file 部分；所有文件边接收边打包，经一次 exec 交给远程 tar 解包。
+    """
+    mode = request.args.get("mode")
+    rel_path = request.args.get("path", "")
+    if mode != "remote":
+        return jsonify({"error": "tar 上传仅支持远程模式"}), 400
+    if not rel_path:
+        logger.warning("[app] /api/upload/tar missing path parameter")
+        return jsonify({"error": "路径参数缺失"}), 400
+    try:
+        parts = iter_multipart(request.stream, request.content_type)
+        first = next(parts, None)
+        if first is None or first.name != "manifest" or first.is_file:
+            return jsonify({"error": "缺少文件清单"}), 400
+        manifest = parse_tar_manifest(first.text())
+    except ValueError as e:
+        logger.warning(f"[app] /api/upload/tar bad request: {e}")
+        return jsonify({"error": str(e)}), 400
+
+    def members():
+        for name, size, mtime in manifest:
+            part = next((p for p in parts if p.name == "file" and p.is_file), None)
+            if part is None:
+                raise ValueError("文件数量与清单不符")
+            yield name, size, mtime, part
+
+    result = remote_service.upload_tar(mode, rel_path, members())
+    logger.info(f"[app] /api/upload/tar result: {result}")
+    return jsonify(result)
+
+@app.route("/api/upload/batch", methods=["POST"])
+def api_upload_batch():
+    """
+    一次请求上传多个小文件
+
+    multipart 请求体中每个 file 部分的文件名为相对于 path 的路径；文件边接收边写入，
+    远程模式下全部经同一条 SFTP 会话写入。返回每个文件的结果。
+    """
+    mode = request.args.get("mode")
+    rel_path = request.args.get("path", "")
+    if not rel_path:
+        logger.warning("[app] /api/upload/batch missing path parameter")
+        return jsonify({"error": "路径参数缺失"}), 400
+    try:
+        parts = iter_multipart(request.stream, request.content_type)
+        files = ((part.filename, part) for part in parts if part.name == "file" and part.is_file)
+        result = get_service(mode).upload_batch(mode, rel_path, files)
+    except ValueError as e:
+        logger.warning(f"[app] /api/upload/batch bad multipart body: {e}")
+        return jsonify({"error": str(e)}), 400
+    if not result.get("results") and result.get("success"):
+        logger.warning("[app] /api/upload/batch no file selected")
+        return jsonify({"error": "未选择文件"}), 400
+    logger.info(f"[app] /api/upload/batch result: files={result.get('files')} failed={result.get('failed')}")
+    return jsonify(result)
+
+def cleanup_expired_uploads():
+    """删除过期分块上传会话的临时文件"""
+    for upload in upload_sessions.expire():
+        logger.info(f"[app] chunked upload expired: id={upload.upload_id} path={upload.path}")
+        with remote_service.server_scope(upload.server):
+            get_service(upload.mode).abort_chunked_upload(upload.mode, upload.temp_path)
+
+@app.route("/api/upload/chunked/init", methods=["POST"])
+def api_chunked_upload_init():
+    """创建分块上传会话：body 为 {filename, size, chunk_size?}"""
+    mode = request.args.get("mode")
+    rel_path = request.args.get("path", "")
+    data = request.get_json(silent=True) or {}
+    filename = data.get("filename")
+    size = data.get("size")
+    chunk_size = data.get("chunk_size")
+    if not rel_path:
+        logger.warning("[app] /api/upload/chunked/init missing path parameter")
+        return jsonify({"error": "路径参数缺失"}), 400
+    # bool 是 int 的子类，JSON 的 true/false 不能当作大小
+    if not filename or not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        return jsonify({"error": "缺少文件名或文件大小"}), 400
+    if chunk_size is not None and (not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size < 0):
+        return jsonify({"error": "chunk_size 必须为非负整数"}), 400
+    cleanup_expired_uploads()
+
+    service = get_service(mode)
+    chunk_size = upload_sessions.normalize_chunk_size(chunk_size)
+    upload_id = upload_sessions.new_upload_id()
+    prepared = service.prepare_chunked_upload(mode, rel_path, filename, upload_id)
+    if not prepared.get("success"):
+        logger.warning(f"[app] /api/upload/chunked/init failed: {prepared}")
+        return jsonify(prepared), 500
+    server_name = remote_service.current_server_name if mode == "remote" else None
+    upload = upload_sessions.create(upload_id, mode, prepared["path"], prepared["temp_path"], size, chunk_size, server_name)
+    result = {"success": True, **upload.to_dict()}
+    logger.info(f"[app] /api/upload/chunked/init result: {result}")
+    return jsonify(result)
+
+@app.route("/api/upload/chunked/<upload_id>", methods=["GET"])
+def api_chunked_upload_status(upload_id):
+    """查询已收到的分块，客户端据此只补传缺失部分"""
+    upload = upload_sessions.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "上传会话不存在"}), 404
+    return jsonify({"success": True, **upload.to_dict()})
+
+@app.route("/api/upload/chunked/<upload_id>/<int:index>", methods=["PUT"])
+def api_chunked_upload_chunk(upload_id, index):
+    """上传第 index 个分块，请求体为原始字节，长度必须与分块长度一致"""
+    try:
+        upload = upload_sessions.begin_chunk(upload_id, index)
+    except KeyError:
+        return jsonify({"error": "上传会话不存在"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+
+    ok = False
+    try:
+        offset, length = upload.chunk_range(index)
+        if request.content_length != length:
+            return jsonify({"error": f"分块长度不符: 期望 {length} 字节"}), 400
+        # 分块写入创建会话时所选的服务器，与当前请求带的参数无关
+        with remote_service.server_scope(upload.server):
+            service = get_service(upload.mode)
+            result = service.write_upload_chunk(upload.mode, upload.temp_path, offset, iter_file_chunks(request.stream))
+        if not result.get("success"):
+            return jsonify(result), 500
+        if result.get("bytes") != length:
+            return jsonify({"error": f"分块数据不完整: 收到 {result.get('bytes')} 字节"}), 400
+        ok = True
+        return jsonify({"success": True, "index": index})
+    finally:
+        upload_sessions.end_chunk(upload_id, index, ok)
+
+@app.route("/api/upload/chunked/<upload_id>/commit", methods=["POST"])
+def api_chunked_upload_commit(upload_id):
+    """全部分块到齐后提交，临时文件重命名为目标文件"""
+    try:
+        upload = upload_sessions.pop_if_complete(upload_id)
+    except KeyError:
+        return jsonify({"error": "上传会话不存在"}), 404
+    if upload is None:
+        status = upload_sessions.get(upload_id)
+        missing = status.missing() if status else []
+        return jsonify({"error": "分块未全部上传", "missing": missing}), 409
+    with remote_service.server_scope(upload.server):
+        service = get_service(upload.mode)
+        result = service.commit_chunked_upload(upload.mode, upload.temp_path, upload.path)
+    if not result.get("success"):
+        upload_sessions.restore(upload)
+        logger.warning(f"[app] /api/upload/chunked/commit failed: {result}")
+        return jsonify(result), 500
+    logger.info(f"[app] /api/upload/chunked/commit result: {result}")
+    return jsonify(result)
+
+@app.route("/api/upload/chunked/<upload_id>", methods=["DELETE"])
+def api_chunked_upload_abort(upload_id):
+    """取消分块上传并删除临时文件"""
+    upload = upload_sessions.remove(upload_id)
+    if upload is None:
+        return jsonify({"error": "上传会话不存在"}), 404
+    with remote_service.server_scope(upload.server):
+        result = get_service(upload.mode).abort_chunked_upload(upload.mode, upload.temp_path)
+    logger.info(f"[app] /api/upload/chunked/abort result: {result}")
+    return jsonify(result)
+
 @app.route("/api/delete", methods=["POST"])
 def api_delete_file():
+    """
+    删除文件或目录，目录连同其内容一起删除
+
+    单个路径用查询参数 path，同步返回结果；
+    多个路径用 body {paths: [...], method: auto|sftp|exec}，后台执行，通过 /api/jobs/<job_id> 查询进度，
+    任务结果的 failed 列出删不掉的条目
+    """
     mode = request.args.get("mode")
     rel_path = request.args.get("path")
-    if not rel_path:
+    data = request.get_json(silent=True) or {}
+    paths = data.get("paths")
+    if not rel_path and not paths:
         logger.warning("[app] /api/delete missing path parameter")
         return jsonify({"success": False, "error": "路径参数缺失"}), 400
     service = get_service(mode)
-    result = service.delete_file(mode, rel_path)
-    logger.info(f"[app] /api/delete result: {result}")
-    return jsonify(result)
+    if rel_path:
+        result = service.delete_file(mode, rel_path)
+        logger.info(f"[app] /api/delete result: {result}")
+        return jsonify(result)
+
+    if not isinstance(paths, list) or not all(isinstance(path, str) and path for path in paths):
+        return jsonify({"success": False, "error": "paths 参数无效"}), 400
+    method = data.get("method", "auto")
+    if method not in DELETE_METHODS:
+        return jsonify({"success": False, "error": f"不支持的删除方式: {method}"}), 400
+    server = remote_service.current_server_name
+
+    def run(job):
+        with remote_service.server_scope(server):
+            result = service.delete_paths(mode, paths, job, method)
+        # 部分条目删不掉时任务照常结束，结果中 success 为 False 并列出 failed
+        if "failed" not in result:
+            raise RuntimeError(result.get("error"))
+        return result
+
+    params = {"mode": mode, "paths": paths, "method": method, "server": server}
+    job = jobs.submit("delete", run, params)
+    logger.info(f"[app] /api/delete submitted: {job.job_id} count={len(paths)} method={method}")
+    return jsonify({"success": True, **job.to_dict()})
+
+def submit_copy_or_move(kind: str):
+    mode = request.args.get("mode")
+    data = request.get_json(silent=True) or {}
+    src_path = data.get("src")
+    dst_path = data.get("dst")
+    if not src_path or not dst_path:
+        logger.warning(f"[app] /api/{kind} missing parameters")
+        return jsonify({"success": False, "error": "缺少源或目标路径"}), 400
+    service = get_service(mode)
+    server = remote_service.current_server_name
+
+    def run(job):
+        func = service.copy_path if kind == "copy" else service.move_path
+        with remote_service.server_scope(server):
+            result = func(mode, src_path, dst_path, job)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error"))
+        return result
+
+    params = {"mode": mode, "src": src_path, "dst": dst_path, "server": server}
+    job = jobs.submit(kind, run, params)
+    logger.info(f"[app] /api/{kind} submitted: {job.job_id} {params}")
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route("/api/copy", methods=["POST"])
+def api_copy():
+    """
+    在文件所在的主机上复制文件或目录树，后台执行
+
+    body: {src, dst}，dst 为完整的目标路径且必须不存在；远程复制的数据不经过本机
+    """
+    return submit_copy_or_move("copy")
+
+@app.route("/api/move", methods=["POST"])
+def api_move():
+    """
+    在文件所在的主机上移动或重命名文件、目录树，后台执行
+
+    body: {src, dst}，dst 为完整的目标路径且必须不存在
+    """
+    return submit_copy_or_move("move")
 
 @app.route("/api/default_dir")
 def get_default_dir():
@@ -188,16 +584,189 @@ def get_default_dir():
     logger.info(f"[app] /api/default_dir result: {result}")
     return jsonify(result)
 
+@app.route("/api/fan_out", methods=["GET"])
+def api_fan_out():
+    """
+    在多台服务器上并发执行 list_dir / calculate_folder_size / calculate_child_sizes
+
+    参数 op、path、servers（逗号分隔，默认全部）、timeout（每台服务器秒数）；
+    响应为 NDJSON，每台服务器完成后立即输出一行，最后一行为汇总
+    """
+    operation = request.args.get("op", "list_dir")
+    rel_path = request.args.get("path")
+    servers = request.args.get("servers")
+    if not rel_path:
+        logger.warning("[app] /api/fan_out missing path parameter")
+        return jsonify({"error": "路径参数缺失"}), 400
+    if operation not in FAN_OUT_OPERATIONS:
+        return jsonify({"error": f"不支持的操作: {operation}"}), 400
+    try:
+        timeout = float(request.args.get("timeout", 30))
+    except ValueError:
+        return jsonify({"error": "timeout 参数无效"}), 400
+    # nan/inf/负数会让每台服务器的超时失效
+    if not (math.isfinite(timeout) and 0 < timeout <= MAX_FAN_OUT_TIMEOUT):
+        return jsonify({"error": f"timeout 须在 (0, {MAX_FAN_OUT_TIMEOUT:g}] 秒之间"}), 400
+    server_names = [name for name in servers.split(",") if name] if servers else None
+
+    def generate():
+        start = time.monotonic()
+        count = failed = 0
+        for item in remote_service.fan_out(operation, rel_path, server_names, timeout=timeout):
+            count += 1
+            if "error" in item or "error" in item.get("result", {}):
+                failed += 1
+            yield app.json.dumps(item) + "\n"
+        summary = {"done": True, "servers": count, "failed": failed, "elapsed": round(time.monotonic() - start, 3)}
+        logger.info(f"[app] /api/fan_out {operation} {rel_path} summary: {summary}")
+        yield app.json.dumps(summary) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+@app.route("/api/transfer", methods=["POST"])
+def api_transfer():
+    """
+    服务器之间复制文件或目录，后台执行
+
+    body: {src_server, src_path, dst_server, dst_path（目标目录）, method: relay|direct|auto}
+    返回任务信息，通过 /api/jobs/<job_id> 查询进度
+    """
+    data = request.get_json(silent=True) or {}
+    src_server = data.get("src_server")
+    src_path = data.get("src_path")
+    dst_server = data.get("dst_server")
+    dst_path = data.get("dst_path")
+    method = data.get("method", "relay")
+    if not all([src_server, src_path, dst_server, dst_path]):
+        logger.warning("[app] /api/transfer missing parameters")
+        return jsonify({"error": "缺少源或目标参数"}), 400
+    if method not in TRANSFER_METHODS:
+        return jsonify({"error": f"不支持的传输方式: {method}"}), 400
+
+    def run(job):
+        result = remote_service.transfer_between_servers(src_server, src_path, dst_server, dst_path, job, method)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error"))
+        return result
+
+    params = {"src_server": src_server, "src_path": src_path, "dst_server": dst_server,
+              "dst_path": dst_path, "method": method}
+    job = jobs.submit("transfer", run, params)
+    logger.info(f"[app] /api/transfer submitted: {job.job_id} {params}")
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route("/api/delta_sync", methods=["POST"])
+def api_delta_sync():
+    """
+    本地文件与当前服务器上的文件之间增量同步，只传输变化的块，后台执行
+
+    body: {direction: upload|download, local_path, remote_path}
+    upload 用本地文件更新远程文件，download 反之；目标不存在时整文件传输
+    """
+    data = request.get_json(silent=True) or {}
+    direction = data.get("direction")
+    local_path = data.get("local_path")
+    remote_path = data.get("remote_path")
+    if not local_path or not remote_path:
+        logger.warning("[app] /api/delta_sync missing parameters")
+        return jsonify({"error": "缺少本地或远程路径"}), 400
+    if direction not in DELTA_DIRECTIONS:
+        return jsonify({"error": f"不支持的同步方向: {direction}"}), 400
+    if direction == "upload" and not os.path.isfile(local_path):
+        return jsonify({"error": "本地文件不存在"}), 404
+    # 后台线程不继承请求上下文，显式带上当前请求所选的服务器
+    server = remote_service.current_server_name
+
+    def run(job):
+        with remote_service.server_scope(server):
+            if direction == "upload":
+                result = remote_service.delta_upload(local_path, remote_path, job)
+            else:
+                result = remote_service.delta_download(remote_path, local_path, job)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error"))
+        return result
+
+    params = {"direction": direction, "local_path": local_path, "remote_path": remote_path, "server": server}
+    job = jobs.submit("delta_sync", run, params)
+    logger.info(f"[app] /api/delta_sync submitted: {job.job_id} {params}")
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route("/api/sync", methods=["POST"])
+def api_sync():
+    """
+    本地目录与当前服务器上的目录镜像同步，后台执行
+
+    body: {local_path, remote_path, direction: push|pull, delete, dry_run, checksum}
+    dry_run 时任务结果中的 actions 为计划执行的操作列表
+    """
+    data = request.get_json(silent=True) or {}
+    local_path = data.get("local_path")
+    remote_path = data.get("remote_path")
+    direction = data.get("direction", "push")
+    if not local_path or not remote_path:
+        logger.warning("[app] /api/sync missing parameters")
+        return jsonify({"error": "缺少本地或远程路径"}), 400
+    if direction not in SYNC_DIRECTIONS:
+        return jsonify({"error": f"不支持的同步方向: {direction}"}), 400
+    options = {key: bool(data.get(key, False)) for key in ("delete", "dry_run", "checksum")}
+    server = remote_service.current_server_name
+
+    def run(job):
+        with remote_service.server_scope(server):
+            result = remote_service.sync_dirs(local_path, remote_path, direction, job=job, **options)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error"))
+        return result
+
+    params = {"local_path": local_path, "remote_path": remote_path, "direction": direction,
+              "server": server, **options}
+    job = jobs.submit("sync", run, params)
+    logger.info(f"[app] /api/sync submitted: {job.job_id} {params}")
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route("/api/jobs", methods=["GET"])
+def api_list_jobs():
+    kind = request.args.get("kind")
+    return jsonify({"jobs": [job.to_dict() for job in jobs.list(kind)]})
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def api_get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def api_cancel_job(job_id):
+    if not jobs.cancel(job_id):
+        return jsonify({"success": False, "error": "任务不存在"}), 404
+    logger.info(f"[app] /api/jobs/{job_id}/cancel requested")
+    return jsonify({"success": True})
+
+@app.route("/api/download_cache/stats")
+def api_download_cache_stats():
+    """下载缓存的命中率、占用和淘汰统计"""
+    return jsonify(remote_service.download_cache_stats())
+
 @app.route("/api/remote_servers")
 def get_remote_servers():
     result = remote_service.get_remote_servers()
     logger.info(f"[app] /api/remote_servers result: {result}")
-    return jsonify({"remote_server_list": result})
+    # 附带后台健康监测的最新结果，配置快照本身不修改
+    servers = [
+        {**remote, "health": remote_service.health_monitor.get(remote.get("config", {}))}
+        if remote.get("config", {}).get("host_ip") else remote
+        for remote in result
+    ]
+    return jsonify({"remote_server_list": servers})
 
 @app.route("/api/test_server_connectivity", methods=["POST"])
 def test_server_connectivity():
     ssh_info = request.json
     result = remote_service.test_server_connectivity(ssh_info)
+    if result.get("success") and result.get("server_name"):
+        session["server_name"] = result["server_name"]
     logger.info(f"[app] /api/test_server_connectivity result: {result}")
     return jsonify(result)
 
@@ -207,8 +776,15 @@ def save_server_pwd():
     server_name = data.get("server_name")
     user_pwd = data.get("user_pwd")
     result = remote_service.save_server_pwd(server_name, user_pwd)
+    if result.get("success"):
+        session["server_name"] = server_name
     logger.info(f"[app] /api/save_server_pwd result: {result}")
     return jsonify(result)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=18023, debug=True)
+    debug = True
+    # debug 模式下 reloader 父进程只负责重启子进程，健康监测只在实际处理请求的进程中运行
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        remote_service.health_monitor.start()
+        remote_service.cleanup_stale_downloads()
+    app.run(host="0.0.0.0", port=18023, debug=debug)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量传输基准：比较几种典型修改场景下，增量传输实际经过网络的字节数（签名 + 增量）与整文件复制
+
+签名、增量计算和重建都在本机完成，只统计字节数和计算耗时，不需要远程服务器：
+
+    cd src/python
+    python benchmarks/bench_delta_sync.py --size-mb 256
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.delta_sync import (  # noqa: E402
+    DeltaStats, build_signature, choose_block_size, generate_delta, mapped_file, patch_file,
+)
+
+
+def _scenarios(old: bytes, rng: random.Random):
+    size = len(old)
+    edits = bytearray(old)
+    for _ in range(10):
+        offset = rng.randrange(0, size - 4096)
+        edits[offset:offset + 4096] = rng.randbytes(4096)
+    return [
+        ("unchanged", old),
+        ("append 1%", old + rng.randbytes(size // 100)),
+        ("10 x 4KB in-place edits", bytes(edits)),
+        ("insert 1KB at head", rng.randbytes(1024) + old),
+        ("log rotation (drop 10% head, append 10%)", old[size // 10:] + rng.randbytes(size // 10)),
+        ("unrelated content", rng.randbytes(size)),
+    ]
+
+
+def _format_size(nbytes: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if nbytes < 1024 or unit == "GB":
+            return f"{nbytes:.1f} {unit}" if unit != "B" else f"{nbytes} B"
+        nbytes /= 1024
+
+
+def run(size_mb: int, seed: int):
+    rng = random.Random(seed)
+    old = rng.randbytes(size_mb * 1024 * 1024)
+    block_size = choose_block_size(len(old))
+    print(f"basis file: {_format_size(len(old))}, block size: {_format_size(block_size)}")
+    print(f"{'scenario':<44}{'full copy':>12}{'on the wire':>14}{'saved':>9}{'delta time':>12}")
+
+    with tempfile.TemporaryDirectory(prefix="bench_delta_") as tmp:
+        basis_path = os.path.join(tmp, "basis.bin")
+        new_path = os.path.join(tmp, "new.bin")
+        for name, new in _scenarios(old, rng):
+            with open(basis_path, "wb") as f:
+                f.write(old)
+            with open(new_path, "wb") as f:
+                f.write(new)
+
+            started = time.perf_counter()
+            with open(basis_path, "rb") as f:
+                signature = build_signature(f, block_size)
+            signature_bytes = len(signature.to_bytes())
+            stats = DeltaStats()
+            with mapped_file(new_path) as data:
+                delta = b"".join(generate_delta(data, signature, stats))
+            elapsed = time.perf_counter() - started
+            patch_file(basis_path, basis_path, io.BytesIO(delta))
+
+            with open(basis_path, "rb") as f:
+                assert f.read() == new, f"reconstruction mismatch: {name}"
+            wire = signature_bytes + stats.delta_bytes
+            saved = 1 - wire / len(new) if new else 0.0
+            print(f"{name:<44}{_format_size(len(new)):>12}{_format_size(wire):>14}{saved:>9.1%}{elapsed:>11.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量传输与整文件复制的传输字节数对比")
+    parser.add_argument("--size-mb", type=int, default=64, help="基准文件大小（MB）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.size_mb, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录列表基准：比较 sftp.listdir_attr 与 exec（find -printf）两种方式列出大目录的耗时
+
+默认在本机模拟：sftp 方式解析按 sftp-server 格式编码的 NAME 应答（每批 100 个条目，每批计一次往返），
+exec 方式真正运行 find 并流式解析输出（计 EXEC_ROUND_TRIPS 次往返）。往返时间由 --rtt-ms 指定：
+
+    cd src/python
+    python benchmarks/bench_list_dir.py --entries 1000 10000 100000 --rtt-ms 1 20
+
+指定 --server 时改为对 config.json 中的服务器实测两种方式（--path 为远程目录）：
+
+    python benchmarks/bench_list_dir.py --server my-server --path /data/huge_dir
+"""
+
+import argparse
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import paramiko
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.remote_listing import (  # noqa: E402
+    EXEC_ROUND_TRIPS, LIST_DIR_COMMAND, LIST_READ_SIZE, SFTP_READDIR_BATCH, ListingPlanner, parse_listing,
+)
+
+
+def _make_dir(root: str, entries: int):
+    for i in range(entries):
+        with open(os.path.join(root, f"file_{i:07d}.dat"), "wb") as f:
+            f.write(b"x" * (i % 100))
+
+
+def _name_messages(root: str):
+    """按 sftp-server 的格式把目录编码为若干 NAME 应答（服务端工作，不计时）"""
+    names = sorted(os.listdir(root))
+    messages = []
+    for start in range(0, len(names), SFTP_READDIR_BATCH):
+        batch = names[start:start + SFTP_READDIR_BATCH]
+        msg = paramiko.Message()
+        msg.add_int(len(batch))
+        for name in batch:
+            attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(root, name)), name)
+            msg.add_string(name)
+            msg.add_string(str(attr))
+            attr._pack(msg)
+        messages.append(msg.asbytes())
+    return messages
+
+
+def _time_sftp_parse(messages) -> float:
+    """客户端解析 NAME 应答的耗时，与 SFTPClient.listdir_attr 的做法相同"""
+    started = time.perf_counter()
+    entries = []
+    for raw in messages:
+        msg = paramiko.Message(raw)
+        for _ in range(msg.get_int()):
+            filename = msg.get_text()
+            longname = msg.get_text()
+            entries.append(paramiko.SFTPAttributes._from_msg(msg, filename, longname))
+    return time.perf_counter() - started
+
+
+def _time_exec(root: str) -> float:
+    started = time.perf_counter()
+    command = LIST_DIR_COMMAND.format(path=root)
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+    count = sum(1 for _ in parse_listing(iter(lambda: process.stdout.read(LIST_READ_SIZE), b"")))
+    process.wait()
+    assert count == len(os.listdir(root))
+    return time.perf_counter() - started
+
+
+def run_local(entry_counts, rtts_ms):
+    planner = ListingPlanner()
+    print(f"{'entries':>9}{'rtt':>8}{'sftp':>11}{'exec':>11}{'speedup':>9}   planner picks")
+    for entries in entry_counts:
+        with tempfile.TemporaryDirectory(prefix="bench_list_") as root:
+            _make_dir(root, entries)
+            messages = _name_messages(root)
+            sftp_cpu = _time_sftp_parse(messages)
+            exec_time = _time_exec(root)
+            dir_size = os.stat(root).st_size
+            for rtt_ms in rtts_ms:
+                rtt = rtt_ms / 1000
+                sftp = sftp_cpu + rtt * max(1, math.ceil(entries / SFTP_READDIR_BATCH))
+                exec_total = exec_time + rtt * EXEC_ROUND_TRIPS
+                choice = planner.choose("bench", root, dir_size, rtt)
+                print(f"{entries:>9}{rtt_ms:>6}ms{sftp:>10.3f}s{exec_total:>10.3f}s"
+                      f"{sftp / exec_total:>8.1f}x   {choice}")
+
+
+def run_server(server_name: str, path: str, repeat: int):
+    from service.impl.remote_file_service import RemoteFileService
+
+    service = RemoteFileService()
+    with service.server_scope(server_name):
+        for backend in ("sftp", "exec"):
+            service.list_backend = backend
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = service.list_dir("remote", path)
+                timings.append(time.perf_counter() - started)
+                if "error" in result:
+                    print(f"{backend}: {result['error']}")
+                    break
+            else:
+                count = len(result["dirs"]) + len(result["files"])
+                print(f"{backend:>5}: {count} entries, best {min(timings):.3f}s of {repeat}")
+    service.pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sftp 与 exec 两种目录列表方式的耗时对比")
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 100000], help="本机模拟的目录条目数")
+    parser.add_argument("--rtt-ms", type=float, nargs="+", default=[1, 20], help="本机模拟的往返时间（毫秒）")
+    parser.add_argument("--server", help="对 config.json 中的该服务器实测")
+    parser.add_argument("--path", help="实测时的远程目录")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.server:
+        if not args.path:
+            parser.error("--server 需要同时指定 --path")
+        run_server(args.server, args.path, args.repeat)
+    else:
+        run_local(args.entries, args.rtt_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSH 传输调优基准：对 config.json 中的一台服务器逐个测量 TUNING_PROFILES 的吞吐量
+
+每组配置新建一条连接，在远程生成 --size-mb 的数据（--data random 不可压缩，text 可压缩）读回本地计时。
+加 --apply 时把最快的配置写回该服务器的 config.tuning，之后新建的连接都使用它：
+
+    cd src/python
+    python benchmarks/bench_ssh_tuning.py --server my-server
+    python benchmarks/bench_ssh_tuning.py --server my-server --data text --profiles default wan wan-compress --apply
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.ssh_tuning import BENCH_COMMANDS, BENCH_SIZE, TUNING_PROFILES  # noqa: E402
+from utils.transfer_engine import format_rate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量各组 SSH 调优配置的吞吐量")
+    parser.add_argument("--server", required=True, help="config.json 中的服务器名称")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(TUNING_PROFILES), help="只测这些配置，默认全部")
+    parser.add_argument("--size-mb", type=int, default=BENCH_SIZE // (1024 * 1024), help="每组配置读取的数据量")
+    parser.add_argument("--data", choices=sorted(BENCH_COMMANDS), default="random")
+    parser.add_argument("--apply", action="store_true", help="把最快的配置写回 config.json")
+    args = parser.parse_args()
+
+    from service.impl.remote_file_service import RemoteFileService
+
+    service = RemoteFileService()
+    result = service.benchmark_tuning(args.server, profiles=args.profiles, size=args.size_mb * 1024 * 1024,
+                                      data=args.data, apply=args.apply)
+    for item in result.get("results", []):
+        if item["success"]:
+            print(f"{item['profile']:>14}{format_rate(item['throughput']):>14}"
+                  f"   connect {item['connect_seconds']:.3f}s   cipher {item['cipher']}")
+        else:
+            print(f"{item['profile']:>14}   failed: {item['error']}")
+    if not result["success"]:
+        print(f"error: {result['error']}")
+        return 1
+    print(f"best: {result['best']}" + ("（已写回 config.json）" if result["applied"] else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
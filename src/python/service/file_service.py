@@ -3,7 +3,10 @@ this file is a interface with abstract methods
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from utils.job_registry import Job
+from utils.file_search import DEFAULT_FIND_LIMIT
 
 class FileService(ABC):
     @abstractmethod
@@ -16,14 +19,64 @@ class FileService(ABC):
         """下载文件，返回本地临时文件路径或绝对路径"""
         pass
 
+    @abstractmethod
+    def open_archive_stream(self, mode: str, rel_path: str, names: Optional[List[str]], fmt: str) -> Dict[str, Any]:
+        """打包下载目录或 rel_path 下选中的多个文件，成功时 stream 为可直接作为响应体的 ArchiveStream"""
+        pass
+
     @abstractmethod
     def upload_file(self, mode: str, rel_path: str, file_obj) -> Dict[str, Any]:
         """上传文件，file_obj为文件对象"""
         pass
 
+    @abstractmethod
+    def prepare_chunked_upload(self, mode: str, rel_path: str, filename: str, upload_id: str) -> Dict[str, Any]:
+        """创建分块上传的临时文件，返回目标路径 path 与临时路径 temp_path"""
+        pass
+
+    @abstractmethod
+    def write_upload_chunk(self, mode: str, temp_path: str, offset: int, chunks: Iterable[bytes]) -> Dict[str, Any]:
+        """把分块数据写到临时文件的 offset 处，返回写入字节数 bytes"""
+        pass
+
+    @abstractmethod
+    def commit_chunked_upload(self, mode: str, temp_path: str, path: str) -> Dict[str, Any]:
+        """分块全部写完后把临时文件重命名为目标文件"""
+        pass
+
+    @abstractmethod
+    def abort_chunked_upload(self, mode: str, temp_path: str) -> Dict[str, Any]:
+        """放弃分块上传，删除临时文件"""
+        pass
+
+    @abstractmethod
+    def upload_batch(self, mode: str, rel_path: str, files: Iterable[Tuple[str, Iterable[bytes]]]) -> Dict[str, Any]:
+        """一次上传多个文件：files 为 (文件名, 数据块迭代器)，results 为每个文件的结果"""
+        pass
+
     @abstractmethod
     def delete_file(self, mode: str, rel_path: str) -> Dict[str, Any]:
-        """删除文件"""
+        """删除文件，目录连同其内容一起删除"""
+        pass
+
+    @abstractmethod
+    def delete_paths(self, mode: str, rel_paths: List[str], job: Optional[Job] = None,
+                     method: str = "auto") -> Dict[str, Any]:
+        """
+        递归删除多个文件或目录，进度计入 job；method 为远程删除方式（见 utils.bulk_delete.DELETE_METHODS）
+
+        返回 deleted_files、deleted_dirs、bytes 和 failed（[{path, error}]），有失败时 success 为 False
+        """
+        pass
+
+    @abstractmethod
+    def copy_path(self, mode: str, src_path: str, dst_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """在文件所在的主机上复制文件或目录树，dst_path 为完整的目标路径且必须不存在"""
+        pass
+
+    @abstractmethod
+    def move_path(self, mode: str, src_path: str, dst_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """在文件所在的主机上移动（重命名）文件或目录树，dst_path 必须不存在"""
         pass
 
     @abstractmethod
@@ -31,6 +84,20 @@ class FileService(ABC):
         """计算文件夹大小"""
         pass
 
+    @abstractmethod
+    def calculate_child_sizes(self, mode: str, rel_path: str) -> Dict[str, Any]:
+        """一次计算目录总大小及各直接子目录的大小，children 为 {名称: {total_size, file_count}}"""
+        pass
+
+    @abstractmethod
+    def search_files(self, mode: str, rel_path: str, pattern: str, kind: Optional[str] = None,
+                     limit: int = DEFAULT_FIND_LIMIT) -> Dict[str, Any]:
+        """
+        在目录树中按文件名通配符（不区分大小写）查找，kind 为 file/dir 时只返回该类型；
+        entries 为 [{path, name, type, size, mtime}]，超过 limit 条时 truncated 为 True
+        """
+        pass
+
     @abstractmethod
     def get_default_dir(self, mode: str) -> Dict[str, Any]:
         """获取默认目录"""
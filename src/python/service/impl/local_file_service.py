@@ -1,13 +1,24 @@
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from utils.archive_stream import (
+    ARCHIVE_FORMATS, ARCHIVE_MIMETYPES, ArchiveStream, archive_filename, build_archive, iter_local_entries,
+    select_roots, zstd_available,
+)
+from utils.bulk_delete import delete_local
+from utils.file_copy import copy_local, move_local
+from utils.file_search import DEFAULT_FIND_LIMIT, SEARCH_KINDS, find, search_result
+from utils.job_registry import Job, JobCancelled
 from utils.log_util import default_logger as logger
+from utils.tar_stream import safe_member_name
 from ..file_service import FileService
-import json
 import os
 from pathlib import Path
-from utils.constants import PROJECT_ROOT
+from utils.config_store import ConfigStore, default_config_store
 
 class LocalFileService(FileService):
+    def __init__(self, config_store: Optional[ConfigStore] = None):
+        self.config_store = config_store or default_config_store
+
     def list_dir(self, mode: str, rel_path: str = "") -> Dict[str, Any]:
         logger.info(f"[LocalFileService] list_dir: mode={mode}, rel_path={rel_path}")
         abs_path = (
@@ -78,6 +89,29 @@ class LocalFileService(FileService):
             return None
         return abs_path
 
+    def open_archive_stream(self, mode: str, rel_path: str, names: Optional[List[str]], fmt: str) -> Dict[str, Any]:
+        """边读边压缩打包本地目录或选中的文件，不生成中间压缩包"""
+        logger.info(f"[LocalFileService] open_archive_stream: mode={mode}, rel_path={rel_path}, names={names}, fmt={fmt}")
+        if fmt not in ARCHIVE_FORMATS:
+            return {"success": False, "error": f"不支持的压缩格式: {fmt}"}
+        if fmt == "tar.zst" and not zstd_available():
+            return {"success": False, "error": "本机未安装 zstd，无法生成 tar.zst"}
+        base = (
+            os.path.abspath(rel_path)
+            if os.path.isabs(rel_path)
+            else os.path.abspath(os.path.join("/", rel_path))
+        )
+        try:
+            archive_base, roots = select_roots(base, names)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        missing = [path for _, path in roots if not os.path.exists(path)]
+        if missing:
+            return {"success": False, "error": f"文件不存在: {missing[0]}"}
+        chunks = build_archive(iter_local_entries(roots), fmt)
+        stream = ArchiveStream(chunks, archive_filename(archive_base, fmt), ARCHIVE_MIMETYPES[fmt])
+        return {"success": True, "stream": stream}
+
     def upload_file(self, mode: str, rel_path: str, file_obj) -> Dict[str, Any]:
         logger.info(f"[LocalFileService] upload_file: mode={mode}, rel_path={rel_path}")
         # rel_path is the directory path, we need to combine it with the filename
@@ -106,20 +140,137 @@ class LocalFileService(FileService):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def delete_file(self, mode: str, rel_path: str) -> Dict[str, Any]:
-        logger.info(f"[LocalFileService] delete_file: mode={mode}, rel_path={rel_path}")
-        abs_path = (
+    def upload_batch(self, mode: str, rel_path: str, files: Iterable[Tuple[str, Iterable[bytes]]]) -> Dict[str, Any]:
+        """逐个写入多个文件，单个文件失败不影响其余文件"""
+        logger.info(f"[LocalFileService] upload_batch: mode={mode}, rel_path={rel_path}")
+        directory_path = (
             os.path.abspath(rel_path)
             if os.path.isabs(rel_path)
             else os.path.abspath(os.path.join("/", rel_path))
         )
+        results = []
+        for filename, chunks in files:
+            try:
+                abs_path = os.path.join(directory_path, safe_member_name(filename).replace('/', os.sep))
+                os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+                size = 0
+                with open(abs_path, "wb") as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                        size += len(chunk)
+                results.append({"name": filename, "success": True, "path": abs_path, "size": size})
+            except Exception as e:
+                logger.warning(f"[LocalFileService] upload_batch file failed: name={filename} error={e}")
+                results.append({"name": filename, "success": False, "error": str(e)})
+        failed = sum(1 for result in results if not result["success"])
+        logger.info(f"[LocalFileService] upload_batch done: files={len(results)} failed={failed}")
+        return {"success": failed == 0, "files": len(results), "failed": failed, "results": results}
+
+    def prepare_chunked_upload(self, mode: str, rel_path: str, filename: str, upload_id: str) -> Dict[str, Any]:
+        """在目标目录创建分块上传的临时文件，分块写完提交时再重命名为目标文件"""
+        logger.info(f"[LocalFileService] prepare_chunked_upload: mode={mode}, rel_path={rel_path}, filename={filename}")
+        directory_path = (
+            os.path.abspath(rel_path)
+            if os.path.isabs(rel_path)
+            else os.path.abspath(os.path.join("/", rel_path))
+        )
+        if not filename:
+            return {"success": False, "error": "文件名为空"}
+        filename = filename.replace('/', os.sep).replace('\\', os.sep)
+        abs_path = os.path.join(directory_path, filename)
+        temp_path = os.path.join(os.path.dirname(abs_path), f".{os.path.basename(abs_path)}.{upload_id}.part")
         try:
-            if os.path.isdir(abs_path):
-                os.rmdir(abs_path)
-            else:
-                os.remove(abs_path)
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+            open(temp_path, "wb").close()
+            return {"success": True, "path": abs_path, "temp_path": temp_path}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def write_upload_chunk(self, mode: str, temp_path: str, offset: int, chunks: Iterable[bytes]) -> Dict[str, Any]:
+        """把一个分块写到临时文件的 offset 处，pwrite 保证并发写入不同分块互不干扰"""
+        written = 0
+        try:
+            fd = os.open(temp_path, os.O_WRONLY)
+            try:
+                for chunk in chunks:
+                    view = memoryview(chunk)
+                    while view:
+                        n = os.pwrite(fd, view, offset + written)
+                        view = view[n:]
+                        written += n
+            finally:
+                os.close(fd)
+            return {"success": True, "bytes": written}
+        except Exception as e:
+            logger.error(f"[LocalFileService] write_upload_chunk error: path={temp_path} offset={offset} error={e}")
+            return {"success": False, "error": str(e)}
+
+    def commit_chunked_upload(self, mode: str, temp_path: str, path: str) -> Dict[str, Any]:
+        """所有分块写完后把临时文件原子地重命名为目标文件"""
+        logger.info(f"[LocalFileService] commit_chunked_upload: temp_path={temp_path}, path={path}")
+        try:
+            os.replace(temp_path, path)
+            return {"success": True, "path": path}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def abort_chunked_upload(self, mode: str, temp_path: str) -> Dict[str, Any]:
+        """放弃分块上传，删除临时文件"""
+        logger.info(f"[LocalFileService] abort_chunked_upload: temp_path={temp_path}")
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True}
+
+    def delete_file(self, mode: str, rel_path: str) -> Dict[str, Any]:
+        logger.info(f"[LocalFileService] delete_file: mode={mode}, rel_path={rel_path}")
+        result = self.delete_paths(mode, [rel_path])
+        if result["success"]:
             return {"success": True}
+        return {"success": False, "error": result["error"]}
+
+    def delete_paths(self, mode: str, rel_paths: List[str], job: Optional[Job] = None,
+                     method: str = "auto") -> Dict[str, Any]:
+        """递归删除多个文件或目录，文件在线程池中并发删除；method 只对远程有意义"""
+        logger.info(f"[LocalFileService] delete_paths: count={len(rel_paths)} paths={rel_paths[:10]}")
+        abs_paths = [
+            os.path.abspath(rel_path)
+            if os.path.isabs(rel_path)
+            else os.path.abspath(os.path.join("/", rel_path))
+            for rel_path in rel_paths
+        ]
+        try:
+            return delete_local(abs_paths, job)
+        except JobCancelled:
+            raise
         except Exception as e:
+            logger.error(f"[LocalFileService] delete_paths error: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def copy_path(self, mode: str, src_path: str, dst_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """复制文件或目录树，文件内容由 copy_file_range/sendfile 在内核中复制"""
+        logger.info(f"[LocalFileService] copy_path: {src_path} -> {dst_path}")
+        return self._copy_or_move(copy_local, src_path, dst_path, job)
+
+    def move_path(self, mode: str, src_path: str, dst_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """移动文件或目录树，同一文件系统内只是 rename"""
+        logger.info(f"[LocalFileService] move_path: {src_path} -> {dst_path}")
+        return self._copy_or_move(move_local, src_path, dst_path, job)
+
+    def _copy_or_move(self, func, src_path: str, dst_path: str, job: Optional[Job]) -> Dict[str, Any]:
+        src, dst = [
+            os.path.abspath(path) if os.path.isabs(path) else os.path.abspath(os.path.join("/", path))
+            for path in (src_path, dst_path)
+        ]
+        try:
+            return func(src, dst, job)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"[LocalFileService] {func.__name__} error: {src} -> {dst} error={e}")
             return {"success": False, "error": str(e)}
 
     def calculate_folder_size(self, mode: str, rel_path: str) -> Dict[str, Any]:
@@ -158,12 +309,92 @@ class LocalFileService(FileService):
             logger.error(f"[LocalFileService] calculate_folder_size error: {str(e)}")
             return {"success": False, "error": str(e)}
 
+    def calculate_child_sizes(self, mode: str, rel_path: str) -> Dict[str, Any]:
+        """一次遍历算出目录总大小及每个直接子目录的大小和文件数"""
+        logger.info(f"[LocalFileService] calculate_child_sizes: mode={mode}, rel_path={rel_path}")
+        abs_path = (
+            os.path.abspath(rel_path)
+            if os.path.isabs(rel_path)
+            else os.path.abspath(os.path.join("/", rel_path))
+        )
+        if not os.path.isdir(abs_path):
+            return {"success": False, "error": "所选路径不是文件夹"}
+
+        total_size = 0
+        file_count = 0
+        children: Dict[str, Dict[str, int]] = {}
+        links: List[str] = []
+        try:
+            for dirpath, dirnames, filenames in os.walk(abs_path):
+                rel_dir = os.path.relpath(dirpath, abs_path)
+                child = None
+                if rel_dir != ".":
+                    child = children.setdefault(rel_dir.split(os.sep, 1)[0], {"total_size": 0, "file_count": 0})
+                else:
+                    # os.walk 不进入指向目录的符号链接，这些子项单独跟随统计
+                    links = [name for name in dirnames if os.path.islink(os.path.join(dirpath, name))]
+                for filename in filenames:
+                    try:
+                        size = os.path.getsize(os.path.join(dirpath, filename))
+                    except OSError:
+                        continue
+                    total_size += size
+                    file_count += 1
+                    if child is not None:
+                        child["total_size"] += size
+                        child["file_count"] += 1
+            # 与远程一致：链接目录有自己的大小，但不计入当前目录的总数
+            for name in links:
+                children[name] = self._walk_files(os.path.join(abs_path, name))
+            return {
+                "success": True,
+                "total_size": total_size,
+                "file_count": file_count,
+                "children": children,
+                "path": abs_path,
+                "is_complete": True
+            }
+        except Exception as e:
+            logger.error(f"[LocalFileService] calculate_child_sizes error: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def _walk_files(path: str) -> Dict[str, int]:
+        """目录下（path 本身可以是符号链接）所有文件的总大小和个数"""
+        total_size = 0
+        file_count = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total_size += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                file_count += 1
+        return {"total_size": total_size, "file_count": file_count}
+
+    def search_files(self, mode: str, rel_path: str, pattern: str, kind: Optional[str] = None,
+                     limit: int = DEFAULT_FIND_LIMIT) -> Dict[str, Any]:
+        logger.info(f"[LocalFileService] search_files: rel_path={rel_path} pattern={pattern} kind={kind}")
+        abs_path = (
+            os.path.abspath(rel_path)
+            if os.path.isabs(rel_path)
+            else os.path.abspath(os.path.join("/", rel_path))
+        )
+        if kind not in SEARCH_KINDS:
+            return {"success": False, "error": f"未知的类型: {kind}"}
+        if not os.path.isdir(abs_path):
+            return {"success": False, "error": "所选路径不是文件夹"}
+        try:
+            found = find(abs_path, pattern, SEARCH_KINDS[kind], limit)
+            return search_result(abs_path, found, os.path.join)
+        except Exception as e:
+            logger.error(f"[LocalFileService] search_files error: {str(e)}")
+            return {"success": False, "error": str(e)}
+
     def get_default_dir(self, mode: str) -> Dict[str, Any]:
         logger.info(f"[LocalFileService] get_default_dir: mode={mode}")
         # 读取配置文件中的默认目录
-        config_path = PROJECT_ROOT / "config.json"
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+        config = self.config_store.get()
         
         # 获取配置值，默认为"~"
         default_dir = config.get("local_default_dir", "~")
@@ -1,90 +1,388 @@
+import fnmatch
+import hashlib
+import io
 import os
-import json
+import posixpath
+import shlex
+import shutil
 import stat
 import tempfile
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from functools import partial
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import paramiko
-from utils.constants import CONFIG_FILE
+from utils import delta_sync, file_search, remote_agent
+from utils.archive_stream import (
+    ARCHIVE_FORMATS, ARCHIVE_MIMETYPES, ArchiveEntry, ArchiveStream, archive_filename, build_archive,
+    compress_tar, select_roots, zstd_available,
+)
+from utils.bulk_delete import DELETE_METHODS, delete_remote
+from utils.config_store import ConfigStore, default_config_store
+from utils.dir_sync import (
+    DEFAULT_MANIFEST_CACHE_DIR, DEFAULT_SYNC_WORKERS, OP_COPY, OP_DELETE, OP_MKDIR, OP_RMDIR,
+    REMOTE_HASH_COMMAND, REMOTE_MANIFEST_COMMAND, SYNC_DIRECTIONS, Manifest, ManifestCache,
+    diff_manifests, execute_plan, hash_candidates, hash_local_file, join_rel, parse_remote_hashes,
+    parse_remote_manifest, scan_local, scan_remote_sftp,
+)
+from utils.download_cache import CacheFill, CachedFileStream, DownloadCache, cleanup_temp_files
+from utils.fan_out import DEFAULT_FAN_OUT_TIMEOUT, fan_out
+from utils.file_copy import copy_remote, move_remote
+from utils.file_search import DEFAULT_FIND_LIMIT, SEARCH_KINDS, search_result
+from utils.health_monitor import HealthMonitor
 from utils.log_util import default_logger as logger
+from utils.multipart_stream import iter_file_chunks
+from utils.remote_agent import RemoteAgent, RemoteAgentError
+from utils.remote_listing import (
+    LIST_BACKENDS, LIST_DIR_COMMAND, LIST_READ_SIZE, ListingEntry, ListingPlanner, parse_listing, stat_many,
+)
+from utils.job_registry import Job, JobCancelled
+from utils.server_transfer import direct_push, relay_tree
+from utils.ssh_pool import SSHConnectionPool, open_ssh_client
+from utils.ssh_tuning import BENCH_COMMANDS, BENCH_READ_SIZE, BENCH_SIZE, TUNING_PROFILES, normalize_tuning, pick_best
+from utils.tar_stream import TarMember, coalesce, iter_tar, safe_member_name
+from utils.transfer_engine import (
+    DEFAULT_RESUME_ATTEMPTS, PARALLEL_THRESHOLD, SFTPTransferEngine, format_rate, is_connection_lost, resume_delay,
+)
 from ..file_service import FileService
 
+# 流式下载每次读取的块大小，以及预取时同时在途的 SFTP 读请求数
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_PREFETCH_REQUESTS = 64
+# download_file 生成的本地临时文件前缀
+DOWNLOAD_TMP_PREFIX = "downloadtool_"
+
+# 目录条目超过该数量时日志只记录条目数
+LIST_LOG_ENTRIES = 200
+
+# 可在多台服务器上并发执行的只读操作
+FAN_OUT_OPERATIONS = ("list_dir", "calculate_folder_size", "calculate_child_sizes")
+
+# 服务器间传输方式：relay 经本进程中转，direct 在源主机上 rsync 推送，auto 先试 direct 失败再 relay
+TRANSFER_METHODS = ("relay", "direct", "auto")
+
+# 增量传输方向：upload 本地新文件 -> 远程旧文件，download 远程新文件 -> 本地旧文件
+DELTA_DIRECTIONS = ("upload", "download")
+# 辅助脚本（增量传输、远程辅助进程）在远程主机上的存放目录（相对用户主目录），文件名带内容摘要，升级后自动换新
+HELPER_DIR = ".cache/downloadtool"
+REMOTE_PYTHON_CHECK = "python3 -c 'import hashlib; hashlib.blake2b'"
+# 目录同步中不小于该大小的已修改文件走增量传输
+SYNC_DELTA_THRESHOLD = 16 * 1024 * 1024
+
+# 文件夹上传的 tar 快速通道：一次 exec 在目标目录下解包 stdin 中的 tar 流
+TAR_EXTRACT_COMMAND = "mkdir -p -- {path} && tar -x -f - -C {path} --no-same-owner"
+# 远程 tar 报错输出最多保留的字节数
+TAR_STDERR_LIMIT = 64 * 1024
+# 打包下载：远程 tar 的输出直接作为压缩包（或经远程压缩命令），tar 的退出码以标记行写到 stderr
+TAR_EXIT_MARKER = "@@downloadtool-tar-exit:"
+TAR_CREATE_COMMAND = "{{ tar -c -f - -C {path} -- {members}; echo \"{marker}$?\" >&2; }}{compress}"
+REMOTE_COMPRESS_COMMANDS = {"tar.gz": "gzip -c", "tar.zst": "zstd -q -c -T0"}
+ARCHIVE_TOOLS_CHECK = "for t in tar gzip zstd; do command -v $t >/dev/null 2>&1 && echo $t; done"
+
+# 当前请求所选服务器的名称：每个请求（线程/协程）各自独立，互不覆盖
+_current_server_name: ContextVar[Optional[str]] = ContextVar("downloadtool_current_server", default=None)
+
+# 批量计算子目录大小：du 每个子项一行 "字节数\t./名称"，分隔行之后是 awk 聚合的 "文件数\t名称"，
+# "." 表示目录自身
+CHILD_SIZES_MARKER = "@@downloadtool-file-counts@@"
+CHILD_SIZES_COMMAND = (
+    "cd -- {path} && {{ du -b --max-depth=1 . ; echo {marker} ; "
+    "find . -mindepth 1 -type f | awk -F/ '{{c[$2]++; t++}} "
+    "END {{for (k in c) printf \"%d\\t%s\\n\", c[k], k; printf \"%d\\t.\\n\", t}}' ; "
+    "echo {marker} ; find . -mindepth 1 -maxdepth 1 -type l -xtype d -exec sh -c {link_script} sh {{}} + ; }}"
+)
+# 指向目录的符号链接不在 du/find 的统计中，单独跟随链接统计，每个链接一行 "字节数\t文件数\t名称"
+CHILD_SIZES_LINK_SCRIPT = (
+    'for l; do printf "%s\\t%s\\t%s\\n" "$(du -sbL -- "$l" | cut -f1)" '
+    '"$(find -L "$l" -type f | wc -l)" "${l#./}"; done'
+)
+
+class RemoteFileStream:
+    """
+    远程文件的流式读取器，可直接作为 Flask Response 的响应体
+
+    持有一条池化连接直到读完或被 close()，WSGI 服务器在响应结束（包括客户端中途断开）时
+    会调用 close()，保证连接归还连接池。
+
+    提供 ssh_info 时，读取中途连接断开会退避重连，确认远程文件大小和修改时间未变后
+    从已发送的位置继续读，客户端看到的仍是一个完整的响应。
+
+    提供 download_cache 时，完整的 200 响应（未设置 Range）边发送边写入缓存，不额外等待；
+    同一文件已有请求在写缓存时先跟随读取它写出的数据，跟随中断后从已发送的位置改读远程。
+    304、416 和 Range 请求在迭代前就已决定，不会写缓存。
+    """
+
+    def __init__(self, pool, conn, remote_file, path: str, size: int, mtime: int,
+                 chunk_size: int = DOWNLOAD_CHUNK_SIZE, ssh_info: Optional[Dict[str, Any]] = None,
+                 resume_attempts: int = DEFAULT_RESUME_ATTEMPTS, download_cache: Optional[DownloadCache] = None,
+                 cache_key: Any = None):
+        self.pool = pool
+        self.conn = conn
+        self.remote_file = remote_file
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.chunk_size = chunk_size
+        self.ssh_info = ssh_info
+        self.resume_attempts = resume_attempts
+        self.resumes = 0
+        self.download_cache = download_cache
+        self.cache_key = cache_key
+        self.start = 0
+        self.end = size
+        self._closed = False
+
+    @property
+    def length(self) -> int:
+        """本次响应实际发送的字节数"""
+        return self.end - self.start
+
+    def set_range(self, start: int, end: int):
+        """只发送 [start, end) 区间，用于 HTTP Range 请求"""
+        self.start = max(0, start)
+        self.end = min(end, self.size)
+
+    def __iter__(self):
+        fill = None
+        try:
+            position = self.start
+            if position >= self.end:
+                return
+            if self.download_cache is not None and (self.start, self.end) == (0, self.size):
+                for data in self.download_cache.follow(self.cache_key, self.path, self.size, self.mtime,
+                                                       self.chunk_size):
+                    position += len(data)
+                    yield data
+                if position >= self.end:
+                    return
+                if position == 0:
+                    fill = self._begin_fill()
+            self._seek(position)
+            attempt = 0
+            while position < self.end:
+                try:
+                    data = self.remote_file.read(min(self.chunk_size, self.end - position))
+                except Exception as e:
+                    if self.ssh_info is None or attempt >= self.resume_attempts or not is_connection_lost(e, self.conn):
+                        raise
+                    attempt = self._resume(position, attempt, e)
+                    continue
+                if not data:
+                    break
+                position += len(data)
+                attempt = 0
+                if fill is not None:
+                    fill = self._write_fill(fill, data)
+                yield data
+            if fill is not None and position == self.size:
+                try:
+                    fill.commit()
+                    fill = None
+                except Exception as e:
+                    logger.warning(f"[RemoteFileStream] download cache commit failed: path={self.path} error={e}")
+        finally:
+            # 客户端中途断开、读取失败或没有读满时丢弃写了一半的缓存
+            if fill is not None:
+                fill.abort()
+            self.close()
+
+    def _begin_fill(self) -> Optional[CacheFill]:
+        try:
+            return self.download_cache.begin_fill(self.cache_key, self.path, self.size, self.mtime)
+        except Exception as e:
+            logger.warning(f"[RemoteFileStream] download cache unavailable: path={self.path} error={e}")
+            return None
+
+    def _write_fill(self, fill: CacheFill, data: bytes) -> Optional[CacheFill]:
+        """写入缓存；失败（本地磁盘满等）时放弃缓存，不影响发给客户端的数据"""
+        try:
+            fill.write(data)
+            return fill
+        except Exception as e:
+            logger.warning(f"[RemoteFileStream] download cache write failed: path={self.path} error={e}")
+            fill.abort()
+            return None
+
+    def _seek(self, position: int):
+        self.remote_file.seek(position)
+        # 后台预取：保持多个读请求在途，读取速度不再受单次往返延迟限制；
+        # prefetch 从当前位置开始，只预取请求的区间
+        self.remote_file.prefetch(self.end, max_concurrent_requests=DOWNLOAD_PREFETCH_REQUESTS)
+
+    def _resume(self, position: int, attempt: int, error: Exception) -> int:
+        """换一条连接重新打开文件并定位到 position，返回已用的重试次数"""
+        while True:
+            attempt += 1
+            self.resumes += 1
+            delay = resume_delay(attempt)
+            logger.warning(f"[RemoteFileStream] read interrupted: path={self.path} offset={position} "
+                           f"error={error} attempt={attempt}/{self.resume_attempts} retry_in={delay:.1f}s")
+            try:
+                self.remote_file.close()
+            except Exception:
+                pass
+            if self.conn is not None:
+                self.conn.broken = True
+                self.pool.release(self.conn)
+                self.conn = None
+            time.sleep(delay)
+            try:
+                self.conn = self.pool.acquire(self.ssh_info)
+                attrs = self.conn.sftp.stat(self.path)
+                if attrs.st_size != self.size or attrs.st_mtime != self.mtime:
+                    raise IOError(f"远程文件在下载过程中被修改，无法续传: {self.path}")
+                self.remote_file = self.conn.sftp.open(self.path, "rb")
+                self._seek(position)
+                logger.info(f"[RemoteFileStream] resumed: path={self.path} offset={position}")
+                return attempt
+            except Exception as e:
+                # 新连接建不起来（conn 为 None）同样继续退避重试
+                if attempt >= self.resume_attempts or (self.conn is not None and not is_connection_lost(e, self.conn)):
+                    raise
+                error = e
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.remote_file.close()
+        except Exception as e:
+            logger.warning(f"[RemoteFileStream] close remote file failed: path={self.path} error={e}")
+        if self.conn is not None:
+            self.pool.release(self.conn)
+            self.conn = None
+
 class RemoteFileService(FileService):
-    def __init__(self):
-        self.current_server = None  # Track the currently connected server
+    def __init__(self, pool: Optional[SSHConnectionPool] = None, config_store: Optional[ConfigStore] = None,
+                 list_backend: str = "auto", use_agent: bool = True, download_cache: Optional[DownloadCache] = None):
+        if list_backend not in LIST_BACKENDS:
+            raise ValueError(f"未知的目录列表方式: {list_backend}")
+        self.pool = pool or SSHConnectionPool()
+        # 目录列表方式：auto 按目录大小和往返时间在 sftp 与 exec 之间自动选择
+        self.list_backend = list_backend
+        self.listing_planner = ListingPlanner()
+        self.config_store = config_store or default_config_store
+        # 健康监测由 app 启动时 start()，未启动时不探测也不拦截连接
+        self.health_monitor = HealthMonitor(self.config_store, self.pool)
+        self.pool.health_gate = self.health_monitor.unavailable_reason
+        self.transfer_engine = SFTPTransferEngine(self.pool, on_done=self.health_monitor.record_transfer)
+        # 远程有 python3 时，列表、目录大小、摘要和查找交给常驻的远程辅助进程（utils/remote_agent.py）
+        self.use_agent = use_agent
+        # server_key -> 远程是否有可用的 python3
+        self._remote_python: Dict[Any, bool] = {}
+        # (server_key, 模块名) -> 远程辅助脚本路径
+        self._helpers: Dict[Tuple[Any, str], str] = {}
+        self._archive_tool_cache: Dict[Any, Set[str]] = {}
+        # 不支持 SFTP copy-data 扩展的服务器，复制文件直接在远程执行 cp
+        self._no_copy_data: Set[Any] = set()
+        # 远程文件下载缓存，按服务器 + 路径索引，远程大小和修改时间变化即失效
+        self.download_cache = download_cache or DownloadCache()
+
+    @property
+    def current_server_name(self) -> Optional[str]:
+        return _current_server_name.get()
+
+    @property
+    def current_server(self) -> Optional[Dict[str, Any]]:
+        """当前请求所选的服务器配置，未选择时为 None"""
+        name = _current_server_name.get()
+        return self.config_store.get_server(server_name=name) if name else None
+
+    @current_server.setter
+    def current_server(self, remote: Optional[Dict[str, Any]]):
+        _current_server_name.set(remote.get("server_name") if remote else None)
+
+    def select_server(self, server_name: Optional[str]) -> Token:
+        """为当前请求选择服务器，返回的 token 交给 reset_server 恢复"""
+        return _current_server_name.set(server_name or None)
+
+    def reset_server(self, token: Token):
+        _current_server_name.reset(token)
+
+    @contextmanager
+    def server_scope(self, server_name: Optional[str]):
+        """在代码块内临时使用指定服务器"""
+        token = self.select_server(server_name)
+        try:
+            yield
+        finally:
+            self.reset_server(token)
+
+    def _get_remote(self, caller: str) -> Dict[str, Any]:
+        """获取当前请求所选的服务器配置，未选择时使用第一个"""
+        name = _current_server_name.get()
+        if name:
+            # 每次从配置索引取，保证拿到的是最新保存的配置
+            remote = self.config_store.get_server(server_name=name)
+            if remote is None:
+                raise ValueError(f"服务器不存在: {name}")
+            logger.info(f"[RemoteFileService] {caller} using current server: {name}")
+        else:
+            remote = self.config_store.get_remote_servers()[0]
+            logger.info(f"[RemoteFileService] {caller} using first server: {remote.get('server_name')}")
+        return remote
+
+    @staticmethod
+    def _resolve_path(sftp, path: str) -> str:
+        """展开 ~ 并保证为绝对路径"""
+        if path == "~" or path.startswith("~/"):
+            home = sftp.normalize(".")
+            if path == "~":
+                path = home
+            else:
+                path = home + path[1:]
+        if not path.startswith("/"):
+            path = "/" + path
+        return path
+
     def list_dir(self, mode: str, rel_path: str = "") -> Dict[str, Any]:
         logger.info(f"[RemoteFileService] list_dir: mode={mode}, rel_path={rel_path}")
+        host = username = None
+        path = rel_path
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # Use the current server if available, otherwise use the first one
-            if self.current_server:
-                remote = self.current_server
-                logger.info(f"[RemoteFileService] Using current server: {remote.get('server_name')}")
-            else:
-                remote = config["remote_server_list"][0]
-                logger.info(f"[RemoteFileService] Using first server: {remote.get('server_name')}")
-            
+            remote = self._get_remote("list_dir")
             ssh_info = remote["config"]
             host = ssh_info["host_ip"]
-            port = ssh_info.get("ssh_port", 22)
             username = ssh_info["user_name"]
-            password = ssh_info.get("user_pwd", "")
             default_dir = ssh_info.get("default_dir", "~")
             path = rel_path or default_dir
 
-            if password:
-                transport = paramiko.Transport((host, port))
-                transport.connect(username=username, password=password)
-                sftp = paramiko.SFTPClient.from_transport(transport)
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(host, port=port, username=username, password=password)
-            else:
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(
-                    host,
-                    port=port,
-                    username=username,
-                    allow_agent=True,
-                    look_for_keys=True,
-                )
-                sftp = ssh.open_sftp()
-            if path == "~" or path.startswith("~/"):
-                home = sftp.normalize(".")
-                if path == "~":
-                    path = home
-                else:
-                    path = home + path[1:]
-            if not path.startswith("/"):
-                path = "/" + path
+            def _list(conn):
+                sftp = conn.sftp
+                resolved = self._resolve_path(sftp, path)
+                return (resolved,) + self._list_entries(conn, resolved)
+
+            path, backend, entries = self.pool.run(ssh_info, _list)
             files = []
             dirs = []
             
             total_size = 0
             file_count = 0
             
-            for entry in sftp.listdir_attr(path):
-                if stat.S_ISDIR(entry.st_mode):
+            for name, kind, size, mtime in entries:
+                if kind == "d":
                     dirs.append(
                         {
-                            "name": entry.filename,
+                            "name": name,
                             "type": "dir",
                             "size": None,  # 不计算目录大小，显示为未知
-                            "mtime": entry.st_mtime,
+                            "mtime": mtime,
                         }
                     )
                 else:
                     files.append(
                         {
-                            "name": entry.filename,
+                            "name": name,
                             "type": "file",
-                            "size": entry.st_size,
-                            "mtime": entry.st_mtime,
+                            "size": size,
+                            "mtime": mtime,
                         }
                     )
-                    total_size += entry.st_size
+                    total_size += size
                     file_count += 1
                     
             # 只统计当前目录中的文件大小总和，不包含子目录
@@ -94,12 +392,13 @@ class RemoteFileService(FileService):
                 "is_complete": False  # 标记未完全计算
             }
             
-            sftp.close()
-            ssh.close()
-            if password:
-                transport.close()
-            
-            logger.info(f"[RemoteFileService] list_dir result: dirs={dirs}, files={files}, path={path}")
+            if len(entries) > LIST_LOG_ENTRIES:
+                logger.info(
+                    f"[RemoteFileService] list_dir result: dirs={len(dirs)}, files={len(files)}, "
+                    f"path={path}, backend={backend}"
+                )
+            else:
+                logger.info(f"[RemoteFileService] list_dir result: dirs={dirs}, files={files}, path={path}, backend={backend}")
             return {"dirs": dirs, "files": files, "path": path, "dir_info": current_dir_info}
         except Exception as e:
             logger.error(
@@ -107,11 +406,80 @@ class RemoteFileService(FileService):
             )
             return {"error": str(e)}
     
+    def _list_entries(self, conn, path: str) -> Tuple[str, List[ListingEntry]]:
+        """
+        列出目录条目，返回 (实际使用的方式, [(名称, 类型字符, 大小, 修改时间)])
+
+        list_backend 为 agent 时优先用远程辅助进程，一次往返拿到全部条目；
+        auto 先 stat 目录，估算条目数不大时同样交给辅助进程，否则或辅助进程不可用时
+        用 stat 的耗时和目录大小交给 ListingPlanner 选择 exec 或 sftp；
+        exec 失败时退回 sftp，确认是远程 find 不支持 -printf 时该服务器以后不再尝试 exec。
+        """
+        sftp = conn.sftp
+        backend = self.list_backend
+        use_agent = backend == "agent"
+        if backend == "auto":
+            started = time.monotonic()
+            dir_size = sftp.stat(path).st_size or 0
+            rtt = time.monotonic() - started
+            use_agent = self.listing_planner.prefer_agent(conn.key, path, dir_size)
+        if use_agent:
+            entries = self._agent_call(conn, "list", path=path)
+            if entries is not None:
+                self.listing_planner.record(conn.key, path, len(entries))
+                return "agent", [tuple(entry) for entry in entries]
+        if backend == "auto":
+            backend = self.listing_planner.choose(conn.key, path, dir_size, rtt)
+        if backend == "exec":
+            entries = self._list_entries_exec(conn, path)
+            if entries is not None:
+                self.listing_planner.record(conn.key, path, len(entries))
+                return "exec", entries
+        attrs = sftp.listdir_attr(path)
+        # listdir_attr 返回的是 lstat 结果：符号链接的目标一次性流水线 stat，失效的链接保持为 l
+        links = [attr for attr in attrs if stat.S_ISLNK(attr.st_mode)]
+        targets = stat_many(sftp, [f"{path.rstrip('/')}/{attr.filename}" for attr in links])
+        resolved = {id(link): target for link, target in zip(links, targets) if target is not None}
+        entries = []
+        for attr in attrs:
+            info = resolved.get(id(attr), attr)
+            if stat.S_ISDIR(info.st_mode):
+                kind = "d"
+            elif stat.S_ISLNK(info.st_mode):
+                kind = "l"
+            else:
+                kind = "f"
+            entries.append((attr.filename, kind, info.st_size, info.st_mtime))
+        self.listing_planner.record(conn.key, path, len(entries))
+        return "sftp", entries
+
+    def _list_entries_exec(self, conn, path: str) -> Optional[List[ListingEntry]]:
+        """经一次 exec 运行 find 列出目录，输出边接收边解析；失败时返回 None"""
+        stdin, stdout, stderr = conn.exec_command(LIST_DIR_COMMAND.format(path=shlex.quote(path)))
+        channel = stdout.channel
+        drainer, errors = self._drain_stderr(stderr)
+        try:
+            channel.shutdown_write()
+            entries = list(parse_listing(iter(lambda: stdout.read(LIST_READ_SIZE), b"")))
+            status = channel.recv_exit_status()
+            drainer.join()
+        finally:
+            channel.close()
+        if status == 0:
+            return entries
+        error = errors.decode("utf-8", errors="replace").strip()
+        if status == 127 or "printf" in error:
+            logger.warning(f"[RemoteFileService] find -printf unsupported on {conn.key}, using sftp listing: {error}")
+            self.listing_planner.mark_exec_unsupported(conn.key)
+        else:
+            logger.warning(f"[RemoteFileService] exec listing failed (exit {status}), using sftp: path={path} error={error}")
+        return None
+
     def _get_remote_dir_size(self, ssh, dir_path: str) -> int:
         """计算远程目录大小"""
         try:
             # 使用du命令计算目录大小
-            du_command = f'du -sb "{dir_path}" 2>/dev/null || echo 0'
+            du_command = f'du -sb {shlex.quote(dir_path)} 2>/dev/null || echo 0'
             stdin, stdout, stderr = ssh.exec_command(du_command)
             du_output = stdout.read().decode('utf-8').strip()
             if du_output and du_output != "0":
@@ -125,86 +493,174 @@ class RemoteFileService(FileService):
 
     def download_file(self, mode: str, rel_path: str) -> Optional[str]:
         logger.info(f"[RemoteFileService] download_file: mode={mode}, rel_path={rel_path}")
+        host = username = None
+        path = rel_path
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # Use the current server if available, otherwise use the first one
-            if self.current_server:
-                remote = self.current_server
-                logger.info(f"[RemoteFileService] download_file using current server: {remote.get('server_name')}")
-            else:
-                remote = config["remote_server_list"][0]
-                logger.info(f"[RemoteFileService] download_file using first server: {remote.get('server_name')}")
-            
+            remote = self._get_remote("download_file")
             ssh_info = remote["config"]
             host = ssh_info["host_ip"]
-            port = ssh_info.get("ssh_port", 22)
             username = ssh_info["user_name"]
-            password = ssh_info.get("user_pwd", "")
-            path = rel_path
 
-            if password:
-                transport = paramiko.Transport((host, port))
-                transport.connect(username=username, password=password)
-                sftp = paramiko.SFTPClient.from_transport(transport)
-            else:
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(
-                    host,
-                    port=port,
-                    username=username,
-                    allow_agent=True,
-                    look_for_keys=True,
-                )
-                sftp = ssh.open_sftp()
-            if path == "~" or path.startswith("~/"):
-                home = sftp.normalize(".")
-                if path == "~":
-                    path = home
-                else:
-                    path = home + path[1:]
-            if not path.startswith("/"):
-                path = "/" + path
-            tmp_file = tempfile.NamedTemporaryFile(delete=False)
-            sftp.get(path, tmp_file.name)
-            sftp.close()
-            if not password:
-                ssh.close()
-            else:
-                transport.close()
-            logger.info(f"[RemoteFileService] download_file success: tmp_file={tmp_file.name}")
-            return tmp_file.name
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                path = self._resolve_path(sftp, path)
+                attrs = sftp.stat(path)
+                cached = self._lookup_cached(conn, path, attrs)
+                fd, tmp_name = tempfile.mkstemp(prefix=DOWNLOAD_TMP_PREFIX)
+                os.close(fd)
+                try:
+                    # 返回的临时文件归调用方所有；缓存命中时从缓存复制一份，不把缓存文件本身交出去
+                    if cached is not None:
+                        with cached, open(tmp_name, "wb") as out:
+                            shutil.copyfileobj(cached, out)
+                        logger.info(f"[RemoteFileService] download_file from cache: path={path} tmp_file={tmp_name}")
+                        return tmp_name
+                    stats = self.transfer_engine.download(ssh_info, conn, path, tmp_name,
+                                                          size=attrs.st_size, mtime=attrs.st_mtime)
+                except Exception:
+                    os.unlink(tmp_name)
+                    raise
+            logger.info(
+                f"[RemoteFileService] download_file success: tmp_file={tmp_name} "
+                f"rate={format_rate(stats.bytes_per_sec)}"
+            )
+            return tmp_name
+        except Exception as e:
+            logger.error(
+                f"远程SFTP下载失败 host={host} user={username} path={path} error={e}"
+            )
+            return None
+
+    def open_download_stream(self, mode: str, rel_path: str) -> Optional[RemoteFileStream]:
+        """
+        打开远程文件用于流式下载，数据直接从 SFTP 读到 HTTP 响应；下载缓存命中时改读本地缓存文件，
+        未命中的完整下载边发送边写入缓存
+
+        Returns:
+            RemoteFileStream: 带 size/mtime 的可迭代对象；文件不存在或不是普通文件时返回 None
+        """
+        logger.info(f"[RemoteFileService] open_download_stream: mode={mode}, rel_path={rel_path}")
+        host = username = None
+        path = rel_path
+        try:
+            remote = self._get_remote("open_download_stream")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+            conn = self.pool.acquire(ssh_info)
         except Exception as e:
             logger.error(
                 f"远程SFTP下载失败 host={host} user={username} path={path} error={e}"
             )
             return None
 
+        try:
+            sftp = conn.sftp
+            path = self._resolve_path(sftp, path)
+            attrs = sftp.stat(path)
+            if not stat.S_ISREG(attrs.st_mode):
+                logger.warning(f"[RemoteFileService] open_download_stream not a regular file: path={path}")
+                self.pool.release(conn)
+                return None
+            cached = self._lookup_cached(conn, path, attrs)
+            if cached is not None:
+                self.pool.release(conn)
+                logger.info(f"[RemoteFileService] open_download_stream from cache: path={path} size={attrs.st_size}")
+                return CachedFileStream(cached, path, attrs.st_size, int(attrs.st_mtime))
+            # 预取推迟到开始迭代时，以便先根据 Range 请求定位到起始偏移
+            remote_file = sftp.open(path, "rb")
+        except Exception as e:
+            logger.error(
+                f"远程SFTP下载失败 host={host} user={username} path={path} error={e}"
+            )
+            if not conn.check_health():
+                conn.broken = True
+            self.pool.release(conn)
+            return None
+        logger.info(f"[RemoteFileService] open_download_stream success: path={path} size={attrs.st_size}")
+        download_cache = self.download_cache if self.download_cache.fits(attrs.st_size) else None
+        return RemoteFileStream(self.pool, conn, remote_file, path, attrs.st_size, attrs.st_mtime, ssh_info=ssh_info,
+                                download_cache=download_cache, cache_key=conn.key)
+
+    def _lookup_cached(self, conn, path: str, attrs) -> Optional[BinaryIO]:
+        """只查下载缓存，不下载；未命中或文件超出缓存上限时返回 None"""
+        if not self.download_cache.fits(attrs.st_size):
+            return None
+        return self.download_cache.lookup(conn.key, path, attrs.st_size, attrs.st_mtime)
+
+    def cleanup_stale_downloads(self):
+        """启动时调用：清理上次运行残留的下载临时文件，加载下载缓存的索引"""
+        cleanup_temp_files(tempfile.gettempdir(), prefix=DOWNLOAD_TMP_PREFIX)
+        self.download_cache.load()
+
+    def download_cache_stats(self) -> Dict[str, Any]:
+        return {"success": True, **self.download_cache.stats()}
+
     def upload_file(self, mode: str, rel_path: str, file_obj) -> Dict[str, Any]:
         logger.info(f"[RemoteFileService] upload_file: mode={mode}, rel_path={rel_path}")
+        if not file_obj.filename:
+            return {"success": False, "error": "文件名为空"}
+        size = self._seekable_size(file_obj)
+        if size is not None and size >= PARALLEL_THRESHOLD:
+            return self._upload_parallel(mode, rel_path, file_obj, size)
+        return self.upload_stream(mode, rel_path, file_obj.filename, iter_file_chunks(file_obj))
+
+    @staticmethod
+    def _seekable_size(file_obj) -> Optional[int]:
+        """可随机访问的上传对象返回其大小，否则返回 None"""
+        stream = getattr(file_obj, "stream", None)
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # Use the current server if available, otherwise use the first one
-            if self.current_server:
-                remote = self.current_server
-                logger.info(f"[RemoteFileService] upload_file using current server: {remote.get('server_name')}")
-            else:
-                remote = config["remote_server_list"][0]
-                logger.info(f"[RemoteFileService] upload_file using first server: {remote.get('server_name')}")
-            
+            if stream is None or not stream.seekable():
+                return None
+            size = stream.seek(0, os.SEEK_END)
+            stream.seek(0)
+            return size
+        except Exception:
+            return None
+
+    def _upload_parallel(self, mode: str, rel_path: str, file_obj, size: int) -> Dict[str, Any]:
+        """大文件按区间多通道并行上传"""
+        host = username = None
+        try:
+            remote = self._get_remote("upload_file")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+            filename = file_obj.filename
+            path = rel_path + filename if rel_path.endswith('/') else rel_path + '/' + filename
+
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                path = self._resolve_path(sftp, path)
+                self._ensure_remote_dirs(sftp, path.rsplit('/', 1)[0] if '/' in path else '')
+                stats = self.transfer_engine.upload(ssh_info, conn, file_obj.stream, path, size)
+            logger.info(f"[RemoteFileService] upload_file success: path={path} rate={format_rate(stats.bytes_per_sec)}")
+            return {"success": True, "path": path, "transfer": stats.to_dict()}
+        except Exception as e:
+            logger.error(
+                f"远程SFTP上传失败 host={host} user={username} path={rel_path} error={e}"
+            )
+            return {"success": False, "error": str(e)}
+
+    def upload_stream(self, mode: str, rel_path: str, filename: Optional[str], chunks: Iterable[bytes]) -> Dict[str, Any]:
+        """
+        把数据块流直接写入远程文件，不经过本地临时文件
+
+        Args:
+            rel_path: 目标目录
+            filename: 文件名，可包含子目录（文件夹上传）
+            chunks: 数据块迭代器，例如请求体中正在接收的文件
+        """
+        logger.info(f"[RemoteFileService] upload_stream: mode={mode}, rel_path={rel_path}, filename={filename}")
+        host = username = None
+        try:
+            remote = self._get_remote("upload_stream")
             ssh_info = remote["config"]
             host = ssh_info["host_ip"]
-            port = ssh_info.get("ssh_port", 22)
             username = ssh_info["user_name"]
-            password = ssh_info.get("user_pwd", "")
             
             # rel_path is the directory path, we need to combine it with the filename
             directory_path = rel_path
-            filename = file_obj.filename
             if not filename:
                 return {"success": False, "error": "文件名为空"}
             
@@ -214,149 +670,524 @@ class RemoteFileService(FileService):
             else:
                 path = directory_path + '/' + filename
 
-            if password:
-                transport = paramiko.Transport((host, port))
-                transport.connect(username=username, password=password)
-                sftp = paramiko.SFTPClient.from_transport(transport)
-            else:
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(
-                    host,
-                    port=port,
-                    username=username,
-                    allow_agent=True,
-                    look_for_keys=True,
-                )
-                sftp = ssh.open_sftp()
-            if path == "~" or path.startswith("~/"):
-                home = sftp.normalize(".")
-                if path == "~":
-                    path = home
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                path = self._resolve_path(sftp, path)
+                self._ensure_remote_dirs(sftp, path.rsplit('/', 1)[0] if '/' in path else '')
+                size = self._write_remote_file(sftp, path, chunks)
+            logger.info(f"[RemoteFileService] upload_stream success: path={path} size={size}")
+            return {"success": True, "path": path}
+        except Exception as e:
+            logger.error(
+                f"远程SFTP上传失败 host={host} user={username} path={rel_path} error={e}"
+            )
+            return {"success": False, "error": str(e)}
+
+    def upload_batch(self, mode: str, rel_path: str, files: Iterable[Tuple[str, Iterable[bytes]]]) -> Dict[str, Any]:
+        """
+        在一条 SFTP 会话中依次写入多个文件
+
+        每个文件流水线写入；已确认存在的远程目录记在集合里，同一目录下的文件不再重复 stat/mkdir。
+        单个文件失败不影响其余文件；连接断开时其余文件直接报告失败。
+
+        Returns:
+            {"success": 全部成功, "files", "failed", "results": [{"name", "success", "path"/"error", "size"}]}
+        """
+        logger.info(f"[RemoteFileService] upload_batch: mode={mode}, rel_path={rel_path}")
+        results: List[Dict[str, Any]] = []
+        host = username = None
+        try:
+            remote = self._get_remote("upload_batch")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                base = self._resolve_path(sftp, rel_path).rstrip('/')
+                known_dirs: Set[str] = set()
+                broken = None
+                for filename, chunks in files:
+                    if broken is not None:
+                        results.append({"name": filename, "success": False, "error": broken})
+                        continue
+                    path = filename
+                    try:
+                        path = f"{base}/{safe_member_name(filename)}"
+                        self._ensure_remote_dirs_known(sftp, path.rsplit('/', 1)[0], known_dirs)
+                        size = self._write_remote_file(sftp, path, chunks)
+                        results.append({"name": filename, "success": True, "path": path, "size": size})
+                    except Exception as e:
+                        logger.warning(f"[RemoteFileService] upload_batch file failed: path={path} error={e}")
+                        results.append({"name": filename, "success": False, "error": str(e)})
+                        if not conn.check_health():
+                            conn.broken = True
+                            broken = f"连接中断: {e}"
+        except Exception as e:
+            logger.error(
+                f"远程SFTP批量上传失败 host={host} user={username} path={rel_path} error={e}"
+            )
+            return {"success": False, "error": str(e), "results": results}
+        failed = sum(1 for result in results if not result["success"])
+        logger.info(f"[RemoteFileService] upload_batch done: files={len(results)} failed={failed}")
+        return {"success": failed == 0, "files": len(results), "failed": failed, "results": results}
+
+    def _ensure_remote_dirs_known(self, sftp, remote_dir: str, known: Set[str]):
+        """同 _ensure_remote_dirs，但跳过 known 中已确认存在的目录，并把新确认的目录及其祖先加入 known"""
+        if not remote_dir or remote_dir in known:
+            return
+        self._ensure_remote_dirs(sftp, remote_dir)
+        current = remote_dir
+        while current and current not in known:
+            known.add(current)
+            current = current.rsplit('/', 1)[0]
+
+    def upload_tar(self, mode: str, rel_path: str, members: Iterable[TarMember]) -> Dict[str, Any]:
+        """
+        把一批文件打包成 tar 流，经一次 exec 交给远程 tar 解包到 rel_path 目录下
+
+        成员边接收边编码写入通道，不落本地磁盘；父目录由 tar 自动创建，
+        吞吐只受带宽限制，与文件个数无关。
+
+        Args:
+            members: (相对路径, 大小, 修改时间, 数据块迭代器) 的迭代器，通常来自正在接收的请求体
+
+        Returns:
+            {"success", "path", "files", "bytes", "elapsed", "rate"}
+        """
+        logger.info(f"[RemoteFileService] upload_tar: mode={mode}, rel_path={rel_path}")
+        host = username = None
+        try:
+            remote = self._get_remote("upload_tar")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+            counts = {"files": 0, "bytes": 0}
+
+            def _counted():
+                for name, size, mtime, chunks in members:
+                    counts["files"] += 1
+                    counts["bytes"] += size
+                    yield name, size, mtime, chunks
+
+            started = time.monotonic()
+            with self.pool.connection(ssh_info) as conn:
+                path = self._resolve_path(conn.sftp, rel_path)
+                stdin, stdout, stderr = conn.exec_command(TAR_EXTRACT_COMMAND.format(path=shlex.quote(path)))
+                channel = stdin.channel
+                drainer, errors = self._drain_stderr(stderr)
+                try:
+                    for chunk in coalesce(iter_tar(_counted())):
+                        stdin.write(chunk)
+                    channel.shutdown_write()
+                except BaseException:
+                    # 关闭通道让远程 tar 因数据不完整而退出
+                    channel.close()
+                    raise
+                status = channel.recv_exit_status()
+                drainer.join()
+            if status != 0:
+                error = errors.decode("utf-8", errors="replace").strip()
+                raise RuntimeError(f"远程 tar 解包失败（退出码 {status}）: {error}")
+            elapsed = max(time.monotonic() - started, 1e-6)
+            rate = format_rate(counts["bytes"] / elapsed)
+            logger.info(
+                f"[RemoteFileService] upload_tar success: path={path} files={counts['files']} "
+                f"bytes={counts['bytes']} elapsed={elapsed:.2f}s rate={rate}"
+            )
+            return {"success": True, "path": path, **counts, "elapsed": round(elapsed, 3), "rate": rate}
+        except Exception as e:
+            logger.error(
+                f"远程tar上传失败 host={host} user={username} path={rel_path} error={e}"
+            )
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def _drain_stderr(stderr, limit: int = TAR_STDERR_LIMIT):
+        """
+        在后台线程中读取远程命令的 stderr，最多保留 limit 字节
+
+        命令大量报错时 stderr 可能写满通道窗口，单独线程读取避免卡住 stdin/stdout 上的数据传输。
+        """
+        errors = bytearray()
+
+        def _drain():
+            for chunk in iter(lambda: stderr.read(4096), b""):
+                if len(errors) < limit:
+                    errors.extend(chunk)
+
+        drainer = threading.Thread(target=_drain, name="remote-stderr", daemon=True)
+        drainer.start()
+        return drainer, errors
+
+    def open_archive_stream(self, mode: str, rel_path: str, names: Optional[List[str]], fmt: str) -> Dict[str, Any]:
+        """
+        打包下载远程目录或选中的文件，数据边生成边发送，本地和远程都不生成中间压缩包
+
+        tar 系列格式优先经一次 exec 在远程运行 tar（远程有对应压缩命令时一并在远程压缩），输出直接转发；
+        zip 格式或远程没有 tar 时，经 SFTP 遍历并预取读取文件，在本地打包压缩。
+        连接一直借用到响应结束。
+
+        Returns:
+            {"success": True, "stream": ArchiveStream, "method": "exec" | "sftp"}
+        """
+        logger.info(f"[RemoteFileService] open_archive_stream: mode={mode}, rel_path={rel_path}, names={names}, fmt={fmt}")
+        if fmt not in ARCHIVE_FORMATS:
+            return {"success": False, "error": f"不支持的压缩格式: {fmt}"}
+        host = username = None
+        try:
+            remote = self._get_remote("open_archive_stream")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+            conn = self.pool.acquire(ssh_info)
+        except Exception as e:
+            logger.error(f"远程打包下载失败 host={host} user={username} path={rel_path} error={e}")
+            return {"success": False, "error": str(e)}
+
+        try:
+            sftp = conn.sftp
+            base = self._resolve_path(sftp, rel_path)
+            archive_base, roots = select_roots(base, names, posixpath)
+            for _, path in roots:
+                try:
+                    sftp.stat(path)
+                except FileNotFoundError:
+                    raise FileNotFoundError(f"文件不存在: {path}")
+            tools = self._archive_tools(conn) if fmt != "zip" else set()
+            if "tar" in tools and (fmt != "tar.zst" or "zstd" in tools or zstd_available()):
+                if names:
+                    parent, members = base, [name for name, _ in roots]
+                else:
+                    parent = posixpath.dirname(base.rstrip('/')) or '/'
+                    members = [posixpath.basename(base.rstrip('/')) or '.']
+                remote_compress = REMOTE_COMPRESS_COMMANDS.get(fmt)
+                if remote_compress and remote_compress.split()[0] in tools:
+                    chunks = self._exec_tar_chunks(conn, parent, members, f" | {remote_compress}")
                 else:
-                    path = home + path[1:]
-            if not path.startswith("/"):
-                path = "/" + path
-            tmp_file = tempfile.NamedTemporaryFile(delete=False)
-            file_obj.save(tmp_file.name)
+                    chunks = compress_tar(self._exec_tar_chunks(conn, parent, members, ""), fmt)
+                method = "exec"
+            else:
+                if fmt == "tar.zst" and not zstd_available():
+                    raise RuntimeError("本机和远程都没有 zstd，无法生成 tar.zst")
+                chunks = build_archive(self._iter_sftp_entries(sftp, roots), fmt)
+                method = "sftp"
+        except Exception as e:
+            logger.error(f"远程打包下载失败 host={host} user={username} path={rel_path} error={e}")
+            if not conn.check_health():
+                conn.broken = True
+            self.pool.release(conn)
+            return {"success": False, "error": str(e)}
+        logger.info(f"[RemoteFileService] open_archive_stream ready: base={base} method={method}")
+        stream = ArchiveStream(chunks, archive_filename(archive_base, fmt), ARCHIVE_MIMETYPES[fmt],
+                               on_close=lambda: self.pool.release(conn))
+        return {"success": True, "stream": stream, "method": method}
+
+    def _archive_tools(self, conn) -> Set[str]:
+        """远程主机上可用的打包/压缩命令，按服务器缓存"""
+        key = conn.key
+        if key not in self._archive_tool_cache:
+            stdin, stdout, stderr = conn.exec_command(ARCHIVE_TOOLS_CHECK)
+            self._archive_tool_cache[key] = set(stdout.read().decode("utf-8", errors="replace").split())
+            logger.info(f"[RemoteFileService] archive tools on {key}: {sorted(self._archive_tool_cache[key])}")
+        return self._archive_tool_cache[key]
+
+    def _exec_tar_chunks(self, conn, parent: str, members: List[str], compress: str) -> Iterator[bytes]:
+        """
+        在远程运行 tar 并逐块转发其输出
+
+        tar 的退出码经 stderr 中的标记行取回（管道的退出码来自压缩命令）；
+        退出码 1 只表示有文件在打包期间被修改，仅记录警告。提前结束时关闭通道，远程进程随之退出。
+        """
+        command = TAR_CREATE_COMMAND.format(
+            path=shlex.quote(parent), members=" ".join(shlex.quote(member) for member in members),
+            marker=TAR_EXIT_MARKER, compress=compress,
+        )
+        stdin, stdout, stderr = conn.exec_command(command)
+        channel = stdout.channel
+        drainer, errors = self._drain_stderr(stderr)
+        try:
+            channel.shutdown_write()
+            for data in iter(lambda: stdout.read(DOWNLOAD_CHUNK_SIZE), b""):
+                yield data
+            status = channel.recv_exit_status()
+            drainer.join()
+            text = errors.decode("utf-8", errors="replace")
+            lines = text.splitlines()
+            tar_status = next((int(line[len(TAR_EXIT_MARKER):]) for line in reversed(lines)
+                               if line.startswith(TAR_EXIT_MARKER)), None)
+            message = "\n".join(line for line in lines if not line.startswith(TAR_EXIT_MARKER)).strip()
+            if tar_status is None or tar_status > 1 or status != 0:
+                raise RuntimeError(f"远程 tar 打包失败（退出码 {tar_status or status}）: {message}")
+            if tar_status == 1:
+                logger.warning(f"[RemoteFileService] remote tar reported changed files: {message}")
+        finally:
+            channel.close()
+
+    def _iter_sftp_entries(self, sftp, roots: List[Tuple[str, str]]) -> Iterator[ArchiveEntry]:
+        """经 SFTP 遍历远程目录树生成打包成员；指向文件的符号链接按文件内容打包，其余符号链接跳过"""
+        for arcname, path in roots:
+            try:
+                attrs = sftp.stat(path)
+            except IOError as e:
+                logger.warning(f"[RemoteFileService] archive skip missing path: path={path} error={e}")
+                continue
+            if stat.S_ISDIR(attrs.st_mode):
+                yield arcname, 0, attrs.st_mtime, None
+                yield from self._walk_sftp(sftp, arcname, path)
+            elif stat.S_ISREG(attrs.st_mode):
+                yield arcname, attrs.st_size, attrs.st_mtime, partial(self._read_sftp_file, sftp, path, attrs.st_size)
+
+    def _walk_sftp(self, sftp, prefix: str, path: str) -> Iterator[ArchiveEntry]:
+        try:
+            children = sorted(sftp.listdir_attr(path), key=lambda attr: attr.filename)
+        except IOError as e:
+            logger.warning(f"[RemoteFileService] archive skip unreadable directory: path={path} error={e}")
+            return
+        for attr in children:
+            arcname = f"{prefix}/{attr.filename}"
+            full = f"{path.rstrip('/')}/{attr.filename}"
+            if stat.S_ISLNK(attr.st_mode):
+                try:
+                    attr = sftp.stat(full)
+                except IOError:
+                    continue
+                if not stat.S_ISREG(attr.st_mode):
+                    continue
+            if stat.S_ISDIR(attr.st_mode):
+                yield arcname, 0, attr.st_mtime, None
+                yield from self._walk_sftp(sftp, arcname, full)
+            elif stat.S_ISREG(attr.st_mode):
+                yield arcname, attr.st_size, attr.st_mtime, partial(self._read_sftp_file, sftp, full, attr.st_size)
+
+    @staticmethod
+    def _read_sftp_file(sftp, path: str, size: int) -> Iterator[bytes]:
+        """预取读取远程文件；打开失败时记录警告并返回空数据（由打包端补零）"""
+        try:
+            remote_file = sftp.open(path, "rb")
+        except IOError as e:
+            logger.warning(f"[RemoteFileService] archive skip unreadable file: path={path} error={e}")
+            return
+        with remote_file:
+            remote_file.prefetch(size, max_concurrent_requests=DOWNLOAD_PREFETCH_REQUESTS)
+            for chunk in iter(lambda: remote_file.read(DOWNLOAD_CHUNK_SIZE), b""):
+                yield chunk
+
+    @staticmethod
+    def _write_remote_file(sftp, path: str, chunks: Iterable[bytes]) -> int:
+        """
+        以流水线方式写远程文件，返回写入字节数
+
+        pipelined 模式下写请求不逐个等待确认，paramiko 会在积压请求过多时回收应答，
+        再加上 SSH 通道窗口的流控，内存占用不随文件大小增长。
+        """
+        written = 0
+        remote_file = sftp.open(path, "wb")
+        try:
+            remote_file.set_pipelined(True)
+            for chunk in chunks:
+                remote_file.write(chunk)
+                written += len(chunk)
+            # close 会等待所有在途写请求的确认，出错时在这里抛出
+            remote_file.close()
+        except Exception:
+            try:
+                remote_file.close()
+            except Exception:
+                pass
+            # 清理写了一半的文件，避免留下看似完整的残缺文件
+            try:
+                sftp.remove(path)
+            except Exception:
+                pass
+            raise
+        return written
+
+    @staticmethod
+    def _ensure_remote_dirs(sftp, remote_dir: str):
+        """逐级创建远程目录（已存在的部分跳过）"""
+        if not remote_dir:
+            return
+        try:
+            # Create directories recursively
+            dirs_to_create = []
+            current_dir = remote_dir
+            while current_dir and current_dir != '/':
+                try:
+                    sftp.stat(current_dir)
+                    break  # Directory exists
+                except Exception:
+                    dirs_to_create.append(current_dir)
+                    current_dir = current_dir.rsplit('/', 1)[0] if '/' in current_dir else ''
             
-            # Create directory structure if it doesn't exist
-            remote_dir = path.rsplit('/', 1)[0] if '/' in path else ''
-            if remote_dir:
+            # Create directories from parent to child
+            for dir_path in reversed(dirs_to_create):
                 try:
-                    # Create directories recursively
-                    dirs_to_create = []
-                    current_dir = remote_dir
-                    while current_dir and current_dir != '/':
-                        try:
-                            sftp.stat(current_dir)
-                            break  # Directory exists
-                        except Exception:
-                            dirs_to_create.append(current_dir)
-                            current_dir = current_dir.rsplit('/', 1)[0] if '/' in current_dir else ''
-                    
-                    # Create directories from parent to child
-                    for dir_path in reversed(dirs_to_create):
-                        try:
-                            sftp.mkdir(dir_path)
-                        except Exception:
-                            # Directory might already exist, ignore error
-                            pass
+                    sftp.mkdir(dir_path)
                 except Exception:
-                    # If directory creation fails, continue anyway
+                    # Directory might already exist, ignore error
                     pass
-            
-            sftp.put(tmp_file.name, path)
-            sftp.close()
-            if not password:
-                ssh.close()
-            else:
-                transport.close()
-            logger.info(f"[RemoteFileService] upload_file success: path={path}")
-            return {"success": True, "path": path}
+        except Exception:
+            # If directory creation fails, continue anyway
+            pass
+
+    def prepare_chunked_upload(self, mode: str, rel_path: str, filename: str, upload_id: str) -> Dict[str, Any]:
+        """在目标目录创建分块上传的临时文件，分块写完提交时再重命名为目标文件"""
+        logger.info(f"[RemoteFileService] prepare_chunked_upload: mode={mode}, rel_path={rel_path}, filename={filename}")
+        host = username = None
+        try:
+            if not filename:
+                return {"success": False, "error": "文件名为空"}
+            remote = self._get_remote("prepare_chunked_upload")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+            path = rel_path + filename if rel_path.endswith('/') else rel_path + '/' + filename
+
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                path = self._resolve_path(sftp, path)
+                remote_dir, name = path.rsplit('/', 1)
+                self._ensure_remote_dirs(sftp, remote_dir)
+                temp_path = f"{remote_dir}/.{name}.{upload_id}.part"
+                sftp.open(temp_path, "wb").close()
+            return {"success": True, "path": path, "temp_path": temp_path}
         except Exception as e:
             logger.error(
                 f"远程SFTP上传失败 host={host} user={username} path={rel_path} error={e}"
             )
             return {"success": False, "error": str(e)}
 
+    def write_upload_chunk(self, mode: str, temp_path: str, offset: int, chunks: Iterable[bytes]) -> Dict[str, Any]:
+        """把一个分块写到临时文件的 offset 处，不同分块可在多条连接上并发写入"""
+        host = username = None
+        try:
+            remote = self._get_remote("write_upload_chunk")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+
+            written = 0
+            with self.pool.connection(ssh_info) as conn:
+                with conn.sftp.open(temp_path, "r+b") as remote_file:
+                    remote_file.set_pipelined(True)
+                    remote_file.seek(offset)
+                    for chunk in chunks:
+                        remote_file.write(chunk)
+                        written += len(chunk)
+            return {"success": True, "bytes": written}
+        except Exception as e:
+            logger.error(
+                f"远程SFTP上传失败 host={host} user={username} path={temp_path} offset={offset} error={e}"
+            )
+            return {"success": False, "error": str(e)}
+
+    def commit_chunked_upload(self, mode: str, temp_path: str, path: str) -> Dict[str, Any]:
+        """所有分块写完后把临时文件原子地重命名为目标文件（覆盖已存在的文件）"""
+        logger.info(f"[RemoteFileService] commit_chunked_upload: temp_path={temp_path}, path={path}")
+        host = username = None
+        try:
+            remote = self._get_remote("commit_chunked_upload")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            username = ssh_info["user_name"]
+
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                try:
+                    sftp.posix_rename(temp_path, path)
+                except IOError:
+                    # 服务器不支持 posix-rename 扩展时退回普通 rename（目标存在会失败）
+                    try:
+                        sftp.remove(path)
+                    except IOError:
+                        pass
+                    sftp.rename(temp_path, path)
+            logger.info(f"[RemoteFileService] commit_chunked_upload success: path={path}")
+            return {"success": True, "path": path}
+        except Exception as e:
+            logger.error(
+                f"远程SFTP上传失败 host={host} user={username} path={path} error={e}"
+            )
+            return {"success": False, "error": str(e)}
+
+    def abort_chunked_upload(self, mode: str, temp_path: str) -> Dict[str, Any]:
+        """放弃分块上传，删除临时文件"""
+        logger.info(f"[RemoteFileService] abort_chunked_upload: temp_path={temp_path}")
+        try:
+            remote = self._get_remote("abort_chunked_upload")
+            with self.pool.connection(remote["config"]) as conn:
+                try:
+                    conn.sftp.remove(temp_path)
+                except FileNotFoundError:
+                    pass
+            return {"success": True}
+        except Exception as e:
+            logger.error(f"[RemoteFileService] abort_chunked_upload error: path={temp_path} error={e}")
+            return {"success": False, "error": str(e)}
+
     def delete_file(self, mode: str, rel_path: str) -> Dict[str, Any]:
         logger.info(f"[RemoteFileService] delete_file: mode={mode}, rel_path={rel_path}")
+        result = self.delete_paths(mode, [rel_path])
+        if result["success"]:
+            return {"success": True}
+        return {"success": False, "error": result["error"]}
+
+    def delete_paths(self, mode: str, rel_paths: List[str], job: Optional[Job] = None,
+                     method: str = "auto") -> Dict[str, Any]:
+        """
+        递归删除多个文件或目录，整个批次共用一条连接
+
+        文件的 remove 请求流水线发出，目录按 method 用一次 rm -rf 或 SFTP 遍历删除，见 utils.bulk_delete。
+        """
+        logger.info(f"[RemoteFileService] delete_paths: count={len(rel_paths)} method={method} paths={rel_paths[:10]}")
+        if method not in DELETE_METHODS:
+            return {"success": False, "error": f"不支持的删除方式: {method}"}
+        host = username = None
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # Use the current server if available, otherwise use the first one
-            if self.current_server:
-                remote = self.current_server
-                logger.info(f"[RemoteFileService] delete_file using current server: {remote.get('server_name')}")
-            else:
-                remote = config["remote_server_list"][0]
-                logger.info(f"[RemoteFileService] delete_file using first server: {remote.get('server_name')}")
-            
+            remote = self._get_remote("delete_paths")
             ssh_info = remote["config"]
             host = ssh_info["host_ip"]
-            port = ssh_info.get("ssh_port", 22)
             username = ssh_info["user_name"]
-            password = ssh_info.get("user_pwd", "")
-            path = rel_path
 
-            if password:
-                transport = paramiko.Transport((host, port))
-                transport.connect(username=username, password=password)
-                sftp = paramiko.SFTPClient.from_transport(transport)
-            else:
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(
-                    host,
-                    port=port,
-                    username=username,
-                    allow_agent=True,
-                    look_for_keys=True,
-                )
-                sftp = ssh.open_sftp()
-            if path == "~" or path.startswith("~/"):
-                home = sftp.normalize(".")
-                if path == "~":
-                    path = home
-                else:
-                    path = home + path[1:]
-            if not path.startswith("/"):
-                path = "/" + path
-            try:
-                sftp.remove(path)
-                result = {"success": True}
-                logger.info(f"[RemoteFileService] delete_file success: path={path}")
-            except Exception as e:
-                result = {"success": False, "error": str(e)}
-                logger.error(f"[RemoteFileService] delete_file failed: path={path}, error={e}")
-            sftp.close()
-            if not password:
-                ssh.close()
-            else:
-                transport.close()
-            return result
+            with self.pool.connection(ssh_info) as conn:
+                paths = [self._resolve_path(conn.sftp, rel_path) for rel_path in rel_paths]
+                return delete_remote(conn, paths, method, job)
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(
-                f"远程SFTP删除失败 host={host} user={username} path={rel_path} error={e}"
+                f"远程SFTP删除失败 host={host} user={username} paths={rel_paths[:10]} error={e}"
             )
             return {"success": False, "error": str(e)}
 
+    def copy_path(self, mode: str, src_path: str, dst_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """在服务器上复制文件或目录树，数据不经过本进程：copy-data 扩展或远程 cp，见 utils.file_copy"""
+        logger.info(f"[RemoteFileService] copy_path: {src_path} -> {dst_path}")
+        return self._copy_or_move("copy_path", src_path, dst_path,
+                                  lambda conn, src, dst: copy_remote(conn, src, dst, job, self._no_copy_data))
+
+    def move_path(self, mode: str, src_path: str, dst_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """在服务器上移动文件或目录树：SFTP rename，失败时远程 mv"""
+        logger.info(f"[RemoteFileService] move_path: {src_path} -> {dst_path}")
+        return self._copy_or_move("move_path", src_path, dst_path, move_remote)
+
+    def _copy_or_move(self, caller: str, src_path: str, dst_path: str, func) -> Dict[str, Any]:
+        try:
+            remote = self._get_remote(caller)
+            with self.pool.connection(remote["config"]) as conn:
+                src = self._resolve_path(conn.sftp, src_path)
+                dst = self._resolve_path(conn.sftp, dst_path)
+                return func(conn, src, dst)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"[RemoteFileService] {caller} error: {src_path} -> {dst_path} error={e}")
+            return {"success": False, "error": str(e)}
+
     def get_default_dir(self, mode: str) -> Dict[str, Any]:
         logger.info(f"[RemoteFileService] get_default_dir: mode={mode}")
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # Use the current server if available, otherwise use the first one
-            if self.current_server:
-                remote = self.current_server
-                logger.info(f"[RemoteFileService] get_default_dir using current server: {remote.get('server_name')}")
-            else:
-                remote = config["remote_server_list"][0]
-                logger.info(f"[RemoteFileService] get_default_dir using first server: {remote.get('server_name')}")
-            
+            remote = self._get_remote("get_default_dir")
             ssh_info = remote["config"]
             default_dir = ssh_info.get("default_dir", "~")
             logger.info(f"[RemoteFileService] get_default_dir result: {default_dir}")
@@ -368,9 +1199,7 @@ class RemoteFileService(FileService):
     def get_remote_servers(self) -> List[Dict[str, Any]]:
         logger.info("[RemoteFileService] get_remote_servers called")
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            result = config.get("remote_server_list", [])
+            result = self.config_store.get_remote_servers()
             logger.info(f"[RemoteFileService] get_remote_servers result: {result}")
             return result
         except Exception as e:
@@ -402,13 +1231,11 @@ class RemoteFileService(FileService):
             logger.info(f"[RemoteFileService] test_server_connectivity success: host={host}")
             # Find and set the current server based on the host
             try:
-                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                    config = json.load(f)
-                for remote in config.get("remote_server_list", []):
-                    if remote["config"]["host_ip"] == host:
-                        self.current_server = remote
-                        logger.info(f"[RemoteFileService] Set current server to: {remote.get('server_name')}")
-                        break
+                remote = self.config_store.get_server(host_ip=host)
+                if remote:
+                    self.current_server = remote
+                    logger.info(f"[RemoteFileService] Set current server to: {remote.get('server_name')}")
+                    return {"success": True, "server_name": remote.get("server_name")}
             except Exception as e:
                 logger.error(f"Failed to set current server: {e}")
             return {"success": True}
@@ -419,98 +1246,965 @@ class RemoteFileService(FileService):
     def save_server_pwd(self, server_name: str, user_pwd: str) -> Dict[str, Any]:
         logger.info(f"[RemoteFileService] save_server_pwd: server_name={server_name}")
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            for remote in config.get("remote_server_list", []):
-                if remote.get("server_name") == server_name:
-                    remote["config"]["user_pwd"] = user_pwd
-                    # Update the current server to this one
-                    self.current_server = remote
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            existing = self.config_store.get_server(server_name=server_name)
+            if existing and existing["config"].get("user_pwd", "") == user_pwd:
+                # 密码未变化时不重写配置文件，也保留已有连接
+                self.current_server = existing
+                logger.info(f"[RemoteFileService] save_server_pwd unchanged: server_name={server_name}")
+                return {"success": True}
+
+            def _set_pwd(config):
+                for remote in config.get("remote_server_list", []):
+                    if remote.get("server_name") == server_name:
+                        remote["config"]["user_pwd"] = user_pwd
+
+            self.config_store.update(_set_pwd)
+            remote = self.config_store.get_server(server_name=server_name)
+            if remote:
+                # Update the current server to this one
+                self.current_server = remote
+                # 凭据变化后旧连接不再复用
+                self.pool.evict(remote["config"])
             logger.info(f"[RemoteFileService] save_server_pwd success: server_name={server_name}")
             return {"success": True}
         except Exception as e:
             logger.error(f"保存远程服务器密码失败 server={server_name} error={e}")
             return {"success": False, "error": str(e)}
 
+    def benchmark_tuning(self, server_name: str, profiles: Optional[List[str]] = None, size: int = BENCH_SIZE,
+                         data: str = "random", apply: bool = False) -> Dict[str, Any]:
+        """
+        对一台服务器逐个测量调优配置：每组配置新建一条连接，从远程读取 size 字节计算吞吐量
+
+        Args:
+            profiles: TUNING_PROFILES 中的名称，默认全部；服务器已有 tuning 时以 "current" 一并参与比较
+            data: BENCH_COMMANDS 之一，决定测试数据是否可压缩
+            apply: 为 True 时把最快的配置写回该服务器的 config.tuning，并关闭使用旧配置的空闲连接
+
+        Returns:
+            {"success", "results": [{"profile", "success", "throughput", "seconds", "connect_seconds", ...}],
+             "best", "applied"}
+        """
+        logger.info(f"[RemoteFileService] benchmark_tuning: server={server_name} profiles={profiles} "
+                    f"size={size} data={data} apply={apply}")
+        try:
+            if data not in BENCH_COMMANDS:
+                raise ValueError(f"不支持的测试数据: {data}")
+            unknown = [name for name in profiles or [] if name not in TUNING_PROFILES]
+            if unknown:
+                raise ValueError(f"未知的调优配置: {', '.join(unknown)}")
+            remote = self.config_store.get_server(server_name=server_name)
+            if remote is None:
+                raise ValueError(f"服务器不存在: {server_name}")
+            ssh_info = remote["config"]
+            candidates = {name: TUNING_PROFILES[name] for name in profiles or TUNING_PROFILES}
+            if ssh_info.get("tuning"):
+                candidates["current"] = normalize_tuning(ssh_info["tuning"])
+            command = BENCH_COMMANDS[data].format(size=int(size))
+
+            results = [self._measure_tuning(ssh_info, name, tuning, size, command)
+                       for name, tuning in candidates.items()]
+            best = pick_best(results)
+            if best is None:
+                return {"success": False, "error": "所有调优配置均测量失败", "results": results,
+                        "best": None, "applied": False}
+            applied = False
+            if apply and best != "current":
+                self._apply_tuning(server_name, candidates[best])
+                applied = True
+            logger.info(f"[RemoteFileService] benchmark_tuning done: server={server_name} best={best} applied={applied}")
+            return {"success": True, "results": results, "best": best, "applied": applied}
+        except Exception as e:
+            logger.error(f"调优测试失败 server={server_name} error={e}")
+            return {"success": False, "error": str(e)}
+
+    def _measure_tuning(self, ssh_info: Dict[str, Any], name: str, tuning: Dict[str, Any], size: int,
+                        command: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            ssh = open_ssh_client(ssh_info, self.pool.connect_timeout, tuning=tuning)
+        except Exception as e:
+            logger.warning(f"[RemoteFileService] benchmark_tuning connect failed: profile={name} error={e}")
+            return {"profile": name, "success": False, "error": str(e)}
+        try:
+            connected = time.perf_counter()
+            stdin, stdout, stderr = ssh.exec_command(command)
+            stdin.close()
+            received = 0
+            for chunk in iter(partial(stdout.read, BENCH_READ_SIZE), b""):
+                received += len(chunk)
+            stdout.channel.recv_exit_status()
+            elapsed = max(time.perf_counter() - connected, 1e-9)
+            if received < size:
+                return {"profile": name, "success": False,
+                        "error": f"只收到 {received}/{size} 字节: {stderr.read(4096).decode(errors='replace').strip()}"}
+            transport = ssh.get_transport()
+            result = {
+                "profile": name,
+                "success": True,
+                "bytes": received,
+                "seconds": round(elapsed, 3),
+                "connect_seconds": round(connected - started, 3),
+                "throughput": received / elapsed,
+                "cipher": getattr(transport, "remote_cipher", None),
+            }
+            logger.info(f"[RemoteFileService] benchmark_tuning: profile={name} rate={format_rate(result['throughput'])}")
+            return result
+        except Exception as e:
+            logger.warning(f"[RemoteFileService] benchmark_tuning failed: profile={name} error={e}")
+            return {"profile": name, "success": False, "error": str(e)}
+        finally:
+            ssh.close()
+
+    def _apply_tuning(self, server_name: str, tuning: Dict[str, Any]):
+        def _set_tuning(config):
+            for remote in config.get("remote_server_list", []):
+                if remote.get("server_name") == server_name:
+                    if tuning:
+                        remote["config"]["tuning"] = dict(tuning)
+                    else:
+                        remote["config"].pop("tuning", None)
+
+        self.config_store.update(_set_tuning)
+        remote = self.config_store.get_server(server_name=server_name)
+        if remote:
+            # 已有的空闲连接按旧配置协商，关闭后新连接使用新配置
+            self.pool.evict(remote["config"])
+
+    def fan_out(self, operation: str, rel_path: str, server_names: Optional[List[str]] = None,
+                timeout: float = DEFAULT_FAN_OUT_TIMEOUT) -> Iterator[Dict[str, Any]]:
+        """
+        在多台服务器上并发执行同一只读操作，按完成顺序产出每台服务器的结果
+
+        Args:
+            operation: FAN_OUT_OPERATIONS 之一
+            server_names: 目标服务器名称，默认全部服务器
+            timeout: 每台服务器的超时秒数
+
+        Yields:
+            {"server", "elapsed", "result"} 或 {"server", "elapsed", "error"}
+        """
+        if operation not in FAN_OUT_OPERATIONS:
+            raise ValueError(f"不支持的操作: {operation}")
+        if server_names is None:
+            server_names = [remote.get("server_name") for remote in self.config_store.get_remote_servers()]
+        logger.info(f"[RemoteFileService] fan_out: operation={operation} path={rel_path} servers={server_names}")
+
+        def _task(server_name):
+            def _run():
+                # 每个线程有独立的上下文，在线程内选择服务器
+                with self.server_scope(server_name):
+                    return getattr(self, operation)("remote", rel_path)
+            return _run
+
+        tasks = {}
+        for name in server_names:
+            if self.config_store.get_server(server_name=name) is None:
+                yield {"server": name, "elapsed": 0.0, "error": f"服务器不存在: {name}"}
+            else:
+                tasks[name] = _task(name)
+        for item in fan_out(tasks, timeout=timeout):
+            result = {"server": item["key"], "elapsed": round(item["elapsed"], 3)}
+            if "error" in item:
+                result["error"] = item["error"]
+            else:
+                result["result"] = item["result"]
+            yield result
+
+    def transfer_between_servers(self, src_server: str, src_path: str, dst_server: str, dst_dir: str,
+                                 job: Optional[Job] = None, method: str = "relay") -> Dict[str, Any]:
+        """
+        把 src_server 上的文件或目录复制到 dst_server 的 dst_dir 目录下，数据不经过浏览器
+
+        Args:
+            method: TRANSFER_METHODS 之一
+            job: 用于汇报进度和响应取消的后台任务
+
+        Raises:
+            JobCancelled: 任务被取消
+        """
+        logger.info(
+            f"[RemoteFileService] transfer_between_servers: {src_server}:{src_path} -> "
+            f"{dst_server}:{dst_dir} method={method}"
+        )
+        try:
+            if method not in TRANSFER_METHODS:
+                return {"success": False, "error": f"不支持的传输方式: {method}"}
+            src_remote = self.config_store.get_server(server_name=src_server)
+            dst_remote = self.config_store.get_server(server_name=dst_server)
+            if src_remote is None or dst_remote is None:
+                missing = src_server if src_remote is None else dst_server
+                return {"success": False, "error": f"服务器不存在: {missing}"}
+            src_info = src_remote["config"]
+            dst_info = dst_remote["config"]
+
+            with self.pool.connection(src_info) as src_conn, self.pool.connection(dst_info) as dst_conn:
+                src_path = self._resolve_path(src_conn.sftp, src_path)
+                dst_dir = self._resolve_path(dst_conn.sftp, dst_dir)
+                self._ensure_remote_dirs(dst_conn.sftp, dst_dir)
+                used = method
+                if method in ("direct", "auto"):
+                    try:
+                        result = direct_push(src_conn, src_path, dst_info, dst_dir, job)
+                        used = "direct"
+                    except JobCancelled:
+                        raise
+                    except Exception as e:
+                        if method == "direct":
+                            raise
+                        logger.warning(f"[RemoteFileService] direct transfer failed, falling back to relay: {e}")
+                        if job is not None:
+                            job.reset_progress()
+                        used = "relay"
+                if used == "relay":
+                    result = relay_tree(src_conn.sftp, src_path, dst_conn.sftp, dst_dir, job)
+            logger.info(f"[RemoteFileService] transfer_between_servers success: method={used} result={result}")
+            return {"success": True, "method": used, **result}
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(
+                f"服务器间传输失败 {src_server}:{src_path} -> {dst_server}:{dst_dir} error={e}"
+            )
+            return {"success": False, "error": str(e)}
+
+    def calculate_child_sizes(self, mode: str, rel_path: str) -> Dict[str, Any]:
+        """
+        一次远程命令算出目录总大小及每个直接子项的大小和文件数
+
+        du --max-depth=1 给出各子项字节数，find 的输出在远端用 awk 按第一级路径聚合计数，
+        只回传每个子项一行，整个目录只需一次 exec。
+        """
+        logger.info(f"[RemoteFileService] calculate_child_sizes: mode={mode}, rel_path={rel_path}")
+        try:
+            remote = self._get_remote("calculate_child_sizes")
+            ssh_info = remote["config"]
+
+            def _calculate(conn):
+                path = self._resolve_path(conn.sftp, rel_path)
+                result = self._agent_call(conn, "child_sizes", path=path)
+                if result is not None:
+                    errors = result.pop("errors")
+                    result.update({"success": True, "path": path, "is_complete": not errors})
+                    return result
+                command = CHILD_SIZES_COMMAND.format(
+                    path=shlex.quote(path), marker=CHILD_SIZES_MARKER,
+                    link_script=shlex.quote(CHILD_SIZES_LINK_SCRIPT),
+                )
+                stdin, stdout, stderr = conn.exec_command(command)
+                drainer, errors = self._drain_stderr(stderr)
+                output = stdout.read().decode('utf-8', errors='replace')
+                drainer.join()
+                error = errors.decode('utf-8', errors='replace').strip()
+                parsed = self._parse_child_sizes(output)
+                if parsed is None:
+                    return {"success": False, "error": error or "无法计算目录大小"}
+                parsed.update({"success": True, "path": path, "is_complete": not error})
+                return parsed
+
+            return self.pool.run(ssh_info, _calculate)
+        except Exception as e:
+            logger.error(f"远程计算文件夹大小失败: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def _parse_child_sizes(output: str) -> Optional[Dict[str, Any]]:
+        """解析 CHILD_SIZES_COMMAND 的输出，缺少目录自身的 du 结果时返回 None"""
+        du_part, _, find_part = output.partition(CHILD_SIZES_MARKER)
+        find_part, _, link_part = find_part.partition(CHILD_SIZES_MARKER)
+        children: Dict[str, Dict[str, int]] = {}
+        total_size = None
+        for line in du_part.splitlines():
+            size, sep, name = line.partition("\t")
+            if not sep or not size.isdigit():
+                continue
+            if name == ".":
+                total_size = int(size)
+            elif name.startswith("./"):
+                children.setdefault(name[2:], {"total_size": 0, "file_count": 0})["total_size"] = int(size)
+        if total_size is None:
+            return None
+        file_count = 0
+        for line in find_part.splitlines():
+            count, sep, name = line.partition("\t")
+            if not sep or not count.isdigit():
+                continue
+            if name == ".":
+                file_count = int(count)
+            elif name in children:
+                children[name]["file_count"] = int(count)
+        for line in link_part.splitlines():
+            parts = line.split("\t", 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                children[parts[2]] = {"total_size": int(parts[0]), "file_count": int(parts[1])}
+        return {"total_size": total_size, "file_count": file_count, "children": children}
+
+    def search_files(self, mode: str, rel_path: str, pattern: str, kind: Optional[str] = None,
+                     limit: int = DEFAULT_FIND_LIMIT) -> Dict[str, Any]:
+        """按文件名查找：远程辅助进程在服务器上遍历，只传回匹配项；不可用时经 SFTP 逐级列目录"""
+        logger.info(f"[RemoteFileService] search_files: rel_path={rel_path} pattern={pattern} kind={kind}")
+        if kind not in SEARCH_KINDS:
+            return {"success": False, "error": f"未知的类型: {kind}"}
+        try:
+            remote = self._get_remote("search_files")
+            ssh_info = remote["config"]
+
+            def _search(conn):
+                path = self._resolve_path(conn.sftp, rel_path)
+                found = self._agent_call(conn, "find", path=path, pattern=pattern, kind=SEARCH_KINDS[kind],
+                                         limit=limit)
+                if found is None:
+                    found = self._find_sftp(conn.sftp, path, pattern, SEARCH_KINDS[kind], limit)
+                return search_result(path, found, join_rel)
+
+            return self.pool.run(ssh_info, _search)
+        except Exception as e:
+            logger.error(f"远程查找文件失败: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def _find_sftp(sftp, root: str, pattern: str, kind: Optional[str], limit: int) -> Dict[str, Any]:
+        """file_search.find 的 SFTP 实现，结果格式相同；不进入指向目录的符号链接"""
+        pattern = pattern.lower()
+        entries = []
+        pending = [("", root)]
+        while pending:
+            rel_dir, path = pending.pop()
+            try:
+                attrs = sorted(sftp.listdir_attr(path), key=lambda a: a.filename)
+            except IOError:
+                continue
+            links = [attr for attr in attrs if stat.S_ISLNK(attr.st_mode)]
+            targets = stat_many(sftp, [join_rel(path, attr.filename) for attr in links])
+            resolved = {id(link): target for link, target in zip(links, targets) if target is not None}
+            for attr in attrs:
+                rel = join_rel(rel_dir, attr.filename) if rel_dir else attr.filename
+                if stat.S_ISDIR(attr.st_mode):
+                    pending.append((rel, join_rel(path, attr.filename)))
+                info = resolved.get(id(attr), attr)
+                entry_kind = "d" if stat.S_ISDIR(info.st_mode) else "l" if stat.S_ISLNK(info.st_mode) else "f"
+                if fnmatch.fnmatchcase(attr.filename.lower(), pattern) and kind in (None, entry_kind):
+                    if len(entries) >= limit:
+                        return {"entries": entries, "truncated": True}
+                    entries.append([rel, entry_kind, info.st_size, int(info.st_mtime)])
+        return {"entries": entries, "truncated": False}
+
     def calculate_folder_size(self, mode: str, rel_path: str) -> Dict[str, Any]:
         logger.info(f"[RemoteFileService] calculate_folder_size: mode={mode}, rel_path={rel_path}")
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # Use the current server if available, otherwise use the first one
-            if self.current_server:
-                remote = self.current_server
-                logger.info(f"[RemoteFileService] Using current server: {remote.get('server_name')}")
+            remote = self._get_remote("calculate_folder_size")
+            ssh_info = remote["config"]
+
+            def _calculate(conn):
+                # 处理路径
+                path = self._resolve_path(conn.sftp, rel_path)
+                result = self._agent_call(conn, "dir_size", path=path)
+                if result is not None:
+                    return {
+                        "success": True,
+                        "total_size": result["total_size"],
+                        "file_count": result["file_count"],
+                        "path": path,
+                        "is_complete": not result["errors"],
+                    }
+                quoted = shlex.quote(path)
+
+                # 使用du命令获取文件夹大小和find命令获取文件数量
+                du_command = f'du -sb {quoted}'
+                find_command = f'find {quoted} -type f | wc -l'
+
+                # 执行命令
+                stdin, stdout, stderr = conn.exec_command(du_command)
+                du_error = stderr.read().decode('utf-8').strip()
+                if du_error:
+                    return {"error": du_error}
+
+                # 解析du命令的输出
+                du_output = stdout.read().decode('utf-8').strip()
+                total_size = int(du_output.split()[0])
+
+                # 执行find命令获取文件数量
+                stdin, stdout, stderr = conn.exec_command(find_command)
+                find_error = stderr.read().decode('utf-8').strip()
+                if find_error:
+                    return {"error": find_error}
+
+                # 解析find命令的输出
+                file_count = int(stdout.read().decode('utf-8').strip())
+
+                return {
+                    "success": True,
+                    "total_size": total_size,
+                    "file_count": file_count,
+                    "path": path,
+                    "is_complete": True  # 标记为完整计算
+                }
+
+            return self.pool.run(ssh_info, _calculate)
+        except Exception as e:
+            logger.error(f"远程计算文件夹大小失败: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def _has_python(self, conn) -> bool:
+        """远程是否有可用的 python3，按服务器缓存，每台服务器只检查一次"""
+        key = conn.key
+        if key not in self._remote_python:
+            stdin, stdout, stderr = conn.exec_command(REMOTE_PYTHON_CHECK)
+            self._remote_python[key] = stdout.channel.recv_exit_status() == 0
+            if not self._remote_python[key]:
+                logger.warning(f"[RemoteFileService] python3 unavailable on {key}, remote helpers disabled")
+        return self._remote_python[key]
+
+    def _install_helper(self, conn, module, *depends) -> Optional[str]:
+        """
+        确保远程主机上有 module 对应的辅助脚本，返回其路径；远程没有可用的 python3 时返回 None
+
+        没有依赖时上传为单个文件 {名称}-{摘要}.py；有依赖时上传为目录 {名称}-{摘要}/，
+        其中各模块保持原文件名，脚本运行时可以直接 import 同目录的依赖。
+        结果按服务器缓存，每台服务器只检查和上传一次。
+        """
+        name = module.__name__.rsplit(".", 1)[-1]
+        cache_key = (conn.key, name)
+        if cache_key in self._helpers:
+            return self._helpers[cache_key]
+        if not self._has_python(conn):
+            return None
+        sources = []
+        for mod in (module,) + depends:
+            with open(mod.__file__, "rb") as f:
+                sources.append((os.path.basename(mod.__file__), f.read()))
+        digest = hashlib.sha1(b"".join(source for _, source in sources)).hexdigest()[:12]
+        sftp = conn.sftp
+        helper_dir = f"{sftp.normalize('.').rstrip('/')}/{HELPER_DIR}"
+        target = f"{helper_dir}/{name}-{digest}" + ("" if depends else ".py")
+        helper = f"{target}/{sources[0][0]}" if depends else target
+        try:
+            sftp.stat(helper)
+        except IOError:
+            self._ensure_remote_dirs(sftp, helper_dir)
+            temp = f"{target}.{os.getpid()}.part"
+            if depends:
+                self._ensure_remote_dirs(sftp, temp)
+                for filename, source in sources:
+                    with sftp.open(f"{temp}/{filename}", "wb") as f:
+                        f.write(source)
             else:
-                remote = config["remote_server_list"][0]
-                logger.info(f"[RemoteFileService] Using first server: {remote.get('server_name')}")
-            
+                with sftp.open(temp, "wb") as f:
+                    f.write(sources[0][1])
+            sftp.posix_rename(temp, target)
+            logger.info(f"[RemoteFileService] helper installed: {conn.key} {helper}")
+        self._helpers[cache_key] = helper
+        return helper
+
+    def _delta_helper(self, conn) -> Optional[str]:
+        return self._install_helper(conn, delta_sync)
+
+    def _remote_agent(self, conn) -> Optional[RemoteAgent]:
+        """连接上的远程辅助进程，按需启动并随连接复用；不可用时返回 None"""
+        if not self.use_agent:
+            return None
+        agent = conn.agent
+        if agent is not None and agent.alive:
+            return agent
+        script = self._install_helper(conn, remote_agent, file_search)
+        if script is None:
+            return None
+        try:
+            conn.agent = RemoteAgent.start(conn, script)
+        except Exception as e:
+            logger.warning(f"[RemoteFileService] remote agent failed to start on {conn.key}: {e}")
+            return None
+        logger.info(f"[RemoteFileService] remote agent started: {conn.key} pid={conn.agent.info.get('pid')}")
+        return conn.agent
+
+    def _agent_call(self, conn, op: str, **args) -> Optional[Any]:
+        """
+        经远程辅助进程执行 op，没有可用的辅助进程或其通道出错时返回 None，由调用方走原有实现
+
+        操作本身失败（如路径不存在）抛出 RemoteAgentError。
+        """
+        agent = self._remote_agent(conn)
+        if agent is None:
+            return None
+        try:
+            return agent.call(op, **args)
+        except RemoteAgentError:
+            raise
+        except Exception as e:
+            logger.warning(f"[RemoteFileService] remote agent failed on {conn.key}, falling back: op={op} error={e}")
+            agent.close()
+            conn.agent = None
+            return None
+
+    @staticmethod
+    def _delta_command(helper: str, *args: Any) -> str:
+        return " ".join(["python3", shlex.quote(helper)] + [shlex.quote(str(arg)) for arg in args])
+
+    @staticmethod
+    def _check_exit(stdout, stderr, what: str):
+        status = stdout.channel.recv_exit_status()
+        if status != 0:
+            error = stderr.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"{what} 失败（退出码 {status}）: {error}")
+
+    @staticmethod
+    def _delta_result(path: str, size: int, method: str, wire_bytes: int, **extra) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "method": method,
+            "path": path,
+            "size": size,
+            "wire_bytes": wire_bytes,
+            "saved_ratio": round(1 - wire_bytes / size, 4) if size else 0.0,
+            **extra,
+        }
+
+    def delta_upload(self, local_path: str, rel_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """
+        增量上传：把本地文件同步到远程同名文件，只发送远程旧文件中没有的数据
+
+        远程辅助脚本计算旧文件的块签名，本地用 mmap 打开新文件计算增量，增量流经 stdin
+        交给远程辅助脚本重建并原子替换目标文件。远程文件不存在或没有 python3 时整文件上传。
+
+        Returns:
+            {"success", "method": "delta"|"full", "path", "size", "wire_bytes", ...}
+        """
+        logger.info(f"[RemoteFileService] delta_upload: {local_path} -> {rel_path}")
+        host = None
+        try:
+            remote = self._get_remote("delta_upload")
             ssh_info = remote["config"]
             host = ssh_info["host_ip"]
-            port = ssh_info.get("ssh_port", 22)
-            username = ssh_info["user_name"]
-            password = ssh_info.get("user_pwd", "")
-            path = rel_path
-            
-            # 创建SSH连接
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            if password:
-                ssh.connect(host, port=port, username=username, password=password)
+            size = os.path.getsize(local_path)
+            if job is not None:
+                job.add_total(nbytes=size, files=1)
+                job.current = local_path
+
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                path = self._resolve_path(sftp, rel_path)
+                try:
+                    remote_attrs = sftp.stat(path)
+                except IOError:
+                    remote_attrs = None
+                helper = self._delta_helper(conn)
+                if remote_attrs is None or not stat.S_ISREG(remote_attrs.st_mode) or helper is None:
+                    self._ensure_remote_dirs(sftp, path.rsplit('/', 1)[0])
+                    stats = self.transfer_engine.upload(ssh_info, conn, local_path, path, size)
+                    if job is not None:
+                        job.add_bytes(size)
+                        job.file_done()
+                    logger.info(f"[RemoteFileService] delta_upload full copy: path={path} size={size}")
+                    return self._delta_result(path, size, "full", size, transfer=stats.to_dict())
+
+                block_size = delta_sync.choose_block_size(remote_attrs.st_size)
+                stdin, stdout, stderr = conn.exec_command(
+                    self._delta_command(helper, "signature", path, block_size))
+                signature_bytes = stdout.read()
+                self._check_exit(stdout, stderr, "计算远程签名")
+                signature = delta_sync.read_signature(io.BytesIO(signature_bytes))
+
+                delta_stats = delta_sync.DeltaStats()
+                stdin, stdout, stderr = conn.exec_command(self._delta_command(helper, "patch", path, path))
+                try:
+                    reported = 0
+                    with delta_sync.mapped_file(local_path) as data:
+                        for chunk in delta_sync.generate_delta(data, signature, delta_stats):
+                            stdin.write(chunk)
+                            if job is not None:
+                                processed = delta_stats.matched_bytes + delta_stats.literal_bytes
+                                job.add_bytes(processed - reported)
+                                reported = processed
+                                job.check_cancelled()
+                    stdin.channel.shutdown_write()
+                except BaseException:
+                    # 增量流没有结束标记，远程辅助脚本会放弃重建，目标文件保持不变
+                    stdin.channel.close()
+                    raise
+                stdout.read()
+                self._check_exit(stdout, stderr, "远程重建文件")
+            if job is not None:
+                job.file_done()
+            wire_bytes = len(signature_bytes) + delta_stats.delta_bytes
+            logger.info(
+                f"[RemoteFileService] delta_upload success: path={path} size={size} wire={wire_bytes} "
+                f"literal={delta_stats.literal_bytes}"
+            )
+            return self._delta_result(path, size, "delta", wire_bytes, block_size=block_size,
+                                      signature_bytes=len(signature_bytes), **delta_stats.to_dict())
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"增量上传失败 host={host} {local_path} -> {rel_path} error={e}")
+            return {"success": False, "error": str(e)}
+
+    def delta_download(self, rel_path: str, local_path: str, job: Optional[Job] = None) -> Dict[str, Any]:
+        """
+        增量下载：把远程文件同步到本地同名文件，只接收本地旧文件中没有的数据
+
+        本地计算旧文件的块签名经 stdin 发给远程辅助脚本，远程算出增量流回本地，
+        本地重建到临时文件、校验后原子替换。本地文件不存在或远程没有 python3 时整文件下载。
+        """
+        logger.info(f"[RemoteFileService] delta_download: {rel_path} -> {local_path}")
+        host = None
+        try:
+            remote = self._get_remote("delta_download")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                path = self._resolve_path(sftp, rel_path)
+                attrs = sftp.stat(path)
+                size = attrs.st_size
+                if job is not None:
+                    job.add_total(nbytes=size, files=1)
+                    job.current = path
+                helper = self._delta_helper(conn)
+                if not os.path.isfile(local_path) or helper is None:
+                    local_dir = os.path.dirname(os.path.abspath(local_path))
+                    os.makedirs(local_dir, exist_ok=True)
+                    fd, temp_path = tempfile.mkstemp(prefix=DOWNLOAD_TMP_PREFIX, dir=local_dir)
+                    os.close(fd)
+                    try:
+                        stats = self.transfer_engine.download(ssh_info, conn, path, temp_path, size, attrs.st_mtime)
+                        os.replace(temp_path, local_path)
+                    except BaseException:
+                        os.unlink(temp_path)
+                        raise
+                    if job is not None:
+                        job.add_bytes(size)
+                        job.file_done()
+                    logger.info(f"[RemoteFileService] delta_download full copy: path={path} size={size}")
+                    return self._delta_result(local_path, size, "full", size, transfer=stats.to_dict())
+
+                block_size = delta_sync.choose_block_size(os.path.getsize(local_path))
+                with open(local_path, "rb") as f:
+                    signature_bytes = delta_sync.build_signature(f, block_size).to_bytes()
+                stdin, stdout, stderr = conn.exec_command(self._delta_command(helper, "delta", path))
+                received = _CountingReader(stdout)
+
+                def _progress(nbytes):
+                    if job is not None:
+                        job.add_bytes(nbytes)
+                        job.check_cancelled()
+
+                try:
+                    stdin.write(signature_bytes)
+                    stdin.channel.shutdown_write()
+                    written = delta_sync.patch_file(local_path, local_path, received, _progress)
+                except BaseException:
+                    stdout.channel.close()
+                    raise
+                self._check_exit(stdout, stderr, "远程计算增量")
+            if job is not None:
+                job.file_done()
+            wire_bytes = len(signature_bytes) + received.count
+            logger.info(
+                f"[RemoteFileService] delta_download success: path={local_path} size={written} wire={wire_bytes}"
+            )
+            return self._delta_result(local_path, written, "delta", wire_bytes, block_size=block_size,
+                                      signature_bytes=len(signature_bytes), delta_bytes=received.count)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"增量下载失败 host={host} {rel_path} -> {local_path} error={e}")
+            return {"success": False, "error": str(e)}
+
+    def sync_dirs(self, local_root: str, remote_root: str, direction: str = "push", delete: bool = False,
+                  dry_run: bool = False, checksum: bool = False, job: Optional[Job] = None,
+                  workers: int = DEFAULT_SYNC_WORKERS, cache_dir=DEFAULT_MANIFEST_CACHE_DIR) -> Dict[str, Any]:
+        """
+        把本地目录与当前服务器上的目录同步为一致
+
+        Args:
+            direction: push 以本地为准更新远程，pull 以远程为准更新本地
+            delete: 删除目标端多余的文件和目录
+            dry_run: 只生成计划（返回 actions），不做任何修改
+            checksum: 大小相同但修改时间不同的文件比较 MD5，内容相同则不传输
+            workers: 并行执行文件操作的线程数（各自借用池化连接）
+
+        Returns:
+            {"success", "dry_run", 计划汇总..., "conflicts", "actions"（仅 dry_run）, "done", "failed"}
+        """
+        logger.info(
+            f"[RemoteFileService] sync_dirs: local={local_root} remote={remote_root} direction={direction} "
+            f"delete={delete} dry_run={dry_run} checksum={checksum}"
+        )
+        host = None
+        try:
+            if direction not in SYNC_DIRECTIONS:
+                return {"success": False, "error": f"不支持的同步方向: {direction}"}
+            remote = self._get_remote("sync_dirs")
+            ssh_info = remote["config"]
+            host = ssh_info["host_ip"]
+            local_root = os.path.abspath(local_root)
+            if direction == "push" and not os.path.isdir(local_root):
+                return {"success": False, "error": f"本地目录不存在: {local_root}"}
+
+            started = time.monotonic()
+            with self.pool.connection(ssh_info) as conn:
+                remote_root = self._resolve_path(conn.sftp, remote_root)
+                remote_manifest = self._scan_remote_tree(conn, remote_root)
+                if remote_manifest is None:
+                    if direction == "pull":
+                        return {"success": False, "error": f"远程目录不存在: {remote_root}"}
+                    remote_manifest = Manifest()
+            local_manifest = scan_local(local_root)
+            if job is not None:
+                job.message = (
+                    f"清单：本地 {len(local_manifest.files)} 个文件，远程 {len(remote_manifest.files)} 个文件"
+                )
+
+            cache = ManifestCache(cache_dir, [remote.get("server_name", host), local_root, remote_root]).load()
+            hashes = None
+            if checksum:
+                hashes = self._sync_hashes(ssh_info, local_root, remote_root, local_manifest, remote_manifest,
+                                           cache, workers)
+            plan = diff_manifests(local_manifest, remote_manifest, direction, cache, delete, hashes)
+            cache.prune(local_manifest, remote_manifest)
+            result = {
+                "success": True,
+                "dry_run": dry_run,
+                "local_path": local_root,
+                "remote_path": remote_root,
+                **plan.summary(),
+                "conflicts": plan.conflicts,
+                "scan_elapsed": round(time.monotonic() - started, 3),
+            }
+            if dry_run:
+                cache.save()
+                result["actions"] = plan.actions
+                logger.info(f"[RemoteFileService] sync_dirs dry run: {plan.summary()}")
+                return result
+
+            if direction == "push":
+                with self.pool.connection(ssh_info) as conn:
+                    self._ensure_remote_dirs(conn.sftp, remote_root)
             else:
-                ssh.connect(host, port=port, username=username, allow_agent=True, look_for_keys=True)
-            
-            # 处理路径
-            if path == "~" or path.startswith("~/"):
-                sftp = ssh.open_sftp()
-                home = sftp.normalize(".")
-                sftp.close()
-                if path == "~":
-                    path = home
+                os.makedirs(local_root, exist_ok=True)
+            handlers = self._sync_handlers(remote.get("server_name"), ssh_info, local_root, remote_root, direction,
+                                           local_manifest, remote_manifest, cache, job)
+            try:
+                outcome = execute_plan(plan, handlers, job, workers)
+            finally:
+                cache.save()
+            result.update(outcome)
+            result["elapsed"] = round(time.monotonic() - started, 3)
+            logger.info(
+                f"[RemoteFileService] sync_dirs success: {plan.summary()} done={outcome['done']} "
+                f"failed={len(outcome['failed'])} elapsed={result['elapsed']}s"
+            )
+            return result
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"目录同步失败 host={host} local={local_root} remote={remote_root} error={e}")
+            return {"success": False, "error": str(e)}
+
+    def _scan_remote_tree(self, conn, root: str) -> Optional[Manifest]:
+        """
+        列出远程目录树：优先用远程辅助进程，其次一次 find；目录不存在返回 None，
+        find 不可用时退回 SFTP 逐级列目录
+        """
+        try:
+            attrs = conn.sftp.stat(root)
+        except IOError:
+            return None
+        if not stat.S_ISDIR(attrs.st_mode):
+            raise ValueError(f"远程路径不是目录: {root}")
+        result = self._agent_call(conn, "manifest", root=root)
+        if result is not None:
+            files = {rel: (size, mtime) for rel, (size, mtime) in result["files"].items()}
+            return Manifest(files, set(result["dirs"]))
+        stdin, stdout, stderr = conn.exec_command(REMOTE_MANIFEST_COMMAND.format(path=shlex.quote(root)))
+        drainer, errors = self._drain_stderr(stderr)
+        output = stdout.read()
+        status = stdout.channel.recv_exit_status()
+        drainer.join()
+        if status == 0 or output:
+            if status != 0:
+                # 部分子目录无权限时 find 仍会列出其余内容
+                error = errors.decode("utf-8", errors="replace").strip()
+                logger.warning(f"[RemoteFileService] remote manifest incomplete: {error}")
+            return parse_remote_manifest(output)
+        logger.warning(f"[RemoteFileService] find unavailable (exit {status}), listing over SFTP: {root}")
+        return scan_remote_sftp(conn.sftp, root)
+
+    def _sync_hashes(self, ssh_info: Dict[str, Any], local_root: str, remote_root: str, local: Manifest,
+                     remote: Manifest, cache: ManifestCache, workers: int) -> Dict[str, Any]:
+        """
+        为需要比较内容的文件取得两端 MD5，优先使用缓存；缺失的本地并行计算，
+        远程经辅助进程或一次 exec 批量计算
+        """
+        candidates = hash_candidates(local, remote, cache)
+        local_missing = [rel for rel in candidates if cache.get_hash("local", rel, local.files[rel]) is None]
+        remote_missing = [rel for rel in candidates if cache.get_hash("remote", rel, remote.files[rel]) is None]
+        logger.info(
+            f"[RemoteFileService] sync hashes: candidates={len(candidates)} "
+            f"local_missing={len(local_missing)} remote_missing={len(remote_missing)}"
+        )
+        if local_missing:
+            with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="sync-hash") as executor:
+                digests = executor.map(lambda rel: hash_local_file(join_rel(local_root, rel, os.sep)), local_missing)
+                for rel, digest in zip(local_missing, digests):
+                    cache.set_hash("local", rel, local.files[rel], digest)
+        if remote_missing:
+            with self.pool.connection(ssh_info) as conn:
+                digests = self._agent_call(conn, "hash", root=remote_root, paths=remote_missing, algorithm="md5")
+                if digests is None:
+                    digests = parse_remote_hashes(self._exec_remote_hashes(conn, remote_root, remote_missing))
+            for rel, digest in digests.items():
+                if rel in remote.files:
+                    cache.set_hash("remote", rel, remote.files[rel], digest)
+        return {
+            rel: (cache.get_hash("local", rel, local.files[rel]), cache.get_hash("remote", rel, remote.files[rel]))
+            for rel in candidates
+        }
+
+    @staticmethod
+    def _exec_remote_hashes(conn, remote_root: str, paths: List[str]) -> bytes:
+        """一次 exec 批量计算远程文件的 MD5，返回 md5sum -z 的输出"""
+        stdin, stdout, stderr = conn.exec_command(REMOTE_HASH_COMMAND.format(path=shlex.quote(remote_root)))
+        names = b"\0".join(rel.encode("utf-8", errors="surrogateescape") for rel in paths)
+
+        def _feed():
+            # 单独线程写入文件列表，避免输出填满通道窗口时双方互相等待
+            try:
+                stdin.write(names)
+            finally:
+                stdin.channel.shutdown_write()
+
+        feeder = threading.Thread(target=_feed, name="sync-hash-feed", daemon=True)
+        feeder.start()
+        output = stdout.read()
+        feeder.join()
+        return output
+
+    def _sync_handlers(self, server_name: Optional[str], ssh_info: Dict[str, Any], local_root: str,
+                       remote_root: str, direction: str, local: Manifest, remote: Manifest,
+                       cache: ManifestCache, job: Optional[Job]) -> Dict[str, Any]:
+        """生成 execute_plan 使用的各操作处理函数"""
+
+        def local_path(rel):
+            return join_rel(local_root, rel, os.sep)
+
+        def remote_path(rel):
+            return join_rel(remote_root, rel)
+
+        def count(nbytes):
+            if job is not None:
+                job.add_bytes(nbytes)
+                job.check_cancelled()
+
+        def delta(action) -> bool:
+            """已修改的大文件走增量传输，成功返回 True"""
+            if action["reason"] != "modified" or action["size"] < SYNC_DELTA_THRESHOLD:
+                return False
+            rel = action["path"]
+            with self.server_scope(server_name):
+                if direction == "push":
+                    result = self.delta_upload(local_path(rel), remote_path(rel))
                 else:
-                    path = home + path[1:]
-            
-            if not path.startswith("/"):
-                path = "/" + path
-            
-            # 使用du命令获取文件夹大小和find命令获取文件数量
-            du_command = f'du -sb "{path}"'
-            find_command = f'find "{path}" -type f | wc -l'
-            
-            # 执行命令
-            stdin, stdout, stderr = ssh.exec_command(du_command)
-            du_error = stderr.read().decode('utf-8').strip()
-            if du_error:
-                ssh.close()
-                return {"error": du_error}
-            
-            # 解析du命令的输出
-            du_output = stdout.read().decode('utf-8').strip()
-            total_size = int(du_output.split()[0])
-            
-            # 执行find命令获取文件数量
-            stdin, stdout, stderr = ssh.exec_command(find_command)
-            find_error = stderr.read().decode('utf-8').strip()
-            if find_error:
-                ssh.close()
-                return {"error": find_error}
-            
-            # 解析find命令的输出
-            file_count = int(stdout.read().decode('utf-8').strip())
-            
-            ssh.close()
-            
+                    result = self.delta_download(remote_path(rel), local_path(rel))
+            if not result.get("success"):
+                raise RuntimeError(result.get("error"))
+            count(action["size"])
+            return True
+
+        def counted(chunks):
+            for chunk in chunks:
+                yield chunk
+                count(len(chunk))
+
+        def push_file(action):
+            rel = action["path"]
+            src = local_path(rel)
+            dst = remote_path(rel)
+            copied = delta(action)
+            with self.pool.connection(ssh_info) as conn:
+                sftp = conn.sftp
+                if not copied:
+                    # 先写临时文件再改名，传输失败时目标端的旧文件保持不变
+                    temp = f"{posixpath.dirname(dst)}/.{posixpath.basename(dst)}.sync-{os.getpid()}.part"
+                    try:
+                        with open(src, "rb") as f:
+                            self._write_remote_file(sftp, temp, counted(iter_file_chunks(f)))
+                        sftp.posix_rename(temp, dst)
+                    except BaseException:
+                        # 传输、取消或改名失败都不留下临时文件
+                        try:
+                            sftp.remove(temp)
+                        except IOError:
+                            pass
+                        raise
+                st = os.stat(src)
+                sftp.utime(dst, (st.st_atime, st.st_mtime))
+                attrs = sftp.stat(dst)
+            cache.record_pair(rel, (st.st_size, st.st_mtime), (attrs.st_size, float(attrs.st_mtime)))
+
+        def pull_file(action):
+            rel = action["path"]
+            src = remote_path(rel)
+            dst = local_path(rel)
+            if not delta(action):
+                with self.pool.connection(ssh_info) as conn:
+                    with conn.sftp.open(src, "rb") as remote_file:
+                        remote_file.prefetch(action["size"], max_concurrent_requests=DOWNLOAD_PREFETCH_REQUESTS)
+                        mode = remote_file.stat().st_mode
+                        fd, temp = tempfile.mkstemp(prefix=DOWNLOAD_TMP_PREFIX, dir=os.path.dirname(dst))
+                        try:
+                            with os.fdopen(fd, "wb") as out:
+                                for chunk in counted(iter(lambda: remote_file.read(DOWNLOAD_CHUNK_SIZE), b"")):
+                                    out.write(chunk)
+                            # mkstemp 创建的文件权限为 0600，改为远程文件的权限
+                            if mode is not None:
+                                os.chmod(temp, stat.S_IMODE(mode) & 0o777)
+                            os.replace(temp, dst)
+                        except BaseException:
+                            os.unlink(temp)
+                            raise
+            size, mtime = remote.files[rel]
+            os.utime(dst, (os.stat(dst).st_atime, mtime))
+            st = os.stat(dst)
+            cache.record_pair(rel, (st.st_size, st.st_mtime), (size, mtime))
+
+        def remote_op(func):
+            def _run(action):
+                with self.pool.connection(ssh_info) as conn:
+                    func(conn.sftp, remote_path(action["path"]))
+            return _run
+
+        def remote_mkdir(sftp, path):
+            try:
+                sftp.mkdir(path)
+            except IOError:
+                if not stat.S_ISDIR(sftp.stat(path).st_mode):
+                    raise
+
+        if direction == "push":
             return {
-                "success": True,
-                "total_size": total_size,
-                "file_count": file_count,
-                "path": path,
-                "is_complete": True  # 标记为完整计算
+                OP_MKDIR: remote_op(remote_mkdir),
+                OP_COPY: push_file,
+                OP_DELETE: remote_op(lambda sftp, path: sftp.remove(path)),
+                OP_RMDIR: remote_op(lambda sftp, path: sftp.rmdir(path)),
             }
-        except Exception as e:
-            logger.error(f"远程计算文件夹大小失败: {str(e)}")
-            return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {
+            OP_MKDIR: lambda action: os.makedirs(local_path(action["path"]), exist_ok=True),
+            OP_COPY: pull_file,
+            OP_DELETE: lambda action: os.remove(local_path(action["path"])),
+            OP_RMDIR: lambda action: os.rmdir(local_path(action["path"])),
+        }
+
+
+class _CountingReader:
+    """包装只读流，统计读到的字节数"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
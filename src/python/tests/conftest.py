@@ -1,17 +1,33 @@
 import pytest
+import io
+import json
 import tempfile
 import os
 import shutil
+import socket
+import threading
 from unittest.mock import patch, MagicMock
 import sys
 from pathlib import Path
 
+import paramiko
+from paramiko.sftp import CMD_EXTENDED
+
 # Add parent directory to Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app import app
 from service.impl.local_file_service import LocalFileService
-from service.impl.remote_file_service import RemoteFileService
+from service.impl.remote_file_service import RemoteFileService, _current_server_name
+from utils.config_store import ConfigStore
+from utils.download_cache import DownloadCache
+
+@pytest.fixture(autouse=True)
+def reset_selected_server():
+    """Keep the per-request server selection from leaking between tests."""
+    token = _current_server_name.set(None)
+    yield
+    _current_server_name.reset(token)
 
 @pytest.fixture
 def client():
@@ -47,14 +63,30 @@ def sample_files(temp_dir):
     return files
 
 @pytest.fixture
-def local_service():
+def config_file(tmp_path, mock_config):
+    """Write the mock configuration to a temporary config.json."""
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(mock_config), encoding="utf-8")
+    return path
+
+@pytest.fixture
+def config_store(config_file):
+    """Create a ConfigStore that re-checks the file on every access."""
+    return ConfigStore(config_file, check_interval=0)
+
+@pytest.fixture
+def local_service(config_store):
     """Create a LocalFileService instance."""
-    return LocalFileService()
+    return LocalFileService(config_store=config_store)
 
 @pytest.fixture
-def remote_service():
-    """Create a RemoteFileService instance."""
-    return RemoteFileService()
+def remote_service(config_store, tmp_path):
+    """Create a RemoteFileService on the SFTP/exec code paths (agent tests enable the remote helper).
+
+    The download cache is disabled so downloads stream straight from SFTP; cache tests enable it.
+    """
+    return RemoteFileService(config_store=config_store, use_agent=False,
+                             download_cache=DownloadCache(tmp_path / 'download_cache', max_bytes=0))
 
 @pytest.fixture
 def mock_config():
@@ -89,5 +121,148 @@ def mock_file_obj():
     """Mock file object for upload tests."""
     file_obj = MagicMock()
     file_obj.filename = "test.txt"
+    file_obj.stream = io.BytesIO(b"test content")
     file_obj.save = MagicMock()
-    return file_obj
\ No newline at end of file
+    return file_obj
+class _LoopbackSFTPServer(paramiko.SFTPServerInterface):
+    """SFTP server over the local filesystem that records stat requests."""
+
+    stats = None
+
+    def stat(self, path):
+        self.stats.append(path)
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def list_folder(self, path):
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)), name)
+                    for name in os.listdir(path)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        if os.path.lexists(newpath):
+            return paramiko.SFTP_FAILURE
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(path, attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def symlink(self, target_path, path):
+        try:
+            os.symlink(target_path, path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def readlink(self, path):
+        try:
+            return os.readlink(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        mode = 'r+b' if flags & os.O_RDWR else 'wb' if flags & os.O_WRONLY else 'rb'
+        handle = paramiko.SFTPHandle(flags)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+class _LoopbackSFTPHandler(paramiko.SFTPServer):
+    """SFTP subsystem that also implements the copy-data extension unless copy_data is turned off.
+
+    With copy_data off and unsupported_desc set, the OP_UNSUPPORTED reply carries that message instead.
+    """
+
+    copy_data = True
+    unsupported_desc = None
+
+    def _process(self, t, request_number, msg):
+        if t == CMD_EXTENDED and self.copy_data:
+            position = msg.packet.tell()
+            if msg.get_text() == 'copy-data':
+                src = self.file_table[msg.get_binary()].readfile
+                src.seek(msg.get_int64())
+                length = msg.get_int64()
+                dst = self.file_table[msg.get_binary()].writefile
+                dst.seek(msg.get_int64())
+                dst.write(src.read(length or -1))
+                dst.flush()
+                self._send_status(request_number, paramiko.SFTP_OK)
+                return
+            msg.packet.seek(position)
+        if t == CMD_EXTENDED and self.unsupported_desc is not None:
+            self._send_status(request_number, paramiko.SFTP_OP_UNSUPPORTED, self.unsupported_desc)
+            return
+        super()._process(t, request_number, msg)
+
+class _AcceptAll(paramiko.ServerInterface):
+    def check_auth_none(self, username):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'none'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+@pytest.fixture
+def sftp_loopback():
+    """A real paramiko SFTPClient talking to an in-process server over a socket pair."""
+    client_sock, server_sock = socket.socketpair()
+    server = paramiko.Transport(server_sock)
+    server.add_server_key(paramiko.RSAKey.generate(1024))
+    server.set_subsystem_handler('sftp', _LoopbackSFTPHandler, _LoopbackSFTPServer)
+    threading.Thread(target=server.start_server, kwargs={'server': _AcceptAll()}, daemon=True).start()
+    client = paramiko.Transport(client_sock)
+    client.connect()
+    client.auth_none('test')
+    _LoopbackSFTPServer.stats = stats = []
+    _LoopbackSFTPHandler.copy_data = True
+    _LoopbackSFTPHandler.unsupported_desc = None
+    sftp = paramiko.SFTPClient.from_transport(client)
+    yield {'sftp': sftp, 'transport': client, 'stats': stats, 'handler': _LoopbackSFTPHandler}
+    sftp.close()
+    client.close()
+    server.close()
@@ -4,6 +4,7 @@ import os
 from unittest.mock import patch, MagicMock
 from werkzeug.datastructures import FileStorage
 import io
+from utils.download_cache import CachedFileStream, DownloadCache
 
 class TestAppRoutes:
     """Test Flask application routes."""
@@ -43,6 +44,299 @@ class TestAPIEndpoints:
         assert data['path'] == '/test/path'
         mock_service.list_dir.assert_called_once_with('local', '/test/path')
     
+    @patch('app.get_service')
+    def test_api_list_with_sizes_single_call(self, mock_get_service, client):
+        """Test subdirectory sizes come from one batched sizing call."""
+        mock_service = MagicMock()
+        mock_service.list_dir.return_value = {
+            'dirs': [{'name': 'a', 'type': 'dir', 'size': None, 'mtime': 1}, {'name': 'locked', 'type': 'dir', 'size': None, 'mtime': 1}],
+            'files': [],
+            'path': '/home/testuser/data'
+        }
+        mock_service.calculate_child_sizes.return_value = {
+            'success': True, 'total_size': 300, 'file_count': 3, 'is_complete': False,
+            'children': {'a': {'total_size': 200, 'file_count': 2}}
+        }
+        mock_get_service.return_value = mock_service
+        
+        response = client.get('/api/list_with_sizes?mode=remote&path=~/data')
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert data['dir_info'] == {'total_size': 300, 'file_count': 3, 'is_complete': False}
+        assert [d['size'] for d in data['dirs']] == [200, None]
+        mock_service.calculate_child_sizes.assert_called_once_with('remote', '/home/testuser/data')
+        mock_service.calculate_folder_size.assert_not_called()
+    
+    @patch('app.get_service')
+    def test_api_server_param_selects_server(self, mock_get_service, client):
+        """Test the server query parameter scopes the request to that server."""
+        import app as app_module
+        seen = []
+        mock_service = MagicMock()
+        mock_service.list_dir.side_effect = lambda mode, path: seen.append(app_module.remote_service.current_server_name) or {}
+        mock_get_service.return_value = mock_service
+        
+        client.get('/api/list?mode=remote&path=/&server=other_server')
+        client.get('/api/list?mode=remote&path=/')
+        
+        assert seen == ['other_server', None]
+    
+    @patch('app.remote_service.save_server_pwd', return_value={'success': True})
+    @patch('app.get_service')
+    def test_api_server_remembered_in_session(self, mock_get_service, mock_save, client):
+        """Test the server chosen at login is remembered per browser session."""
+        import app as app_module
+        seen = []
+        mock_service = MagicMock()
+        mock_service.list_dir.side_effect = lambda mode, path: seen.append(app_module.remote_service.current_server_name) or {}
+        mock_get_service.return_value = mock_service
+        
+        client.post('/api/save_server_pwd', json={'server_name': 'other_server', 'user_pwd': 'x'})
+        client.get('/api/list?mode=remote&path=/')
+        with app_module.app.test_client() as other_browser:
+            other_browser.get('/api/list?mode=remote&path=/')
+        
+        assert seen == ['other_server', None]
+    
+    @patch('app.remote_service')
+    def test_api_fan_out_streams_ndjson(self, mock_remote_service, client):
+        """Test fan-out results are streamed one JSON line per server plus a summary."""
+        mock_remote_service.fan_out.return_value = iter([
+            {'server': 'b', 'elapsed': 0.1, 'result': {'dirs': [], 'files': [], 'path': '/data'}},
+            {'server': 'a', 'elapsed': 5.0, 'error': '超时（5 秒）'},
+        ])
+        
+        response = client.get('/api/fan_out?op=list_dir&path=/data&servers=a,b&timeout=5')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        assert [line.get('server') for line in lines[:2]] == ['b', 'a']
+        assert lines[2]['done'] is True
+        assert lines[2]['servers'] == 2
+        assert lines[2]['failed'] == 1
+        mock_remote_service.fan_out.assert_called_once_with('list_dir', '/data', ['a', 'b'], timeout=5.0)
+    
+    @patch('app.get_service')
+    def test_api_search(self, mock_get_service, client):
+        """Test search parameters are passed through and invalid ones rejected."""
+        mock_service = MagicMock()
+        mock_service.search_files.return_value = {
+            'success': True, 'path': '/data', 'truncated': False,
+            'entries': [{'path': '/data/a.log', 'name': 'a.log', 'type': 'file', 'size': 1, 'mtime': 1}],
+        }
+        mock_get_service.return_value = mock_service
+        
+        response = client.get('/api/search?mode=remote&path=/data&pattern=*.log&kind=file&limit=50')
+        assert response.status_code == 200
+        assert json.loads(response.data)['entries'][0]['name'] == 'a.log'
+        mock_service.search_files.assert_called_once_with('remote', '/data', '*.log', 'file', 50)
+        
+        assert client.get('/api/search?mode=remote&path=/data').status_code == 400
+        assert client.get('/api/search?mode=remote&path=/data&pattern=*&limit=x').status_code == 400
+        assert client.get('/api/search?mode=remote&path=/data&pattern=*&limit=0').status_code == 400
+        mock_service.search_files.return_value = {'success': False, 'error': '所选路径不是文件夹'}
+        assert client.get('/api/search?mode=remote&path=/data&pattern=*').status_code == 400
+    
+    def test_api_fan_out_invalid(self, client):
+        """Test fan-out rejects missing paths and unsupported operations."""
+        assert client.get('/api/fan_out?op=list_dir').status_code == 400
+        assert client.get('/api/fan_out?op=delete_file&path=/').status_code == 400
+        assert client.get('/api/fan_out?path=/&timeout=abc').status_code == 400
+        for timeout in ('nan', 'inf', '-1', '0', '301'):
+            assert client.get(f'/api/fan_out?path=/&timeout={timeout}').status_code == 400
+    
+    @patch('app.remote_service')
+    def test_api_transfer_job(self, mock_remote_service, client):
+        """Test a transfer runs as a background job whose status can be polled."""
+        import app as app_module
+        mock_remote_service.transfer_between_servers.return_value = {'success': True, 'method': 'relay', 'path': '/b/f', 'files': 1, 'bytes': 3}
+        
+        response = client.post('/api/transfer', json={
+            'src_server': 'a', 'src_path': '/f', 'dst_server': 'b', 'dst_path': '/b'
+        })
+        assert response.status_code == 200
+        job_id = json.loads(response.data)['job_id']
+        app_module.jobs.wait(job_id, timeout=5)
+        
+        data = json.loads(client.get(f'/api/jobs/{job_id}').data)
+        assert data['status'] == 'done'
+        assert data['result']['path'] == '/b/f'
+        assert mock_remote_service.transfer_between_servers.call_args.args[:4] == ('a', '/f', 'b', '/b')
+        assert any(job['job_id'] == job_id for job in json.loads(client.get('/api/jobs?kind=transfer').data)['jobs'])
+    
+    @patch('app.remote_service')
+    def test_api_transfer_failure(self, mock_remote_service, client):
+        """Test a failed transfer marks the job failed."""
+        import app as app_module
+        mock_remote_service.transfer_between_servers.return_value = {'success': False, 'error': 'No such file'}
+        
+        response = client.post('/api/transfer', json={
+            'src_server': 'a', 'src_path': '/f', 'dst_server': 'b', 'dst_path': '/b', 'method': 'auto'
+        })
+        job_id = json.loads(response.data)['job_id']
+        app_module.jobs.wait(job_id, timeout=5)
+        
+        data = json.loads(client.get(f'/api/jobs/{job_id}').data)
+        assert data['status'] == 'failed'
+        assert data['error'] == 'No such file'
+    
+    def test_api_transfer_invalid(self, client):
+        """Test missing parameters and unknown methods are rejected."""
+        assert client.post('/api/transfer', json={'src_server': 'a'}).status_code == 400
+        assert client.post('/api/transfer', json={
+            'src_server': 'a', 'src_path': '/f', 'dst_server': 'b', 'dst_path': '/b', 'method': 'ftp'
+        }).status_code == 400
+        assert client.get('/api/jobs/missing').status_code == 404
+        assert client.post('/api/jobs/missing/cancel').status_code == 404
+    
+    @patch('app.remote_service')
+    def test_api_delta_sync_job(self, mock_remote_service, client, tmp_path):
+        """Test a delta upload runs as a job scoped to the selected server."""
+        import app as app_module
+        local_file = tmp_path / 'data.bin'
+        local_file.write_bytes(b'data')
+        mock_remote_service.current_server_name = 'test_server'
+        mock_remote_service.delta_upload.return_value = {'success': True, 'method': 'delta', 'wire_bytes': 10}
+        
+        response = client.post('/api/delta_sync', json={
+            'direction': 'upload', 'local_path': str(local_file), 'remote_path': '/data/data.bin'
+        })
+        assert response.status_code == 200
+        job_id = json.loads(response.data)['job_id']
+        app_module.jobs.wait(job_id, timeout=5)
+        
+        data = json.loads(client.get(f'/api/jobs/{job_id}').data)
+        assert data['status'] == 'done'
+        assert data['params']['server'] == 'test_server'
+        assert mock_remote_service.delta_upload.call_args.args[:2] == (str(local_file), '/data/data.bin')
+        mock_remote_service.server_scope.assert_called_with('test_server')
+    
+    def test_api_delta_sync_invalid(self, client, tmp_path):
+        """Test missing paths, unknown directions and missing local files are rejected."""
+        assert client.post('/api/delta_sync', json={'direction': 'upload'}).status_code == 400
+        assert client.post('/api/delta_sync', json={
+            'direction': 'sideways', 'local_path': '/a', 'remote_path': '/b'
+        }).status_code == 400
+        assert client.post('/api/delta_sync', json={
+            'direction': 'upload', 'local_path': str(tmp_path / 'missing'), 'remote_path': '/b'
+        }).status_code == 404
+    
+    @patch('app.remote_service')
+    def test_api_sync_job(self, mock_remote_service, client):
+        """Test a sync runs as a job with its options passed through."""
+        import app as app_module
+        mock_remote_service.current_server_name = 'test_server'
+        mock_remote_service.sync_dirs.return_value = {'success': True, 'dry_run': True, 'copy': 2, 'actions': []}
+        
+        response = client.post('/api/sync', json={
+            'local_path': '/data/local', 'remote_path': '/data/remote', 'direction': 'pull', 'dry_run': True
+        })
+        job_id = json.loads(response.data)['job_id']
+        app_module.jobs.wait(job_id, timeout=5)
+        
+        data = json.loads(client.get(f'/api/jobs/{job_id}').data)
+        assert data['status'] == 'done'
+        assert data['result']['copy'] == 2
+        call = mock_remote_service.sync_dirs.call_args
+        assert call.args == ('/data/local', '/data/remote', 'pull')
+        assert call.kwargs['dry_run'] is True and call.kwargs['delete'] is False
+        mock_remote_service.server_scope.assert_called_with('test_server')
+    
+    def test_api_sync_invalid(self, client):
+        """Test missing paths and unknown directions are rejected."""
+        assert client.post('/api/sync', json={'local_path': '/a'}).status_code == 400
+        assert client.post('/api/sync', json={
+            'local_path': '/a', 'remote_path': '/b', 'direction': 'both'
+        }).status_code == 400
+    
+    @patch('app.remote_service')
+    def test_api_upload_tar(self, mock_remote_service, client):
+        """Test the tar upload pairs manifest entries with the streamed file parts."""
+        received = []
+        
+        def upload_tar(mode, rel_path, members):
+            for name, size, mtime, chunks in members:
+                received.append((name, size, mtime, b''.join(chunks)))
+            return {'success': True, 'files': len(received)}
+        
+        mock_remote_service.upload_tar.side_effect = upload_tar
+        manifest = [{'name': 'dir/a.txt', 'size': 3, 'mtime': 1700000000}, {'name': 'dir/sub/b.txt', 'size': 2}]
+        response = client.post('/api/upload/tar?mode=remote&path=/data', data={
+            'manifest': json.dumps(manifest),
+            'file': [(io.BytesIO(b'abc'), 'dir/a.txt'), (io.BytesIO(b'de'), 'dir/sub/b.txt')],
+        }, content_type='multipart/form-data')
+        
+        assert response.status_code == 200
+        assert json.loads(response.data)['files'] == 2
+        assert received == [('dir/a.txt', 3, 1700000000.0, b'abc'), ('dir/sub/b.txt', 2, None, b'de')]
+        assert mock_remote_service.upload_tar.call_args.args[:2] == ('remote', '/data')
+    
+    def test_api_upload_tar_invalid(self, client):
+        """Test local mode, missing manifests and unsafe names are rejected."""
+        body = {'manifest': json.dumps([{'name': 'a', 'size': 1}]), 'file': (io.BytesIO(b'x'), 'a')}
+        assert client.post('/api/upload/tar?mode=local&path=/data', data=dict(body),
+                           content_type='multipart/form-data').status_code == 400
+        assert client.post('/api/upload/tar?mode=remote&path=/data', data={'file': (io.BytesIO(b'x'), 'a')},
+                           content_type='multipart/form-data').status_code == 400
+        bad = {'manifest': json.dumps([{'name': '../a', 'size': 1}]), 'file': (io.BytesIO(b'x'), 'a')}
+        assert client.post('/api/upload/tar?mode=remote&path=/data', data=bad,
+                           content_type='multipart/form-data').status_code == 400
+    
+    @patch('app.get_service')
+    def test_api_upload_batch(self, mock_get_service, client):
+        """Test every file part is streamed to one upload_batch call."""
+        received = []
+        
+        def upload_batch(mode, rel_path, files):
+            for name, chunks in files:
+                received.append((name, b''.join(chunks)))
+            return {'success': True, 'files': len(received), 'failed': 0,
+                    'results': [{'name': name, 'success': True} for name, _ in received]}
+        
+        mock_get_service.return_value.upload_batch.side_effect = upload_batch
+        response = client.post('/api/upload/batch?mode=remote&path=/data', data={
+            'note': 'ignored',
+            'file': [(io.BytesIO(b'abc'), 'a.txt'), (io.BytesIO(b'de'), 'dir/b.txt')],
+        }, content_type='multipart/form-data')
+        
+        assert response.status_code == 200
+        assert json.loads(response.data)['files'] == 2
+        assert received == [('a.txt', b'abc'), ('dir/b.txt', b'de')]
+        mock_get_service.assert_called_with('remote')
+    
+    def test_api_upload_batch_invalid(self, client):
+        """Test missing paths and bodies without files are rejected."""
+        assert client.post('/api/upload/batch?mode=local', data={'file': (io.BytesIO(b'x'), 'a')},
+                           content_type='multipart/form-data').status_code == 400
+        assert client.post('/api/upload/batch?mode=local&path=/tmp', data={'note': 'x'},
+                           content_type='multipart/form-data').status_code == 400
+    
+    @patch('app.get_service')
+    def test_api_download_archive(self, mock_get_service, client):
+        """Test the archive stream becomes an attachment response and POSTed names are passed on."""
+        from utils.archive_stream import ArchiveStream
+        mock_get_service.return_value.open_archive_stream.return_value = {
+            'success': True, 'stream': ArchiveStream(iter([b'PK', b'data']), '项目.zip', 'application/zip'),
+        }
+        
+        response = client.post('/api/download/archive?mode=remote',
+                               data={'path': '/data/项目', 'format': 'zip', 'name': ['a', 'b']})
+        
+        assert response.status_code == 200
+        assert response.data == b'PKdata'
+        assert response.mimetype == 'application/zip'
+        assert "filename*=UTF-8''" in response.headers['Content-Disposition']
+        mock_get_service.return_value.open_archive_stream.assert_called_once_with('remote', '/data/项目', ['a', 'b'], 'zip')
+    
+    @patch('app.get_service')
+    def test_api_download_archive_errors(self, mock_get_service, client):
+        """Test missing paths, unknown formats and missing files."""
+        assert client.get('/api/download/archive?mode=local').status_code == 400
+        assert client.get('/api/download/archive?mode=local&path=/d&format=rar').status_code == 400
+        mock_get_service.return_value.open_archive_stream.return_value = {'success': False, 'error': '文件不存在: /d/x'}
+        assert client.get('/api/download/archive?mode=local&path=/d&name=x').status_code == 404
+    
     @patch('app.get_service')
     def test_api_list_remote(self, mock_get_service, client):
         """Test /api/list endpoint for remote mode."""
@@ -87,6 +381,105 @@ class TestAPIEndpoints:
         assert data['success'] is True
         assert data['path'] == '/test/path/test.txt'
     
+    @patch('app.remote_service')
+    def test_api_upload_remote_streams(self, mock_remote_service, client):
+        """Test remote upload is piped from the request stream to upload_stream."""
+        received = {}
+        
+        def upload_stream(mode, rel_path, filename, chunks):
+            received['args'] = (mode, rel_path, filename)
+            received['data'] = b''.join(chunks)
+            return {'success': True, 'path': '/remote/path/test.txt'}
+        
+        mock_remote_service.upload_stream.side_effect = upload_stream
+        file_obj = FileStorage(
+            stream=io.BytesIO(b'remote file content'),
+            filename='test.txt',
+            content_type='text/plain'
+        )
+        
+        response = client.post('/api/upload?mode=remote&path=/remote/path',
+                             data={'file': file_obj})
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert data['success'] is True
+        assert received['args'] == ('remote', '/remote/path', 'test.txt')
+        assert received['data'] == b'remote file content'
+        mock_remote_service.upload_file.assert_not_called()
+    
+    @patch('app.remote_service')
+    def test_api_upload_remote_missing_file(self, mock_remote_service, client):
+        """Test remote streaming upload without a file part."""
+        response = client.post('/api/upload?mode=remote&path=/remote/path',
+                             data={'other': 'value'})
+        assert response.status_code == 400
+        assert '未选择文件' in json.loads(response.data)['error']
+        mock_remote_service.upload_stream.assert_not_called()
+    
+    def test_api_chunked_upload_flow(self, client, temp_dir):
+        """Test init, out of order chunk PUTs, status query and commit."""
+        payload = bytes(range(256)) * 2048
+        chunk_size = 256 * 1024
+        response = client.post(f'/api/upload/chunked/init?mode=local&path={temp_dir}',
+                               json={'filename': 'big.bin', 'size': len(payload), 'chunk_size': chunk_size})
+        assert response.status_code == 200
+        session = json.loads(response.data)
+        assert session['total_chunks'] == 2
+        upload_id = session['upload_id']
+        
+        response = client.put(f'/api/upload/chunked/{upload_id}/1', data=payload[chunk_size:])
+        assert response.status_code == 200
+        response = client.post(f'/api/upload/chunked/{upload_id}/commit')
+        assert response.status_code == 409
+        assert json.loads(response.data)['missing'] == [0]
+        
+        response = client.get(f'/api/upload/chunked/{upload_id}')
+        assert json.loads(response.data)['received'] == [1]
+        
+        response = client.put(f'/api/upload/chunked/{upload_id}/0', data=payload[:chunk_size])
+        assert response.status_code == 200
+        response = client.post(f'/api/upload/chunked/{upload_id}/commit')
+        assert response.status_code == 200
+        with open(os.path.join(temp_dir, 'big.bin'), 'rb') as f:
+            assert f.read() == payload
+        assert client.get(f'/api/upload/chunked/{upload_id}').status_code == 404
+    
+    def test_api_chunked_upload_wrong_length(self, client, temp_dir):
+        """Test a chunk with the wrong length is rejected and not recorded."""
+        response = client.post(f'/api/upload/chunked/init?mode=local&path={temp_dir}',
+                               json={'filename': 'f.bin', 'size': 10})
+        upload_id = json.loads(response.data)['upload_id']
+        
+        response = client.put(f'/api/upload/chunked/{upload_id}/0', data=b'short')
+        assert response.status_code == 400
+        assert json.loads(client.get(f'/api/upload/chunked/{upload_id}').data)['received'] == []
+        
+        response = client.put(f'/api/upload/chunked/{upload_id}/5', data=b'0123456789')
+        assert response.status_code == 409
+    
+    def test_api_chunked_upload_abort(self, client, temp_dir):
+        """Test aborting removes the session and its temporary file."""
+        response = client.post(f'/api/upload/chunked/init?mode=local&path={temp_dir}',
+                               json={'filename': 'f.bin', 'size': 10})
+        upload_id = json.loads(response.data)['upload_id']
+        assert len(os.listdir(temp_dir)) == 1
+        
+        assert client.delete(f'/api/upload/chunked/{upload_id}').status_code == 200
+        assert os.listdir(temp_dir) == []
+        assert client.delete(f'/api/upload/chunked/{upload_id}').status_code == 404
+    
+    def test_api_chunked_upload_init_invalid(self, client):
+        """Test init rejects a missing filename, a non-integer size or chunk size, and booleans."""
+        response = client.post('/api/upload/chunked/init?mode=local&path=/tmp', json={'filename': 'f.bin'})
+        assert response.status_code == 400
+        for body in ({'size': True}, {'size': '10'}, {'size': 10, 'chunk_size': 'abc'},
+                     {'size': 10, 'chunk_size': [1]}, {'size': 10, 'chunk_size': True},
+                     {'size': 10, 'chunk_size': 1.5}, {'size': 10, 'chunk_size': -1}):
+            response = client.post('/api/upload/chunked/init?mode=local&path=/tmp', json={'filename': 'f.bin', **body})
+            assert response.status_code == 400, body
+            assert 'error' in json.loads(response.data)
+    
     @patch('app.get_service')
     def test_api_upload_missing_file(self, mock_get_service, client):
         """Test upload with missing file."""
@@ -128,6 +521,208 @@ class TestAPIEndpoints:
             assert response.status_code == 200
             mock_service.download_file.assert_called_once_with('local', '/test/path/test.txt')
     
+    @patch('app.remote_service')
+    def test_api_download_remote_streams(self, mock_remote_service, client):
+        """Test remote download is streamed with Content-Length from stat."""
+        stream = MagicMock()
+        stream.path = '/home/testuser/报告.bin'
+        stream.size = 6
+        stream.mtime = 1234567890
+        stream.__iter__.return_value = iter([b'abc', b'def'])
+        mock_remote_service.open_download_stream.return_value = stream
+        
+        response = client.get('/api/download?mode=remote&path=~/报告.bin')
+        assert response.status_code == 200
+        assert response.headers['Content-Length'] == '6'
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert response.headers['ETag'] == '"6-499602d2"'
+        assert response.headers['Last-Modified'] == 'Fri, 13 Feb 2009 23:31:30 GMT'
+        assert "filename*=UTF-8''" in response.headers['Content-Disposition']
+        assert response.data == b'abcdef'
+        mock_remote_service.download_file.assert_not_called()
+        response.close()
+        stream.close.assert_called()
+    
+    @staticmethod
+    def _range_stream(content):
+        """Build a mocked RemoteFileStream honouring set_range."""
+        stream = MagicMock()
+        stream.path = '/data/file.bin'
+        stream.size = len(content)
+        stream.mtime = 1234567890
+        stream.start, stream.end = 0, len(content)
+        def set_range(start, end):
+            stream.start, stream.end = start, end
+            stream.length = end - start
+        stream.set_range.side_effect = set_range
+        stream.__iter__.side_effect = lambda: iter([content[stream.start:stream.end]])
+        return stream
+    
+    @patch('app.remote_service')
+    def test_api_download_remote_range(self, mock_remote_service, client):
+        """Test a Range request returns 206 with only the requested bytes."""
+        stream = self._range_stream(b'0123456789')
+        mock_remote_service.open_download_stream.return_value = stream
+        
+        response = client.get('/api/download?mode=remote&path=/data/file.bin', headers={'Range': 'bytes=2-5'})
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == 'bytes 2-5/10'
+        assert response.headers['Content-Length'] == '4'
+        assert response.data == b'2345'
+        stream.set_range.assert_called_once_with(2, 6)
+        response.close()
+    
+    @patch('app.remote_service')
+    def test_api_download_remote_suffix_range(self, mock_remote_service, client):
+        """Test a suffix range resumes from the end of the file."""
+        stream = self._range_stream(b'0123456789')
+        mock_remote_service.open_download_stream.return_value = stream
+        
+        response = client.get('/api/download?mode=remote&path=/data/file.bin', headers={'Range': 'bytes=-3'})
+        assert response.status_code == 206
+        assert response.data == b'789'
+        response.close()
+    
+    @patch('app.remote_service')
+    def test_api_download_remote_if_range_mismatch(self, mock_remote_service, client):
+        """Test a stale If-Range validator falls back to the full file."""
+        stream = self._range_stream(b'0123456789')
+        mock_remote_service.open_download_stream.return_value = stream
+        
+        response = client.get('/api/download?mode=remote&path=/data/file.bin',
+                              headers={'Range': 'bytes=2-5', 'If-Range': '"stale"'})
+        assert response.status_code == 200
+        assert response.data == b'0123456789'
+        stream.set_range.assert_not_called()
+        response.close()
+    
+    @patch('app.remote_service')
+    def test_api_download_remote_if_range_match(self, mock_remote_service, client):
+        """Test a matching If-Range validator honours the range."""
+        stream = self._range_stream(b'0123456789')
+        mock_remote_service.open_download_stream.return_value = stream
+        
+        response = client.get('/api/download?mode=remote&path=/data/file.bin',
+                              headers={'Range': 'bytes=5-', 'If-Range': '"a-499602d2"'})
+        assert response.status_code == 206
+        assert response.data == b'56789'
+        response.close()
+    
+    @patch('app.remote_service')
+    def test_api_download_remote_range_not_satisfiable(self, mock_remote_service, client):
+        """Test an out of bounds range returns 416 and releases the stream."""
+        stream = self._range_stream(b'0123456789')
+        mock_remote_service.open_download_stream.return_value = stream
+        
+        response = client.get('/api/download?mode=remote&path=/data/file.bin', headers={'Range': 'bytes=50-60'})
+        assert response.status_code == 416
+        assert response.headers['Content-Range'] == 'bytes */10'
+        stream.close.assert_called_once()
+    
+    @patch('app.remote_service')
+    def test_api_download_remote_not_modified(self, mock_remote_service, client):
+        """Test a matching If-None-Match returns 304 without a body."""
+        stream = self._range_stream(b'0123456789')
+        mock_remote_service.open_download_stream.return_value = stream
+        
+        response = client.get('/api/download?mode=remote&path=/data/file.bin',
+                              headers={'If-None-Match': '"a-499602d2"'})
+        assert response.status_code == 304
+        assert response.data == b''
+        stream.close.assert_called_once()
+    
+    @patch('app.get_service')
+    def test_api_download_local_range(self, mock_get_service, client, tmp_path):
+        """Test local downloads honour Range requests."""
+        local_file = tmp_path / 'local.bin'
+        local_file.write_bytes(b'0123456789')
+        mock_service = MagicMock()
+        mock_service.download_file.return_value = str(local_file)
+        mock_get_service.return_value = mock_service
+        
+        response = client.get(f'/api/download?mode=local&path={local_file}', headers={'Range': 'bytes=7-'})
+        assert response.status_code == 206
+        assert response.data == b'789'
+        assert response.headers['Content-Range'] == 'bytes 7-9/10'
+        assert 'ETag' in response.headers
+        response.close()
+    
+    @patch('app.remote_service')
+    def test_api_download_remote_from_cache(self, mock_remote_service, client, tmp_path):
+        """Test a cached remote file is served with the same validators and Range handling."""
+        (tmp_path / 'cached').write_bytes(b'0123456789')
+        stream = CachedFileStream(open(tmp_path / 'cached', 'rb'), '/data/file.bin', 10, 1234567890)
+        mock_remote_service.open_download_stream.return_value = stream
+
+        response = client.get('/api/download?mode=remote&path=/data/file.bin', headers={'Range': 'bytes=2-5'})
+        assert response.status_code == 206
+        assert response.headers['ETag'] == '"a-499602d2"'
+        assert response.data == b'2345'
+        response.close()
+        assert stream.file_obj.closed
+
+    @pytest.mark.parametrize('headers, status', [
+        ({'If-None-Match': '"64-5f5e1000"'}, 304),
+        ({'Range': 'bytes=-4'}, 206),
+        ({'Range': 'bytes=200-'}, 416),
+    ])
+    def test_api_download_uncached_no_fill(self, remote_service, client, tmp_path, headers, status):
+        """Test revalidation and Range requests on an uncached file never download the whole file."""
+        remote_service.download_cache = DownloadCache(tmp_path / 'cache', max_bytes=1000)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=100, st_mtime=1600000000)
+        mock_sftp.open.return_value.read.side_effect = [b'tail', b'']
+        ssh = MagicMock()
+        ssh.open_sftp.return_value = mock_sftp
+
+        with patch('app.remote_service', remote_service), patch('paramiko.SSHClient', return_value=ssh), \
+             patch.object(remote_service.transfer_engine, 'download') as mock_download:
+            response = client.get('/api/download?mode=remote&path=/data/file.bin', headers=headers)
+            assert response.status_code == status
+            if status == 206:
+                assert response.data == b'tail'
+            response.close()
+            mock_download.assert_not_called()
+        stats = remote_service.download_cache_stats()
+        assert (stats['entries'], stats['misses'], stats['filling']) == (0, 1, 0)
+
+    def test_api_download_full_fills_cache(self, remote_service, client, tmp_path):
+        """Test an unconditional full download is streamed into the cache and the next one is served from it."""
+        remote_service.download_cache = DownloadCache(tmp_path / 'cache', max_bytes=1000)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=100, st_mtime=1600000000)
+        mock_sftp.open.return_value.read.side_effect = lambda n: b'x' * min(n, 30)
+        ssh = MagicMock()
+        ssh.open_sftp.return_value = mock_sftp
+
+        with patch('app.remote_service', remote_service), patch('paramiko.SSHClient', return_value=ssh), \
+             patch.object(remote_service.transfer_engine, 'download') as mock_download:
+            for _ in range(2):
+                response = client.get('/api/download?mode=remote&path=/data/file.bin')
+                assert response.status_code == 200 and response.data == b'x' * 100
+                response.close()
+            mock_download.assert_not_called()
+            assert mock_sftp.open.call_count == 1
+        stats = remote_service.download_cache_stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+    @patch('app.remote_service')
+    def test_api_download_cache_stats(self, mock_remote_service, client):
+        """Test the download cache stats endpoint."""
+        mock_remote_service.download_cache_stats.return_value = {'success': True, 'hits': 3, 'misses': 1,
+                                                                  'hit_rate': 0.75}
+        response = client.get('/api/download_cache/stats')
+        assert response.status_code == 200
+        assert json.loads(response.data)['hit_rate'] == 0.75
+
+    @patch('app.remote_service')
+    def test_api_download_remote_not_found(self, mock_remote_service, client):
+        """Test remote streaming download of a missing file."""
+        mock_remote_service.open_download_stream.return_value = None
+        
+        response = client.get('/api/download?mode=remote&path=/missing.bin')
+        assert response.status_code == 404
+    
     @patch('app.get_service')
     def test_api_download_missing_path(self, mock_get_service, client):
         """Test download with missing path."""
@@ -160,6 +755,49 @@ class TestAPIEndpoints:
         assert data['success'] is True
         mock_service.delete_file.assert_called_once_with('local', '/test/path/test.txt')
     
+    def test_api_delete_batch_job(self, client, tmp_path):
+        """Test a multi-path delete runs as a job and reports entries it could not delete."""
+        import app as app_module
+        (tmp_path / 'tree' / 'sub').mkdir(parents=True)
+        (tmp_path / 'tree' / 'sub' / 'a.txt').write_bytes(b'abc')
+        (tmp_path / 'b.txt').write_bytes(b'de')
+        paths = [str(tmp_path / 'tree'), str(tmp_path / 'b.txt'), str(tmp_path / 'missing')]
+        
+        response = client.post('/api/delete?mode=local', json={'paths': paths})
+        job_id = json.loads(response.data)['job_id']
+        app_module.jobs.wait(job_id, timeout=5)
+        
+        data = json.loads(client.get(f'/api/jobs/{job_id}').data)
+        assert data['kind'] == 'delete' and data['status'] == 'done'
+        assert data['files_done'] == data['files_total'] == 4
+        assert data['result']['bytes'] == 5
+        assert [item['path'] for item in data['result']['failed']] == [paths[2]]
+        assert os.listdir(tmp_path) == []
+    
+    def test_api_delete_batch_invalid(self, client):
+        """Test malformed path lists and unknown methods are rejected."""
+        assert client.post('/api/delete?mode=local', json={'paths': '/a'}).status_code == 400
+        assert client.post('/api/delete?mode=remote', json={'paths': ['/a'], 'method': 'shred'}).status_code == 400
+    
+    def test_api_copy_and_move_jobs(self, client, tmp_path):
+        """Test copy and move run as jobs and a failed move fails its job."""
+        import app as app_module
+        (tmp_path / 'a.txt').write_bytes(b'abc')
+        
+        def _run(route, src, dst):
+            response = client.post(f'/api/{route}?mode=local', json={'src': str(src), 'dst': str(dst)})
+            job_id = json.loads(response.data)['job_id']
+            app_module.jobs.wait(job_id, timeout=5)
+            return json.loads(client.get(f'/api/jobs/{job_id}').data)
+        
+        copied = _run('copy', tmp_path / 'a.txt', tmp_path / 'b.txt')
+        assert copied['kind'] == 'copy' and copied['status'] == 'done' and copied['bytes_done'] == 3
+        assert _run('move', tmp_path / 'b.txt', tmp_path / 'c.txt')['result']['method'] == 'rename'
+        failed = _run('move', tmp_path / 'c.txt', tmp_path / 'a.txt')
+        assert failed['status'] == 'failed' and '目标已存在' in failed['error']
+        assert sorted(os.listdir(tmp_path)) == ['a.txt', 'c.txt']
+        assert client.post('/api/copy?mode=local', json={'src': '/a'}).status_code == 400
+    
     @patch('app.get_service')
     def test_api_delete_missing_path(self, mock_get_service, client):
         """Test delete with missing path."""
@@ -205,6 +843,7 @@ class TestAPIEndpoints:
             {'server_name': 'test1', 'config': {'host_ip': '192.168.1.100'}},
             {'server_name': 'test2', 'config': {'host_ip': '192.168.1.200'}}
         ]
+        mock_remote_service.health_monitor.get.return_value = {'status': 'up', 'rtt_ms': 1.5}
         
         response = client.get('/api/remote_servers')
         assert response.status_code == 200
@@ -213,6 +852,7 @@ class TestAPIEndpoints:
         assert 'remote_server_list' in data
         assert len(data['remote_server_list']) == 2
         assert data['remote_server_list'][0]['server_name'] == 'test1'
+        assert data['remote_server_list'][0]['health'] == {'status': 'up', 'rtt_ms': 1.5}
     
     @patch('app.remote_service')
     def test_api_test_server_connectivity(self, mock_remote_service, client):
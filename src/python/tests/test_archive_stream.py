@@ -0,0 +1,143 @@
+import pytest
+import io
+import os
+import subprocess
+import tarfile
+import threading
+import zipfile
+
+from utils.archive_stream import (
+    ArchiveStream, build_archive, fit_size, iter_local_entries, iter_tar_entries, select_roots, zstd_available,
+)
+
+def _entries():
+    return [
+        ('proj', 0, 1700000000, None),
+        ('proj/a.txt', 5, 1700000000, lambda: iter([b'he', b'llo'])),
+        ('proj/文件.bin', 3, None, lambda: iter([b'xyz'])),
+    ]
+
+class TestBuildArchive:
+    """Test encoding members into each archive format."""
+
+    def test_zip(self):
+        """Test the zip stream opens with zipfile, including directories."""
+        data = b''.join(build_archive(_entries(), 'zip'))
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.namelist() == ['proj/', 'proj/a.txt', 'proj/文件.bin']
+            assert zf.read('proj/a.txt') == b'hello'
+            assert zf.getinfo('proj/a.txt').date_time[:3] == (2023, 11, 14)
+            assert zf.testzip() is None
+
+    @pytest.mark.parametrize('fmt', ['tar', 'tar.gz'])
+    def test_tar(self, fmt):
+        """Test plain and gzip tar streams open with tarfile."""
+        data = b''.join(build_archive(_entries(), fmt))
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            assert tar.getnames() == ['proj', 'proj/a.txt', 'proj/文件.bin']
+            assert tar.getmember('proj').isdir()
+            assert tar.extractfile('proj/a.txt').read() == b'hello'
+
+    @pytest.mark.skipif(not zstd_available(), reason='zstd not installed')
+    def test_tar_zst(self):
+        """Test tar.zst is compressed by the zstd process."""
+        data = b''.join(build_archive(_entries(), 'tar.zst'))
+        raw = subprocess.run(['zstd', '-dc'], input=data, capture_output=True, check=True).stdout
+        with tarfile.open(fileobj=io.BytesIO(raw)) as tar:
+            assert tar.extractfile('proj/文件.bin').read() == b'xyz'
+
+    def test_files_opened_lazily(self):
+        """Test each file is opened only when the archive reaches it."""
+        opened = []
+
+        def opener(name):
+            opened.append(name)
+            return iter([b'x'])
+
+        chunks = iter_tar_entries((n, 1, None, lambda n=n: opener(n)) for n in ('a', 'b'))
+        next(chunks)
+        next(chunks)
+        assert opened == ['a']
+
+    def test_unknown_format(self):
+        """Test unsupported formats are rejected."""
+        with pytest.raises(ValueError):
+            build_archive([], 'rar')
+
+    def test_fit_size(self):
+        """Test files that changed size are truncated or zero-padded."""
+        assert b''.join(fit_size(iter([b'abc', b'def']), 4)) == b'abcd'
+        assert b''.join(fit_size(iter([b'ab']), 4)) == b'ab\0\0'
+        assert b''.join(fit_size(iter([]), 0)) == b''
+
+class TestLocalEntries:
+    """Test selecting and walking local paths."""
+
+    def test_select_roots(self):
+        """Test archive naming and that selections stay inside the directory."""
+        assert select_roots('/data/proj', None) == ('proj', [('proj', '/data/proj')])
+        assert select_roots('/data/proj', ['a.txt']) == ('a.txt', [('a.txt', '/data/proj/a.txt')])
+        assert select_roots('/data/proj', ['a', 'b'])[0] == 'proj'
+        for bad in (['../etc'], ['a/b'], ['/etc']):
+            with pytest.raises(ValueError):
+                select_roots('/data/proj', bad)
+
+    def test_iter_local_entries(self, tmp_path):
+        """Test directories, files and file symlinks are listed in order."""
+        (tmp_path / 'd' / 'empty').mkdir(parents=True)
+        (tmp_path / 'd' / 'f.txt').write_bytes(b'data')
+        os.symlink(tmp_path / 'd' / 'f.txt', tmp_path / 'd' / 'link')
+        os.symlink(tmp_path / 'd' / 'empty', tmp_path / 'd' / 'dirlink')
+
+        entries = list(iter_local_entries([('d', str(tmp_path / 'd'))]))
+
+        assert [(name, opener is None) for name, _, _, opener in entries] == [
+            ('d', True), ('d/empty', True), ('d/f.txt', False), ('d/link', False),
+        ]
+        assert b''.join(entries[2][3]()) == b'data'
+
+class TestArchiveStream:
+    """Test the background producer feeding the response."""
+
+    def test_stream_and_on_close(self):
+        """Test chunks arrive in order and on_close runs once."""
+        closed = []
+        stream = ArchiveStream(iter([b'a', b'', b'b']), 'x.zip', 'application/zip', on_close=lambda: closed.append(1))
+        assert b''.join(stream) == b'ab'
+        stream.close()
+        assert closed == [1]
+        assert stream.bytes_sent == 2
+
+    def test_error_raised_to_consumer(self):
+        """Test a producer failure surfaces while iterating."""
+        def chunks():
+            yield b'a'
+            raise IOError('disk gone')
+
+        with pytest.raises(IOError):
+            b''.join(ArchiveStream(chunks(), 'x.zip', 'application/zip'))
+
+    def test_close_stops_producer(self):
+        """Test closing early stops the producer and closes its generator."""
+        finished = threading.Event()
+
+        def chunks():
+            try:
+                while True:
+                    yield b'x' * 1024
+            finally:
+                finished.set()
+
+        closed = []
+        stream = ArchiveStream(chunks(), 'x.tar', 'application/x-tar', on_close=lambda: closed.append(1), queue_size=2)
+        iterator = iter(stream)
+        next(iterator)
+        iterator.close()
+        assert finished.wait(5)
+        assert closed == [1]
+
+    def test_close_without_iterating(self):
+        """Test on_close still runs when the response is never iterated."""
+        closed = []
+        ArchiveStream(iter([]), 'x.zip', 'application/zip', on_close=lambda: closed.append(1)).close()
+        assert closed == [1]
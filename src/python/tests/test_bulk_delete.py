@@ -0,0 +1,114 @@
+import pytest
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from utils.bulk_delete import DeleteReport, delete_remote, sftp_lstat_many, sftp_remove_many
+from utils.job_registry import Job, JobCancelled
+
+@pytest.fixture
+def tree(tmp_path):
+    """A nested tree with files at several depths and a symlink to a directory outside it."""
+    root = tmp_path / 'root'
+    (root / 'a' / 'deep').mkdir(parents=True)
+    for i in range(30):
+        (root / 'a' / 'deep' / f'{i}.bin').write_bytes(b'x' * 10)
+    (root / 'a' / 'one.txt').write_bytes(b'1' * 100)
+    (root / 'b').mkdir()
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'keep.txt').write_bytes(b'k')
+    os.symlink(outside, root / 'b' / 'linked')
+    return root
+
+def _conn(sftp, exec_command=None):
+    return SimpleNamespace(sftp=sftp, exec_command=exec_command or MagicMock(side_effect=OSError('exec refused')))
+
+class TestPipelinedRequests:
+    """Test pipelined remove/rmdir/lstat over a real SFTP channel."""
+
+    def test_remove_many(self, sftp_loopback, tmp_path):
+        """Test replies map back to their paths, including failures."""
+        paths = []
+        for i in range(100):
+            path = tmp_path / f'{i}.txt'
+            path.write_bytes(b'x')
+            paths.append(str(path))
+        (tmp_path / 'dir').mkdir()
+        paths += [str(tmp_path / 'missing'), str(tmp_path / 'dir')]
+
+        errors = sftp_remove_many(sftp_loopback['sftp'], paths, depth=16)
+
+        assert errors[:100] == [None] * 100
+        assert errors[100] and errors[101]
+        assert os.listdir(tmp_path) == ['dir']
+        assert sftp_remove_many(sftp_loopback['sftp'], [str(tmp_path / 'dir')], rmdir=True) == [None]
+
+    def test_lstat_many(self, sftp_loopback, tree):
+        """Test lstat does not follow links and reports missing paths as None."""
+        attrs = sftp_lstat_many(sftp_loopback['sftp'], [str(tree / 'b' / 'linked'), str(tree / 'nope')])
+        assert attrs[0].st_mode & 0o170000 == 0o120000
+        assert attrs[1] is None
+
+class TestDeleteRemote:
+    """Test the remote delete policies."""
+
+    def test_sftp_tree(self, sftp_loopback, tree, tmp_path):
+        """Test a tree is removed over SFTP without following links, with progress."""
+        job = Job('delete')
+        result = delete_remote(_conn(sftp_loopback['sftp']), [str(tree)], 'sftp', job)
+
+        assert result['success'] is True, result
+        assert result['method'] == 'sftp'
+        assert (result['deleted_files'], result['deleted_dirs'], result['bytes']) == (32, 4, 400)
+        assert (job.files_done, job.files_total, job.bytes_done) == (36, 36, 400)
+        assert not tree.exists()
+        assert (tmp_path / 'outside' / 'keep.txt').exists()
+
+    def test_auto_falls_back_to_sftp(self, sftp_loopback, tree):
+        """Test files are removed directly and directories fall back to SFTP when exec is unavailable."""
+        conn = _conn(sftp_loopback['sftp'])
+        paths = [str(tree / 'a' / 'one.txt'), str(tree / 'a'), str(tree / 'missing')]
+
+        result = delete_remote(conn, paths, 'auto')
+
+        conn.exec_command.assert_called_once()
+        assert result['method'] == 'sftp'
+        assert result['deleted_files'] == 31 and result['deleted_dirs'] == 2
+        assert [item['path'] for item in result['failed']] == [paths[2]]
+        assert sorted(os.listdir(tree)) == ['b']
+
+    def test_exec_failure_reported(self, sftp_loopback, tree):
+        """Test the exec method reports directories rm could not remove instead of walking them."""
+        result = delete_remote(_conn(sftp_loopback['sftp']), [str(tree)], 'exec')
+
+        assert result['success'] is False
+        assert result['failed'] == [{'path': str(tree), 'error': 'exec refused'}]
+        assert tree.exists()
+
+    def test_refuses_root(self):
+        """Test the root directory is rejected before any request is sent."""
+        sftp = MagicMock()
+        result = delete_remote(_conn(sftp), ['/', '//'], 'auto')
+        assert result['success'] is False and len(result['failed']) == 2
+        sftp.remove.assert_not_called()
+
+    def test_cancelled(self, sftp_loopback, tree):
+        """Test a cancelled job stops before deleting anything."""
+        job = Job('delete')
+        job.cancel()
+        with pytest.raises(JobCancelled):
+            delete_remote(_conn(sftp_loopback['sftp']), [str(tree)], 'sftp', job)
+        assert (tree / 'a' / 'one.txt').exists()
+
+class TestDeleteReport:
+    """Test failure bookkeeping."""
+
+    def test_failures_block_ancestors(self):
+        """Test directories above a failed entry are skipped rather than reported again."""
+        report = DeleteReport()
+        report.fail('/r/a/b/f.txt', 'denied')
+        assert report.skip_blocked('/r/a/b') and report.skip_blocked('/r/a')
+        assert not report.skip_blocked('/r/c')
+        result = report.to_dict()
+        assert result['success'] is False and result['error'] == 'denied'
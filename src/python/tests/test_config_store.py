@@ -0,0 +1,104 @@
+import pytest
+import json
+import os
+import threading
+from unittest.mock import patch
+
+from utils.config_store import ConfigStore
+
+class TestConfigStore:
+    """Test ConfigStore functionality."""
+
+    def test_get_loads_once(self, config_file, mock_config):
+        """Test the config is parsed once while the file is unchanged."""
+        store = ConfigStore(config_file, check_interval=0)
+
+        with patch('json.load', wraps=json.load) as mock_load:
+            assert store.get() == mock_config
+            assert store.get() == mock_config
+            assert mock_load.call_count == 1
+
+    def test_reload_on_change(self, config_file, mock_config):
+        """Test the config is reloaded after the file changes on disk."""
+        store = ConfigStore(config_file, check_interval=0)
+        assert store.get()['local_default_dir'] == '/tmp/test'
+
+        mock_config['local_default_dir'] = '/srv/data'
+        config_file.write_text(json.dumps(mock_config), encoding='utf-8')
+
+        assert store.get()['local_default_dir'] == '/srv/data'
+
+    def test_check_interval_throttles_stat(self, config_file):
+        """Test file metadata is not re-checked within the check interval."""
+        store = ConfigStore(config_file, check_interval=60)
+        store.get()
+
+        with patch('os.stat') as mock_stat:
+            store.get()
+            mock_stat.assert_not_called()
+
+    def test_get_server_index(self, config_store):
+        """Test lookups by server_name and host_ip."""
+        assert config_store.get_server(server_name='test_server')['config']['host_ip'] == '192.168.1.100'
+        assert config_store.get_server(host_ip='192.168.1.100')['server_name'] == 'test_server'
+        assert config_store.get_server(server_name='missing') is None
+        assert config_store.get_server() is None
+
+    def test_update_writes_atomically(self, config_store, config_file):
+        """Test update() rewrites the file through a rename and refreshes the index."""
+        inode_before = os.stat(config_file).st_ino
+
+        def _set_pwd(config):
+            config['remote_server_list'][0]['config']['user_pwd'] = 'changed'
+
+        config_store.update(_set_pwd)
+
+        saved = json.loads(config_file.read_text(encoding='utf-8'))
+        assert saved['remote_server_list'][0]['config']['user_pwd'] == 'changed'
+        assert os.stat(config_file).st_ino != inode_before
+        assert config_store.get_server(server_name='test_server')['config']['user_pwd'] == 'changed'
+        leftovers = [p for p in config_file.parent.iterdir() if p.name.endswith('.tmp')]
+        assert leftovers == []
+
+    def test_update_keeps_old_snapshot(self, config_store):
+        """Test snapshots handed out before an update are not mutated."""
+        before = config_store.get_server(server_name='test_server')
+
+        config_store.update(lambda c: c['remote_server_list'][0]['config'].update(user_pwd='changed'))
+
+        assert before['config']['user_pwd'] == 'testpass'
+
+    def test_update_failure_keeps_file(self, config_store, config_file):
+        """Test a failing write leaves the original file intact."""
+        original = config_file.read_text(encoding='utf-8')
+
+        with patch('json.dump', side_effect=Exception('Disk full')):
+            with pytest.raises(Exception, match='Disk full'):
+                config_store.update(lambda c: c.update(port=1))
+
+        assert config_file.read_text(encoding='utf-8') == original
+        leftovers = [p for p in config_file.parent.iterdir() if p.name.endswith('.tmp')]
+        assert leftovers == []
+
+    def test_concurrent_updates(self, config_store, config_file):
+        """Test concurrent updates are serialized without losing writes."""
+        def _add_server(i):
+            def _mutate(config):
+                config['remote_server_list'].append({'server_name': f's{i}', 'config': {'host_ip': f'10.0.0.{i}'}})
+            config_store.update(_mutate)
+
+        threads = [threading.Thread(target=_add_server, args=(i,)) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        saved = json.loads(config_file.read_text(encoding='utf-8'))
+        assert len(saved['remote_server_list']) == 11
+
+    def test_missing_file_raises(self, tmp_path):
+        """Test loading a missing config file raises."""
+        store = ConfigStore(tmp_path / 'missing.json')
+
+        with pytest.raises(FileNotFoundError):
+            store.get()
@@ -0,0 +1,181 @@
+import pytest
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import zlib
+
+from utils import delta_sync
+from utils.delta_sync import (
+    DeltaStats, apply_delta, build_signature, choose_block_size, generate_delta, mapped_file,
+    patch_file, read_signature, roll_adler32,
+)
+
+BLOCK = 4096
+
+def _random_bytes(size, seed):
+    return random.Random(seed).randbytes(size)
+
+def _roundtrip(old, new, block=BLOCK):
+    signature = read_signature(io.BytesIO(build_signature(io.BytesIO(old), block).to_bytes()))
+    stats = DeltaStats()
+    delta = b''.join(generate_delta(new, signature, stats))
+    out = io.BytesIO()
+    size = apply_delta(io.BytesIO(old), io.BytesIO(delta), out)
+    assert out.getvalue() == new
+    assert size == len(new)
+    assert stats.delta_bytes == len(delta)
+    assert stats.matched_bytes + stats.literal_bytes == len(new)
+    return stats
+
+class TestChecksums:
+    """Test block size selection and the rolling checksum."""
+
+    def test_choose_block_size(self):
+        """Test block sizes grow with the square root of the file and stay within limits."""
+        assert choose_block_size(0) == delta_sync.MIN_BLOCK_SIZE
+        assert choose_block_size(4 * 1024 ** 3) == 64 * 1024
+        assert choose_block_size(10 ** 15) == delta_sync.MAX_BLOCK_SIZE
+
+    def test_roll_matches_adler32(self):
+        """Test rolling the window one byte at a time equals recomputing Adler-32."""
+        data = _random_bytes(3000, 1)
+        weak = zlib.adler32(data[:1000])
+        for pos in range(1, 2001):
+            weak = roll_adler32(weak, data[pos - 1], data[pos + 999], 1000)
+            assert weak == zlib.adler32(data[pos:pos + 1000])
+
+    def test_signature_roundtrip(self):
+        """Test signatures survive encoding, including a short last block."""
+        data = _random_bytes(BLOCK * 3 + 100, 2)
+        signature = read_signature(io.BytesIO(build_signature(io.BytesIO(data), BLOCK).to_bytes()))
+        assert signature.count == 4
+        assert signature.file_size == len(data)
+        assert signature.block_length(3) == 100
+        assert signature.weak[1] == zlib.adler32(data[BLOCK:2 * BLOCK])
+
+    def test_bad_signature(self):
+        """Test malformed signatures are rejected."""
+        with pytest.raises(ValueError):
+            read_signature(io.BytesIO(b'XXXX' + b'\0' * 16))
+        with pytest.raises(ValueError):
+            read_signature(io.BytesIO(b'DT'))
+
+class TestDelta:
+    """Test delta generation and reconstruction."""
+
+    def test_identical_file_sends_no_literals(self):
+        """Test an unchanged file is encoded as block copies only."""
+        old = _random_bytes(BLOCK * 50 + 123, 3)
+        stats = _roundtrip(old, old)
+        assert stats.literal_bytes == 0
+        assert stats.delta_bytes < 100
+
+    def test_append(self):
+        """Test appended data is the only literal data."""
+        old = _random_bytes(BLOCK * 50, 4)
+        stats = _roundtrip(old, old + b'new tail')
+        assert stats.literal_bytes == len(b'new tail')
+
+    def test_insert_shifts_following_blocks(self):
+        """Test an insertion near the start does not resend the shifted rest of the file."""
+        old = _random_bytes(BLOCK * 50, 5)
+        new = old[:1000] + b'inserted' * 100 + old[1000:]
+        stats = _roundtrip(old, new)
+        assert stats.literal_bytes < 2 * BLOCK + 800
+
+    def test_in_place_change_and_delete(self):
+        """Test modified and deleted ranges cost about one block each."""
+        old = _random_bytes(BLOCK * 50, 6)
+        new = old[:BLOCK * 10] + b'x' * 10 + old[BLOCK * 10 + 10:BLOCK * 30] + old[BLOCK * 32:]
+        stats = _roundtrip(old, new)
+        assert stats.literal_bytes <= 2 * BLOCK
+
+    def test_resync_after_long_mismatch(self):
+        """Test matching resumes after a changed region longer than the rolling budget."""
+        old = _random_bytes(BLOCK * 100, 7)
+        changed = _random_bytes(BLOCK * (delta_sync.ROLL_BLOCKS + 5) + 17, 8)
+        new = changed + old
+        stats = _roundtrip(old, new)
+        assert stats.matched_bytes >= len(old) - BLOCK * delta_sync.ROLL_EVERY
+
+    def test_unrelated_and_empty_files(self):
+        """Test unrelated, empty and shorter-than-a-block inputs reconstruct correctly."""
+        _roundtrip(_random_bytes(BLOCK * 5, 9), _random_bytes(BLOCK * 3 + 5, 10))
+        _roundtrip(b'', b'hello')
+        _roundtrip(b'hello', b'')
+        _roundtrip(b'short', b'short')
+
+    def test_truncated_or_corrupt_delta(self, tmp_path):
+        """Test incomplete deltas fail and leave the target untouched."""
+        old = _random_bytes(BLOCK * 4, 11)
+        new = old[:100] + b'changed' + old[100:]
+        signature = build_signature(io.BytesIO(old), BLOCK)
+        delta = b''.join(generate_delta(new, signature))
+
+        basis = tmp_path / 'file.bin'
+        basis.write_bytes(old)
+        with pytest.raises(ValueError):
+            patch_file(str(basis), str(basis), io.BytesIO(delta[:-10]))
+        assert basis.read_bytes() == old
+        assert os.listdir(tmp_path) == ['file.bin']
+
+        corrupt = bytearray(delta)
+        corrupt[-1] ^= 0xff
+        with pytest.raises(ValueError):
+            apply_delta(io.BytesIO(old), io.BytesIO(bytes(corrupt)), io.BytesIO())
+
+    def test_patch_file_keeps_mode_and_reports_progress(self, tmp_path):
+        """Test patch_file replaces the target, keeps its permissions and reports progress."""
+        old = _random_bytes(BLOCK * 8, 12)
+        new = old + b'more'
+        basis = tmp_path / 'data.bin'
+        basis.write_bytes(old)
+        os.chmod(basis, 0o640)
+        progress = []
+        with mapped_file(str(tmp_path / 'data.bin')) as data:
+            signature = build_signature(io.BytesIO(data[:]), BLOCK)
+        delta = b''.join(generate_delta(new, signature))
+
+        assert patch_file(str(basis), str(basis), io.BytesIO(delta), progress.append) == len(new)
+        assert basis.read_bytes() == new
+        assert os.stat(basis).st_mode & 0o777 == 0o640
+        assert sum(progress) == len(new)
+
+    def test_mapped_empty_file(self, tmp_path):
+        """Test mapping an empty file yields empty data instead of failing."""
+        path = tmp_path / 'empty'
+        path.write_bytes(b'')
+        with mapped_file(str(path)) as data:
+            assert len(data) == 0
+
+class TestHelperScript:
+    """Test the module runs as the standalone remote helper."""
+
+    def _run(self, *args, stdin=b''):
+        return subprocess.run([sys.executable, delta_sync.__file__, *args], input=stdin,
+                              capture_output=True, check=True).stdout
+
+    def test_signature_delta_patch(self, tmp_path):
+        """Test the signature, delta and patch commands reproduce the new file."""
+        old = _random_bytes(BLOCK * 20, 13)
+        new = old[:5000] + b'patched' + old[5000:]
+        basis = tmp_path / 'old.bin'
+        basis.write_bytes(old)
+        source = tmp_path / 'new.bin'
+        source.write_bytes(new)
+
+        signature = self._run('signature', str(basis), str(BLOCK))
+        delta = self._run('delta', str(source), stdin=signature)
+        assert len(delta) < len(new) // 4
+        result = json.loads(self._run('patch', str(basis), str(basis), stdin=delta))
+
+        assert result == {'size': len(new)}
+        assert basis.read_bytes() == new
+
+    def test_usage(self):
+        """Test unknown commands exit with usage."""
+        result = subprocess.run([sys.executable, delta_sync.__file__, 'bogus'], capture_output=True)
+        assert result.returncode == 2
@@ -0,0 +1,152 @@
+import pytest
+import os
+import threading
+
+from utils.dir_sync import (
+    Manifest, ManifestCache, diff_manifests, execute_plan, hash_candidates, parse_remote_hashes,
+    parse_remote_manifest, scan_local,
+)
+from utils.job_registry import Job, JobCancelled
+
+def _manifest(files=None, dirs=()):
+    return Manifest(dict(files or {}), set(dirs))
+
+class TestManifests:
+    """Test building manifests from both sides."""
+
+    def test_scan_local(self, tmp_path):
+        """Test scandir walks the tree and skips symlinks."""
+        (tmp_path / 'd' / 'e').mkdir(parents=True)
+        (tmp_path / 'd' / 'e' / 'f.txt').write_bytes(b'12345')
+        (tmp_path / 'top.txt').write_bytes(b'1')
+        os.symlink(tmp_path / 'top.txt', tmp_path / 'link')
+
+        manifest = scan_local(str(tmp_path))
+
+        assert manifest.dirs == {'d', 'd/e'}
+        assert set(manifest.files) == {'top.txt', 'd/e/f.txt'}
+        assert manifest.files['d/e/f.txt'][0] == 5
+        assert manifest.total_size == 6
+        assert scan_local(str(tmp_path / 'missing')).files == {}
+
+    def test_parse_remote_manifest(self):
+        """Test find -printf records, including names with tabs and newlines."""
+        output = b'd\t4096\t1700000000.5\tsub\0f\t12\t1700000001.25\tsub/a\tb\nc\0f\t1\t1.0\ttop\0'
+        manifest = parse_remote_manifest(output)
+        assert manifest.dirs == {'sub'}
+        assert manifest.files == {'sub/a\tb\nc': (12, 1700000001.25), 'top': (1, 1.0)}
+
+    def test_parse_remote_hashes(self):
+        """Test md5sum -z output parsing."""
+        output = b'0' * 32 + b'  a b.txt\0' + b'f' * 32 + b'  dir/c\0'
+        assert parse_remote_hashes(output) == {'a b.txt': '0' * 32, 'dir/c': 'f' * 32}
+
+class TestDiff:
+    """Test turning two manifests into a plan."""
+
+    def test_push_plan(self):
+        """Test new, modified, unchanged and extra entries when pushing."""
+        local = _manifest({'new': (1, 10.0), 'same': (2, 20.9), 'changed': (3, 30.0)}, {'dir', 'dir/sub'})
+        remote = _manifest({'same': (2, 20.0), 'changed': (4, 30.0), 'extra': (5, 1.0)}, {'old'})
+
+        plan = diff_manifests(local, remote, 'push', delete=True)
+
+        ops = [(a['op'], a['path'], a['reason']) for a in plan.actions]
+        assert ops == [
+            ('mkdir', 'dir', None), ('mkdir', 'dir/sub', None),
+            ('copy', 'changed', 'modified'), ('copy', 'new', 'new'),
+            ('delete', 'extra', None), ('rmdir', 'old', None),
+        ]
+        summary = plan.summary()
+        assert summary['copy_bytes'] == 4 and summary['unchanged'] == 1
+
+    def test_pull_uses_remote_as_source(self):
+        """Test pull copies remote-only files and keeps local extras without delete."""
+        local = _manifest({'mine': (1, 1.0)})
+        remote = _manifest({'theirs': (2, 2.0)})
+        plan = diff_manifests(local, remote, 'pull')
+        assert [(a['op'], a['path']) for a in plan.actions] == [('copy', 'theirs')]
+
+    def test_conflicts(self):
+        """Test a file on one side and a directory on the other is reported, not overwritten."""
+        plan = diff_manifests(_manifest({'x': (1, 1.0)}, {'y'}), _manifest({'y': (1, 1.0)}, {'x'}), 'push', delete=True)
+        assert {c['path'] for c in plan.conflicts} == {'x', 'y'}
+        assert plan.actions == []
+
+    def test_hashes_and_cache(self, tmp_path):
+        """Test equal hashes and cached pairs count as unchanged and are remembered."""
+        local = _manifest({'f': (3, 100.0)})
+        remote = _manifest({'f': (3, 200.0)})
+        cache = ManifestCache(tmp_path, ['server', '/l', '/r'])
+
+        assert hash_candidates(local, remote, cache) == ['f']
+        assert diff_manifests(local, remote, 'push', cache).summary()['copy'] == 1
+        assert diff_manifests(local, remote, 'push', cache, hashes={'f': ('abc', 'abc')}).summary()['copy'] == 0
+
+        cache.set_hash('local', 'f', local.files['f'], 'abc')
+        cache.save()
+        reloaded = ManifestCache(tmp_path, ['server', '/l', '/r']).load()
+        assert reloaded.in_sync('f', (3, 100.0), (3, 200.0))
+        assert reloaded.get_hash('local', 'f', (3, 100.0)) == 'abc'
+        assert reloaded.get_hash('local', 'f', (3, 101.0)) is None
+        assert hash_candidates(local, remote, reloaded) == []
+        assert diff_manifests(local, remote, 'push', reloaded).summary()['unchanged'] == 1
+
+        reloaded.prune(_manifest(), remote)
+        assert reloaded.pairs == {} and reloaded.hashes['local'] == {}
+
+    def test_unreadable_cache_ignored(self, tmp_path):
+        """Test a corrupt cache file behaves like an empty cache."""
+        cache = ManifestCache(tmp_path, ['k'])
+        cache.path.write_text('{not json', encoding='utf-8')
+        assert cache.load().pairs == {}
+
+    def test_invalid_direction(self):
+        """Test unknown directions are rejected."""
+        with pytest.raises(ValueError):
+            diff_manifests(_manifest(), _manifest(), 'both')
+
+class TestExecutePlan:
+    """Test running a plan."""
+
+    def test_order_parallelism_and_failures(self):
+        """Test directories come first, rmdir last, and one failure does not stop the rest."""
+        plan = diff_manifests(
+            _manifest({'a': (1, 1.0), 'b': (2, 1.0), 'bad': (3, 1.0)}, {'d'}),
+            _manifest({'gone': (1, 1.0)}, {'old'}), 'push', delete=True)
+        calls = []
+        lock = threading.Lock()
+
+        def handler(action):
+            with lock:
+                calls.append((action['op'], action['path']))
+            if action['path'] == 'bad':
+                raise IOError('disk full')
+
+        job = Job('sync')
+        outcome = execute_plan(plan, {op: handler for op in ('mkdir', 'copy', 'delete', 'rmdir')}, job, workers=3)
+
+        assert calls[0] == ('mkdir', 'd')
+        assert calls[-1] == ('rmdir', 'old')
+        assert outcome['done'] == 5
+        assert outcome['failed'] == [{'op': 'copy', 'path': 'bad', 'error': 'disk full'}]
+        assert job.files_total == 6 and job.files_done == 5
+        assert job.bytes_total == 6
+
+    def test_missing_handlers_skipped(self):
+        """Test operations without a handler are not run."""
+        plan = diff_manifests(_manifest({'a': (1, 1.0)}), _manifest({'b': (1, 1.0)}), 'push', delete=True)
+        outcome = execute_plan(plan, {'copy': lambda action: None})
+        assert outcome == {'done': 1, 'failed': []}
+
+    def test_cancel(self):
+        """Test a cancelled job stops the plan."""
+        plan = diff_manifests(_manifest({str(i): (1, 1.0) for i in range(20)}), _manifest(), 'push')
+        job = Job('sync')
+
+        def handler(action):
+            job.cancel()
+
+        with pytest.raises(JobCancelled):
+            execute_plan(plan, {'copy': handler}, job, workers=2)
+        assert job.files_done < 20
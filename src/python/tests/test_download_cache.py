@@ -0,0 +1,176 @@
+import pytest
+import os
+import threading
+import time
+
+from utils.download_cache import CachedFileStream, DownloadCache, cleanup_temp_files
+
+SERVER = ('192.168.1.100', 22, 'testuser')
+
+def _fill(cache, path, data, mtime=1600000000, server=SERVER):
+    """Write data into the cache the way a full streamed response does."""
+    fill = cache.begin_fill(server, path, len(data), mtime)
+    fill.write(data)
+    fill.commit()
+
+def _read(cache, path, size, mtime=1600000000):
+    file_obj = cache.lookup(SERVER, path, size, mtime)
+    if file_obj is None:
+        return None
+    with file_obj:
+        return file_obj.read()
+
+class TestDownloadCache:
+    """Test lookups, validation and LRU eviction."""
+
+    def test_miss_fill_hit(self, tmp_path):
+        """Test a miss is counted, a committed fill is served, and the entry keeps the remote mtime."""
+        cache = DownloadCache(tmp_path, max_bytes=1000)
+        assert _read(cache, '/data/a.bin', 100) is None
+        _fill(cache, '/data/a.bin', b'x' * 100)
+        assert _read(cache, '/data/a.bin', 100) == b'x' * 100
+
+        entry = tmp_path / DownloadCache.entry_name(SERVER, '/data/a.bin')
+        assert os.stat(entry).st_mtime == 1600000000
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (1, 1, 1, 100)
+        assert stats['hit_rate'] == 0.5
+        assert [p.name for p in tmp_path.iterdir()] == [entry.name]
+
+    def test_changed_remote_invalidates(self, tmp_path):
+        """Test a different remote size or mtime discards the cached copy and counts a miss."""
+        cache = DownloadCache(tmp_path, max_bytes=1000)
+        _fill(cache, '/a', b'old')
+        assert _read(cache, '/a', 3, mtime=1700000000) is None
+        assert cache.stats()['entries'] == 0
+        _fill(cache, '/a', b'longer', mtime=1700000000)
+        assert _read(cache, '/a', 3, mtime=1700000000) is None
+        assert cache.stats()['misses'] == 2
+
+    def test_keyed_by_server(self, tmp_path):
+        """Test the same path on another server is a separate entry."""
+        cache = DownloadCache(tmp_path, max_bytes=1000)
+        _fill(cache, '/a', b'one')
+        assert cache.lookup(('other', 22, 'testuser'), '/a', 3, 1600000000) is None
+        _fill(cache, '/a', b'two', server=('other', 22, 'testuser'))
+        assert _read(cache, '/a', 3) == b'one'
+
+    def test_lru_eviction(self, tmp_path):
+        """Test the least recently used entries are evicted to stay within the byte budget."""
+        cache = DownloadCache(tmp_path, max_bytes=300, max_entry_bytes=300)
+        for name in ('/a', '/b', '/c'):
+            _fill(cache, name, b'x' * 100)
+        _read(cache, '/a', 100)
+        _fill(cache, '/d', b'x' * 150)
+
+        stats = cache.stats()
+        assert stats['evictions'] == 2 and stats['bytes'] == 250
+        names = {p.name for p in tmp_path.iterdir()}
+        assert names == {DownloadCache.entry_name(SERVER, p) for p in ('/a', '/d')}
+
+    def test_fits(self, tmp_path):
+        """Test oversized files and a disabled cache are not cached."""
+        cache = DownloadCache(tmp_path, max_bytes=400)
+        assert cache.fits(100) and not cache.fits(101)
+        assert not DownloadCache(tmp_path, max_bytes=0).fits(0)
+
+    def test_short_or_aborted_fill(self, tmp_path):
+        """Test a short or aborted fill leaves nothing behind and the file can be filled again."""
+        cache = DownloadCache(tmp_path, max_bytes=1000)
+        fill = cache.begin_fill(SERVER, '/a', 10, 1600000000)
+        assert cache.begin_fill(SERVER, '/a', 10, 1600000000) is None
+        fill.write(b'short')
+        with pytest.raises(IOError):
+            fill.commit()
+        fill.abort()
+        assert list(tmp_path.iterdir()) == []
+        _fill(cache, '/a', b'0123456789')
+        assert _read(cache, '/a', 10) == b'0123456789'
+        assert cache.stats()['filling'] == 0
+
+    def test_follow_growing_fill(self, tmp_path):
+        """Test a concurrent request reads the fill as it is written instead of transferring again."""
+        cache = DownloadCache(tmp_path, max_bytes=1000)
+        fill = cache.begin_fill(SERVER, '/a', 6, 1600000000)
+        fill.write(b'sha')
+        follower = cache.follow(SERVER, '/a', 6, 1600000000, chunk_size=2)
+        assert next(follower) == b'sh'
+
+        chunks = []
+        thread = threading.Thread(target=lambda: chunks.extend(follower))
+        thread.start()
+        time.sleep(0.05)
+        fill.write(b'red')
+        fill.commit()
+        thread.join(5)
+
+        assert b'sh' + b''.join(chunks) == b'shared'
+        assert cache.stats()['shared'] == 1
+        assert _read(cache, '/a', 6) == b'shared'
+
+    def test_follow_stops_on_abort_or_stall(self, tmp_path):
+        """Test followers end with the bytes written so far when the fill is aborted or stalls."""
+        cache = DownloadCache(tmp_path, max_bytes=1000)
+        fill = cache.begin_fill(SERVER, '/a', 6, 1600000000)
+        fill.write(b'abc')
+        assert b''.join(cache.follow(SERVER, '/a', 6, 1600000000, timeout=0.05)) == b'abc'
+
+        follower = cache.follow(SERVER, '/a', 6, 1600000000)
+        assert next(follower) == b'abc'
+        fill.abort()
+        assert list(follower) == []
+        assert list(cache.follow(SERVER, '/a', 6, 1600000000)) == []
+        assert list(tmp_path.iterdir()) == []
+
+    def test_follow_ignores_other_version(self, tmp_path):
+        """Test a fill of a different remote version is not followed."""
+        cache = DownloadCache(tmp_path, max_bytes=1000)
+        fill = cache.begin_fill(SERVER, '/a', 6, 1600000000)
+        fill.write(b'abc')
+        assert list(cache.follow(SERVER, '/a', 6, 1700000000)) == []
+        fill.abort()
+
+    def test_load_restores_lru_order(self, tmp_path):
+        """Test a restart rebuilds the index from disk by access time and drops stale partial files."""
+        cache = DownloadCache(tmp_path, max_bytes=300, max_entry_bytes=300)
+        for name in ('/a', '/b', '/c'):
+            _fill(cache, name, b'x' * 100)
+        os.utime(tmp_path / DownloadCache.entry_name(SERVER, '/a'), (time.time() + 10, 1600000000))
+        stale = tmp_path / 'abc.123.part'
+        stale.write_bytes(b'partial')
+        os.utime(stale, (0, 0))
+        fresh = tmp_path / 'def.456.part'
+        fresh.write_bytes(b'partial')
+
+        restarted = DownloadCache(tmp_path, max_bytes=300, max_entry_bytes=300)
+        restarted.load()
+        assert restarted.stats()['entries'] == 3
+        assert not stale.exists() and fresh.exists()
+        _fill(restarted, '/d', b'x' * 100)
+        assert not (tmp_path / DownloadCache.entry_name(SERVER, '/b')).exists()
+        assert (tmp_path / DownloadCache.entry_name(SERVER, '/a')).exists()
+
+class TestCleanupAndStream:
+    """Test stale temp file cleanup and reading cached files."""
+
+    def test_cleanup_temp_files(self, tmp_path):
+        """Test only old files with the given prefix are removed."""
+        for name in ('downloadtool_old', 'downloadtool_new', 'other_old'):
+            (tmp_path / name).write_bytes(b'x')
+        for name in ('downloadtool_old', 'other_old'):
+            os.utime(tmp_path / name, (0, 0))
+        (tmp_path / 'downloadtool_dir').mkdir()
+
+        assert cleanup_temp_files(tmp_path, prefix='downloadtool_') == 1
+        assert sorted(p.name for p in tmp_path.iterdir()) == ['downloadtool_dir', 'downloadtool_new', 'other_old']
+        assert cleanup_temp_files(tmp_path / 'missing') == 0
+
+    def test_cached_stream_range(self, tmp_path):
+        """Test the stream honours set_range and closes the file when done."""
+        (tmp_path / 'f').write_bytes(b'0123456789')
+        file_obj = open(tmp_path / 'f', 'rb')
+        stream = CachedFileStream(file_obj, '/remote/f', 10, 1600000000, chunk_size=3)
+        stream.set_range(2, 8)
+        assert stream.length == 6
+        assert list(stream) == [b'234', b'567']
+        assert file_obj.closed
@@ -0,0 +1,70 @@
+import pytest
+import threading
+import time
+
+from utils.fan_out import fan_out
+
+def _sleeper(seconds, value=None):
+    def run():
+        time.sleep(seconds)
+        return value
+    return run
+
+class TestFanOut:
+    """Test concurrent fan-out execution."""
+
+    def test_results_in_completion_order(self):
+        """Test results stream as tasks finish, not in submission order."""
+        tasks = {'slow': _sleeper(0.3, 'S'), 'fast': _sleeper(0.05, 'F')}
+
+        results = list(fan_out(tasks, timeout=5))
+
+        assert [r['key'] for r in results] == ['fast', 'slow']
+        assert [r['result'] for r in results] == ['F', 'S']
+
+    def test_total_time_is_slowest_task(self):
+        """Test tasks run concurrently."""
+        tasks = {f'h{i}': _sleeper(0.2, i) for i in range(8)}
+
+        start = time.monotonic()
+        results = list(fan_out(tasks, timeout=5))
+
+        assert len(results) == 8
+        assert time.monotonic() - start < 1.0
+
+    def test_timeout_does_not_block_others(self):
+        """Test a hung task is reported as a timeout while others complete."""
+        release = threading.Event()
+        tasks = {'hung': lambda: release.wait(5), 'ok': _sleeper(0.01, 'ok')}
+
+        start = time.monotonic()
+        try:
+            results = {r['key']: r for r in fan_out(tasks, timeout=0.2)}
+        finally:
+            release.set()
+
+        assert results['ok']['result'] == 'ok'
+        assert '超时' in results['hung']['error']
+        assert time.monotonic() - start < 1.0
+
+    def test_errors_reported_per_task(self):
+        """Test an exception in one task is reported without affecting others."""
+        def boom():
+            raise RuntimeError('boom')
+
+        results = {r['key']: r for r in fan_out({'bad': boom, 'good': lambda: 1})}
+
+        assert results['bad']['error'] == 'boom'
+        assert results['good']['result'] == 1
+
+    def test_timeout_counts_from_start_not_queueing(self):
+        """Test queued tasks are not timed out while waiting for a worker."""
+        tasks = {f'h{i}': _sleeper(0.15, i) for i in range(3)}
+
+        results = list(fan_out(tasks, timeout=0.5, max_workers=1))
+
+        assert all('result' in r for r in results)
+
+    def test_empty(self):
+        """Test no tasks yields nothing."""
+        assert list(fan_out({})) == []
@@ -0,0 +1,210 @@
+import pytest
+import errno
+import os
+import stat
+import subprocess
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from utils.file_copy import (
+    CopyDataUnsupported, copy_fd, copy_local, copy_remote, move_local, move_remote, sftp_copy_data,
+)
+from utils.job_registry import Job
+
+@pytest.fixture
+def tree(tmp_path):
+    """A source tree with nested files, an empty directory and symlinks."""
+    src = tmp_path / 'src'
+    (src / 'sub' / 'empty').mkdir(parents=True)
+    (src / 'a.bin').write_bytes(os.urandom(300000))
+    (src / 'sub' / 'b.txt').write_bytes(b'hello')
+    os.chmod(src / 'sub' / 'b.txt', 0o640)
+    os.utime(src / 'sub' / 'b.txt', (1600000000, 1600000000))
+    os.symlink('sub/b.txt', src / 'link')
+    os.symlink('sub', src / 'dirlink')
+    return src
+
+def _local_exec(command, **kwargs):
+    """Run an exec'd command locally and return paramiko-shaped streams."""
+    proc = subprocess.run(command, shell=True, capture_output=True)
+    stdout = MagicMock()
+    stdout.read.return_value = proc.stdout
+    stdout.channel.recv_exit_status.return_value = proc.returncode
+    return MagicMock(), stdout, MagicMock()
+
+def _conn(sftp, exec_command=_local_exec):
+    return SimpleNamespace(sftp=sftp, exec_command=MagicMock(side_effect=exec_command), key=('h', 22, 'u'))
+
+def _same_tree(a, b):
+    """Compare two trees: names, file contents, modes and link targets."""
+    for dirpath, dirnames, filenames in os.walk(a):
+        other = b / os.path.relpath(dirpath, a)
+        assert sorted(os.listdir(dirpath)) == sorted(os.listdir(other))
+        for name in dirnames + filenames:
+            path, copy = os.path.join(dirpath, name), other / name
+            if os.path.islink(path):
+                assert os.readlink(path) == os.readlink(copy)
+            elif os.path.isfile(path):
+                assert open(path, 'rb').read() == copy.read_bytes()
+                assert os.stat(path).st_mode == os.stat(copy).st_mode
+    return True
+
+class TestCopyFd:
+    """Test the kernel copy paths and their fallbacks."""
+
+    @pytest.mark.parametrize('broken, expected', [
+        ((), 'copy_file_range'),
+        (('copy_file_range',), 'sendfile'),
+        (('copy_file_range', 'sendfile'), 'read'),
+    ])
+    def test_fallbacks(self, tmp_path, broken, expected):
+        """Test unsupported methods fall through to the next one with identical output."""
+        data = os.urandom(100000)
+        (tmp_path / 'in').write_bytes(data)
+        patches = [patch(f'os.{name}', side_effect=OSError(errno.EXDEV, 'cross-device')) for name in broken]
+        for p in patches:
+            p.start()
+        try:
+            with open(tmp_path / 'in', 'rb') as fin, open(tmp_path / 'out', 'wb') as fout:
+                job = Job('copy')
+                assert copy_fd(fin.fileno(), fout.fileno(), job) == expected
+        finally:
+            for p in patches:
+                p.stop()
+        assert (tmp_path / 'out').read_bytes() == data
+        assert job.bytes_done == len(data)
+
+    def test_real_errors_raise(self, tmp_path):
+        """Test errors other than 'unsupported' are not masked by a fallback."""
+        (tmp_path / 'in').write_bytes(b'x')
+        with patch('os.copy_file_range', side_effect=OSError(errno.ENOSPC, 'No space left')):
+            with open(tmp_path / 'in', 'rb') as fin, open(tmp_path / 'out', 'wb') as fout:
+                with pytest.raises(OSError):
+                    copy_fd(fin.fileno(), fout.fileno())
+
+class TestLocalCopyMove:
+    """Test local copies and moves."""
+
+    def test_copy_tree(self, tree, tmp_path):
+        """Test a tree copy keeps contents, modes, times and links, with progress."""
+        job = Job('copy')
+        result = copy_local(str(tree), str(tmp_path / 'dst'), job)
+
+        assert result['success'] is True and result['files'] == 4
+        assert result['bytes'] == 300005 == job.bytes_done == job.bytes_total
+        assert job.files_done == job.files_total == 4
+        assert _same_tree(tree, tmp_path / 'dst')
+        assert os.stat(tmp_path / 'dst' / 'sub' / 'b.txt').st_mtime == 1600000000
+        assert os.path.islink(tmp_path / 'dst' / 'dirlink')
+
+    def test_copy_rejects_existing_and_nested(self, tree, tmp_path):
+        """Test existing targets and copies into the source itself are refused."""
+        with pytest.raises(FileExistsError):
+            copy_local(str(tree / 'a.bin'), str(tree / 'sub' / 'b.txt'))
+        with pytest.raises(ValueError):
+            copy_local(str(tree), str(tree / 'sub' / 'inner'))
+        assert (tree / 'sub' / 'b.txt').read_bytes() == b'hello'
+
+    def test_copy_failure_cleans_up(self, tree, tmp_path):
+        """Test a failed copy leaves no partial target behind."""
+        with patch('utils.file_copy.copy_fd', side_effect=OSError(errno.EIO, 'I/O error')):
+            with pytest.raises(OSError):
+                copy_local(str(tree), str(tmp_path / 'dst'))
+        assert not (tmp_path / 'dst').exists()
+
+    def test_move_rename_and_cross_device(self, tree, tmp_path):
+        """Test moves rename in place, and copy then delete across filesystems."""
+        assert move_local(str(tree), str(tmp_path / 'moved'))['method'] == 'rename'
+        assert not tree.exists()
+
+        with patch('os.rename', side_effect=OSError(errno.EXDEV, 'cross-device')):
+            result = move_local(str(tmp_path / 'moved'), str(tmp_path / 'again'))
+        assert result['method'] == 'copy+delete'
+        assert not (tmp_path / 'moved').exists()
+        assert (tmp_path / 'again' / 'sub' / 'b.txt').read_bytes() == b'hello'
+
+class TestRemoteCopyMove:
+    """Test server-side copies over a real SFTP channel, with exec run locally."""
+
+    def test_copy_data(self, sftp_loopback, tree, tmp_path):
+        """Test copy-data copies on the server and keeps mode and mtime."""
+        sftp = sftp_loopback['sftp']
+        sftp_copy_data(sftp, str(tree / 'sub' / 'b.txt'), str(tmp_path / 'b.txt'))
+
+        assert (tmp_path / 'b.txt').read_bytes() == b'hello'
+        copied = os.stat(tmp_path / 'b.txt')
+        assert stat.S_IMODE(copied.st_mode) == 0o640 and copied.st_mtime == 1600000000
+        with pytest.raises(IOError):
+            sftp_copy_data(sftp, str(tree / 'a.bin'), str(tmp_path / 'b.txt'))
+        assert (tmp_path / 'b.txt').read_bytes() == b'hello'
+
+    def test_file_falls_back_to_cp(self, sftp_loopback, tree, tmp_path):
+        """Test servers without copy-data are remembered and files copied with cp."""
+        sftp_loopback['handler'].copy_data = False
+        conn = _conn(sftp_loopback['sftp'])
+        no_copy_data = set()
+
+        result = copy_remote(conn, str(tree / 'a.bin'), str(tmp_path / 'a.bin'), no_copy_data=no_copy_data)
+
+        assert result['method'] == 'cp'
+        assert no_copy_data == {conn.key}
+        assert (tmp_path / 'a.bin').read_bytes() == (tree / 'a.bin').read_bytes()
+        with pytest.raises(CopyDataUnsupported):
+            sftp_copy_data(sftp_loopback['sftp'], str(tree / 'a.bin'), str(tmp_path / 'other'))
+        assert not (tmp_path / 'other').exists()
+
+    def test_unsupported_detected_by_status_code(self, sftp_loopback, tree, tmp_path):
+        """Test OP_UNSUPPORTED with a server-specific message still falls back to cp."""
+        sftp_loopback['handler'].copy_data = False
+        sftp_loopback['handler'].unsupported_desc = 'Operation nicht unterstützt'
+        with pytest.raises(CopyDataUnsupported):
+            sftp_copy_data(sftp_loopback['sftp'], str(tree / 'a.bin'), str(tmp_path / 'a.bin'))
+        assert not (tmp_path / 'a.bin').exists()
+
+        result = copy_remote(_conn(sftp_loopback['sftp']), str(tree / 'a.bin'), str(tmp_path / 'a.bin'))
+        assert result['method'] == 'cp'
+
+    def test_tree_with_cp(self, sftp_loopback, tree, tmp_path):
+        """Test a directory is copied with a single cp."""
+        conn = _conn(sftp_loopback['sftp'])
+        result = copy_remote(conn, str(tree), str(tmp_path / 'dst'))
+
+        assert result['method'] == 'cp'
+        assert 'cp -a --reflink=auto' in conn.exec_command.call_args.args[0]
+        assert _same_tree(tree, tmp_path / 'dst')
+
+    def test_tree_without_cp(self, sftp_loopback, tree, tmp_path):
+        """Test a failed cp is cleaned up and the tree copied over SFTP with copy-data."""
+        def _failing_cp(command, **kwargs):
+            return _local_exec(f'mkdir {tmp_path / "dst"}; echo "cp: unrecognized option"; exit 1')
+
+        job = Job('copy')
+        result = copy_remote(_conn(sftp_loopback['sftp'], _failing_cp), str(tree), str(tmp_path / 'dst'), job)
+
+        assert result['method'] == 'sftp' and result['bytes'] == 300005
+        assert job.files_done == job.files_total == 4
+        assert _same_tree(tree, tmp_path / 'dst')
+
+    def test_tree_without_cp_or_copy_data(self, sftp_loopback, tree, tmp_path):
+        """Test the copy fails without moving data through the client when neither method is available."""
+        sftp_loopback['handler'].copy_data = False
+        conn = _conn(sftp_loopback['sftp'], lambda command, **kwargs: _local_exec('echo "cp: not found"; exit 127'))
+        no_copy_data = set()
+
+        with pytest.raises(OSError, match='cp: not found'):
+            copy_remote(conn, str(tree), str(tmp_path / 'dst'), no_copy_data=no_copy_data)
+        assert not (tmp_path / 'dst').exists()
+        assert no_copy_data == {conn.key}
+
+    def test_move(self, sftp_loopback, tree, tmp_path):
+        """Test moves use SFTP rename and fall back to mv."""
+        conn = _conn(sftp_loopback['sftp'])
+        assert move_remote(conn, str(tree / 'a.bin'), str(tmp_path / 'a.bin'))['method'] == 'rename'
+        conn.exec_command.assert_not_called()
+
+        with patch.object(conn.sftp, 'rename', side_effect=IOError('Failure')):
+            result = move_remote(conn, str(tree), str(tmp_path / 'moved'))
+        assert result['method'] == 'mv'
+        assert not tree.exists() and (tmp_path / 'moved' / 'sub' / 'b.txt').exists()
+        with pytest.raises(FileExistsError):
+            move_remote(conn, str(tmp_path / 'a.bin'), str(tmp_path / 'moved'))
@@ -0,0 +1,132 @@
+import pytest
+import json
+import socket
+import threading
+import time
+from unittest.mock import MagicMock
+
+from utils.config_store import ConfigStore
+from utils.health_monitor import (
+    HEALTH_DOWN, HEALTH_UNKNOWN, HEALTH_UNSTABLE, HEALTH_UP, THROUGHPUT_MIN_BYTES, HealthMonitor, probe_ssh,
+)
+from utils.ssh_pool import SSHConnectionPool
+from utils.transfer_engine import TransferStats
+
+@pytest.fixture
+def banner_server():
+    """A TCP server that greets every connection with text lines followed by an SSH banner."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+
+    def _serve():
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            sock.sendall(b'welcome\r\nSSH-2.0-OpenSSH_9.6\r\n')
+            sock.close()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    yield listener.getsockname()[1]
+    listener.close()
+
+@pytest.fixture
+def closed_port():
+    """A localhost port with nothing listening."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def _monitor(tmp_path, servers, **kwargs):
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'remote_server_list': [
+        {'server_name': name, 'config': {'host_ip': '127.0.0.1', 'ssh_port': port, 'user_name': 'u'}}
+        for name, port in servers
+    ]}))
+    return HealthMonitor(ConfigStore(config_path), **kwargs)
+
+class TestProbeSSH:
+    """Test the TCP + banner probe."""
+
+    def test_banner(self, banner_server):
+        """Test pre-banner lines are skipped and timings returned."""
+        tcp_rtt, banner_time, banner = probe_ssh('127.0.0.1', banner_server, timeout=2)
+        assert banner == 'SSH-2.0-OpenSSH_9.6'
+        assert 0 <= tcp_rtt < 2 and 0 <= banner_time < 2
+
+    def test_refused(self, closed_port):
+        """Test an unreachable port raises."""
+        with pytest.raises(OSError):
+            probe_ssh('127.0.0.1', closed_port, timeout=2)
+
+class TestHealthMonitor:
+    """Test probing rounds, failure tracking and fail-fast."""
+
+    def test_probe_rounds(self, tmp_path, banner_server, closed_port):
+        """Test reachable servers are up and unreachable ones become unstable, then down."""
+        monitor = _monitor(tmp_path, [('good', banner_server), ('bad', closed_port)])
+        assert monitor.get({'host_ip': '127.0.0.1', 'ssh_port': closed_port, 'user_name': 'u'})['status'] == HEALTH_UNKNOWN
+
+        first = monitor.probe_all()
+        good = first[f'u@127.0.0.1:{banner_server}']
+        bad = first[f'u@127.0.0.1:{closed_port}']
+        assert good['status'] == HEALTH_UP and good['rtt_ms'] is not None
+        assert good['banner'] == 'SSH-2.0-OpenSSH_9.6'
+        assert bad['status'] == HEALTH_UNSTABLE and bad['consecutive_failures'] == 1
+
+        bad = monitor.probe_all()[f'u@127.0.0.1:{closed_port}']
+        assert bad['status'] == HEALTH_DOWN
+        assert len(bad['recent_failures']) == 2 and bad['recent_failures'][0]['error']
+
+    def test_fail_fast_only_while_running(self, tmp_path, closed_port):
+        """Test the pool refuses down servers immediately once the monitor runs."""
+        pool = SSHConnectionPool()
+        monitor = _monitor(tmp_path, [('bad', closed_port)], pool=pool, interval=60)
+        pool.health_gate = monitor.unavailable_reason
+        ssh_info = {'host_ip': '127.0.0.1', 'ssh_port': closed_port, 'user_name': 'u', 'user_pwd': 'p'}
+        monitor.probe_all()
+        monitor.probe_all()
+        key = ('127.0.0.1', closed_port, 'u')
+        assert monitor.unavailable_reason(key) is None
+
+        monitor.start()
+        try:
+            assert monitor.unavailable_reason(key)
+            started = time.monotonic()
+            with pytest.raises(ConnectionError, match='服务器不可用'):
+                pool.acquire(ssh_info)
+            assert time.monotonic() - started < 1
+            assert pool.stats()[f'u@127.0.0.1:{closed_port}'] == {'idle': 0, 'in_use': 0}
+        finally:
+            monitor.stop()
+        assert not monitor.running
+
+    def test_session_ping(self, tmp_path, banner_server):
+        """Test an idle pooled session is pinged and its RTT recorded."""
+        pool = MagicMock()
+        pool.ping_idle.return_value = 0.004
+        monitor = _monitor(tmp_path, [('good', banner_server)], pool=pool)
+        health = monitor.probe_all()[f'u@127.0.0.1:{banner_server}']
+        assert health['session_rtt_ms'] == 4.0
+
+        pool.ping_idle.side_effect = EOFError('session closed')
+        assert monitor.probe_all()[f'u@127.0.0.1:{banner_server}']['status'] == HEALTH_UP
+
+    def test_throughput_from_transfers(self, tmp_path):
+        """Test only sizeable transfers update the smoothed throughput."""
+        monitor = _monitor(tmp_path, [])
+        ssh_info = {'host_ip': 'h', 'user_name': 'u'}
+        small = TransferStats('download', '/a', 10)
+        small.add(10)
+        monitor.record_transfer(ssh_info, small)
+        assert monitor.get(ssh_info)['bytes_per_sec'] is None
+
+        big = TransferStats('download', '/b', THROUGHPUT_MIN_BYTES)
+        big.add(THROUGHPUT_MIN_BYTES)
+        big.finish()
+        monitor.record_transfer(ssh_info, big)
+        assert monitor.get(ssh_info)['bytes_per_sec'] > 0
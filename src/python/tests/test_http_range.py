@@ -0,0 +1,49 @@
+import pytest
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from utils.http_range import if_range_matches, make_etag, resolve_range
+
+MTIME = 1234567890
+ETAG = make_etag(10, MTIME)
+
+def _request(**headers):
+    return Request(EnvironBuilder(headers=headers).get_environ())
+
+class TestHttpRange:
+    """Test Range/If-Range resolution."""
+
+    def test_make_etag(self):
+        """Test the ETag is derived from size and mtime only."""
+        assert make_etag(10, 1234567890.7) == 'a-499602d2'
+        assert make_etag(11, MTIME) != ETAG
+
+    def test_no_range(self):
+        """Test requests without Range get the full content."""
+        assert resolve_range(_request(), 10, ETAG, MTIME) is None
+
+    def test_single_range(self):
+        """Test open ended and suffix ranges are resolved against the size."""
+        assert resolve_range(_request(Range='bytes=3-'), 10, ETAG, MTIME) == (3, 10)
+        assert resolve_range(_request(Range='bytes=-4'), 10, ETAG, MTIME) == (6, 10)
+        assert resolve_range(_request(Range='bytes=0-100'), 10, ETAG, MTIME) == (0, 10)
+
+    def test_multiple_ranges_ignored(self):
+        """Test multi-range requests fall back to the full content."""
+        assert resolve_range(_request(Range='bytes=0-1,5-6'), 10, ETAG, MTIME) is None
+
+    def test_unsatisfiable(self):
+        """Test a range beyond the end of the file raises 416."""
+        with pytest.raises(RequestedRangeNotSatisfiable):
+            resolve_range(_request(Range='bytes=20-30'), 10, ETAG, MTIME)
+
+    def test_if_range(self):
+        """Test If-Range by ETag and by date."""
+        assert if_range_matches(_request(**{'If-Range': f'"{ETAG}"'}).if_range, ETAG, MTIME)
+        assert not if_range_matches(_request(**{'If-Range': '"other"'}).if_range, ETAG, MTIME)
+        date = 'Fri, 13 Feb 2009 23:31:30 GMT'
+        assert if_range_matches(_request(**{'If-Range': date}).if_range, ETAG, MTIME)
+        assert not if_range_matches(_request(**{'If-Range': date}).if_range, ETAG, MTIME + 60)
+        stale = _request(Range='bytes=3-', **{'If-Range': '"other"'})
+        assert resolve_range(stale, 10, ETAG, MTIME) is None
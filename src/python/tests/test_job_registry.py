@@ -0,0 +1,70 @@
+import pytest
+import threading
+
+from utils.job_registry import JOB_CANCELLED, JOB_DONE, JOB_FAILED, JobRegistry
+
+class TestJobRegistry:
+    """Test background job tracking."""
+
+    def test_job_success(self):
+        """Test a job's result and progress are recorded."""
+        registry = JobRegistry(max_workers=1)
+
+        def run(job):
+            job.add_total(nbytes=100, files=1)
+            job.add_bytes(100)
+            job.file_done()
+            return {'ok': True}
+
+        job = registry.submit('copy', run, {'src': 'a'})
+        registry.wait(job.job_id, timeout=5)
+
+        data = job.to_dict()
+        assert data['status'] == JOB_DONE
+        assert data['result'] == {'ok': True}
+        assert data['progress'] == 1.0
+        assert data['files_done'] == 1
+        assert data['bytes_per_sec'] > 0
+        assert registry.list('copy') == [job]
+        assert registry.list('other') == []
+
+    def test_job_failure(self):
+        """Test an exception marks the job failed with its message."""
+        registry = JobRegistry(max_workers=1)
+
+        def run(job):
+            raise RuntimeError('disk full')
+
+        job = registry.submit('copy', run)
+        registry.wait(job.job_id, timeout=5)
+
+        assert job.status == JOB_FAILED
+        assert job.error == 'disk full'
+
+    def test_job_cancel(self):
+        """Test a running job stops at its next cancellation check."""
+        registry = JobRegistry(max_workers=1)
+        started = threading.Event()
+
+        def run(job):
+            started.set()
+            while True:
+                job.check_cancelled()
+                job.add_bytes(1)
+
+        job = registry.submit('copy', run)
+        assert started.wait(5)
+        assert registry.cancel(job.job_id) is True
+        registry.wait(job.job_id, timeout=5)
+
+        assert job.status == JOB_CANCELLED
+        assert registry.cancel('missing') is False
+
+    def test_finished_jobs_pruned(self):
+        """Test finished jobs are dropped after the retention period."""
+        registry = JobRegistry(max_workers=1, retention=0)
+        job = registry.submit('copy', lambda job: None)
+        registry.wait(job.job_id, timeout=5)
+        job.finished_at -= 1
+
+        assert registry.list() == []
@@ -1,11 +1,14 @@
 import pytest
 import os
+import io
 import json
 import tempfile
+import zipfile
 from unittest.mock import patch, MagicMock, mock_open
 from pathlib import Path
 
 from service.impl.local_file_service import LocalFileService
+from utils.job_registry import Job
 
 class TestLocalFileService:
     """Test LocalFileService functionality."""
@@ -108,6 +111,100 @@ class TestLocalFileService:
         assert result['success'] is False
         assert 'Permission denied' in result['error']
     
+    def test_chunked_upload(self, local_service, temp_dir):
+        """Test chunks written out of order are assembled at their offsets."""
+        prepared = local_service.prepare_chunked_upload('local', temp_dir, 'sub/big.bin', 'abc123')
+        assert prepared['success'] is True
+        assert prepared['path'] == os.path.join(temp_dir, 'sub', 'big.bin')
+        
+        for offset, data in ((6, b'world'), (0, b'hello ')):
+            result = local_service.write_upload_chunk('local', prepared['temp_path'], offset, iter([data[:2], data[2:]]))
+            assert result == {'success': True, 'bytes': len(data)}
+        
+        result = local_service.commit_chunked_upload('local', prepared['temp_path'], prepared['path'])
+        assert result['success'] is True
+        with open(prepared['path'], 'rb') as f:
+            assert f.read() == b'hello world'
+        assert not os.path.exists(prepared['temp_path'])
+    
+    def test_upload_batch(self, local_service, temp_dir):
+        """Test several files are written with per-file results."""
+        files = [('a.txt', [b'hello']), ('sub/b.txt', iter([b'wor', b'ld'])), ('../x.txt', [b'x'])]
+        result = local_service.upload_batch('local', temp_dir, iter(files))
+        
+        assert result['success'] is False
+        assert result['files'] == 3 and result['failed'] == 1
+        assert result['results'][1] == {
+            'name': 'sub/b.txt', 'success': True, 'path': os.path.join(temp_dir, 'sub', 'b.txt'), 'size': 5
+        }
+        with open(os.path.join(temp_dir, 'sub', 'b.txt'), 'rb') as f:
+            assert f.read() == b'world'
+        assert not os.path.exists(os.path.join(os.path.dirname(temp_dir), 'x.txt'))
+    
+    def test_open_archive_stream(self, local_service, temp_dir):
+        """Test a directory is streamed as a zip and bad requests are rejected."""
+        os.makedirs(os.path.join(temp_dir, 'proj', 'sub'))
+        with open(os.path.join(temp_dir, 'proj', 'sub', 'a.txt'), 'wb') as f:
+            f.write(b'hello')
+        
+        result = local_service.open_archive_stream('local', os.path.join(temp_dir, 'proj'), None, 'zip')
+        assert result['success'] is True
+        assert result['stream'].filename == 'proj.zip'
+        with zipfile.ZipFile(io.BytesIO(b''.join(result['stream']))) as zf:
+            assert zf.read('proj/sub/a.txt') == b'hello'
+        
+        assert local_service.open_archive_stream('local', temp_dir, ['missing'], 'zip')['success'] is False
+        assert local_service.open_archive_stream('local', temp_dir, ['../x'], 'zip')['success'] is False
+        assert local_service.open_archive_stream('local', temp_dir, None, 'rar')['success'] is False
+    
+    def test_abort_chunked_upload(self, local_service, temp_dir):
+        """Test aborting removes the temporary file and tolerates repeats."""
+        prepared = local_service.prepare_chunked_upload('local', temp_dir, 'big.bin', 'abc123')
+        assert local_service.abort_chunked_upload('local', prepared['temp_path']) == {'success': True}
+        assert not os.path.exists(prepared['temp_path'])
+        assert local_service.abort_chunked_upload('local', prepared['temp_path']) == {'success': True}
+    
+    def test_calculate_child_sizes(self, local_service, temp_dir, sample_files):
+        """Test one walk yields the total and per-subdirectory sizes."""
+        os.makedirs(os.path.join(temp_dir, 'empty'))
+        
+        result = local_service.calculate_child_sizes('local', temp_dir)
+        
+        assert result['success'] is True
+        assert result['file_count'] == 3
+        assert result['total_size'] == len('Hello World') + len('Nested content') + len(b'fake image data')
+        assert result['children'] == {
+            'subdir': {'total_size': len('Nested content'), 'file_count': 1},
+            'empty': {'total_size': 0, 'file_count': 0},
+        }
+    
+    def test_calculate_child_sizes_symlinked_dir(self, local_service, temp_dir, tmp_path):
+        """Test a symlinked subdirectory is sized through the link but not added to the parent total."""
+        target = tmp_path / 'target'
+        (target / 'inner').mkdir(parents=True)
+        (target / 'inner' / 'data.bin').write_bytes(b'x' * 1000)
+        os.symlink(target, os.path.join(temp_dir, 'linked'))
+        with open(os.path.join(temp_dir, 'top.txt'), 'wb') as f:
+            f.write(b'y' * 10)
+
+        result = local_service.calculate_child_sizes('local', temp_dir)
+
+        assert result['children'] == {'linked': {'total_size': 1000, 'file_count': 1}}
+        assert (result['total_size'], result['file_count']) == (10, 1)
+        assert local_service.calculate_folder_size('local', os.path.join(temp_dir, 'linked'))['total_size'] == 1000
+    
+    def test_search_files(self, local_service, temp_dir, sample_files):
+        """Test name search is recursive, case-insensitive and filtered by kind."""
+        result = local_service.search_files('local', temp_dir, '*.TXT')
+        
+        assert result['success'] is True and result['truncated'] is False
+        assert sorted(e['name'] for e in result['entries']) == ['nested.txt', 'test.txt']
+        assert os.path.join(temp_dir, 'subdir', 'nested.txt') in [e['path'] for e in result['entries']]
+        dirs = local_service.search_files('local', temp_dir, 'sub*', kind='dir')
+        assert [e['type'] for e in dirs['entries']] == ['dir']
+        assert local_service.search_files('local', temp_dir, '*', limit=1)['truncated'] is True
+        assert local_service.search_files('local', os.path.join(temp_dir, 'test.txt'), '*')['success'] is False
+    
     def test_delete_file_success(self, local_service, temp_dir, sample_files):
         """Test successful file deletion."""
         test_file = os.path.join(temp_dir, 'test.txt')
@@ -135,18 +232,77 @@ class TestLocalFileService:
         assert 'error' in result
     
     def test_delete_non_empty_directory(self, local_service, temp_dir, sample_files):
-        """Test deletion of non-empty directory."""
+        """Test a non-empty directory is deleted recursively."""
         test_dir = os.path.join(temp_dir, 'subdir')
         
         result = local_service.delete_file('local', test_dir)
         
+        assert result['success'] is True
+        assert not os.path.exists(test_dir)
+    
+    def test_delete_paths(self, local_service, temp_dir, sample_files):
+        """Test several trees and files are deleted in one call with progress and a missing path reported."""
+        deep = os.path.join(temp_dir, 'tree', 'a', 'b')
+        os.makedirs(deep)
+        for i in range(20):
+            with open(os.path.join(deep, f'{i}.bin'), 'wb') as f:
+                f.write(b'x' * 10)
+        os.symlink(os.path.join(temp_dir, 'subdir'), os.path.join(temp_dir, 'tree', 'link'))
+        job = Job('delete')
+        paths = [os.path.join(temp_dir, 'tree'), os.path.join(temp_dir, 'test.txt'), os.path.join(temp_dir, 'nope')]
+        
+        result = local_service.delete_paths('local', paths, job)
+        
         assert result['success'] is False
-        assert 'error' in result
+        assert [item['path'] for item in result['failed']] == [paths[2]]
+        assert (result['deleted_files'], result['deleted_dirs'], result['bytes']) == (22, 3, 211)
+        assert (job.files_done, job.files_total, job.bytes_done) == (25, 25, 211)
+        assert sorted(os.listdir(temp_dir)) == ['image.png', 'subdir']
+        assert os.listdir(os.path.join(temp_dir, 'subdir')) == ['nested.txt']
+    
+    def test_delete_paths_partial_failure(self, local_service, temp_dir):
+        """Test an undeletable entry is reported once and its ancestors are left in place."""
+        locked = os.path.join(temp_dir, 'tree', 'locked')
+        os.makedirs(locked)
+        open(os.path.join(locked, 'keep.txt'), 'w').close()
+        open(os.path.join(temp_dir, 'tree', 'gone.txt'), 'w').close()
+        remove = os.remove
+        
+        def _remove(path):
+            if path.endswith('keep.txt'):
+                raise PermissionError(13, 'Permission denied', path)
+            remove(path)
+        
+        with patch('os.remove', side_effect=_remove):
+            result = local_service.delete_paths('local', [os.path.join(temp_dir, 'tree')])
+        
+        assert result['success'] is False
+        assert [item['path'] for item in result['failed']] == [os.path.join(locked, 'keep.txt')]
+        assert os.listdir(os.path.join(temp_dir, 'tree')) == ['locked']
+    
+    def test_copy_and_move_path(self, local_service, temp_dir, sample_files):
+        """Test copying and renaming inside the local filesystem."""
+        copied = local_service.copy_path('local', os.path.join(temp_dir, 'subdir'), os.path.join(temp_dir, 'copy'))
+        moved = local_service.move_path('local', os.path.join(temp_dir, 'test.txt'),
+                                        os.path.join(temp_dir, 'copy', 'renamed.txt'))
+        
+        assert copied['success'] is True and moved['method'] == 'rename'
+        assert sorted(os.listdir(os.path.join(temp_dir, 'copy'))) == ['nested.txt', 'renamed.txt']
+        assert not os.path.exists(os.path.join(temp_dir, 'test.txt'))
+        again = local_service.copy_path('local', os.path.join(temp_dir, 'subdir'), os.path.join(temp_dir, 'copy'))
+        assert again['success'] is False and '目标已存在' in again['error']
+    
+    def test_delete_paths_refuses_root(self, local_service):
+        """Test the filesystem root is never deleted."""
+        result = local_service.delete_paths('local', ['/'])
+        
+        assert result['success'] is False
+        assert '根目录' in result['error']
     
-    @patch('builtins.open', new_callable=mock_open, read_data='{"local_default_dir": "/custom/path"}')
     @patch('os.path.expanduser')
-    def test_get_default_dir_custom(self, mock_expanduser, mock_file, local_service):
+    def test_get_default_dir_custom(self, mock_expanduser, local_service, config_file):
         """Test get default directory with custom path."""
+        config_file.write_text('{"local_default_dir": "/custom/path"}', encoding='utf-8')
         mock_expanduser.return_value = '/custom/path'
         
         result = local_service.get_default_dir('local')
@@ -154,10 +310,10 @@ class TestLocalFileService:
         assert result['default_dir'] == '/custom/path'
         mock_expanduser.assert_called_once_with('/custom/path')
     
-    @patch('builtins.open', new_callable=mock_open, read_data='{}')
     @patch('os.path.expanduser')
-    def test_get_default_dir_default(self, mock_expanduser, mock_file, local_service):
+    def test_get_default_dir_default(self, mock_expanduser, local_service, config_file):
         """Test get default directory with default path."""
+        config_file.write_text('{}', encoding='utf-8')
         mock_expanduser.return_value = '/home/user'
         
         result = local_service.get_default_dir('local')
@@ -165,10 +321,10 @@ class TestLocalFileService:
         assert result['default_dir'] == '/home/user'
         mock_expanduser.assert_called_once_with('~')
     
-    @patch('builtins.open', new_callable=mock_open, read_data='{"local_default_dir": "~/custom"}')
     @patch('os.path.expanduser')
-    def test_get_default_dir_tilde_expansion(self, mock_expanduser, mock_file, local_service):
+    def test_get_default_dir_tilde_expansion(self, mock_expanduser, local_service, config_file):
         """Test get default directory with tilde expansion."""
+        config_file.write_text('{"local_default_dir": "~/custom"}', encoding='utf-8')
         mock_expanduser.return_value = '/home/user/custom'
         
         result = local_service.get_default_dir('local')
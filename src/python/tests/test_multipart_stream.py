@@ -0,0 +1,80 @@
+import pytest
+import io
+
+from utils.multipart_stream import iter_file_chunks, iter_multipart
+
+BOUNDARY = 'testboundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+def _body(*parts):
+    """Build a multipart body from (name, filename, data) tuples."""
+    chunks = []
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        chunks.append(f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode())
+        chunks.append(data + b'\r\n')
+    chunks.append(f'--{BOUNDARY}--\r\n'.encode())
+    return b''.join(chunks)
+
+class TestMultipartStream:
+    """Test incremental multipart parsing."""
+
+    def test_iter_fields_and_files(self):
+        """Test fields and files are produced in order with their data."""
+        body = _body(('note', None, b'hello'), ('file', 'a.txt', b'A' * 1000), ('file', 'dir/b.txt', b'B'))
+
+        parts = []
+        for part in iter_multipart(io.BytesIO(body), CONTENT_TYPE, read_size=64):
+            parts.append((part.name, part.filename, part.read()))
+
+        assert parts == [
+            ('note', None, b'hello'),
+            ('file', 'a.txt', b'A' * 1000),
+            ('file', 'dir/b.txt', b'B'),
+        ]
+
+    def test_data_arrives_in_chunks(self):
+        """Test a large file is yielded incrementally rather than buffered whole."""
+        payload = bytes(range(256)) * 4096
+        body = _body(('file', 'big.bin', payload))
+
+        part = next(iter(iter_multipart(io.BytesIO(body), CONTENT_TYPE, read_size=8192)))
+        sizes = [len(chunk) for chunk in part]
+
+        assert sum(sizes) == len(payload)
+        assert max(sizes) <= 8192 + len(BOUNDARY) + 8
+        assert len(sizes) > 1
+
+    def test_unconsumed_part_is_skipped(self):
+        """Test skipping a part without reading it still reaches the next part."""
+        body = _body(('skip', 'x.bin', b'X' * 5000), ('file', 'keep.txt', b'keep'))
+
+        names = []
+        for part in iter_multipart(io.BytesIO(body), CONTENT_TYPE, read_size=100):
+            if part.name == 'file':
+                assert part.read() == b'keep'
+            names.append(part.name)
+
+        assert names == ['skip', 'file']
+
+    def test_truncated_body(self):
+        """Test a truncated body raises ValueError."""
+        body = _body(('file', 'a.txt', b'A' * 100))[:-40]
+
+        with pytest.raises(ValueError):
+            for part in iter_multipart(io.BytesIO(body), CONTENT_TYPE):
+                part.read()
+
+    def test_not_multipart(self):
+        """Test non-multipart content types are rejected."""
+        with pytest.raises(ValueError):
+            iter_multipart(io.BytesIO(b''), 'application/json')
+
+    def test_iter_file_chunks(self):
+        """Test reading a FileStorage-like object in chunks."""
+        class Upload:
+            stream = io.BytesIO(b'abcdefg')
+
+        assert list(iter_file_chunks(Upload(), chunk_size=3)) == [b'abc', b'def', b'g']
@@ -0,0 +1,159 @@
+import pytest
+import hashlib
+import io
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock
+
+from utils.dir_sync import scan_local
+from utils.remote_agent import (
+    AGENT_CALL_TIMEOUT, MAX_FRAME_SIZE, RemoteAgent, RemoteAgentError, read_frame, write_frame,
+)
+
+AGENT_SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'utils', 'remote_agent.py')
+
+@pytest.fixture
+def agent():
+    """A RemoteAgent talking to a local agent process over pipes."""
+    proc = subprocess.Popen([sys.executable, AGENT_SCRIPT, 'serve'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    client = RemoteAgent(proc.stdin, proc.stdout)
+    client.info = read_frame(proc.stdout)
+    yield client
+    client.close()
+    proc.kill()
+    proc.wait()
+
+@pytest.fixture
+def tree(tmp_path):
+    """A directory tree with nested files, a hard link and symlinks (to a dir, to a file, broken)."""
+    root = tmp_path / 'root'
+    (root / 'a' / 'deep').mkdir(parents=True)
+    (root / 'a' / 'one.txt').write_bytes(b'1' * 100)
+    (root / 'a' / 'deep' / 'two.log').write_bytes(b'2' * 200)
+    (root / 'b').mkdir()
+    (root / 'b' / 'hard.txt').write_bytes(b'3' * 300)
+    os.link(root / 'b' / 'hard.txt', root / 'b' / 'hard2.txt')
+    (root / 'top.log').write_bytes(b'4' * 50)
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'x.bin').write_bytes(b'5' * 70)
+    os.symlink(outside, root / 'linked')
+    os.symlink(root / 'top.log', root / 'alias.log')
+    os.symlink(root / 'missing', root / 'dangling')
+    return root
+
+def _du(path):
+    """Apparent size of a tree as du -sb reports it."""
+    return int(subprocess.check_output(['du', '-sb', str(path)]).split()[0])
+
+class TestFrames:
+    """Test the length-prefixed JSON framing."""
+
+    def test_round_trip(self):
+        """Test frames round-trip, including non-UTF-8 file names."""
+        stream = io.BytesIO()
+        name = os.fsdecode(b'caf\xe9.txt')
+        write_frame(stream, {'names': [name, '中文']})
+        write_frame(stream, {'n': 2})
+        stream.seek(0)
+        assert read_frame(stream) == {'names': [name, '中文']}
+        assert read_frame(stream) == {'n': 2}
+        assert read_frame(stream) is None
+
+    def test_truncated_and_oversized(self):
+        """Test a partial frame and an absurd length are rejected."""
+        stream = io.BytesIO()
+        write_frame(stream, {'n': 1})
+        with pytest.raises(EOFError):
+            read_frame(io.BytesIO(stream.getvalue()[:-1]))
+        with pytest.raises(ValueError):
+            read_frame(io.BytesIO((MAX_FRAME_SIZE + 1).to_bytes(4, 'big')))
+
+class TestRemoteAgent:
+    """Test the agent operations over a real agent process."""
+
+    def test_handshake_and_ping(self, agent):
+        """Test the greeting and a ping come from the agent process."""
+        assert agent.info['agent'] == 1
+        assert agent.call('ping')['pid'] == agent.info['pid']
+
+    def test_list(self, agent, tree):
+        """Test listings follow symlinks and keep broken links as l."""
+        entries = {name: (kind, size) for name, kind, size, mtime in agent.call('list', path=str(tree))}
+        assert entries['a'][0] == 'd' and entries['linked'][0] == 'd'
+        assert entries['alias.log'] == ('f', 50)
+        assert entries['dangling'][0] == 'l'
+        assert entries['top.log'] == ('f', 50)
+
+    def test_dir_size_matches_du(self, agent, tree):
+        """Test sizes match du -sb and file counts match find -type f."""
+        result = agent.call('dir_size', path=str(tree))
+        assert result == {'total_size': _du(tree), 'file_count': 5, 'errors': 0}
+
+    def test_child_sizes(self, agent, tree):
+        """Test per-directory sizes, with symlinked directories followed but not added to the total."""
+        result = agent.call('child_sizes', path=str(tree))
+        assert result['total_size'] == _du(tree)
+        assert result['file_count'] == 5
+        assert set(result['children']) == {'a', 'b', 'linked'}
+        assert result['children']['a'] == {'total_size': _du(tree / 'a'), 'file_count': 2}
+        assert result['children']['linked']['file_count'] == 1
+
+    def test_hash_and_manifest(self, agent, tree):
+        """Test digests of selected files and a manifest identical to the local scan."""
+        digests = agent.call('hash', root=str(tree), paths=['a/one.txt', 'nope'], algorithm='md5')
+        assert digests == {'a/one.txt': hashlib.md5(b'1' * 100).hexdigest()}
+        manifest = agent.call('manifest', root=str(tree))
+        local = scan_local(str(tree))
+        assert set(manifest['dirs']) == local.dirs
+        assert {rel: tuple(meta) for rel, meta in manifest['files'].items()} == local.files
+
+    def test_find(self, agent, tree):
+        """Test name filtering is case-insensitive, honours kind and truncates at the limit."""
+        found = agent.call('find', path=str(tree), pattern='*.LOG', kind=None, limit=10)
+        assert sorted(e[0] for e in found['entries']) == ['a/deep/two.log', 'alias.log', 'top.log']
+        assert found['truncated'] is False
+        dirs = agent.call('find', path=str(tree), pattern='*', kind='d', limit=10)
+        assert sorted(e[0] for e in dirs['entries']) == ['a', 'a/deep', 'b', 'linked']
+        limited = agent.call('find', path=str(tree), pattern='*', kind=None, limit=2)
+        assert len(limited['entries']) == 2 and limited['truncated'] is True
+
+    def test_errors(self, agent, tree):
+        """Test failed operations raise RemoteAgentError and leave the agent usable."""
+        with pytest.raises(RemoteAgentError) as info:
+            agent.call('list', path=str(tree / 'missing'))
+        assert info.value.errno == 2
+        with pytest.raises(RemoteAgentError, match='未知的操作'):
+            agent.call('rm_rf', path='/')
+        assert agent.alive and agent.call('ping')
+
+    def test_dead_agent(self, agent):
+        """Test a closed channel marks the agent dead."""
+        agent.stdin.close()
+        with pytest.raises(Exception):
+            agent.call('ping')
+        assert agent.alive is False
+        with pytest.raises(EOFError):
+            agent.call('ping')
+
+    def test_stderr_drained_and_reported(self):
+        """Test a process flooding stderr does not block, and its last lines explain the failure."""
+        script = "import sys; sys.stderr.write('noise\\n' * 50000 + 'Traceback: boom\\n')"
+        proc = subprocess.Popen([sys.executable, '-c', script], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        conn = MagicMock()
+        conn.exec_command.return_value = (proc.stdin, proc.stdout, proc.stderr)
+        try:
+            with pytest.raises(EOFError, match='Traceback: boom'):
+                RemoteAgent.start(conn, '/helper/remote_agent.py')
+        finally:
+            proc.kill()
+            proc.wait()
+
+    def test_channel_timeout(self):
+        """Test the channel gets a read timeout so a stuck agent fails the call instead of hanging."""
+        stdout = io.BytesIO()
+        stdout.channel = MagicMock()
+        RemoteAgent(io.BytesIO(), stdout)
+        stdout.channel.settimeout.assert_called_once_with(AGENT_CALL_TIMEOUT)
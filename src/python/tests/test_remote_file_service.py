@@ -1,30 +1,45 @@
 import pytest
+import io
 import json
+import os
+import random
+import stat
+import subprocess
+import sys
+import tarfile
 import tempfile
+import threading
+import zipfile
 from unittest.mock import patch, MagicMock, mock_open
 
+import paramiko
+
 from service.impl.remote_file_service import RemoteFileService
+from utils.download_cache import CachedFileStream, DownloadCache
+from utils.job_registry import Job, JobCancelled
+from utils.remote_listing import AGENT_LIST_MAX_ENTRIES
+
+def _ssh_client_returning(sftp):
+    """构造 open_sftp 返回指定 sftp 的 SSHClient mock"""
+    ssh = MagicMock()
+    ssh.open_sftp.return_value = sftp
+    return ssh
 
 class TestRemoteFileService:
     """Test RemoteFileService functionality."""
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_list_dir_success_with_password(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_list_dir_success_with_password(self, remote_service, mock_config):
         """Test successful directory listing with password authentication."""
-        mock_json_load.return_value = mock_config
-        
         # Mock paramiko components
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.listdir_attr.return_value = [
             MagicMock(filename='test.txt', st_mode=33188, st_size=100, st_mtime=1234567890),
             MagicMock(filename='testdir', st_mode=16877, st_size=4096, st_mtime=1234567890)
         ]
+        mock_sftp.stat.return_value = MagicMock(st_mode=16877, st_size=4096)
         mock_sftp.normalize.return_value = '/home/testuser'
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp), \
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)), \
              patch('stat.S_ISDIR', side_effect=lambda x: x == 16877):
             
             result = remote_service.list_dir('remote', '/test/path')
@@ -37,17 +52,15 @@ class TestRemoteFileService:
             assert result['dirs'][0]['name'] == 'testdir'
             assert result['files'][0]['name'] == 'test.txt'
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_list_dir_success_with_ssh_key(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_list_dir_success_with_ssh_key(self, remote_service, mock_config, config_file):
         """Test successful directory listing with SSH key authentication."""
         # Remove password to use SSH key
         mock_config['remote_server_list'][0]['config']['user_pwd'] = ''
-        mock_json_load.return_value = mock_config
-        
+        config_file.write_text(json.dumps(mock_config), encoding='utf-8')
         mock_ssh = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.listdir_attr.return_value = []
+        mock_sftp.stat.return_value = MagicMock(st_mode=16877, st_size=4096)
         mock_sftp.normalize.return_value = '/home/testuser'
         
         with patch('paramiko.SSHClient', return_value=mock_ssh), \
@@ -58,20 +71,32 @@ class TestRemoteFileService:
             assert 'dirs' in result
             assert 'files' in result
             mock_ssh.connect.assert_called_once()
+            assert mock_ssh.connect.call_args.kwargs['look_for_keys'] is True
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_list_dir_tilde_path(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_list_dir_reuses_pooled_connection(self, remote_service, mock_config):
+        """Test consecutive operations share one SSH login."""
+        mock_sftp = MagicMock()
+        mock_sftp.listdir_attr.return_value = []
+        mock_sftp.normalize.return_value = '/home/testuser'
+        mock_ssh = _ssh_client_returning(mock_sftp)
+
+        with patch('paramiko.SSHClient', return_value=mock_ssh) as mock_client:
+            remote_service.list_dir('remote', '/test/path')
+            remote_service.list_dir('remote', '/test/other')
+            remote_service.delete_file('remote', '/test/path/file.txt')
+
+            assert mock_client.call_count == 1
+            mock_ssh.connect.assert_called_once()
+            mock_ssh.open_sftp.assert_called_once()
+
+    def test_list_dir_tilde_path(self, remote_service, mock_config):
         """Test directory listing with tilde path."""
-        mock_json_load.return_value = mock_config
-        
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.listdir_attr.return_value = []
+        mock_sftp.stat.return_value = MagicMock(st_mode=16877, st_size=4096)
         mock_sftp.normalize.return_value = '/home/testuser'
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp):
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
             
             result = remote_service.list_dir('remote', '~/test')
             
@@ -79,83 +104,439 @@ class TestRemoteFileService:
             # Should expand ~ to home directory
             mock_sftp.listdir_attr.assert_called_once_with('/home/testuser/test')
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_list_dir_connection_error(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_list_dir_connection_error(self, remote_service, mock_config):
         """Test directory listing with connection error."""
-        mock_json_load.return_value = mock_config
-        
-        with patch('paramiko.Transport', side_effect=Exception('Connection failed')):
+        with patch('paramiko.SSHClient', side_effect=Exception('Connection failed')):
             result = remote_service.list_dir('remote', '/test/path')
             
             assert 'error' in result
             assert 'Connection failed' in result['error']
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_download_file_success(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_download_file_success(self, remote_service, mock_config):
         """Test successful file download."""
-        mock_json_load.return_value = mock_config
+        mock_sftp = MagicMock()
+        mock_sftp.normalize.return_value = '/home/testuser'
+        mock_sftp.stat.return_value = MagicMock(st_size=100)
+        remote_file = mock_sftp.open.return_value.__enter__.return_value
+        remote_file.readv.side_effect = lambda pieces, **kwargs: (b'x' * length for _, length in pieces)
         
-        mock_transport = MagicMock()
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            result = remote_service.download_file('remote', '/test/path/file.txt')
+            
+            try:
+                assert os.path.basename(result).startswith('downloadtool_')
+                with open(result, 'rb') as f:
+                    assert f.read() == b'x' * 100
+                mock_sftp.open.assert_called_with('/test/path/file.txt', 'rb')
+            finally:
+                os.unlink(result)
+    
+    def test_open_download_stream(self, remote_service, mock_config):
+        """Test streaming download reads chunks and returns the connection to the pool."""
+        remote_file = MagicMock()
+        remote_file.read.side_effect = [b'hello ', b'world', b'']
         mock_sftp = MagicMock()
         mock_sftp.normalize.return_value = '/home/testuser'
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=11, st_mtime=1234567890)
+        mock_sftp.open.return_value = remote_file
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp), \
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)), \
              patch('tempfile.NamedTemporaryFile') as mock_temp:
+            stream = remote_service.open_download_stream('remote', '~/file.txt')
             
-            mock_temp_file = MagicMock()
-            mock_temp_file.name = '/tmp/test_file'
-            mock_temp.return_value = mock_temp_file
+            assert stream.size == 11
+            assert stream.path == '/home/testuser/file.txt'
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22']['in_use'] == 1
+            assert b''.join(stream) == b'hello world'
             
-            result = remote_service.download_file('remote', '/test/path/file.txt')
+            remote_file.prefetch.assert_called_once()
+            remote_file.close.assert_called_once()
+            mock_temp.assert_not_called()
+            mock_sftp.get.assert_not_called()
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22'] == {'idle': 1, 'in_use': 0}
+    
+    def test_open_download_stream_close_before_read(self, remote_service, mock_config):
+        """Test closing an unread stream still releases the connection."""
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=11, st_mtime=1234567890)
+        
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            stream = remote_service.open_download_stream('remote', '/file.txt')
+            stream.close()
+            stream.close()
             
-            assert result == '/tmp/test_file'
-            mock_sftp.get.assert_called_once()
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22'] == {'idle': 1, 'in_use': 0}
+
+    def test_open_download_stream_range(self, remote_service, mock_config):
+        """Test a byte range is read from the right offset and truncated to its length."""
+        content = b'0123456789abcdef'
+        remote_file = MagicMock()
+        position = {'pos': 0}
+        remote_file.seek.side_effect = lambda offset: position.update(pos=offset)
+        def read(size):
+            data = content[position['pos']:position['pos'] + size]
+            position['pos'] += len(data)
+            return data
+        remote_file.read.side_effect = read
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=16, st_mtime=1234567890)
+        mock_sftp.open.return_value = remote_file
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            stream = remote_service.open_download_stream('remote', '/file.bin')
+            stream.chunk_size = 3
+            stream.set_range(4, 10)
+
+            assert stream.length == 6
+            assert b''.join(stream) == b'456789'
+            remote_file.seek.assert_called_once_with(4)
+            remote_file.prefetch.assert_called_once_with(10, max_concurrent_requests=64)
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22'] == {'idle': 1, 'in_use': 0}
+
+    @staticmethod
+    def _seekable_file(content):
+        """A remote file mock reading content from its seek position."""
+        remote_file = MagicMock()
+        position = {'pos': 0}
+        remote_file.seek.side_effect = lambda offset: position.update(pos=offset)
+        def read(size):
+            data = content[position['pos']:position['pos'] + size]
+            position['pos'] += len(data)
+            return data
+        remote_file.read.side_effect = read
+        return remote_file
+
+    def test_open_download_stream_resumes(self, remote_service, mock_config, monkeypatch):
+        """Test a dropped connection is replaced and reading continues at the sent offset."""
+        monkeypatch.setattr('service.impl.remote_file_service.resume_delay', lambda attempt: 0)
+        content = b'0123456789abcdef'
+        dropped = MagicMock()
+        dropped.read.side_effect = [b'4567', EOFError('connection lost')]
+        resumed = self._seekable_file(content)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=16, st_mtime=1234567890)
+        mock_sftp.open.side_effect = [dropped, resumed]
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            stream = remote_service.open_download_stream('remote', '/file.bin')
+            stream.chunk_size = 4
+            stream.set_range(4, 14)
+
+            assert b''.join(stream) == b'456789abcd'
+            assert stream.resumes == 1
+            resumed.seek.assert_called_once_with(8)
+            resumed.prefetch.assert_called_once_with(14, max_concurrent_requests=64)
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22'] == {'idle': 1, 'in_use': 0}
+
+    def test_open_download_stream_resume_modified(self, remote_service, mock_config, monkeypatch):
+        """Test a file modified while disconnected fails instead of mixing two versions."""
+        monkeypatch.setattr('service.impl.remote_file_service.resume_delay', lambda attempt: 0)
+        dropped = MagicMock()
+        dropped.read.side_effect = [b'0123', EOFError('connection lost')]
+        mock_sftp = MagicMock()
+        mock_sftp.stat.side_effect = [MagicMock(st_mode=0o100644, st_size=16, st_mtime=1234567890),
+                                      MagicMock(st_mode=0o100644, st_size=16, st_mtime=1234567999)]
+        mock_sftp.open.return_value = dropped
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            stream = remote_service.open_download_stream('remote', '/file.bin')
+            with pytest.raises(IOError, match='被修改'):
+                b''.join(stream)
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22']['in_use'] == 0
+
+    def test_open_download_stream_directory(self, remote_service, mock_config):
+        """Test streaming download of a directory returns None."""
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o040755, st_size=4096, st_mtime=1234567890)
+        
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            assert remote_service.open_download_stream('remote', '/somedir') is None
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22']['in_use'] == 0
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_download_file_error(self, mock_json_load, mock_file, remote_service, mock_config):
-        """Test file download with error."""
-        mock_json_load.return_value = mock_config
+    def test_open_download_stream_missing(self, remote_service, mock_config):
+        """Test streaming download of a missing file returns None."""
+        mock_sftp = MagicMock()
+        mock_sftp.stat.side_effect = FileNotFoundError('No such file')
         
-        with patch('paramiko.Transport', side_effect=Exception('Download failed')):
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            assert remote_service.open_download_stream('remote', '/missing.txt') is None
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22']['in_use'] == 0
+    
+    def test_download_file_error(self, remote_service, mock_config):
+        """Test file download with error."""
+        with patch('paramiko.SSHClient', side_effect=Exception('Download failed')):
             result = remote_service.download_file('remote', '/test/path/file.txt')
             
             assert result is None
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_upload_file_success(self, mock_json_load, mock_file, remote_service, mock_config, mock_file_obj):
+    def test_downloads_use_cache(self, remote_service, mock_config, tmp_path):
+        """Test a full streamed download fills the cache as it goes and later requests are served from disk."""
+        remote_service.download_cache = DownloadCache(tmp_path / 'cache', max_bytes=1000)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=100, st_mtime=1600000000)
+        remote_file = mock_sftp.open.return_value
+        remote_file.read.side_effect = lambda n: b'x' * n
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)), \
+             patch.object(remote_service.transfer_engine, 'download') as mock_download:
+            stream = remote_service.open_download_stream('remote', '/data/file.bin')
+            assert not isinstance(stream, CachedFileStream)
+            chunks = iter(stream)
+            assert next(chunks) == b'x' * 100
+            assert remote_service.download_cache_stats()['filling'] == 1
+            assert list(chunks) == []
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22']['in_use'] == 0
+
+            stream = remote_service.open_download_stream('remote', '/data/file.bin')
+            assert isinstance(stream, CachedFileStream)
+            assert (stream.path, stream.size, stream.mtime) == ('/data/file.bin', 100, 1600000000)
+            assert remote_service.pool.stats()['testuser@192.168.1.100:22']['in_use'] == 0
+            assert b''.join(stream) == b'x' * 100
+
+            copy = remote_service.download_file('remote', '/data/file.bin')
+            try:
+                assert os.path.basename(copy).startswith('downloadtool_')
+                with open(copy, 'rb') as f:
+                    assert f.read() == b'x' * 100
+            finally:
+                os.unlink(copy)
+
+            mock_sftp.stat.return_value.st_mtime = 1700000000
+            assert b''.join(remote_service.open_download_stream('remote', '/data/file.bin')) == b'x' * 100
+            mock_download.assert_not_called()
+            assert remote_file.read.call_count == 2
+
+        stats = remote_service.download_cache_stats()
+        assert (stats['hits'], stats['misses'], stats['entries'], stats['filling']) == (2, 2, 1, 0)
+
+    def test_concurrent_download_follows_fill(self, remote_service, mock_config, tmp_path):
+        """Test a second full download reads the first one's cache fill instead of reading the remote file."""
+        remote_service.download_cache = DownloadCache(tmp_path / 'cache', max_bytes=1000)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=100, st_mtime=1600000000)
+        remote_file = mock_sftp.open.return_value
+        remote_file.read.side_effect = lambda n: b'x' * n
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            first = remote_service.open_download_stream('remote', '/data/file.bin')
+            second = remote_service.open_download_stream('remote', '/data/file.bin')
+            first.chunk_size = second.chunk_size = 50
+            leader = iter(first)
+            assert next(leader) == b'x' * 50
+
+            received = []
+            follower = threading.Thread(target=lambda: received.extend(second))
+            follower.start()
+            assert list(leader) == [b'x' * 50]
+            follower.join(5)
+
+        assert b''.join(received) == b'x' * 100
+        assert remote_file.read.call_count == 2
+        assert remote_service.download_cache_stats()['shared'] == 1
+
+    def test_interrupted_download_leaves_no_cache(self, remote_service, mock_config, tmp_path):
+        """Test a client that disconnects mid-download discards the partial cache file."""
+        remote_service.download_cache = DownloadCache(tmp_path / 'cache', max_bytes=1000)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=100, st_mtime=1600000000)
+        mock_sftp.open.return_value.read.side_effect = lambda n: b'x' * min(n, 10)
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            stream = remote_service.open_download_stream('remote', '/data/file.bin')
+            chunks = iter(stream)
+            next(chunks)
+            chunks.close()
+        assert list((tmp_path / 'cache').iterdir()) == []
+        assert remote_service.download_cache_stats()['filling'] == 0
+
+    def test_range_download_does_not_fill_cache(self, remote_service, mock_config, tmp_path):
+        """Test a Range request on an uncached file streams only the range from SFTP."""
+        remote_service.download_cache = DownloadCache(tmp_path / 'cache', max_bytes=1000)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=100, st_mtime=1600000000)
+        mock_sftp.open.return_value.read.side_effect = [b'tail', b'']
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)), \
+             patch.object(remote_service.transfer_engine, 'download') as mock_download:
+            stream = remote_service.open_download_stream('remote', '/data/file.bin')
+            stream.set_range(96, 100)
+            assert b''.join(stream) == b'tail'
+            mock_download.assert_not_called()
+        stats = remote_service.download_cache_stats()
+        assert (stats['entries'], stats['hits'], stats['misses'], stats['hit_rate']) == (0, 0, 1, 0.0)
+
+    def test_download_larger_than_cache_streams(self, remote_service, mock_config, tmp_path):
+        """Test files over the per-entry limit are streamed and never written to the cache."""
+        remote_service.download_cache = DownloadCache(tmp_path / 'cache', max_bytes=40)
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=11, st_mtime=1600000000)
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            stream = remote_service.open_download_stream('remote', '/data/file.bin')
+            assert not isinstance(stream, CachedFileStream)
+            stream.close()
+        assert remote_service.download_cache_stats()['misses'] == 0
+
+    def test_cleanup_stale_downloads(self, remote_service, tmp_path):
+        """Test startup cleanup removes old download temp files and loads the cache index."""
+        old = tmp_path / 'downloadtool_old'
+        old.write_bytes(b'x')
+        os.utime(old, (0, 0))
+        with patch('tempfile.gettempdir', return_value=str(tmp_path)):
+            remote_service.cleanup_stale_downloads()
+        assert not old.exists()
+        assert (tmp_path / 'download_cache').is_dir()
+
+    def test_upload_file_success(self, remote_service, mock_config, mock_file_obj):
         """Test successful file upload."""
-        mock_json_load.return_value = mock_config
-        
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.normalize.return_value = '/home/testuser'
         mock_sftp.stat.side_effect = Exception('Directory not found')  # To test directory creation
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp), \
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)), \
              patch('tempfile.NamedTemporaryFile') as mock_temp:
             
-            mock_temp_file = MagicMock()
-            mock_temp_file.name = '/tmp/test_file'
-            mock_temp.return_value = mock_temp_file
-            
             result = remote_service.upload_file('remote', '/test/path', mock_file_obj)
             
             assert result['success'] is True
-            assert 'path' in result
-            mock_sftp.put.assert_called_once()
+            assert result['path'] == '/test/path/test.txt'
+            # 直接流式写入远程文件，不落本地临时文件
+            mock_temp.assert_not_called()
+            mock_sftp.put.assert_not_called()
+            mock_sftp.open.assert_called_once_with('/test/path/test.txt', 'wb')
+            remote_file = mock_sftp.open.return_value
+            remote_file.set_pipelined.assert_called_once_with(True)
+            remote_file.write.assert_called_once_with(b'test content')
+            remote_file.close.assert_called_once()
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_upload_file_no_filename(self, mock_json_load, mock_file, remote_service, mock_config):
-        """Test upload with file object without filename."""
-        mock_json_load.return_value = mock_config
+    def test_upload_stream_chunks(self, remote_service, mock_config):
+        """Test upload_stream writes every chunk as it arrives."""
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock()
+        
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            result = remote_service.upload_stream('remote', '/test/path/', 'big.bin', iter([b'a' * 10, b'b' * 10]))
+            
+            assert result == {'success': True, 'path': '/test/path/big.bin'}
+            remote_file = mock_sftp.open.return_value
+            assert remote_file.write.call_count == 2
+    
+    def test_upload_stream_failure_removes_partial(self, remote_service, mock_config):
+        """Test a failed upload removes the partially written remote file."""
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock()
+        
+        def chunks():
+            yield b'partial'
+            raise IOError('client disconnected')
+        
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            result = remote_service.upload_stream('remote', '/test/path', 'big.bin', chunks())
+            
+            assert result['success'] is False
+            assert 'client disconnected' in result['error']
+            mock_sftp.remove.assert_called_once_with('/test/path/big.bin')
+    
+    def test_upload_stream_close_failure_removes_partial(self, remote_service, mock_config):
+        """Test a write error reported when closing the file also removes the partial file."""
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock()
+        mock_sftp.open.return_value.close.side_effect = [IOError('disk full'), None]
+
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            result = remote_service.upload_stream('remote', '/test/path', 'big.bin', iter([b'data']))
+
+            assert result['success'] is False
+            assert 'disk full' in result['error']
+            mock_sftp.remove.assert_called_once_with('/test/path/big.bin')
+
+    def test_calculate_child_sizes_single_exec(self, remote_service, mock_config):
+        """Test child sizes are computed by one quoted remote command."""
+        mock_sftp = MagicMock()
+        mock_sftp.normalize.return_value = '/home/testuser'
+        mock_ssh = _ssh_client_returning(mock_sftp)
+        output = (
+            "8199\t./a b\n4096\t./empty\n16392\t.\n"
+            "@@downloadtool-file-counts@@\n2\ta b\n1\ttop.txt\n3\t.\n"
+            "@@downloadtool-file-counts@@\n20480\t7\tlinked\n"
+        )
+        mock_ssh.exec_command.return_value = (MagicMock(), io.BytesIO(output.encode()), io.BytesIO(b''))
         
+        with patch('paramiko.SSHClient', return_value=mock_ssh):
+            result = remote_service.calculate_child_sizes('remote', "~/it's here")
+            
+            assert mock_ssh.exec_command.call_count == 1
+            command = mock_ssh.exec_command.call_args.args[0]
+            assert command.startswith("cd -- '/home/testuser/it'\"'\"'s here' && ")
+            assert result['success'] is True
+            assert result['is_complete'] is True
+            assert result['total_size'] == 16392
+            assert result['file_count'] == 3
+            assert result['children'] == {
+                'a b': {'total_size': 8199, 'file_count': 2},
+                'empty': {'total_size': 4096, 'file_count': 0},
+                'linked': {'total_size': 20480, 'file_count': 7},
+            }
+    
+    def test_calculate_child_sizes_missing_dir(self, remote_service, mock_config):
+        """Test a failed cd is reported as an error."""
+        mock_ssh = _ssh_client_returning(MagicMock())
+        mock_ssh.exec_command.return_value = (MagicMock(), io.BytesIO(b''), io.BytesIO(b'cd: /nope: No such file or directory'))
+        
+        with patch('paramiko.SSHClient', return_value=mock_ssh):
+            result = remote_service.calculate_child_sizes('remote', '/nope')
+            
+            assert result['success'] is False
+            assert 'No such file' in result['error']
+    
+    def test_calculate_child_sizes_stderr_flood(self, remote_service, local_host, tmp_path):
+        """Test heavy stderr from du/find does not stall reading their output."""
+        (tmp_path / 'a').mkdir()
+        (tmp_path / 'a' / 'f.txt').write_bytes(b'x' * 10)
+        flood = f"{sys.executable} -c \"import sys; sys.stderr.write('du: Permission denied\\n' * 20000)\""
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess(
+            f"{flood}; {command}").streams()
+
+        result = remote_service.calculate_child_sizes('remote', str(tmp_path))
+
+        assert result['success'] is True and result['is_complete'] is False
+        assert result['children']['a']['file_count'] == 1
+
+    def test_chunked_upload(self, remote_service, mock_config):
+        """Test chunked upload writes at offsets and renames into place."""
+        mock_sftp = MagicMock()
+        mock_sftp.stat.return_value = MagicMock()
+        
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            prepared = remote_service.prepare_chunked_upload('remote', '/test/path', 'big.bin', 'abc123')
+            assert prepared == {'success': True, 'path': '/test/path/big.bin', 'temp_path': '/test/path/.big.bin.abc123.part'}
+            mock_sftp.open.assert_called_with('/test/path/.big.bin.abc123.part', 'wb')
+            
+            result = remote_service.write_upload_chunk('remote', prepared['temp_path'], 1024, iter([b'ab', b'cd']))
+            assert result == {'success': True, 'bytes': 4}
+            mock_sftp.open.assert_called_with('/test/path/.big.bin.abc123.part', 'r+b')
+            remote_file = mock_sftp.open.return_value.__enter__.return_value
+            remote_file.seek.assert_called_once_with(1024)
+            assert remote_file.write.call_count == 2
+            
+            result = remote_service.commit_chunked_upload('remote', prepared['temp_path'], prepared['path'])
+            assert result == {'success': True, 'path': '/test/path/big.bin'}
+            mock_sftp.posix_rename.assert_called_once_with('/test/path/.big.bin.abc123.part', '/test/path/big.bin')
+    
+    def test_commit_chunked_upload_rename_fallback(self, remote_service, mock_config):
+        """Test commit falls back to remove + rename without posix-rename support."""
+        mock_sftp = MagicMock()
+        mock_sftp.posix_rename.side_effect = IOError('Operation unsupported')
+        
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
+            result = remote_service.commit_chunked_upload('remote', '/d/.f.part', '/d/f')
+            
+            assert result['success'] is True
+            mock_sftp.remove.assert_called_once_with('/d/f')
+            mock_sftp.rename.assert_called_once_with('/d/.f.part', '/d/f')
+    
+    def test_upload_file_no_filename(self, remote_service, mock_config):
+        """Test upload with file object without filename."""
         mock_file_obj = MagicMock()
         mock_file_obj.filename = None
         
@@ -164,27 +545,17 @@ class TestRemoteFileService:
         assert result['success'] is False
         assert result['error'] == '文件名为空'
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_upload_file_with_subdirectory(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_upload_file_with_subdirectory(self, remote_service, mock_config):
         """Test upload with subdirectory in filename."""
-        mock_json_load.return_value = mock_config
-        
         mock_file_obj = MagicMock()
         mock_file_obj.filename = 'subdir/test.txt'
+        mock_file_obj.stream = io.BytesIO(b'test content')
         
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.normalize.return_value = '/home/testuser'
         mock_sftp.stat.side_effect = Exception('Directory not found')  # To test directory creation
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp), \
-             patch('tempfile.NamedTemporaryFile') as mock_temp:
-            
-            mock_temp_file = MagicMock()
-            mock_temp_file.name = '/tmp/test_file'
-            mock_temp.return_value = mock_temp_file
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
             
             result = remote_service.upload_file('remote', '/test/path', mock_file_obj)
             
@@ -192,90 +563,63 @@ class TestRemoteFileService:
             # Should create subdirectory
             mock_sftp.mkdir.assert_called()
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_upload_file_connection_error(self, mock_json_load, mock_file, remote_service, mock_config, mock_file_obj):
+    def test_upload_file_connection_error(self, remote_service, mock_config, mock_file_obj):
         """Test upload with connection error."""
-        mock_json_load.return_value = mock_config
-        
-        with patch('paramiko.Transport', side_effect=Exception('Connection failed')):
+        with patch('paramiko.SSHClient', side_effect=Exception('Connection failed')):
             result = remote_service.upload_file('remote', '/test/path', mock_file_obj)
             
             assert result['success'] is False
             assert 'Connection failed' in result['error']
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_delete_file_success(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_delete_file_success(self, remote_service, mock_config):
         """Test successful file deletion."""
-        mock_json_load.return_value = mock_config
-        
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.normalize.return_value = '/home/testuser'
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp):
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
             
             result = remote_service.delete_file('remote', '/test/path/file.txt')
             
             assert result['success'] is True
             mock_sftp.remove.assert_called_once()
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_delete_file_error(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_delete_file_error(self, remote_service, mock_config):
         """Test file deletion with error."""
-        mock_json_load.return_value = mock_config
-        
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.normalize.return_value = '/home/testuser'
         mock_sftp.remove.side_effect = Exception('Delete failed')
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp):
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
             
             result = remote_service.delete_file('remote', '/test/path/file.txt')
             
             assert result['success'] is False
             assert 'Delete failed' in result['error']
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_delete_file_connection_error(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_delete_file_connection_error(self, remote_service, mock_config):
         """Test file deletion with connection error."""
-        mock_json_load.return_value = mock_config
-        
-        with patch('paramiko.Transport', side_effect=Exception('Connection failed')):
+        with patch('paramiko.SSHClient', side_effect=Exception('Connection failed')):
             result = remote_service.delete_file('remote', '/test/path/file.txt')
             
             assert result['success'] is False
             assert 'Connection failed' in result['error']
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_get_default_dir_success(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_get_default_dir_success(self, remote_service, mock_config):
         """Test get default directory success."""
-        mock_json_load.return_value = mock_config
-        
         result = remote_service.get_default_dir('remote')
         
         assert result['default_dir'] == '~/test'
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_get_default_dir_no_config(self, mock_json_load, mock_file, remote_service):
+    def test_get_default_dir_no_config(self, remote_service, config_file):
         """Test get default directory with missing config."""
-        mock_json_load.return_value = {'remote_server_list': [{'config': {}}]}
+        config_file.write_text(json.dumps({'remote_server_list': [{'config': {}}]}), encoding='utf-8')
         
         result = remote_service.get_default_dir('remote')
         
         assert result['default_dir'] == '~'
     
-    @patch('builtins.open', new_callable=mock_open)
     @patch('json.load')
-    def test_get_default_dir_error(self, mock_json_load, mock_file, remote_service):
+    def test_get_default_dir_error(self, mock_json_load, remote_service):
         """Test get default directory with error."""
         mock_json_load.side_effect = Exception('Config error')
         
@@ -284,20 +628,15 @@ class TestRemoteFileService:
         assert 'error' in result
         assert 'Config error' in result['error']
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_get_remote_servers_success(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_get_remote_servers_success(self, remote_service, mock_config):
         """Test get remote servers success."""
-        mock_json_load.return_value = mock_config
-        
         result = remote_service.get_remote_servers()
         
         assert len(result) == 1
         assert result[0]['server_name'] == 'test_server'
     
-    @patch('builtins.open', new_callable=mock_open)
     @patch('json.load')
-    def test_get_remote_servers_error(self, mock_json_load, mock_file, remote_service):
+    def test_get_remote_servers_error(self, mock_json_load, remote_service):
         """Test get remote servers with error."""
         mock_json_load.side_effect = Exception('Config error')
         
@@ -305,12 +644,8 @@ class TestRemoteFileService:
         
         assert result == []
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_test_server_connectivity_success(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_test_server_connectivity_success(self, remote_service, mock_config):
         """Test server connectivity success."""
-        mock_json_load.return_value = mock_config
-        
         ssh_info = {
             'host_ip': '192.168.1.100',
             'user_name': 'testuser',
@@ -325,12 +660,8 @@ class TestRemoteFileService:
             assert result['success'] is True
             mock_transport.connect.assert_called_once()
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_test_server_connectivity_ssh_key(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_test_server_connectivity_ssh_key(self, remote_service, mock_config):
         """Test server connectivity with SSH key."""
-        mock_json_load.return_value = mock_config
-        
         ssh_info = {
             'host_ip': '192.168.1.100',
             'user_name': 'testuser',
@@ -345,12 +676,8 @@ class TestRemoteFileService:
             assert result['success'] is True
             mock_ssh.connect.assert_called_once()
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_test_server_connectivity_error(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_test_server_connectivity_error(self, remote_service, mock_config):
         """Test server connectivity with error."""
-        mock_json_load.return_value = mock_config
-        
         ssh_info = {
             'host_ip': '192.168.1.100',
             'user_name': 'testuser',
@@ -363,21 +690,26 @@ class TestRemoteFileService:
             assert result['success'] is False
             assert 'Connection failed' in result['error']
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    @patch('json.dump')
-    def test_save_server_pwd_success(self, mock_json_dump, mock_json_load, mock_file, remote_service, mock_config):
+    def test_save_server_pwd_success(self, remote_service, mock_config, config_file):
         """Test save server password success."""
-        mock_json_load.return_value = mock_config
-        
         result = remote_service.save_server_pwd('test_server', 'new_password')
         
         assert result['success'] is True
-        mock_json_dump.assert_called_once()
+        saved = json.loads(config_file.read_text(encoding='utf-8'))
+        assert saved['remote_server_list'][0]['config']['user_pwd'] == 'new_password'
+        assert saved['local_default_dir'] == mock_config['local_default_dir']
+    
+    def test_save_server_pwd_unchanged_skips_write(self, remote_service, mock_config, config_file):
+        """Test saving the same password does not rewrite the config file."""
+        before = config_file.stat().st_mtime_ns
+        
+        result = remote_service.save_server_pwd('test_server', 'testpass')
+        
+        assert result['success'] is True
+        assert config_file.stat().st_mtime_ns == before
     
-    @patch('builtins.open', new_callable=mock_open)
     @patch('json.load')
-    def test_save_server_pwd_error(self, mock_json_load, mock_file, remote_service):
+    def test_save_server_pwd_error(self, mock_json_load, remote_service):
         """Test save server password with error."""
         mock_json_load.side_effect = Exception('Config error')
         
@@ -386,32 +718,166 @@ class TestRemoteFileService:
         assert result['success'] is False
         assert 'Config error' in result['error']
 
+class TestRemoteFileServiceServerScope:
+    """Test per-request server selection."""
+
+    @pytest.fixture
+    def two_servers(self, mock_config, config_file):
+        second = json.loads(json.dumps(mock_config['remote_server_list'][0]))
+        second['server_name'] = 'other_server'
+        second['config']['host_ip'] = '10.0.0.2'
+        mock_config['remote_server_list'].append(second)
+        config_file.write_text(json.dumps(mock_config), encoding='utf-8')
+        return mock_config
+
+    def test_default_is_first_server(self, remote_service, two_servers):
+        """Test requests without a selection use the first configured server."""
+        assert remote_service.current_server is None
+        assert remote_service._get_remote('test')['server_name'] == 'test_server'
+
+    def test_server_scope(self, remote_service, two_servers):
+        """Test server_scope selects a server only inside the block."""
+        with remote_service.server_scope('other_server'):
+            assert remote_service._get_remote('test')['config']['host_ip'] == '10.0.0.2'
+            assert remote_service.current_server['server_name'] == 'other_server'
+        assert remote_service.current_server_name is None
+
+    def test_unknown_server(self, remote_service, two_servers):
+        """Test selecting a server that is not configured fails instead of using another one."""
+        mock_sftp = MagicMock()
+        with remote_service.server_scope('missing'), \
+             patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)) as mock_client:
+            result = remote_service.list_dir('remote', '/tmp')
+            assert '服务器不存在' in result['error']
+            mock_client.assert_not_called()
+
+    def test_concurrent_selections_are_isolated(self, remote_service, two_servers):
+        """Test threads selecting different servers do not see each other's choice."""
+        barrier = threading.Barrier(2)
+        seen = {}
+
+        def worker(name):
+            with remote_service.server_scope(name):
+                barrier.wait()
+                seen[name] = remote_service._get_remote('test')['server_name']
+
+        threads = [threading.Thread(target=worker, args=(name,)) for name in ('test_server', 'other_server')]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert seen == {'test_server': 'test_server', 'other_server': 'other_server'}
+
+    def test_connections_pooled_per_server(self, remote_service, two_servers):
+        """Test operations on different servers use their own pooled connections."""
+        mock_sftp = MagicMock()
+        mock_sftp.listdir_attr.return_value = []
+
+        with patch('paramiko.SSHClient', side_effect=lambda: _ssh_client_returning(mock_sftp)):
+            for name in ('test_server', 'other_server', 'test_server'):
+                with remote_service.server_scope(name):
+                    remote_service.list_dir('remote', '/tmp')
+
+        assert set(remote_service.pool.stats()) == {'testuser@192.168.1.100:22', 'testuser@10.0.0.2:22'}
+
+    def test_fan_out_list_dir(self, remote_service, two_servers):
+        """Test list_dir runs on every server, each against its own host."""
+        hosts = {}
+
+        def client():
+            ssh = MagicMock()
+            sftp = MagicMock()
+            sftp.listdir_attr.return_value = []
+            sftp.stat.return_value = MagicMock(st_mode=16877, st_size=4096)
+            ssh.open_sftp.return_value = sftp
+            ssh.connect.side_effect = lambda host, **kwargs: hosts.setdefault(host, threading.current_thread().name)
+            return ssh
+
+        with patch('paramiko.SSHClient', side_effect=client):
+            results = {r['server']: r for r in remote_service.fan_out('list_dir', '/data')}
+
+        assert set(results) == {'test_server', 'other_server'}
+        assert all(r['result']['path'] == '/data' for r in results.values())
+        assert set(hosts) == {'192.168.1.100', '10.0.0.2'}
+
+    def test_fan_out_unknown_server_and_operation(self, remote_service, two_servers):
+        """Test unknown servers are reported and unsupported operations rejected."""
+        results = list(remote_service.fan_out('list_dir', '/data', ['nope']))
+        assert results == [{'server': 'nope', 'elapsed': 0.0, 'error': '服务器不存在: nope'}]
+
+        with pytest.raises(ValueError):
+            list(remote_service.fan_out('delete_file', '/data'))
+
+    def test_transfer_between_servers_relay(self, remote_service, two_servers):
+        """Test a relay transfer borrows one connection per server and resolves paths."""
+        src_sftp = MagicMock()
+        src_sftp.normalize.return_value = '/home/testuser'
+        dst_sftp = MagicMock()
+        clients = {'192.168.1.100': _ssh_client_returning(src_sftp), '10.0.0.2': _ssh_client_returning(dst_sftp)}
+        created = []
+
+        def client():
+            ssh = MagicMock()
+            def connect(host, **kwargs):
+                created.append(host)
+                ssh.open_sftp.return_value = clients[host].open_sftp()
+            ssh.connect.side_effect = connect
+            return ssh
+
+        with patch('paramiko.SSHClient', side_effect=client), \
+             patch('service.impl.remote_file_service.relay_tree', return_value={'path': '/backup/data', 'files': 2, 'bytes': 10}) as relay:
+            result = remote_service.transfer_between_servers('test_server', '~/data', 'other_server', '/backup')
+
+        assert result == {'success': True, 'method': 'relay', 'path': '/backup/data', 'files': 2, 'bytes': 10}
+        assert relay.call_args.args[:4] == (src_sftp, '/home/testuser/data', dst_sftp, '/backup')
+        assert sorted(created) == ['10.0.0.2', '192.168.1.100']
+
+    def test_transfer_auto_falls_back_to_relay(self, remote_service, two_servers):
+        """Test auto mode tries rsync on the source host and falls back to relaying."""
+        job = Job('transfer')
+        job.add_total(nbytes=5)
+        with patch('paramiko.SSHClient', side_effect=lambda: _ssh_client_returning(MagicMock())), \
+             patch('service.impl.remote_file_service.direct_push', side_effect=RuntimeError('rsync: command not found')), \
+             patch('service.impl.remote_file_service.relay_tree', return_value={'path': '/b/f', 'files': 1, 'bytes': 1}) as relay:
+            result = remote_service.transfer_between_servers('test_server', '/f', 'other_server', '/b', job, method='auto')
+
+        assert result['success'] is True
+        assert result['method'] == 'relay'
+        assert job.bytes_total == 0
+        relay.assert_called_once()
+
+    def test_transfer_direct_failure_reported(self, remote_service, two_servers):
+        """Test direct mode reports rsync failures without relaying."""
+        with patch('paramiko.SSHClient', side_effect=lambda: _ssh_client_returning(MagicMock())), \
+             patch('service.impl.remote_file_service.direct_push', side_effect=RuntimeError('Permission denied')), \
+             patch('service.impl.remote_file_service.relay_tree') as relay:
+            result = remote_service.transfer_between_servers('test_server', '/f', 'other_server', '/b', method='direct')
+
+        assert result == {'success': False, 'error': 'Permission denied'}
+        relay.assert_not_called()
+
+    def test_transfer_unknown_server(self, remote_service, two_servers):
+        """Test unknown servers are rejected."""
+        result = remote_service.transfer_between_servers('test_server', '/f', 'nope', '/b')
+        assert result == {'success': False, 'error': '服务器不存在: nope'}
+
 class TestRemoteFileServiceDirectoryCreation:
     """Test directory creation logic in remote file service."""
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_upload_file_directory_creation_nested(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_upload_file_directory_creation_nested(self, remote_service, mock_config):
         """Test upload with nested directory creation."""
-        mock_json_load.return_value = mock_config
-        
         mock_file_obj = MagicMock()
         mock_file_obj.filename = 'level1/level2/test.txt'
+        mock_file_obj.stream = io.BytesIO(b'test content')
         
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.normalize.return_value = '/home/testuser'
         
         # Mock stat to simulate directories don't exist
         mock_sftp.stat.side_effect = Exception('Directory not found')
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp), \
-             patch('tempfile.NamedTemporaryFile') as mock_temp:
-            
-            mock_temp_file = MagicMock()
-            mock_temp_file.name = '/tmp/test_file'
-            mock_temp.return_value = mock_temp_file
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
             
             result = remote_service.upload_file('remote', '/test/path', mock_file_obj)
             
@@ -419,32 +885,736 @@ class TestRemoteFileServiceDirectoryCreation:
             # Should attempt to create directories
             assert mock_sftp.mkdir.call_count >= 1
     
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('json.load')
-    def test_upload_file_directory_exists(self, mock_json_load, mock_file, remote_service, mock_config):
+    def test_upload_file_directory_exists(self, remote_service, mock_config):
         """Test upload when directory already exists."""
-        mock_json_load.return_value = mock_config
-        
         mock_file_obj = MagicMock()
         mock_file_obj.filename = 'existing_dir/test.txt'
+        mock_file_obj.stream = io.BytesIO(b'test content')
         
-        mock_transport = MagicMock()
         mock_sftp = MagicMock()
         mock_sftp.normalize.return_value = '/home/testuser'
         
         # Mock stat to simulate directory exists
         mock_sftp.stat.return_value = MagicMock()
         
-        with patch('paramiko.Transport', return_value=mock_transport), \
-             patch('paramiko.SFTPClient.from_transport', return_value=mock_sftp), \
-             patch('tempfile.NamedTemporaryFile') as mock_temp:
-            
-            mock_temp_file = MagicMock()
-            mock_temp_file.name = '/tmp/test_file'
-            mock_temp.return_value = mock_temp_file
+        with patch('paramiko.SSHClient', return_value=_ssh_client_returning(mock_sftp)):
             
             result = remote_service.upload_file('remote', '/test/path', mock_file_obj)
             
             assert result['success'] is True
             # Should not attempt to create directory
-            mock_sftp.mkdir.assert_not_called()
\ No newline at end of file
+            mock_sftp.mkdir.assert_not_called()
+class _LocalProcess:
+    """Runs an exec'd command locally, exposing paramiko's (stdin, stdout, stderr) shape."""
+
+    class _Stream:
+        def __init__(self, stream, channel):
+            self._stream = stream
+            self.channel = channel
+
+        def read(self, size=-1):
+            return self._stream.read(size)
+
+        def write(self, data):
+            self._stream.write(data)
+
+        def flush(self):
+            self._stream.flush()
+
+    def __init__(self, command):
+        self.command = command
+        self.proc = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def shutdown_write(self):
+        self.proc.stdin.close()
+
+    def close(self):
+        self.proc.kill()
+        self.proc.wait()
+
+    def recv_exit_status(self):
+        return self.proc.wait()
+
+    def streams(self):
+        return (self._Stream(self.proc.stdin, self), self._Stream(self.proc.stdout, self),
+                self._Stream(self.proc.stderr, self))
+
+class _LocalSFTPFile:
+    """A local file with the SFTPFile extras used by the service."""
+
+    def __init__(self, path, mode='r'):
+        self._f = open(path, mode if 'b' in mode else mode + 'b')
+
+    def prefetch(self, size=None, max_concurrent_requests=None):
+        pass
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self._f.fileno()))
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._f.close()
+
+@pytest.fixture
+def local_host(tmp_path):
+    """SSH client whose SFTP and exec operate on the local filesystem."""
+    home = tmp_path / 'home'
+    home.mkdir()
+    sftp = MagicMock()
+    sftp.normalize.return_value = str(home)
+    sftp.stat.side_effect = lambda path: paramiko.SFTPAttributes.from_stat(os.stat(path))
+    sftp.lstat.side_effect = lambda path: paramiko.SFTPAttributes.from_stat(os.lstat(path))
+    sftp.listdir_attr.side_effect = lambda path: [
+        paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)), name) for name in os.listdir(path)
+    ]
+    sftp.mkdir.side_effect = os.mkdir
+    sftp.rmdir.side_effect = os.rmdir
+    sftp.remove.side_effect = os.remove
+    sftp.utime.side_effect = os.utime
+    sftp.open.side_effect = _LocalSFTPFile
+    sftp.posix_rename.side_effect = os.rename
+    sftp.rename.side_effect = os.rename
+    ssh = _ssh_client_returning(sftp)
+    commands = []
+
+    def exec_command(command, **kwargs):
+        commands.append(command)
+        return _LocalProcess(command).streams()
+
+    ssh.exec_command.side_effect = exec_command
+    with patch('paramiko.SSHClient', return_value=ssh):
+        yield {'sftp': sftp, 'ssh': ssh, 'commands': commands, 'home': home}
+
+class TestRemoteFileServiceDeltaSync:
+    """Test delta transfers against a 'remote' host that is the local machine."""
+
+    def test_delta_upload(self, remote_service, local_host, tmp_path):
+        """Test only the changed data crosses the wire and the remote file is rebuilt."""
+        old = random.Random(1).randbytes(1024 * 1024)
+        new = old[:300000] + b'patched' + old[300000:]
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(old)
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(new)
+        job = Job('delta_sync')
+
+        result = remote_service.delta_upload(str(local_path), str(remote_path), job)
+
+        assert result['success'] is True, result
+        assert result['method'] == 'delta'
+        assert remote_path.read_bytes() == new
+        assert result['wire_bytes'] < len(new) // 10
+        assert result['literal_bytes'] < 3 * result['block_size']
+        assert job.bytes_done == job.bytes_total == len(new)
+        assert job.files_done == 1
+        helpers = list((local_host['home'] / '.cache' / 'downloadtool').iterdir())
+        assert len(helpers) == 1 and helpers[0].name.startswith('delta_sync-')
+
+    def test_delta_download(self, remote_service, local_host, tmp_path):
+        """Test a local copy is brought up to date from the remote file."""
+        old = random.Random(2).randbytes(1024 * 1024)
+        new = old + random.Random(3).randbytes(5000)
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(new)
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(old)
+
+        result = remote_service.delta_download(str(remote_path), str(local_path))
+
+        assert result['success'] is True, result
+        assert result['method'] == 'delta'
+        assert local_path.read_bytes() == new
+        assert result['wire_bytes'] < 50000
+        assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+    def test_helper_checked_and_installed_once(self, remote_service, local_host, tmp_path):
+        """Test the python3 check and helper upload happen once per server."""
+        for name in ('a', 'b'):
+            (tmp_path / f'{name}.remote').write_bytes(b'x' * 10000)
+            (tmp_path / f'{name}.local').write_bytes(b'x' * 10001)
+            assert remote_service.delta_upload(str(tmp_path / f'{name}.local'), str(tmp_path / f'{name}.remote'))['success']
+
+        checks = [c for c in local_host['commands'] if c.startswith("python3 -c")]
+        assert len(checks) == 1
+        assert local_host['sftp'].posix_rename.call_count == 1
+
+    def test_falls_back_to_full_copy(self, remote_service, local_host, tmp_path):
+        """Test a missing remote file is uploaded in full."""
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(b'data')
+        stats = MagicMock()
+        stats.to_dict.return_value = {}
+
+        with patch.object(remote_service.transfer_engine, 'upload', return_value=stats) as upload:
+            result = remote_service.delta_upload(str(local_path), str(tmp_path / 'missing.bin'))
+
+        assert result['method'] == 'full'
+        assert result['wire_bytes'] == 4
+        assert upload.call_args.args[2:] == (str(local_path), str(tmp_path / 'missing.bin'), 4)
+
+    def test_no_python_on_remote(self, remote_service, local_host, tmp_path):
+        """Test hosts without python3 fall back to a full download."""
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess('exit 127').streams()
+        (tmp_path / 'remote.bin').write_bytes(b'new')
+        (tmp_path / 'local.bin').write_bytes(b'old')
+
+        def fake_download(ssh_info, conn, path, local_path, size, mtime=None):
+            with open(local_path, 'wb') as f:
+                f.write(b'new')
+            return MagicMock(to_dict=MagicMock(return_value={}))
+
+        with patch.object(remote_service.transfer_engine, 'download', side_effect=fake_download):
+            result = remote_service.delta_download(str(tmp_path / 'remote.bin'), str(tmp_path / 'local.bin'))
+
+        assert result['method'] == 'full'
+        assert (tmp_path / 'local.bin').read_bytes() == b'new'
+
+    def test_cancel_leaves_remote_file_unchanged(self, remote_service, local_host, tmp_path):
+        """Test cancelling mid-upload keeps the old remote file intact."""
+        old = random.Random(4).randbytes(256 * 1024)
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(old)
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(random.Random(5).randbytes(256 * 1024))
+        job = Job('delta_sync')
+        job.cancel()
+
+        with pytest.raises(JobCancelled):
+            remote_service.delta_upload(str(local_path), str(remote_path), job)
+
+        assert remote_path.read_bytes() == old
+
+class TestRemoteFileServiceSyncDirs:
+    """Test directory sync against a 'remote' directory on the local machine."""
+
+    @pytest.fixture
+    def trees(self, tmp_path):
+        local = tmp_path / 'local'
+        remote = tmp_path / 'remote'
+        (local / 'sub' / 'deep').mkdir(parents=True)
+        (local / 'a.txt').write_bytes(b'alpha')
+        (local / 'sub' / 'b.txt').write_bytes(b'bravo')
+        (local / 'sub' / 'deep' / 'c.bin').write_bytes(os.urandom(300000))
+        remote.mkdir()
+        return {'local': local, 'remote': remote, 'cache': tmp_path / 'cache'}
+
+    def _sync(self, service, trees, **kwargs):
+        return service.sync_dirs(str(trees['local']), str(trees['remote']), cache_dir=trees['cache'], **kwargs)
+
+    def test_push_then_nothing_to_do(self, remote_service, local_host, trees):
+        """Test a push copies the tree with mtimes and an immediate repeat plans nothing."""
+        job = Job('sync')
+        result = self._sync(remote_service, trees, job=job)
+
+        assert result['success'] is True, result
+        assert result['copy'] == 3 and result['mkdir'] == 2
+        assert result['failed'] == []
+        assert (trees['remote'] / 'sub' / 'deep' / 'c.bin').read_bytes() == (trees['local'] / 'sub' / 'deep' / 'c.bin').read_bytes()
+        assert int(os.stat(trees['remote'] / 'a.txt').st_mtime) == int(os.stat(trees['local'] / 'a.txt').st_mtime)
+        assert job.bytes_done == job.bytes_total == 300010
+        manifest_commands = [c for c in local_host['commands'] if 'find .' in c]
+        assert len(manifest_commands) == 1
+
+        again = self._sync(remote_service, trees)
+        assert again['copy'] == 0 and again['mkdir'] == 0
+        assert again['unchanged'] == 3
+
+    def test_dry_run_changes_nothing(self, remote_service, local_host, trees):
+        """Test a dry run lists the planned actions without touching either side."""
+        (trees['remote'] / 'stale.txt').write_bytes(b'old')
+        result = self._sync(remote_service, trees, dry_run=True, delete=True)
+
+        assert result['dry_run'] is True
+        ops = {(a['op'], a['path']) for a in result['actions']}
+        assert ('copy', 'sub/deep/c.bin') in ops
+        assert ('delete', 'stale.txt') in ops
+        assert sorted(os.listdir(trees['remote'])) == ['stale.txt']
+
+    def test_push_with_delete_and_modified(self, remote_service, local_host, trees):
+        """Test modified files are re-sent and extra remote entries are removed."""
+        self._sync(remote_service, trees)
+        (trees['local'] / 'a.txt').write_bytes(b'alpha, changed')
+        (trees['remote'] / 'extra').mkdir()
+        (trees['remote'] / 'extra' / 'x.txt').write_bytes(b'x')
+
+        result = self._sync(remote_service, trees, delete=True)
+
+        assert result['copy'] == 1 and result['delete'] == 1 and result['rmdir'] == 1
+        assert (trees['remote'] / 'a.txt').read_bytes() == b'alpha, changed'
+        assert not (trees['remote'] / 'extra').exists()
+
+    def test_checksum_skips_touched_files(self, remote_service, local_host, trees):
+        """Test checksum mode does not re-send files whose content is unchanged."""
+        self._sync(remote_service, trees)
+        os.utime(trees['local'] / 'a.txt', (1, 1000000))
+
+        assert self._sync(remote_service, trees, dry_run=True)['copy'] == 1
+        result = self._sync(remote_service, trees, checksum=True, dry_run=True)
+        assert result['copy'] == 0
+        assert any('md5sum' in c for c in local_host['commands'])
+
+        # 摘要已缓存，再次比较不再执行远程命令
+        local_host['commands'].clear()
+        assert self._sync(remote_service, trees, checksum=True, dry_run=True)['copy'] == 0
+        assert not any('md5sum' in c for c in local_host['commands'])
+
+    def test_pull(self, remote_service, local_host, trees, tmp_path):
+        """Test pulling mirrors the remote tree into a new local directory."""
+        self._sync(remote_service, trees)
+        target = tmp_path / 'restore'
+        result = remote_service.sync_dirs(str(target), str(trees['remote']), direction='pull',
+                                          cache_dir=trees['cache'])
+
+        assert result['success'] is True, result
+        assert (target / 'sub' / 'b.txt').read_bytes() == b'bravo'
+        assert int(os.stat(target / 'a.txt').st_mtime) == int(os.stat(trees['remote'] / 'a.txt').st_mtime)
+
+    def test_pull_keeps_remote_mode(self, remote_service, local_host, trees, tmp_path):
+        """Test pulled files get the remote permissions rather than the temp file's 0600."""
+        self._sync(remote_service, trees)
+        os.chmod(trees['remote'] / 'a.txt', 0o755)
+        os.chmod(trees['remote'] / 'sub' / 'b.txt', 0o644)
+        target = tmp_path / 'restore'
+        remote_service.sync_dirs(str(target), str(trees['remote']), direction='pull', cache_dir=trees['cache'])
+
+        assert stat.S_IMODE(os.stat(target / 'a.txt').st_mode) == 0o755
+        assert stat.S_IMODE(os.stat(target / 'sub' / 'b.txt').st_mode) == 0o644
+
+    def test_failed_push_leaves_no_temp(self, remote_service, local_host, trees):
+        """Test a failed rename or a failed close removes the sync temp file."""
+        local_host['sftp'].posix_rename.side_effect = IOError('rename failed')
+        result = self._sync(remote_service, trees)
+        assert len(result['failed']) == 3
+        assert not [p for p in trees['remote'].rglob('*') if p.is_file()]
+
+    def test_remote_manifest_stderr_drained(self, remote_service, local_host, trees):
+        """Test a find flooding stderr does not stall the manifest scan."""
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess(
+            f"{sys.executable} -c \"import sys; sys.stderr.write('denied\\n' * 50000)\"; exit 1"
+            if 'find .' in command else command).streams()
+        (trees['remote'] / 'old.txt').write_bytes(b'old')
+
+        result = self._sync(remote_service, trees, dry_run=True)
+        assert result['success'] is True
+        assert ('copy', 'a.txt') in {(a['op'], a['path']) for a in result['actions']}
+
+    def test_checksum_with_agent(self, remote_service, local_host, trees):
+        """Test the remote manifest and digests come from the agent when python3 is available."""
+        remote_service.use_agent = True
+        self._sync(remote_service, trees)
+        os.utime(trees['local'] / 'a.txt', (1, 1000000))
+
+        result = self._sync(remote_service, trees, checksum=True, dry_run=True)
+
+        assert result['copy'] == 0
+        assert not any('md5sum' in c or 'find .' in c for c in local_host['commands'])
+
+    def test_missing_roots(self, remote_service, local_host, trees, tmp_path):
+        """Test pulling from a missing remote directory or pushing a missing local one fails."""
+        result = remote_service.sync_dirs(str(tmp_path / 'x'), str(tmp_path / 'nope'), direction='pull',
+                                          cache_dir=trees['cache'])
+        assert result['success'] is False
+        result = remote_service.sync_dirs(str(tmp_path / 'nope'), str(trees['remote']), cache_dir=trees['cache'])
+        assert result['success'] is False
+        assert remote_service.sync_dirs('/a', '/b', direction='sideways')['success'] is False
+
+class TestRemoteFileServiceUploadTar:
+    """Test the tar upload fast path against local tar."""
+
+    def test_upload_tar(self, remote_service, local_host, tmp_path):
+        """Test many files are extracted by one exec, creating parent directories."""
+        target = tmp_path / 'upload'
+        members = [(f'proj/src/m{i}/f{i}.py', 6, 1700000000, iter([b'print', b'\n'])) for i in range(200)]
+
+        result = remote_service.upload_tar('remote', str(target), iter(members))
+
+        assert result['success'] is True, result
+        assert result['files'] == 200 and result['bytes'] == 1200
+        assert (target / 'proj' / 'src' / 'm7' / 'f7.py').read_bytes() == b'print\n'
+        assert int(os.stat(target / 'proj' / 'src' / 'm7' / 'f7.py').st_mtime) == 1700000000
+        assert len(local_host['commands']) == 1
+        local_host['sftp'].open.assert_not_called()
+
+    def test_upload_tar_size_mismatch(self, remote_service, local_host, tmp_path):
+        """Test a member shorter than declared aborts the upload."""
+        result = remote_service.upload_tar('remote', str(tmp_path / 'upload'), iter([('a.txt', 10, None, [b'short'])]))
+        assert result['success'] is False
+        assert '不符' in result['error']
+
+    def test_upload_tar_remote_failure(self, remote_service, local_host, tmp_path):
+        """Test a failing remote tar reports its exit status and stderr."""
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess(
+            'cat > /dev/null; echo "tar: not found" >&2; exit 127').streams()
+        result = remote_service.upload_tar('remote', str(tmp_path), iter([('a.txt', 1, None, [b'x'])]))
+        assert result['success'] is False
+        assert '127' in result['error'] and 'tar: not found' in result['error']
+
+class TestRemoteFileServiceUploadBatch:
+    """Test writing many files through one SFTP session."""
+
+    def test_upload_batch(self, remote_service, local_host, tmp_path):
+        """Test files land in their directories and each directory is checked only once."""
+        target = tmp_path / 'upload'
+        files = [(f'd{i % 2}/sub/f{i}.txt', iter([b'data', str(i).encode()])) for i in range(10)]
+
+        result = remote_service.upload_batch('remote', str(target), iter(files))
+
+        assert result['success'] is True, result
+        assert result['files'] == 10 and result['failed'] == 0
+        assert (target / 'd1' / 'sub' / 'f7.txt').read_bytes() == b'data7'
+        assert [r['size'] for r in result['results']] == [5] * 10
+        stat_calls = [c.args[0] for c in local_host['sftp'].stat.call_args_list]
+        assert stat_calls.count(str(target / 'd0' / 'sub')) == 1
+        assert local_host['sftp'].open.call_count == 10
+        assert local_host['ssh'].open_sftp.call_count == 1
+
+    def test_upload_batch_partial_failure(self, remote_service, local_host, tmp_path):
+        """Test a failing file is reported while the rest are still written."""
+        def chunks():
+            yield b'par'
+            raise IOError('client went away')
+
+        files = [('a.txt', [b'a']), ('../escape.txt', [b'x']), ('bad.txt', chunks()), ('b.txt', [b'b'])]
+        result = remote_service.upload_batch('remote', str(tmp_path), iter(files))
+
+        assert result['success'] is False
+        assert result['failed'] == 2
+        assert [r['success'] for r in result['results']] == [True, False, False, True]
+        assert (tmp_path / 'b.txt').read_bytes() == b'b'
+        assert not (tmp_path / 'bad.txt').exists()
+        assert not (tmp_path.parent / 'escape.txt').exists()
+
+class TestRemoteFileServiceArchive:
+    """Test archive downloads against a 'remote' host that is the local machine."""
+
+    @staticmethod
+    def _tree(tmp_path):
+        root = tmp_path / 'proj'
+        (root / 'sub' / 'empty').mkdir(parents=True)
+        (root / 'a.txt').write_bytes(b'hello')
+        (root / 'sub' / 'b.bin').write_bytes(b'\x01' * 300000)
+        return root
+
+    def test_tar_gz_via_exec(self, remote_service, local_host, tmp_path):
+        """Test tar.gz is produced by one remote tar | gzip and the connection is returned."""
+        root = self._tree(tmp_path)
+
+        result = remote_service.open_archive_stream('remote', str(root), None, 'tar.gz')
+
+        assert result['success'] is True, result
+        assert result['method'] == 'exec'
+        stream = result['stream']
+        assert stream.filename == 'proj.tar.gz'
+        data = b''.join(stream)
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            assert tar.extractfile('proj/sub/b.bin').read() == b'\x01' * 300000
+            assert 'proj/sub/empty' in tar.getnames()
+        assert any('gzip -c' in command for command in local_host['commands'])
+        assert all(slot['in_use'] == 0 for slot in remote_service.pool.stats().values())
+
+    def test_zip_via_sftp(self, remote_service, local_host, tmp_path):
+        """Test zip selections are read over SFTP and packed locally."""
+        root = self._tree(tmp_path)
+
+        result = remote_service.open_archive_stream('remote', str(root), ['a.txt', 'sub'], 'zip')
+
+        assert result['method'] == 'sftp'
+        with zipfile.ZipFile(io.BytesIO(b''.join(result['stream']))) as zf:
+            assert zf.namelist() == ['a.txt', 'sub/', 'sub/b.bin', 'sub/empty/']
+            assert zf.read('a.txt') == b'hello'
+        assert local_host['commands'] == []
+
+    def test_falls_back_to_sftp_without_tar(self, remote_service, local_host, tmp_path):
+        """Test hosts without tar are archived over SFTP."""
+        root = self._tree(tmp_path)
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess('true').streams()
+
+        result = remote_service.open_archive_stream('remote', str(root), None, 'tar')
+
+        assert result['method'] == 'sftp'
+        with tarfile.open(fileobj=io.BytesIO(b''.join(result['stream']))) as tar:
+            assert tar.extractfile('proj/a.txt').read() == b'hello'
+
+    def test_remote_tar_failure_raised(self, remote_service, local_host, tmp_path):
+        """Test a fatal remote tar error aborts the stream instead of ending it cleanly."""
+        root = self._tree(tmp_path)
+        result = remote_service.open_archive_stream('remote', str(root), ['a.txt'], 'tar')
+        os.remove(root / 'a.txt')
+        with pytest.raises(RuntimeError, match='tar'):
+            b''.join(result['stream'])
+
+    def test_missing_path(self, remote_service, local_host, tmp_path):
+        """Test missing selections are reported before streaming starts."""
+        result = remote_service.open_archive_stream('remote', str(tmp_path), ['nope'], 'zip')
+        assert result['success'] is False
+        assert '不存在' in result['error']
+        assert all(slot['in_use'] == 0 for slot in remote_service.pool.stats().values())
+
+class TestRemoteFileServiceDelete:
+    """Test recursive bulk delete against a 'remote' host that is the local machine."""
+
+    @staticmethod
+    def _populate(root):
+        (root / 'build' / 'obj').mkdir(parents=True)
+        for i in range(40):
+            (root / 'build' / 'obj' / f'{i}.o').write_bytes(b'o' * 8)
+        (root / 'build' / 'app').write_bytes(b'a' * 100)
+        (root / 'notes.txt').write_bytes(b'n')
+        (root / 'keep.txt').write_bytes(b'k')
+
+    def test_delete_paths_exec(self, remote_service, local_host, tmp_path):
+        """Test files go through SFTP, directories through one rm -rf whose output drives progress."""
+        self._populate(tmp_path)
+        job = Job('delete')
+
+        result = remote_service.delete_paths('remote', [str(tmp_path / 'build'), str(tmp_path / 'notes.txt')], job)
+
+        assert result['success'] is True, result
+        assert result['method'] == 'exec'
+        assert (result['deleted_files'], result['deleted_dirs']) == (42, 2)
+        assert job.files_done == job.files_total == 44
+        assert [c for c in local_host['commands'] if 'rm -rfv' in c] == [
+            f"LC_ALL=C rm -rfv -- {tmp_path / 'build'} 2>&1"]
+        assert not (tmp_path / 'notes.txt').exists() and (tmp_path / 'keep.txt').exists()
+
+    def test_delete_paths_without_rm(self, remote_service, local_host, tmp_path):
+        """Test a missing rm falls back to walking the tree over SFTP."""
+        self._populate(tmp_path)
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess(
+            'echo "sh: rm: not found"; exit 127').streams()
+
+        result = remote_service.delete_paths('remote', [str(tmp_path / 'build')])
+
+        assert result['success'] is True, result
+        assert result['method'] == 'sftp'
+        assert (result['deleted_files'], result['deleted_dirs'], result['bytes']) == (41, 2, 420)
+        assert not (tmp_path / 'build').exists()
+
+    def test_delete_file_directory(self, remote_service, local_host, tmp_path):
+        """Test delete_file removes a non-empty directory and reports missing paths."""
+        self._populate(tmp_path)
+
+        assert remote_service.delete_file('remote', str(tmp_path / 'build')) == {'success': True}
+        assert not (tmp_path / 'build').exists()
+        result = remote_service.delete_file('remote', str(tmp_path / 'build'))
+        assert result['success'] is False and result['error']
+
+    def test_copy_and_move_path(self, remote_service, local_host, tmp_path):
+        """Test copies run as a remote cp and moves as an SFTP rename, without reading file data."""
+        self._populate(tmp_path)
+
+        copied = remote_service.copy_path('remote', str(tmp_path / 'build'), str(tmp_path / 'copy'))
+        moved = remote_service.move_path('remote', str(tmp_path / 'notes.txt'), str(tmp_path / 'copy' / 'notes.txt'))
+
+        assert copied == {'success': True, 'path': str(tmp_path / 'copy'), 'method': 'cp'}
+        assert moved['method'] == 'rename'
+        assert len(os.listdir(tmp_path / 'copy' / 'obj')) == 40
+        assert (tmp_path / 'copy' / 'notes.txt').read_bytes() == b'n'
+        local_host['sftp'].open.assert_not_called()
+        missing = remote_service.move_path('remote', str(tmp_path / 'notes.txt'), str(tmp_path / 'x'))
+        assert missing['success'] is False
+
+    def test_delete_paths_bad_method(self, remote_service):
+        """Test unknown delete methods are rejected."""
+        result = remote_service.delete_paths('remote', ['/x'], method='shred')
+        assert result['success'] is False
+
+class TestRemoteFileServiceListing:
+    """Test the exec listing backend against a 'remote' host that is the local machine."""
+
+    @staticmethod
+    def _populate(root):
+        (root / 'sub').mkdir()
+        (root / 'a\tb.txt').write_bytes(b'12345')
+        for i in range(50):
+            (root / f'f{i}').write_bytes(b'x' * i)
+        os.symlink(root / 'f1', root / 'link')
+
+    def test_exec_matches_sftp(self, remote_service, local_host, tmp_path):
+        """Test both backends return the same listing."""
+        root = tmp_path / 'big'
+        root.mkdir()
+        self._populate(root)
+
+        remote_service.list_backend = 'sftp'
+        via_sftp = remote_service.list_dir('remote', str(root))
+        remote_service.list_backend = 'exec'
+        via_exec = remote_service.list_dir('remote', str(root))
+
+        assert len(local_host['commands']) == 1 and 'find' in local_host['commands'][0]
+        # SFTP reports whole seconds; the local fake passes os.stat's float through
+        normalize = lambda entries: sorted((e['name'], e['type'], e['size'], int(e['mtime'])) for e in entries)
+        assert normalize(via_exec['files']) == normalize(via_sftp['files'])
+        assert normalize(via_exec['dirs']) == normalize(via_sftp['dirs'])
+        assert via_exec['dir_info'] == via_sftp['dir_info']
+        assert len(via_exec['files']) == 52
+
+    def test_auto_uses_history(self, remote_service, local_host, tmp_path):
+        """Test auto mode switches to exec once a directory is known to be large."""
+        root = tmp_path / 'big'
+        root.mkdir()
+        self._populate(root)
+
+        remote_service.list_dir('remote', str(root))
+        assert local_host['commands'] == []
+
+        key = next(iter(remote_service.pool._slots))
+        remote_service.listing_planner.record(key, str(root), 100000)
+        result = remote_service.list_dir('remote', str(root))
+
+        assert len(result['files']) == 52
+        assert len(local_host['commands']) == 1
+
+    def test_exec_unsupported_falls_back(self, remote_service, local_host, tmp_path):
+        """Test a find without -printf falls back to SFTP and is not retried."""
+        root = tmp_path / 'big'
+        root.mkdir()
+        self._populate(root)
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess(
+            'echo "find: unrecognized: -printf" >&2; exit 1').streams()
+        remote_service.list_backend = 'exec'
+
+        result = remote_service.list_dir('remote', str(root))
+
+        assert len(result['files']) == 52
+        assert remote_service.listing_planner.stats()['exec_unsupported'] == 1
+        remote_service.list_backend = 'auto'
+        key = next(iter(remote_service.pool._slots))
+        assert remote_service.listing_planner.choose(key, str(root), 10 ** 9, 1.0) == 'sftp'
+
+    def test_symlinks_followed(self, remote_service, local_host, tmp_path):
+        """Test links to directories list as directories in both backends and broken links as files."""
+        root = tmp_path / 'links'
+        root.mkdir()
+        (tmp_path / 'target').mkdir()
+        (tmp_path / 'data.bin').write_bytes(b'x' * 300)
+        os.symlink(tmp_path / 'target', root / 'dirlink')
+        os.symlink(tmp_path / 'data.bin', root / 'filelink')
+        os.symlink(tmp_path / 'missing', root / 'broken')
+
+        for backend in ('sftp', 'exec', 'agent'):
+            remote_service.list_backend = backend
+            remote_service.use_agent = backend == 'agent'
+            result = remote_service.list_dir('remote', str(root))
+            assert [d['name'] for d in result['dirs']] == ['dirlink']
+            files = {f['name']: f['size'] for f in result['files']}
+            assert set(files) == {'filelink', 'broken'}
+            assert files['filelink'] == 300
+        assert local_host['sftp'].stat.call_count >= 3
+
+    def test_invalid_backend(self, config_store):
+        """Test unknown backends are rejected."""
+        with pytest.raises(ValueError):
+            RemoteFileService(config_store=config_store, list_backend='ls')
+
+class TestRemoteFileServiceAgent:
+    """Test operations handed to the remote helper agent, and the fallbacks without it."""
+
+    @pytest.fixture
+    def agent_service(self, remote_service):
+        remote_service.use_agent = True
+        return remote_service
+
+    @pytest.fixture
+    def tree(self, tmp_path):
+        root = tmp_path / 'tree'
+        (root / 'a' / 'deep').mkdir(parents=True)
+        (root / 'a' / 'one.txt').write_bytes(b'1' * 100)
+        (root / 'a' / 'deep' / 'Two.LOG').write_bytes(b'2' * 200)
+        (root / 'b').mkdir()
+        (root / 'top.log').write_bytes(b'3' * 50)
+        return root
+
+    def test_agent_started_once_and_reused(self, agent_service, local_host, tree):
+        """Test listing and sizing go through one long-lived agent instead of per-call commands."""
+        listing = agent_service.list_dir('remote', str(tree))
+        sizes = agent_service.calculate_child_sizes('remote', str(tree))
+        total = agent_service.calculate_folder_size('remote', str(tree))
+
+        assert [d['name'] for d in sorted(listing['dirs'], key=lambda d: d['name'])] == ['a', 'b']
+        assert [f['name'] for f in listing['files']] == ['top.log']
+        assert sizes['success'] and sizes['is_complete']
+        assert sizes['children']['a']['file_count'] == 2
+        assert total['success'] and total['file_count'] == 3
+        assert total['total_size'] == sizes['total_size']
+        starts = [c for c in local_host['commands'] if c.endswith(' serve')]
+        assert len(starts) == 1
+        assert not [c for c in local_host['commands'] if c.startswith(('du ', 'find ', 'cd '))]
+        local_host['sftp'].listdir_attr.assert_not_called()
+
+    def test_large_directory_listed_by_exec(self, agent_service, local_host, tree):
+        """Test auto mode streams directories above the agent threshold through exec."""
+        agent_service.list_dir('remote', str(tree))
+        key = next(iter(agent_service.pool._slots))
+        agent_service.listing_planner.record(key, str(tree), AGENT_LIST_MAX_ENTRIES + 1)
+        listing = agent_service.list_dir('remote', str(tree))
+
+        assert [f['name'] for f in listing['files']] == ['top.log']
+        assert [c for c in local_host['commands'] if c.startswith('cd ')]
+        agent_service.list_backend = 'agent'
+        agent_service.list_dir('remote', str(tree))
+        assert len([c for c in local_host['commands'] if c.startswith('cd ')]) == 1
+
+    def test_agent_installed_with_dependencies(self, agent_service, local_host, tree):
+        """Test the agent is uploaded as one directory holding its modules under their own names."""
+        agent_service.search_files('remote', str(tree), '*.log')
+        helpers = list((local_host['home'] / '.cache' / 'downloadtool').iterdir())
+        assert len(helpers) == 1 and helpers[0].name.startswith('remote_agent-') and helpers[0].is_dir()
+        assert sorted(p.name for p in helpers[0].iterdir()) == ['file_search.py', 'remote_agent.py']
+
+    def test_matches_exec_results(self, agent_service, local_host, tree):
+        """Test agent sizes agree with the du/find commands they replace."""
+        via_agent = agent_service.calculate_child_sizes('remote', str(tree))
+        agent_service.use_agent = False
+        via_exec = agent_service.calculate_child_sizes('remote', str(tree))
+        assert via_agent == via_exec
+
+    def test_fallback_without_python(self, agent_service, local_host, tree):
+        """Test hosts without python3 keep using SFTP listings and find searches over SFTP."""
+        local_host['ssh'].exec_command.side_effect = lambda command, **kwargs: _LocalProcess(
+            'exit 1' if command.startswith('python3') else command).streams()
+
+        listing = agent_service.list_dir('remote', str(tree))
+        found = agent_service.search_files('remote', str(tree), '*.log')
+
+        assert [f['name'] for f in listing['files']] == ['top.log']
+        assert sorted(e['name'] for e in found['entries']) == ['Two.LOG', 'top.log']
+        assert local_host['sftp'].listdir_attr.called
+
+    def test_search_agent_and_sftp_agree(self, agent_service, local_host, tree):
+        """Test searching with and without the agent returns the same entries."""
+        via_agent = agent_service.search_files('remote', str(tree), '*.log', kind='file', limit=10)
+        agent_service.use_agent = False
+        via_sftp = agent_service.search_files('remote', str(tree), '*.log', kind='file', limit=10)
+
+        assert via_agent == via_sftp
+        assert via_agent['entries'][0]['path'] == str(tree / 'top.log')
+        limited = agent_service.search_files('remote', str(tree), '*', limit=1)
+        assert len(limited['entries']) == 1 and limited['truncated'] is True
+        assert agent_service.search_files('remote', str(tree), '*', kind='socket')['success'] is False
+
+    def test_dead_agent_falls_back_and_restarts(self, agent_service, local_host, tree):
+        """Test a crashed agent does not fail the request and is restarted on the next one."""
+        agent_service.list_dir('remote', str(tree))
+        conn = next(iter(agent_service.pool._slots.values())).idle[0]
+        # the agent exits once its stdin is gone; further writes fail like a dropped channel
+        conn.agent.stdin._stream.close()
+
+        assert [f['name'] for f in agent_service.list_dir('remote', str(tree))['files']] == ['top.log']
+        agent_service.list_dir('remote', str(tree))
+        starts = [c for c in local_host['commands'] if c.endswith(' serve')]
+        assert len(starts) == 2
+
+    def test_agent_errors_reported(self, agent_service, local_host, tmp_path):
+        """Test errors raised inside the agent surface as failed results."""
+        result = agent_service.calculate_child_sizes('remote', str(tmp_path / 'missing'))
+        assert result['success'] is False
@@ -0,0 +1,107 @@
+import pytest
+import os
+import stat
+
+import paramiko
+
+from utils.remote_listing import (
+    AGENT_LIST_MAX_ENTRIES, DIR_BYTES_PER_ENTRY, ListingPlanner, estimate_exec_cost, estimate_sftp_cost, parse_listing, stat_many,
+)
+
+class TestParseListing:
+    """Test parsing find -printf output as a stream."""
+
+    def test_records_split_across_chunks(self):
+        """Test records cut at arbitrary chunk boundaries, including odd names."""
+        output = b'd\t4096\t1700000000.75\tsub\0f\t12\t1700000001.0\ta\tb\nc\0l\t7\t5.5\tlink\0'
+        expected = [('sub', 'd', 4096, 1700000000), ('a\tb\nc', 'f', 12, 1700000001), ('link', 'l', 7, 5)]
+        for size in (1, 3, 7, len(output)):
+            chunks = [output[i:i + size] for i in range(0, len(output), size)]
+            assert list(parse_listing(chunks)) == expected
+
+    def test_malformed_and_undecodable(self):
+        """Test malformed records are skipped and bad UTF-8 is replaced."""
+        output = b'garbage\0f\tx\t1\tbad\0f\t1\t1\t\xff.txt'
+        assert list(parse_listing([output])) == [('�.txt', 'f', 1, 1)]
+
+class TestListingPlanner:
+    """Test choosing between SFTP and exec listings."""
+
+    def test_cost_model(self):
+        """Test exec wins for large directories and high latency, SFTP for small ones."""
+        assert estimate_sftp_cost(50, 0.001) < estimate_exec_cost(50, 0.001)
+        assert estimate_exec_cost(100000, 0.001) < estimate_sftp_cost(100000, 0.001)
+        assert estimate_exec_cost(1000, 0.1) < estimate_sftp_cost(1000, 0.1)
+
+    def test_choose_from_size_and_history(self):
+        """Test directory size and remembered counts both drive the choice."""
+        planner = ListingPlanner()
+        assert planner.choose('srv', '/small', 4096, 0.001) == 'sftp'
+        assert planner.choose('srv', '/big', 100000 * DIR_BYTES_PER_ENTRY, 0.001) == 'exec'
+        planner.record('srv', '/small', 100000)
+        assert planner.choose('srv', '/small', 4096, 0.001) == 'exec'
+        assert planner.choose('other', '/small', 4096, 0.001) == 'sftp'
+        planner.record('srv', '/big', 10)
+        assert planner.choose('srv', '/big', 100000 * DIR_BYTES_PER_ENTRY, 0.001) == 'sftp'
+
+    def test_exec_unsupported(self):
+        """Test servers without find -printf always use SFTP."""
+        planner = ListingPlanner()
+        planner.mark_exec_unsupported('srv')
+        assert planner.choose('srv', '/big', 10 ** 9, 1.0) == 'sftp'
+
+    def test_prefer_agent(self):
+        """Test the agent is preferred up to the entry threshold, or always when exec is unsupported."""
+        planner = ListingPlanner()
+        big = (AGENT_LIST_MAX_ENTRIES + 1) * DIR_BYTES_PER_ENTRY
+        assert planner.prefer_agent('srv', '/small', 4096)
+        assert not planner.prefer_agent('srv', '/big', big)
+        planner.record('srv', '/small', AGENT_LIST_MAX_ENTRIES + 1)
+        assert not planner.prefer_agent('srv', '/small', 4096)
+        planner.mark_exec_unsupported('srv')
+        assert planner.prefer_agent('srv', '/big', big)
+
+    def test_history_bounded(self):
+        """Test only the most recent directories are remembered."""
+        planner = ListingPlanner(history_size=2)
+        for path in ('/a', '/b', '/c'):
+            planner.record('srv', path, 1)
+        assert planner.stats()['remembered_dirs'] == 2
+        assert planner.estimate_entries('srv', '/a', 0) == 0
+
+class TestStatMany:
+    """Test pipelined stat requests on one SFTP channel."""
+
+    def test_resolves_links_in_order(self, sftp_loopback, tmp_path):
+        """Test more paths than the pipeline depth, with broken links reported as None."""
+        (tmp_path / 'dir').mkdir()
+        (tmp_path / 'file').write_bytes(b'12345')
+        paths = []
+        for i in range(150):
+            target = ('dir', 'file', 'missing')[i % 3]
+            os.symlink(tmp_path / target, tmp_path / f'link{i}')
+            paths.append(str(tmp_path / f'link{i}'))
+
+        results = stat_many(sftp_loopback['sftp'], paths, depth=16)
+
+        assert len(results) == 150
+        for i, attr in enumerate(results):
+            if i % 3 == 0:
+                assert stat.S_ISDIR(attr.st_mode)
+            elif i % 3 == 1:
+                assert stat.S_ISREG(attr.st_mode) and attr.st_size == 5
+            else:
+                assert attr is None
+        assert sftp_loopback['stats'] == paths
+
+    def test_empty_and_fallback(self, sftp_loopback, tmp_path):
+        """Test no requests for no paths, and sequential stat for other SFTP objects."""
+        assert stat_many(sftp_loopback['sftp'], []) == []
+
+        class Plain:
+            def stat(self, path):
+                return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+        (tmp_path / 'f').write_bytes(b'x')
+        results = stat_many(Plain(), [str(tmp_path / 'f'), str(tmp_path / 'nope')])
+        assert results[0].st_size == 1 and results[1] is None
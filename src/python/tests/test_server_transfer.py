@@ -0,0 +1,224 @@
+import pytest
+import os
+import shlex
+import threading
+from unittest.mock import MagicMock
+
+import paramiko
+
+from utils.job_registry import Job, JobCancelled
+from utils.server_transfer import DIRECT_ERROR_LINES, direct_push, pipe_file, plan_tree, relay_tree, rsync_push_command
+
+class LocalFile:
+    """A local file with the SFTPFile methods used by the relay."""
+
+    def __init__(self, path, mode):
+        self._f = open(path, mode)
+
+    def prefetch(self, size, max_concurrent_requests=None):
+        pass
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def read(self, size):
+        return self._f.read(size)
+
+    def write(self, data):
+        self._f.write(data)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class LocalSFTP:
+    """SFTP client backed by the local filesystem."""
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+    def listdir_attr(self, path):
+        return [paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)), name) for name in os.listdir(path)]
+
+    def open(self, path, mode='r'):
+        return LocalFile(path, mode)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def chmod(self, path, mode):
+        os.chmod(path, mode)
+
+    def utime(self, path, times):
+        os.utime(path, times)
+
+def _tree(root):
+    result = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                result[os.path.relpath(path, root)] = f.read()
+    return result
+
+class TestRelay:
+    """Test server-to-server relay copies."""
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        src = tmp_path / 'src' / 'project'
+        (src / 'sub' / 'deep').mkdir(parents=True)
+        (src / 'a.txt').write_bytes(b'alpha')
+        (src / 'sub' / 'b.bin').write_bytes(os.urandom(300_000))
+        (src / 'sub' / 'deep' / 'c').write_bytes(b'')
+        os.symlink(src / 'a.txt', src / 'link')
+        os.utime(src / 'a.txt', (1_000_000_000, 1_000_000_000))
+        return src
+
+    def test_plan_tree_skips_symlinks(self, source):
+        """Test planning lists directories top-down and regular files only."""
+        dirs, files = plan_tree(LocalSFTP(), str(source))
+
+        assert dirs[0] == 'project'
+        assert set(dirs) == {'project', 'project/sub', 'project/sub/deep'}
+        assert sorted(rel for rel, _ in files) == ['project/a.txt', 'project/sub/b.bin', 'project/sub/deep/c']
+
+    def test_relay_directory(self, source, tmp_path):
+        """Test a directory tree is copied with contents, modes and mtimes."""
+        dst = tmp_path / 'dst'
+        dst.mkdir()
+        job = Job('transfer')
+
+        result = relay_tree(LocalSFTP(), str(source), LocalSFTP(), str(dst), job)
+
+        copied = dst / 'project'
+        assert result['path'] == str(copied)
+        assert result['files'] == 3
+        assert _tree(copied) == {k: v for k, v in _tree(source).items() if k != 'link'}
+        assert os.stat(copied / 'a.txt').st_mtime == 1_000_000_000
+        assert job.bytes_done == job.bytes_total == 300_005
+        assert job.files_done == 3
+
+    def test_relay_single_file(self, source, tmp_path):
+        """Test a single file lands inside the destination directory."""
+        dst = tmp_path / 'dst'
+        dst.mkdir()
+
+        result = relay_tree(LocalSFTP(), str(source / 'a.txt'), LocalSFTP(), str(dst))
+
+        assert result == {'path': str(dst / 'a.txt'), 'files': 1, 'bytes': 5}
+        assert (dst / 'a.txt').read_bytes() == b'alpha'
+
+    def test_relay_cancel_removes_partial(self, source, tmp_path):
+        """Test cancelling mid-file removes the partially written file."""
+        dst = tmp_path / 'dst'
+        dst.mkdir()
+        job = Job('transfer')
+        sftp = LocalSFTP()
+        original_open = sftp.open
+
+        def open_and_cancel(path, mode='r'):
+            if mode == 'wb':
+                job.cancel()
+            return original_open(path, mode)
+        sftp.open = open_and_cancel
+
+        with pytest.raises(JobCancelled):
+            relay_tree(LocalSFTP(), str(source / 'sub' / 'b.bin'), sftp, str(dst), job)
+        assert not (dst / 'b.bin').exists()
+
+class TestPipeFile:
+    """Test the bounded read/write pipe."""
+
+    def test_buffer_is_bounded(self):
+        """Test the reader never runs more than the buffer ahead of the writer."""
+        reads = []
+        writes = []
+        lock = threading.Lock()
+
+        class Source:
+            def __init__(self):
+                self.left = 50
+            def read(self, size):
+                with lock:
+                    if not self.left:
+                        return b''
+                    self.left -= 1
+                    reads.append(1)
+                    return b'x' * size
+
+        class Sink:
+            def write(self, data):
+                with lock:
+                    writes.append(1)
+                    assert len(reads) - len(writes) <= 4 + 2
+
+        assert pipe_file(Source(), Sink(), chunk_size=10, buffer_chunks=4) == 500
+
+    def test_read_error_propagates(self):
+        """Test errors in the reader thread surface in the caller."""
+        source = MagicMock()
+        source.read.side_effect = IOError('connection reset')
+
+        with pytest.raises(IOError, match='connection reset'):
+            pipe_file(source, MagicMock())
+
+class TestDirectPush:
+    """Test remote-side rsync pushes."""
+
+    def test_rsync_command_quoting(self):
+        """Test paths and the remote shell command are quoted."""
+        info = {'host_ip': '10.0.0.2', 'user_name': 'bob', 'ssh_port': 2222}
+        command = rsync_push_command("/data/it's here/", info, '/backup dir')
+        args = shlex.split(command)
+
+        assert args[0] == 'rsync'
+        assert args[args.index('-e') + 1].startswith('ssh -p 2222 -o BatchMode=yes')
+        assert args[-2:] == ["/data/it's here", 'bob@10.0.0.2:/backup dir/']
+
+    def test_progress_parsed(self):
+        """Test rsync progress lines update the job as they arrive."""
+        job = Job('transfer')
+        conn = MagicMock()
+        conn.sftp.stat.return_value = MagicMock(st_mode=0o100644, st_size=2000)
+        channel = MagicMock()
+        channel.recv.side_effect = [b'        1,000  50%  1.00MB/s    0:00:01\r', b'  2,000 100%  1.00MB/s    0:00:02 (xfr#1)\n', b'']
+        channel.recv_exit_status.return_value = 0
+        stdout = MagicMock(channel=channel)
+        conn.exec_command.return_value = (MagicMock(), stdout, MagicMock())
+
+        result = direct_push(conn, '/data/f.bin', {'host_ip': 'h', 'user_name': 'u'}, '/dst', job)
+
+        assert result['bytes'] == 2000
+        assert job.bytes_done == 2000
+        assert job.files_done == 1
+
+    def test_failure_raises(self):
+        """Test a non-zero rsync exit status is raised with the last lines of its combined output."""
+        conn = MagicMock()
+        channel = MagicMock()
+        noise = b''.join(b'rsync: send_files failed to open "/data/f%d": Permission denied (13)\n' % i
+                         for i in range(DIRECT_ERROR_LINES * 2))
+        channel.recv.side_effect = [noise, b'  1,000  50%  1.00MB/s    0:00:01\r',
+                                    b'rsync error: some files could not be transferred (code 23)', b'']
+        channel.recv_exit_status.return_value = 23
+        stderr = MagicMock()
+        conn.exec_command.return_value = (MagicMock(), MagicMock(channel=channel), stderr)
+
+        with pytest.raises(RuntimeError, match='code 23') as info:
+            direct_push(conn, '/data/f.bin', {'host_ip': 'h', 'user_name': 'u'}, '/dst')
+
+        channel.set_combined_stderr.assert_called_once_with(True)
+        stderr.read.assert_not_called()
+        lines = str(info.value).split('\n')
+        assert len(lines) == DIRECT_ERROR_LINES
+        assert '/data/f%d"' % (DIRECT_ERROR_LINES * 2 - 1) in lines[-2]
+        assert not any('50%' in line for line in lines)
@@ -0,0 +1,158 @@
+import pytest
+import threading
+from unittest.mock import patch, MagicMock
+
+from utils.ssh_pool import SSHConnectionPool, server_key
+
+SSH_INFO = {
+    "host_ip": "192.168.1.100",
+    "user_name": "testuser",
+    "user_pwd": "testpass",
+    "ssh_port": 22,
+}
+
+def _new_ssh_client(*args, **kwargs):
+    ssh = MagicMock()
+    ssh.get_transport.return_value.is_active.return_value = True
+    return ssh
+
+class TestSSHConnectionPool:
+    """Test SSHConnectionPool functionality."""
+
+    def test_server_key(self):
+        """Test pool key derived from host, port and user."""
+        assert server_key(SSH_INFO) == ("192.168.1.100", 22, "testuser")
+        assert server_key({"host_ip": "h", "user_name": "u"}) == ("h", 22, "u")
+
+    def test_connection_reused(self):
+        """Test released connection is reused instead of reconnecting."""
+        pool = SSHConnectionPool()
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client) as mock_client:
+            with pool.connection(SSH_INFO) as first:
+                pass
+            with pool.connection(SSH_INFO) as second:
+                pass
+
+            assert first is second
+            assert mock_client.call_count == 1
+            first.ssh.connect.assert_called_once()
+            assert pool.stats()["testuser@192.168.1.100:22"] == {"idle": 1, "in_use": 0}
+
+    def test_password_auth_and_keepalive(self):
+        """Test password login disables key lookup and enables keepalive."""
+        pool = SSHConnectionPool(keepalive_interval=15)
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client):
+            conn = pool.acquire(SSH_INFO)
+            kwargs = conn.ssh.connect.call_args.kwargs
+            assert kwargs["password"] == "testpass"
+            assert kwargs["look_for_keys"] is False
+            conn.ssh.get_transport.return_value.set_keepalive.assert_called_once_with(15)
+            pool.release(conn)
+
+    def test_dead_connection_replaced(self):
+        """Test a dropped idle connection is discarded and reconnected."""
+        pool = SSHConnectionPool()
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client) as mock_client:
+            with pool.connection(SSH_INFO) as first:
+                pass
+            first.ssh.get_transport.return_value.is_active.return_value = False
+
+            with pool.connection(SSH_INFO) as second:
+                pass
+
+            assert second is not first
+            assert mock_client.call_count == 2
+            first.ssh.close.assert_called()
+
+    def test_max_size_per_server(self):
+        """Test acquire blocks and times out when the server slot is full."""
+        pool = SSHConnectionPool(max_size_per_server=1, acquire_timeout=0.05)
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client):
+            conn = pool.acquire(SSH_INFO)
+            with pytest.raises(TimeoutError):
+                pool.acquire(SSH_INFO)
+            pool.release(conn)
+
+    def test_waiter_gets_released_connection(self):
+        """Test a blocked borrower receives the connection once released."""
+        pool = SSHConnectionPool(max_size_per_server=1, acquire_timeout=5)
+        got = []
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client):
+            conn = pool.acquire(SSH_INFO)
+            waiter = threading.Thread(target=lambda: got.append(pool.acquire(SSH_INFO)))
+            waiter.start()
+            pool.release(conn)
+            waiter.join(timeout=5)
+
+            assert got == [conn]
+
+    def test_idle_timeout(self):
+        """Test idle connections past the timeout are closed."""
+        pool = SSHConnectionPool(idle_timeout=0)
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client) as mock_client:
+            with pool.connection(SSH_INFO) as first:
+                pass
+            with pool.connection(SSH_INFO):
+                pass
+
+            assert mock_client.call_count == 2
+            first.ssh.close.assert_called()
+
+    def test_run_retries_on_lost_connection(self):
+        """Test run() transparently reconnects when the connection drops."""
+        pool = SSHConnectionPool()
+        calls = []
+
+        def op(conn):
+            calls.append(conn)
+            if len(calls) == 1:
+                conn.ssh.get_transport.return_value.is_active.return_value = False
+                raise EOFError("connection reset")
+            return "ok"
+
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client):
+            assert pool.run(SSH_INFO, op) == "ok"
+
+        assert len(calls) == 2
+        assert calls[0] is not calls[1]
+
+    def test_run_does_not_retry_operation_errors(self):
+        """Test run() re-raises errors from a healthy connection."""
+        pool = SSHConnectionPool()
+
+        def op(conn):
+            raise FileNotFoundError("no such file")
+
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client):
+            with pytest.raises(FileNotFoundError):
+                pool.run(SSH_INFO, op)
+            assert pool.stats()["testuser@192.168.1.100:22"]["idle"] == 1
+
+    def test_connect_failure_frees_slot(self):
+        """Test failed connects do not leak pool capacity."""
+        pool = SSHConnectionPool(max_size_per_server=1, acquire_timeout=0.05)
+        with patch('paramiko.SSHClient', side_effect=Exception('Connection failed')):
+            for _ in range(3):
+                with pytest.raises(Exception, match='Connection failed'):
+                    pool.acquire(SSH_INFO)
+
+    def test_ping_idle(self):
+        """Test only idle connections are pinged and their idle time is kept."""
+        pool = SSHConnectionPool()
+        with patch('paramiko.SSHClient', side_effect=_new_ssh_client):
+            assert pool.ping_idle(SSH_INFO) is None
+            with pool.connection(SSH_INFO) as conn:
+                assert pool.ping_idle(SSH_INFO) is None
+            conn.last_used -= 100
+            idle_since = conn.last_used
+
+            assert pool.ping_idle(SSH_INFO) >= 0
+            conn.ssh.get_transport.return_value.global_request.assert_called_once_with(
+                "keepalive@openssh.com", wait=True)
+            assert conn.last_used == idle_since
+            assert pool.stats()["testuser@192.168.1.100:22"] == {"idle": 1, "in_use": 0}
+
+            conn.ssh.get_transport.return_value.is_active.return_value = False
+            with pytest.raises(ConnectionError):
+                pool.ping_idle(SSH_INFO)
+            assert pool.stats()["testuser@192.168.1.100:22"] == {"idle": 0, "in_use": 0}
@@ -0,0 +1,165 @@
+import pytest
+import json
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+from service.impl.remote_file_service import RemoteFileService
+from utils.config_store import ConfigStore
+from utils.ssh_pool import open_ssh_client
+from utils.ssh_tuning import TUNING_PROFILES, connect_options, normalize_tuning, pick_best, preferred_ciphers
+
+class _ExecServer(paramiko.ServerInterface):
+    """Password-authenticated SSH server that runs exec requests as local shell commands."""
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if password == 'secret' else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def _run():
+            proc = subprocess.Popen(command.decode(), shell=True, stdout=subprocess.PIPE)
+            for chunk in iter(lambda: proc.stdout.read(65536), b''):
+                channel.sendall(chunk)
+            channel.send_exit_status(proc.wait())
+            channel.close()
+
+        threading.Thread(target=_run, daemon=True).start()
+        return True
+
+@pytest.fixture
+def ssh_server():
+    """An SSH server on a random localhost port; yields (ssh_info, server transports)."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    host_key = paramiko.RSAKey.generate(1024)
+    transports = []
+
+    def _serve():
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(host_key)
+            transport.use_compression(True)
+            transport.start_server(server=_ExecServer())
+            transports.append(transport)
+
+    threading.Thread(target=_serve, daemon=True).start()
+    ssh_info = {'host_ip': '127.0.0.1', 'ssh_port': listener.getsockname()[1],
+                'user_name': 'tester', 'user_pwd': 'secret'}
+    yield ssh_info, transports
+    listener.close()
+    for transport in transports:
+        transport.close()
+
+class TestTuningConfig:
+    """Test validating tuning options and turning them into connect arguments."""
+
+    def test_normalize(self):
+        """Test valid options pass and bad ones are rejected."""
+        assert normalize_tuning(None) == {}
+        tuning = {'ciphers': ['aes128-ctr'], 'window_size': 1 << 24, 'max_packet_size': 32768, 'compress': True}
+        assert normalize_tuning(tuning) == tuning
+        for bad in ([], {'speed': 1}, {'ciphers': 'aes128-ctr'}, {'window_size': 10},
+                    {'window_size': True}, {'max_packet_size': 1 << 30}, {'compress': 'yes'}):
+            with pytest.raises(ValueError):
+                normalize_tuning(bad)
+        for profile in TUNING_PROFILES.values():
+            normalize_tuning(profile)
+
+    def test_preferred_ciphers(self):
+        """Test preferred ciphers go first and unsupported ones are skipped."""
+        ordered = preferred_ciphers(['chacha20-poly1305@openssh.com', 'aes256-gcm@openssh.com'])
+        assert ordered[0] == 'aes256-gcm@openssh.com'
+        assert 'chacha20-poly1305@openssh.com' not in ordered
+        assert sorted(ordered) == sorted(paramiko.Transport._preferred_ciphers)
+
+    def test_connect_options(self):
+        """Test no options without tuning, and a transport factory when needed."""
+        assert connect_options(None) == {}
+        assert connect_options({'compress': True}) == {'compress': True}
+        options = connect_options({'window_size': 1 << 24})
+        assert options['compress'] is False and callable(options['transport_factory'])
+
+    def test_pick_best(self):
+        """Test the fastest successful profile wins."""
+        results = [{'profile': 'a', 'success': True, 'throughput': 10},
+                   {'profile': 'b', 'success': False, 'error': 'x'},
+                   {'profile': 'c', 'success': True, 'throughput': 30}]
+        assert pick_best(results) == 'c'
+        assert pick_best(results[1:2]) is None
+
+class TestTunedConnections:
+    """Test tuning against a real SSH server."""
+
+    def test_tuning_negotiated(self, ssh_server):
+        """Test cipher, window size and compression reach the transport."""
+        ssh_info, _ = ssh_server
+        tuning = {'ciphers': ['aes256-gcm@openssh.com'], 'window_size': 1 << 24,
+                  'max_packet_size': 65536, 'compress': True}
+        ssh = open_ssh_client({**ssh_info, 'tuning': tuning})
+        try:
+            transport = ssh.get_transport()
+            assert transport.remote_cipher == 'aes256-gcm@openssh.com'
+            assert transport.default_window_size == 1 << 24
+            assert transport.default_max_packet_size == 65536
+            assert transport.remote_compression in ('zlib@openssh.com', 'zlib')
+            stdin, stdout, stderr = ssh.exec_command('echo hi')
+            assert stdout.read() == b'hi\n'
+        finally:
+            ssh.close()
+
+        ssh = open_ssh_client({**ssh_info, 'tuning': tuning}, tuning={})
+        try:
+            assert ssh.get_transport().default_window_size == paramiko.common.DEFAULT_WINDOW_SIZE
+        finally:
+            ssh.close()
+
+    def test_benchmark_and_apply(self, ssh_server, tmp_path):
+        """Test every profile is measured and the best one is written back to config."""
+        ssh_info, _ = ssh_server
+        config_path = tmp_path / 'config.json'
+        config_path.write_text(json.dumps({'remote_server_list': [{'server_name': 'bench', 'config': ssh_info}]}))
+        service = RemoteFileService(config_store=ConfigStore(config_path))
+
+        result = service.benchmark_tuning('bench', profiles=['default', 'lan', 'wan-compress'],
+                                          size=256 * 1024, data='text', apply=True)
+
+        assert result['success'] is True, result
+        assert [r['profile'] for r in result['results']] == ['default', 'lan', 'wan-compress']
+        assert all(r['success'] and r['bytes'] == 256 * 1024 for r in result['results'])
+        assert result['results'][1]['cipher'] == 'aes128-gcm@openssh.com'
+        saved = json.loads(config_path.read_text())['remote_server_list'][0]['config']
+        assert result['applied'] is True
+        assert saved.get('tuning', {}) == TUNING_PROFILES[result['best']]
+
+        again = service.benchmark_tuning('bench', profiles=['default'], size=1024)
+        if saved.get('tuning'):
+            assert [r['profile'] for r in again['results']] == ['default', 'current']
+
+    def test_benchmark_errors(self, ssh_server, tmp_path):
+        """Test bad arguments and failing measurements are reported."""
+        ssh_info, _ = ssh_server
+        config_path = tmp_path / 'config.json'
+        bad_login = {**ssh_info, 'user_pwd': 'wrong'}
+        config_path.write_text(json.dumps({'remote_server_list': [{'server_name': 'bench', 'config': bad_login}]}))
+        service = RemoteFileService(config_store=ConfigStore(config_path))
+
+        assert 'error' in service.benchmark_tuning('nope')
+        assert 'error' in service.benchmark_tuning('bench', profiles=['turbo'])
+        assert 'error' in service.benchmark_tuning('bench', data='zeros')
+        result = service.benchmark_tuning('bench', profiles=['default'], size=1024, apply=True)
+        assert result['success'] is False and result['applied'] is False
+        assert result['results'][0]['success'] is False
+        assert 'tuning' not in json.loads(config_path.read_text())['remote_server_list'][0]['config']
@@ -0,0 +1,60 @@
+import pytest
+import io
+import json
+import tarfile
+
+from utils.tar_stream import coalesce, iter_tar, parse_manifest, safe_member_name, tar_header
+
+class TestTarStream:
+    """Test building tar streams from sized members."""
+
+    def test_stream_is_valid_tar(self):
+        """Test the stream extracts with the tarfile module, including long and non-ASCII names."""
+        long_name = 'deep/' + 'x' * 150 + '/文件.txt'
+        members = [
+            ('a.txt', 5, 1700000000, [b'hel', b'lo']),
+            (long_name, 0, None, []),
+            ('sub/big.bin', 1000, 1700000000, [b'\x01' * 600, b'\x02' * 400]),
+        ]
+        data = b''.join(iter_tar(members))
+        assert len(data) % 512 == 0
+
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            names = tar.getnames()
+            assert names == ['a.txt', long_name, 'sub/big.bin']
+            assert tar.extractfile('a.txt').read() == b'hello'
+            assert tar.getmember('a.txt').mtime == 1700000000
+            assert tar.extractfile('sub/big.bin').read() == b'\x01' * 600 + b'\x02' * 400
+
+    def test_size_mismatch(self):
+        """Test members shorter or longer than declared abort the stream."""
+        with pytest.raises(ValueError):
+            b''.join(iter_tar([('a', 5, None, [b'abc'])]))
+        with pytest.raises(ValueError):
+            b''.join(iter_tar([('a', 2, None, [b'abc'])]))
+
+    def test_safe_member_name(self):
+        """Test names are normalised and unsafe paths rejected."""
+        assert safe_member_name('./dir//a.txt') == 'dir/a.txt'
+        assert safe_member_name('dir\\\\b.txt') == 'dir/b.txt'
+        for bad in ('/etc/passwd', '../x', 'a/../../x', '', './'):
+            with pytest.raises(ValueError):
+                safe_member_name(bad)
+        with pytest.raises(ValueError):
+            tar_header('../x', 1)
+
+    def test_parse_manifest(self):
+        """Test manifest validation."""
+        text = json.dumps([{'name': 'd/a.txt', 'size': 3, 'mtime': 1700000000}, {'name': 'b', 'size': 0}])
+        assert parse_manifest(text) == [('d/a.txt', 3, 1700000000.0), ('b', 0, None)]
+        for bad in ('not json', '{}', '[1]', '[{"name": "a", "size": -1}]', '[{"name": "../a", "size": 1}]'):
+            with pytest.raises(ValueError):
+                parse_manifest(bad)
+
+    def test_coalesce(self):
+        """Test small chunks are merged and large ones passed through."""
+        chunks = [b'a' * 10] * 5 + [b'b' * 100] + [b'c' * 3]
+        out = list(coalesce(chunks, size=32))
+        assert b''.join(out) == b''.join(chunks)
+        assert out[0] == b'a' * 40
+        assert b'b' * 100 in out[1]
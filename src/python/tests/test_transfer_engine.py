@@ -0,0 +1,391 @@
+import pytest
+import io
+import os
+from collections import deque
+
+import paramiko
+from unittest.mock import MagicMock
+
+from utils.transfer_engine import (
+    MAX_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    MIN_INFLIGHT_REQUESTS,
+    PARALLEL_THRESHOLD,
+    RESUME_VERIFY_BYTES,
+    AdaptiveTuner,
+    SFTPTransferEngine,
+    TransferStats,
+    format_rate,
+    _last_request,
+    _wait_writes,
+)
+
+class FakeRemoteFile:
+    """A local file exposing the subset of paramiko.SFTPFile used by the engine."""
+
+    def __init__(self, path, mode):
+        self._f = open(path, mode)
+        self.pipelined = False
+
+    def readv(self, chunks, max_concurrent_prefetch_requests=None):
+        for offset, length in chunks:
+            self._f.seek(offset)
+            yield self._f.read(length)
+
+    def set_pipelined(self, pipelined=True):
+        self.pipelined = pipelined
+
+    def seek(self, offset):
+        self._f.seek(offset)
+
+    def read(self, size):
+        return self._f.read(size)
+
+    def write(self, data):
+        self._f.write(data)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class FakeSFTP:
+    """SFTP client mapping remote paths onto the local filesystem."""
+
+    def __init__(self):
+        self.opened = []
+
+    def normalize(self, path):
+        return '/'
+
+    def close(self):
+        pass
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode='r'):
+        self.opened.append((path, mode))
+        return FakeRemoteFile(path, mode)
+
+class FlakySFTP(FakeSFTP):
+    """FakeSFTP whose connection 'drops' once a byte budget has crossed it."""
+
+    def __init__(self, budget=None):
+        super().__init__()
+        self.budget = budget
+        self.moved = 0
+
+    def open(self, path, mode='r'):
+        remote_file = super().open(path, mode)
+        readv, write = remote_file.readv, remote_file.write
+
+        def flaky_readv(chunks, **kwargs):
+            for data in readv(chunks, **kwargs):
+                self._spend(len(data))
+                yield data
+
+        def flaky_write(data):
+            self._spend(len(data))
+            write(data)
+
+        remote_file.readv, remote_file.write = flaky_readv, flaky_write
+        return remote_file
+
+    def _spend(self, nbytes):
+        if self.budget is not None and self.moved + nbytes > self.budget:
+            raise EOFError('connection dropped')
+        self.moved += nbytes
+
+def _flaky_setup(budget, fresh_budget=None):
+    """A primary connection that drops after budget bytes, and a pool handing out a fresh one."""
+    conn = _primary_conn()
+    conn.sftp = FlakySFTP(budget)
+    conn.check_health.return_value = False
+    fresh = MagicMock()
+    fresh.sftp = FlakySFTP(fresh_budget)
+    pool = MagicMock()
+    pool.acquire.return_value = fresh
+    return conn, fresh, pool
+
+def _primary_conn():
+    conn = MagicMock()
+    conn.sftp = FakeSFTP()
+    conn.ssh.open_sftp.side_effect = lambda: FakeSFTP()
+    return conn
+
+def _full_pool():
+    pool = MagicMock()
+    pool.acquire.side_effect = TimeoutError('pool full')
+    return pool
+
+class TestAdaptiveTuner:
+    """Test adaptive chunk sizing."""
+
+    def test_initial_values(self):
+        """Test defaults before any throughput sample."""
+        tuner = AdaptiveTuner(rtt=0.05)
+        assert tuner.inflight >= MIN_INFLIGHT_REQUESTS
+
+    def test_chunk_grows_with_throughput(self):
+        """Test faster links get larger chunks and deeper pipelines."""
+        tuner = AdaptiveTuner(rtt=0.1)
+        tuner.record(100 * 1024 * 1024, 1.0)
+        assert tuner.chunk_size == min(MAX_CHUNK_SIZE, 50 * 1024 * 1024)
+        fast_inflight = tuner.inflight
+
+        slow = AdaptiveTuner(rtt=0.1)
+        slow.record(64 * 1024, 1.0)
+        assert slow.chunk_size == MIN_CHUNK_SIZE
+        assert slow.inflight < fast_inflight
+
+    def test_channels_for(self):
+        """Test channel count depends on file size and latency."""
+        assert AdaptiveTuner(rtt=0.1).channels_for(1024, 4) == 1
+        assert AdaptiveTuner(rtt=0.1).channels_for(PARALLEL_THRESHOLD * 4, 4) == 4
+        assert AdaptiveTuner(rtt=0.001).channels_for(PARALLEL_THRESHOLD * 4, 4) == 2
+
+class TestTransferStats:
+    """Test transfer statistics."""
+
+    def test_rate(self):
+        """Test bytes/sec reporting."""
+        stats = TransferStats('download', '/f', 100)
+        stats.add(60)
+        stats.add(40)
+        stats.finish()
+        data = stats.to_dict()
+        assert data['bytes_transferred'] == 100
+        assert data['bytes_per_sec'] > 0
+
+    def test_format_rate(self):
+        """Test human readable rates."""
+        assert format_rate(512) == '512.00 B/s'
+        assert format_rate(5 * 1024 * 1024) == '5.00 MB/s'
+
+class TestSFTPTransferEngine:
+    """Test parallel SFTP transfers."""
+
+    def test_parallel_download(self, tmp_path):
+        """Test a large file is downloaded over several channels intact."""
+        payload = os.urandom(PARALLEL_THRESHOLD * 2 + 12345)
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(payload)
+        local_path = tmp_path / 'local.bin'
+        conn = _primary_conn()
+        engine = SFTPTransferEngine(_full_pool(), max_channels=3)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        stats = engine.download({}, conn, str(remote_path), str(local_path))
+
+        assert local_path.read_bytes() == payload
+        assert stats.bytes_transferred == len(payload)
+        assert stats.channels == 3
+        assert conn.ssh.open_sftp.call_count == 2
+
+    def test_download_uses_pooled_connections(self, tmp_path):
+        """Test extra channels are borrowed from the pool when available."""
+        payload = os.urandom(PARALLEL_THRESHOLD + 1)
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(payload)
+        pool = MagicMock()
+        extra = MagicMock()
+        extra.sftp = FakeSFTP()
+        pool.acquire.return_value = extra
+        engine = SFTPTransferEngine(pool, max_channels=2)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        engine.download({}, _primary_conn(), str(remote_path), str(tmp_path / 'local.bin'))
+
+        assert (tmp_path / 'local.bin').read_bytes() == payload
+        pool.release.assert_called_once_with(extra)
+
+    def test_small_download_single_channel(self, tmp_path):
+        """Test small files use only the primary channel."""
+        remote_path = tmp_path / 'small.txt'
+        remote_path.write_bytes(b'hello')
+        conn = _primary_conn()
+        engine = SFTPTransferEngine(_full_pool())
+
+        stats = engine.download({}, conn, str(remote_path), str(tmp_path / 'out.txt'), size=5)
+
+        assert (tmp_path / 'out.txt').read_bytes() == b'hello'
+        assert stats.channels == 1
+        conn.ssh.open_sftp.assert_not_called()
+
+    def test_parallel_upload(self, tmp_path):
+        """Test a large file is uploaded over several pipelined channels intact."""
+        payload = os.urandom(PARALLEL_THRESHOLD * 2 + 999)
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(payload)
+        remote_path = tmp_path / 'remote.bin'
+        conn = _primary_conn()
+        engine = SFTPTransferEngine(_full_pool(), max_channels=4)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        stats = engine.upload({}, conn, str(local_path), str(remote_path), len(payload))
+
+        assert remote_path.read_bytes() == payload
+        assert stats.channels == 4
+        assert stats.to_dict()['direction'] == 'upload'
+
+    def test_upload_from_file_object(self, tmp_path):
+        """Test uploading from a seekable file object."""
+        payload = b'0123456789' * 1000
+        remote_path = tmp_path / 'remote.bin'
+
+        SFTPTransferEngine(_full_pool()).upload({}, _primary_conn(), io.BytesIO(payload), str(remote_path), len(payload))
+
+        assert remote_path.read_bytes() == payload
+
+    def test_worker_error_propagates(self, tmp_path):
+        """Test errors in a worker channel are raised to the caller."""
+        conn = _primary_conn()
+        conn.sftp.open = MagicMock(side_effect=IOError('channel closed'))
+
+        with pytest.raises(IOError, match='channel closed'):
+            SFTPTransferEngine(_full_pool()).download({}, conn, '/remote', str(tmp_path / 'x'), size=10)
+
+class TestTransferResume:
+    """Test transfers resuming after the SSH connection drops."""
+
+    @pytest.fixture(autouse=True)
+    def no_backoff(self, monkeypatch):
+        monkeypatch.setattr('utils.transfer_engine.resume_delay', lambda attempt: 0)
+        # keep ranges at 1MB so progress before the drop is checkpointed
+        monkeypatch.setattr('utils.transfer_engine.MAX_CHUNK_SIZE', 1024 * 1024)
+
+    def test_download_resumes(self, tmp_path):
+        """Test only the unconfirmed ranges are fetched again over a new connection."""
+        payload = os.urandom(PARALLEL_THRESHOLD + 12345)
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(payload)
+        conn, fresh, pool = _flaky_setup(budget=3 * 1024 * 1024)
+        engine = SFTPTransferEngine(pool, max_channels=1)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        stats = engine.download({}, conn, str(remote_path), str(tmp_path / 'local.bin'))
+
+        assert (tmp_path / 'local.bin').read_bytes() == payload
+        assert stats.resumes == 1 and stats.to_dict()['resumes'] == 1
+        assert conn.broken is True
+        assert fresh.sftp.moved <= len(payload) - 2 * 1024 * 1024
+        pool.release.assert_called_once_with(fresh)
+
+    def test_download_restarts_when_remote_changed(self, tmp_path):
+        """Test a source modified during the outage is downloaded again from the start."""
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(os.urandom(PARALLEL_THRESHOLD))
+        changed = os.urandom(PARALLEL_THRESHOLD)
+        conn, fresh, pool = _flaky_setup(budget=3 * 1024 * 1024)
+
+        def reconnect(ssh_info):
+            remote_path.write_bytes(changed)
+            os.utime(remote_path, (1, 1))
+            return fresh
+
+        pool.acquire.side_effect = reconnect
+        engine = SFTPTransferEngine(pool, max_channels=1)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        engine.download({}, conn, str(remote_path), str(tmp_path / 'local.bin'))
+
+        assert (tmp_path / 'local.bin').read_bytes() == changed
+        assert fresh.sftp.moved == len(changed)
+
+    def test_upload_resumes(self, tmp_path):
+        """Test an upload continues after verifying the tail of the confirmed data."""
+        payload = os.urandom(PARALLEL_THRESHOLD + 999)
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(payload)
+        remote_path = tmp_path / 'remote.bin'
+        conn, fresh, pool = _flaky_setup(budget=3 * 1024 * 1024)
+        engine = SFTPTransferEngine(pool, max_channels=1)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        stats = engine.upload({}, conn, str(local_path), str(remote_path), len(payload))
+
+        assert remote_path.read_bytes() == payload
+        assert stats.resumes == 1
+        assert fresh.sftp.moved <= len(payload) - 1024 * 1024 + RESUME_VERIFY_BYTES
+        assert stats.bytes_transferred == len(payload)
+
+    def test_upload_restarts_on_tail_mismatch(self, tmp_path):
+        """Test a remote partial file changed by someone else is uploaded again from scratch."""
+        payload = os.urandom(PARALLEL_THRESHOLD)
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(payload)
+        remote_path = tmp_path / 'remote.bin'
+        conn, fresh, pool = _flaky_setup(budget=3 * 1024 * 1024)
+
+        def reconnect(ssh_info):
+            remote_path.write_bytes(b'\0' * len(payload))
+            return fresh
+
+        pool.acquire.side_effect = reconnect
+        engine = SFTPTransferEngine(pool, max_channels=1)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        engine.upload({}, conn, str(local_path), str(remote_path), len(payload))
+
+        assert remote_path.read_bytes() == payload
+        assert fresh.sftp.moved == len(payload)
+
+    def test_gives_up_after_attempts(self, tmp_path):
+        """Test the error surfaces once every reconnect attempt has failed."""
+        remote_path = tmp_path / 'remote.bin'
+        remote_path.write_bytes(os.urandom(PARALLEL_THRESHOLD))
+        conn, fresh, pool = _flaky_setup(budget=1024 * 1024, fresh_budget=0)
+        fresh.check_health.return_value = False
+        engine = SFTPTransferEngine(pool, max_channels=1, resume_attempts=3)
+        engine.measure_rtt = lambda sftp: 0.05
+
+        with pytest.raises(EOFError):
+            engine.download({}, conn, str(remote_path), str(tmp_path / 'local.bin'))
+        assert pool.acquire.call_count == 3
+
+    def test_pipelined_writes_confirmed(self, sftp_loopback, tmp_path):
+        """Test uploads over a real paramiko SFTP channel wait for write acknowledgements."""
+        payload = os.urandom(3 * 1024 * 1024 + 7)
+        local_path = tmp_path / 'local.bin'
+        local_path.write_bytes(payload)
+        remote_path = tmp_path / 'remote.bin'
+        conn = MagicMock()
+        conn.sftp = sftp_loopback['sftp']
+        engine = SFTPTransferEngine(_full_pool(), max_channels=1)
+
+        stats = engine.upload({}, conn, str(local_path), str(remote_path), len(payload))
+
+        assert remote_path.read_bytes() == payload
+        assert stats.bytes_transferred == len(payload)
+
+class TestParamikoInternals:
+    """Fail loudly if the private paramiko internals this code relies on change."""
+
+    def test_private_attributes_exist(self):
+        """Test the private methods used for pipelined requests are still there."""
+        assert callable(paramiko.SFTPClient._read_response)
+        assert callable(paramiko.SFTPClient._async_request)
+        assert callable(paramiko.SFTPClient._request)
+        assert callable(paramiko.SFTPClient._convert_status)
+        assert callable(paramiko.SFTPAttributes._from_msg)
+        assert paramiko.Transport._preferred_ciphers
+
+    def test_pipelined_write_acks(self, sftp_loopback, tmp_path):
+        """Test pipelined writes queue request numbers in SFTPFile._reqs and _wait_writes confirms them."""
+        with sftp_loopback['sftp'].open(str(tmp_path / 'out'), 'wb') as remote_file:
+            remote_file.set_pipelined(True)
+            remote_file.write(b'a' * 1000)
+            remote_file.write(b'b' * 1000)
+            assert isinstance(remote_file._reqs, deque)
+            last = _last_request(remote_file)
+            assert last is not None
+
+            _wait_writes(remote_file, last)
+
+            assert _last_request(remote_file) is None
+        assert (tmp_path / 'out').read_bytes() == b'a' * 1000 + b'b' * 1000
@@ -0,0 +1,75 @@
+import pytest
+import time
+
+from utils.upload_session import MIN_CHUNK_SIZE, UploadSessionManager
+
+def _create(manager, size=25, chunk_size=10):
+    return manager.create(manager.new_upload_id(), 'local', '/dst/file.bin', '/dst/.file.bin.part', size, chunk_size)
+
+class TestUploadSessionManager:
+    """Test chunked upload session bookkeeping."""
+
+    def test_chunk_layout(self):
+        """Test chunk offsets and the short final chunk."""
+        session = _create(UploadSessionManager())
+        assert session.total_chunks == 3
+        assert session.chunk_range(0) == (0, 10)
+        assert session.chunk_range(2) == (20, 5)
+
+    def test_empty_file_has_one_chunk(self):
+        """Test an empty file still needs a single empty chunk."""
+        session = _create(UploadSessionManager(), size=0)
+        assert session.total_chunks == 1
+        assert session.chunk_range(0) == (0, 0)
+
+    def test_out_of_order_chunks_complete(self):
+        """Test chunks may arrive in any order before commit."""
+        manager = UploadSessionManager()
+        session = _create(manager)
+        for index in (2, 0):
+            manager.begin_chunk(session.upload_id, index)
+            manager.end_chunk(session.upload_id, index, ok=True)
+
+        assert manager.pop_if_complete(session.upload_id) is None
+        assert session.missing() == [1]
+
+        manager.begin_chunk(session.upload_id, 1)
+        manager.end_chunk(session.upload_id, 1, ok=True)
+        assert manager.pop_if_complete(session.upload_id) is session
+        assert manager.get(session.upload_id) is None
+
+    def test_failed_chunk_not_received(self):
+        """Test a failed chunk write is not recorded as received."""
+        manager = UploadSessionManager()
+        session = _create(manager)
+        manager.begin_chunk(session.upload_id, 0)
+        manager.end_chunk(session.upload_id, 0, ok=False)
+        assert session.to_dict()['received'] == []
+
+    def test_begin_chunk_validation(self):
+        """Test unknown sessions, bad indexes and duplicate writers are rejected."""
+        manager = UploadSessionManager()
+        session = _create(manager)
+        with pytest.raises(KeyError):
+            manager.begin_chunk('missing', 0)
+        with pytest.raises(ValueError):
+            manager.begin_chunk(session.upload_id, 3)
+        manager.begin_chunk(session.upload_id, 1)
+        with pytest.raises(ValueError):
+            manager.begin_chunk(session.upload_id, 1)
+
+    def test_expire(self):
+        """Test idle sessions expire but sessions with writes in flight do not."""
+        manager = UploadSessionManager(ttl=0)
+        idle = _create(manager)
+        busy = _create(manager)
+        manager.begin_chunk(busy.upload_id, 0)
+        time.sleep(0.01)
+
+        assert manager.expire() == [idle]
+        assert manager.get(busy.upload_id) is busy
+
+    def test_normalize_chunk_size(self):
+        """Test chunk sizes are clamped."""
+        assert UploadSessionManager.normalize_chunk_size(1) == MIN_CHUNK_SIZE
+        assert UploadSessionManager.normalize_chunk_size(None) > MIN_CHUNK_SIZE
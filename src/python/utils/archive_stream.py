@@ -0,0 +1,378 @@
+"""
+边读边压缩的打包下载流
+
+文件夹或多选文件下载时，把成员逐个编码为 zip 或 tar(.gz/.zst) 直接作为响应体发送，不生成中间压缩包。
+读文件和压缩在后台线程中进行，经有界队列交给响应线程发送，压缩与网络 I/O 互相重叠：
+zlib 压缩时会释放 GIL，zstd 则交给独立的 zstd 进程。
+"""
+
+import os
+import queue
+import shutil
+import stat
+import subprocess
+import threading
+import time
+import zipfile
+import zlib
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from utils.log_util import default_logger as logger
+from utils.tar_stream import DEFAULT_DIR_MODE, DEFAULT_FILE_MODE, coalesce, iter_tar, safe_member_name
+
+ARCHIVE_FORMATS = ("zip", "tar", "tar.gz", "tar.zst")
+ARCHIVE_MIMETYPES = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+    "tar.zst": "application/zstd",
+}
+# 本地文件每次读取的字节数
+ARCHIVE_READ_SIZE = 1024 * 1024
+# 生成线程最多领先发送端的数据块数
+ARCHIVE_QUEUE_SIZE = 16
+GZIP_LEVEL = 6
+ZSTD_COMMAND = ["zstd", "-q", "-c", "-T0"]
+# 响应结束后等待生成线程退出的秒数
+ARCHIVE_CLOSE_TIMEOUT = 10.0
+
+# (成员名, 大小, 修改时间, 打开数据块迭代器的函数)；函数为 None 表示目录
+ArchiveEntry = Tuple[str, int, Optional[float], Optional[Callable[[], Iterable[bytes]]]]
+
+_DONE = object()
+
+
+def zstd_available() -> bool:
+    """本机是否有 zstd 命令（tar.zst 的本地压缩依赖它）"""
+    return shutil.which(ZSTD_COMMAND[0]) is not None
+
+
+def archive_filename(base: str, fmt: str) -> str:
+    return f"{base or 'download'}.{fmt}"
+
+
+def select_roots(base: str, names: Optional[List[str]], pathmod=os.path) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    确定要打包的顶层成员
+
+    Args:
+        base: 目录（或单个文件）的绝对路径
+        names: base 目录下选中的名称；为空时打包 base 本身
+
+    Returns:
+        (压缩包名称（不含扩展名）, [(成员名, 路径)])
+
+    Raises:
+        ValueError: 选中的名称不是 base 下的直接子项
+    """
+    if not names:
+        name = pathmod.basename(base.rstrip("/\\")) or "root"
+        return name, [(name, base)]
+    roots = []
+    for name in names:
+        member = safe_member_name(name)
+        if "/" in member:
+            raise ValueError(f"只能选择当前目录下的文件: {name}")
+        roots.append((member, pathmod.join(base, member)))
+    archive_base = roots[0][0] if len(roots) == 1 else (pathmod.basename(base.rstrip("/\\")) or "download")
+    return archive_base, roots
+
+
+def read_local_file(path: str, read_size: int = ARCHIVE_READ_SIZE) -> Iterator[bytes]:
+    """大块读取本地文件；打开失败时记录警告并返回空数据（由 fit_size 补零）"""
+    try:
+        f = open(path, "rb", buffering=read_size)
+    except OSError as e:
+        logger.warning(f"[ArchiveStream] skip unreadable file: path={path} error={e}")
+        return
+    with f:
+        for chunk in iter(lambda: f.read(read_size), b""):
+            yield chunk
+
+
+def iter_local_entries(roots: List[Tuple[str, str]]) -> Iterator[ArchiveEntry]:
+    """遍历本地目录树生成成员；目录不跟随符号链接，指向文件的符号链接按文件内容打包"""
+    for arcname, path in roots:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.warning(f"[ArchiveStream] skip missing path: path={path} error={e}")
+            continue
+        if stat.S_ISDIR(st.st_mode) and not os.path.islink(path):
+            yield arcname, 0, st.st_mtime, None
+            yield from _walk_local(arcname, path)
+        elif stat.S_ISREG(st.st_mode):
+            yield arcname, st.st_size, st.st_mtime, lambda path=path: read_local_file(path)
+
+
+def _walk_local(prefix: str, path: str) -> Iterator[ArchiveEntry]:
+    try:
+        with os.scandir(path) as it:
+            children = sorted(it, key=lambda entry: entry.name)
+    except OSError as e:
+        logger.warning(f"[ArchiveStream] skip unreadable directory: path={path} error={e}")
+        return
+    for entry in children:
+        arcname = f"{prefix}/{entry.name}"
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield arcname, 0, entry.stat(follow_symlinks=False).st_mtime, None
+                yield from _walk_local(arcname, entry.path)
+            elif entry.is_file():
+                st = entry.stat()
+                yield arcname, st.st_size, st.st_mtime, lambda path=entry.path: read_local_file(path)
+        except OSError as e:
+            logger.warning(f"[ArchiveStream] skip entry: path={entry.path} error={e}")
+
+
+def fit_size(chunks: Iterable[bytes], size: int, name: str = "") -> Iterator[bytes]:
+    """
+    按声明的大小截断或补零
+
+    成员头部在读数据之前就已写出，文件在打包期间被修改时保持压缩包结构有效（与 GNU tar 的做法一致）。
+    """
+    remaining = size
+    try:
+        for chunk in chunks:
+            if len(chunk) >= remaining:
+                if remaining:
+                    yield chunk[:remaining]
+                remaining = 0
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    if remaining:
+        logger.warning(f"[ArchiveStream] file shrank while archiving, padding with zeros: {name}")
+        zeros = bytes(min(remaining, ARCHIVE_READ_SIZE))
+        while remaining:
+            step = min(remaining, len(zeros))
+            yield zeros[:step]
+            remaining -= step
+
+
+class _ZipSink:
+    """zipfile 的写入目标：不提供 tell/seek，zipfile 因此改用数据描述符而不回头改写文件头"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _zip_date(mtime: Optional[float]) -> Tuple[int, int, int, int, int, int]:
+    # zip 的 DOS 时间不能早于 1980 年
+    return max(time.localtime(mtime if mtime else time.time())[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def iter_zip(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """把成员编码为 zip 流（Deflate 压缩，必要时使用 ZIP64）"""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for name, size, mtime, opener in entries:
+            if opener is None:
+                info = zipfile.ZipInfo(f"{safe_member_name(name)}/", _zip_date(mtime))
+                info.external_attr = ((stat.S_IFDIR | DEFAULT_DIR_MODE) << 16) | 0x10
+                zf.writestr(info, b"")
+            else:
+                info = zipfile.ZipInfo(safe_member_name(name), _zip_date(mtime))
+                info.external_attr = (stat.S_IFREG | DEFAULT_FILE_MODE) << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                # 事先给出大小，超过 4GB 的成员会提前写成 ZIP64 格式
+                info.file_size = size
+                with zf.open(info, "w") as dest:
+                    for chunk in fit_size(opener(), size, name):
+                        dest.write(chunk)
+                        data = sink.take()
+                        if data:
+                            yield data
+            data = sink.take()
+            if data:
+                yield data
+    data = sink.take()
+    if data:
+        yield data
+
+
+def iter_tar_entries(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """把成员编码为未压缩的 tar 流；文件在轮到它时才打开"""
+    return iter_tar(
+        (name, size, mtime, None if opener is None else fit_size(opener(), size, name))
+        for name, size, mtime, opener in entries
+    )
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def pipe_chunks(chunks: Iterable[bytes], command: List[str]) -> Iterator[bytes]:
+    """
+    让数据块流经外部过滤进程（如 zstd）
+
+    写入在单独线程中进行，避免进程的输入输出管道互相等待；提前结束时杀掉进程。
+
+    Raises:
+        RuntimeError: 进程非零退出
+    """
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    errors = []
+
+    def _feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=_feed, name=f"{command[0]}-feed", daemon=True)
+    feeder.start()
+    try:
+        for data in iter(lambda: process.stdout.read1(ARCHIVE_READ_SIZE), b""):
+            yield data
+        feeder.join()
+        if errors:
+            raise errors[0]
+        status = process.wait()
+        if status != 0:
+            raise RuntimeError(f"{command[0]} 压缩失败（退出码 {status}）")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        feeder.join()
+        process.stdout.close()
+
+
+def compress_tar(chunks: Iterable[bytes], fmt: str) -> Iterator[bytes]:
+    """按格式压缩 tar 流；fmt 为 tar 时原样返回"""
+    if fmt == "tar.gz":
+        return gzip_chunks(chunks)
+    if fmt == "tar.zst":
+        return pipe_chunks(chunks, ZSTD_COMMAND)
+    return iter(chunks)
+
+
+def build_archive(entries: Iterable[ArchiveEntry], fmt: str) -> Iterator[bytes]:
+    """
+    生成整个压缩包的数据块
+
+    Raises:
+        ValueError: 不支持的格式
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"不支持的压缩格式: {fmt}")
+    if fmt == "zip":
+        return coalesce(iter_zip(entries))
+    return coalesce(compress_tar(iter_tar_entries(entries), fmt))
+
+
+class ArchiveStream:
+    """
+    在后台线程中生成、由响应线程逐块发送的响应体
+
+    生成端（读文件、压缩）与发送端经有界队列解耦；客户端断开时 WSGI 服务器调用 close()，
+    生成线程在下一次放入数据时退出，随后在该线程中执行 on_close（如归还连接）。
+    生成过程出错时迭代抛出异常，服务器随即断开连接，客户端不会把残缺的压缩包当作完整下载。
+    """
+
+    def __init__(self, chunks: Iterable[bytes], filename: str, mimetype: str,
+                 on_close: Optional[Callable[[], None]] = None, queue_size: int = ARCHIVE_QUEUE_SIZE):
+        self.filename = filename
+        self.mimetype = mimetype
+        self.bytes_sent = 0
+        self._chunks = chunks
+        self._on_close = on_close
+        self._queue: "queue.Queue" = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._produce, name="archive-stream", daemon=True)
+                self._thread.start()
+        try:
+            while self._thread is not None:
+                item = self._queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                self.bytes_sent += len(item)
+                yield item
+        finally:
+            self.close()
+
+    def _produce(self):
+        try:
+            for chunk in self._chunks:
+                if chunk and not self._put(chunk):
+                    return
+            self._put(_DONE)
+        except Exception as e:
+            logger.error(f"[ArchiveStream] archive failed: file={self.filename} error={e}")
+            self._put(e)
+        finally:
+            close = getattr(self._chunks, "close", None)
+            if close is not None:
+                close()
+            self._run_on_close()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_on_close(self):
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            try:
+                on_close()
+            except Exception as e:
+                logger.warning(f"[ArchiveStream] on_close failed: file={self.filename} error={e}")
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        self._stop.set()
+        if thread is None:
+            self._run_on_close()
+            return
+        thread.join(ARCHIVE_CLOSE_TIMEOUT)
+        if thread.is_alive():
+            logger.warning(f"[ArchiveStream] producer still running after close: file={self.filename}")
+        else:
+            logger.info(f"[ArchiveStream] closed: file={self.filename} bytes_sent={self.bytes_sent}")
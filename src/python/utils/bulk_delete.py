@@ -0,0 +1,405 @@
+"""
+递归批量删除文件和目录树
+
+本地：先遍历出整棵树（不跟随符号链接），文件交给线程池并发 unlink，目录再按从深到浅逐层 rmdir。
+unlink 的耗时主要在文件系统的元数据更新上，大目录和网络文件系统上并发能明显缩短总时间。
+
+远程有两种方式：
+- sftp：listdir_attr 遍历后，remove 请求在同一 SFTP 通道上流水线发出，不逐个等待应答；目录按层
+  从深到浅流水线 rmdir，一层的应答全部收到后才删上一层，不依赖服务器按顺序处理请求
+- exec：一次 rm -rf 在远程完成遍历和删除，与条目数无关只需一次往返；rm -v 的输出逐行计入进度
+auto 时选中的文件直接流水线 remove，目录交给 rm -rf，exec 失败（没有 rm、有条目删不掉等）
+再用 sftp 方式处理剩下的部分。
+
+进度计入 Job：files_total/files_done 为文件和目录的条目数，条目数在遍历后或边删边累加；
+bytes 为已删除文件的大小，只统计遍历时知道大小的文件。
+"""
+
+import os
+import posixpath
+import shlex
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from paramiko import SFTPAttributes, SFTPClient
+from paramiko.sftp import CMD_ATTRS, CMD_LSTAT, CMD_REMOVE, CMD_RMDIR, CMD_STATUS
+
+from .job_registry import Job, JobCancelled
+from .log_util import default_logger as logger
+from .remote_listing import STAT_PIPELINE_DEPTH, pipeline_requests
+
+# 远程删除方式，含义见模块说明
+DELETE_METHODS = ("auto", "sftp", "exec")
+DEFAULT_DELETE_WORKERS = 8
+# 流水线删除每批的条目数，批与批之间更新进度、检查取消
+DELETE_BATCH_SIZE = 1024
+# LC_ALL=C 保证 -v 的输出为 "removed '...'" / "removed directory '...'"；错误信息并入 stdout，避免 stderr 写满窗口
+RM_RF_COMMAND = "LC_ALL=C rm -rfv -- {paths} 2>&1"
+RM_READ_SIZE = 4096
+RM_REMOVED_PREFIX = "removed "
+RM_DIR_PREFIX = "removed directory "
+
+# (路径, 大小) 与 (深度, 路径)
+TreeFiles = List[Tuple[str, int]]
+TreeDirs = List[Tuple[int, str]]
+
+
+class DeleteReport:
+    """一次批量删除的统计，计数方法线程安全；to_dict 为服务方法返回的结果"""
+
+    def __init__(self, job: Optional[Job] = None, sep: str = "/"):
+        self.job = job
+        self.sep = sep
+        self.files = 0
+        self.dirs = 0
+        self.bytes = 0
+        self.failed: List[Dict[str, str]] = []
+        # 有条目删不掉的目录：其上各级目录必然非空，不再尝试 rmdir，也不重复报错
+        self.blocked: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _parent(self, path: str) -> str:
+        return posixpath.dirname(path) if self.sep == "/" else os.path.dirname(path)
+
+    def expect(self, entries: int, nbytes: int = 0):
+        if self.job is not None:
+            self.job.add_total(nbytes, entries)
+
+    def check_cancelled(self, current: Optional[str] = None):
+        if self.job is not None:
+            self.job.check_cancelled()
+            if current is not None:
+                self.job.current = current
+
+    def removed(self, is_dir: bool, size: int = 0):
+        with self._lock:
+            if is_dir:
+                self.dirs += 1
+            else:
+                self.files += 1
+            self.bytes += size
+        if self.job is not None:
+            self.job.file_done()
+            self.job.add_bytes(size)
+
+    def fail(self, path: str, error: str):
+        logger.warning(f"[bulk_delete] delete failed: path={path} error={error}")
+        with self._lock:
+            self.failed.append({"path": path, "error": error})
+            self.blocked.add(self._parent(path))
+
+    def skip_blocked(self, path: str) -> bool:
+        """path 下有删不掉的条目时返回 True，并把它的上级目录也标记为删不掉"""
+        with self._lock:
+            if path not in self.blocked:
+                return False
+            self.blocked.add(self._parent(path))
+            return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "success": not self.failed,
+            "deleted_files": self.files,
+            "deleted_dirs": self.dirs,
+            "bytes": self.bytes,
+            "failed": self.failed,
+        }
+        if self.failed:
+            first = self.failed[0]
+            result["error"] = first["error"] if len(self.failed) == 1 else (
+                f"{len(self.failed)} 个条目删除失败，首个: {first['path']}: {first['error']}"
+            )
+        return result
+
+
+def _refuse_root(path: str, report: DeleteReport) -> bool:
+    if path.rstrip("/\\") == "":
+        report.fail(path, "拒绝删除根目录")
+        return True
+    return False
+
+
+def _by_depth(dirs: TreeDirs) -> List[List[str]]:
+    """目录按深度分层，最深的在前"""
+    levels: Dict[int, List[str]] = {}
+    for depth, path in dirs:
+        levels.setdefault(depth, []).append(path)
+    return [levels[depth] for depth in sorted(levels, reverse=True)]
+
+
+def scan_local_tree(root: str, report: DeleteReport) -> Tuple[TreeFiles, TreeDirs]:
+    """列出 root 下的全部文件和目录（含 root 自身），不进入指向目录的符号链接"""
+    files: TreeFiles = []
+    dirs: TreeDirs = [(0, root)]
+    pending = [(0, root)]
+    while pending:
+        depth, path = pending.pop()
+        report.check_cancelled(path)
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append((depth + 1, entry.path))
+                        pending.append((depth + 1, entry.path))
+                    else:
+                        size = 0
+                        if entry.is_file(follow_symlinks=False):
+                            try:
+                                size = entry.stat(follow_symlinks=False).st_size
+                            except OSError:
+                                pass
+                        files.append((entry.path, size))
+        except OSError as e:
+            report.fail(path, str(e))
+    return files, dirs
+
+
+def delete_local(paths: List[str], job: Optional[Job] = None,
+                 workers: int = DEFAULT_DELETE_WORKERS) -> Dict[str, Any]:
+    """
+    删除本地的文件和目录树
+
+    Returns:
+        {"success", "deleted_files", "deleted_dirs", "bytes", "failed": [{"path", "error"}]}，有失败时带 error
+    """
+    report = DeleteReport(job, sep=os.sep)
+    files: TreeFiles = []
+    dirs: TreeDirs = []
+    for path in paths:
+        if _refuse_root(path, report):
+            continue
+        try:
+            st = os.lstat(path)
+        except OSError as e:
+            report.fail(path, str(e))
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            tree_files, tree_dirs = scan_local_tree(path, report)
+            files.extend(tree_files)
+            dirs.extend(tree_dirs)
+        else:
+            files.append((path, st.st_size if stat.S_ISREG(st.st_mode) else 0))
+    report.expect(len(files) + len(dirs), sum(size for _, size in files))
+
+    def _unlink(item):
+        path, size = item
+        report.check_cancelled(path)
+        try:
+            os.remove(path)
+        except OSError as e:
+            report.fail(path, str(e))
+        else:
+            report.removed(False, size)
+
+    def _rmdir(path):
+        report.check_cancelled(path)
+        if report.skip_blocked(path):
+            return
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            report.fail(path, str(e))
+        else:
+            report.removed(True)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="delete") as executor:
+        # list() 取回全部结果，任务中抛出的 JobCancelled 在这里重新抛出
+        list(executor.map(_unlink, files))
+        for level in _by_depth(dirs):
+            list(executor.map(_rmdir, level))
+    logger.info(f"[bulk_delete] local delete done: files={report.files} dirs={report.dirs} "
+                f"bytes={report.bytes} failed={len(report.failed)}")
+    return report.to_dict()
+
+
+def sftp_remove_many(sftp, paths: List[str], rmdir: bool = False,
+                     depth: int = STAT_PIPELINE_DEPTH) -> List[Optional[str]]:
+    """
+    批量 remove（rmdir=True 时为 rmdir），按 paths 的顺序返回 None（成功）或错误信息
+
+    paramiko 的 SFTPClient 上请求流水线发出；其他 SFTP 客户端对象退回逐个删除。
+    """
+    if not isinstance(sftp, SFTPClient):
+        func = sftp.rmdir if rmdir else sftp.remove
+        errors: List[Optional[str]] = []
+        for path in paths:
+            try:
+                func(path)
+                errors.append(None)
+            except IOError as e:
+                errors.append(str(e))
+        return errors
+
+    errors = []
+    for t, msg in pipeline_requests(sftp, CMD_RMDIR if rmdir else CMD_REMOVE, paths, depth):
+        if t != CMD_STATUS:
+            errors.append(f"意外的 SFTP 应答: {t}")
+            continue
+        try:
+            sftp._convert_status(msg)
+            errors.append(None)
+        except (IOError, EOFError) as e:
+            errors.append(str(e))
+    return errors
+
+
+def sftp_lstat_many(sftp, paths: List[str]) -> List[Optional[SFTPAttributes]]:
+    """批量 lstat，不存在或无权限的返回 None；SFTPClient 上流水线发出"""
+    if not isinstance(sftp, SFTPClient):
+        results = []
+        for path in paths:
+            try:
+                results.append(sftp.lstat(path))
+            except IOError:
+                results.append(None)
+        return results
+    return [SFTPAttributes._from_msg(msg) if t == CMD_ATTRS else None
+            for t, msg in pipeline_requests(sftp, CMD_LSTAT, paths)]
+
+
+def scan_sftp_tree(sftp, root: str, report: DeleteReport) -> Tuple[TreeFiles, TreeDirs]:
+    """scan_local_tree 的 SFTP 版本"""
+    files: TreeFiles = []
+    dirs: TreeDirs = [(0, root)]
+    pending = [(0, root)]
+    while pending:
+        depth, path = pending.pop()
+        report.check_cancelled(path)
+        try:
+            attrs = sftp.listdir_attr(path)
+        except IOError as e:
+            report.fail(path, str(e))
+            continue
+        for attr in attrs:
+            child = posixpath.join(path, attr.filename)
+            if stat.S_ISDIR(attr.st_mode):
+                dirs.append((depth + 1, child))
+                pending.append((depth + 1, child))
+            else:
+                files.append((child, attr.st_size if stat.S_ISREG(attr.st_mode) else 0))
+    return files, dirs
+
+
+def _remove_batches(sftp, items: List[Tuple[str, int]], rmdir: bool, report: DeleteReport):
+    for start in range(0, len(items), DELETE_BATCH_SIZE):
+        batch = items[start:start + DELETE_BATCH_SIZE]
+        report.check_cancelled(batch[0][0])
+        for (path, size), error in zip(batch, sftp_remove_many(sftp, [path for path, _ in batch], rmdir)):
+            if error is None:
+                report.removed(rmdir, size)
+            else:
+                report.fail(path, error)
+
+
+def delete_sftp_trees(sftp, roots: List[str], report: DeleteReport):
+    """经 SFTP 删除若干目录树：先遍历，再流水线删除文件，最后逐层删除目录"""
+    files: TreeFiles = []
+    dirs: TreeDirs = []
+    for root in roots:
+        tree_files, tree_dirs = scan_sftp_tree(sftp, root, report)
+        files.extend(tree_files)
+        dirs.extend(tree_dirs)
+    report.expect(len(files) + len(dirs), sum(size for _, size in files))
+    _remove_batches(sftp, files, False, report)
+    for level in _by_depth(dirs):
+        _remove_batches(sftp, [(path, 0) for path in level if not report.skip_blocked(path)], True, report)
+
+
+def delete_exec(exec_command: Callable, paths: List[str], report: DeleteReport) -> Tuple[int, str]:
+    """
+    一次 rm -rf 删除 paths，rm -v 每输出一行计一个条目
+
+    Returns:
+        (退出码, rm 的错误信息)
+    """
+    stdin, stdout, stderr = exec_command(RM_RF_COMMAND.format(paths=" ".join(shlex.quote(p) for p in paths)))
+    channel = stdout.channel
+    errors: List[str] = []
+    pending = b""
+    try:
+        channel.shutdown_write()
+        for chunk in iter(lambda: stdout.read(RM_READ_SIZE), b""):
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            report.check_cancelled()
+            for line in lines:
+                text = line.decode("utf-8", errors="replace")
+                if text.startswith(RM_REMOVED_PREFIX):
+                    report.expect(1)
+                    report.removed(text.startswith(RM_DIR_PREFIX))
+                elif text:
+                    errors.append(text)
+        if pending:
+            errors.append(pending.decode("utf-8", errors="replace"))
+        status = channel.recv_exit_status()
+    finally:
+        channel.close()
+    return status, "\n".join(errors[-5:])
+
+
+def delete_remote(conn, paths: List[str], method: str = "auto", job: Optional[Job] = None) -> Dict[str, Any]:
+    """
+    删除远程的文件和目录树，method 见 DELETE_METHODS
+
+    Args:
+        conn: 连接池中的连接，需要 sftp 和 exec_command
+
+    Returns:
+        与 delete_local 相同，另有 method 为实际使用的方式
+    """
+    report = DeleteReport(job)
+    report.check_cancelled()
+    sftp = conn.sftp
+    paths = [path for path in paths if not _refuse_root(path, report)]
+    used = "exec" if method == "exec" else "sftp"
+    if method == "exec":
+        trees = paths
+    else:
+        # 先按文件删除，一次往返处理完所有选中的文件；删不掉的再看是不是目录
+        trees = []
+        errors = sftp_remove_many(sftp, paths)
+        failed = [(path, error) for path, error in zip(paths, errors) if error is not None]
+        report.expect(len(paths) - len(failed))
+        for _ in range(len(paths) - len(failed)):
+            report.removed(False)
+        attrs = sftp_lstat_many(sftp, [path for path, _ in failed])
+        for (path, error), attr in zip(failed, attrs):
+            if attr is not None and stat.S_ISDIR(attr.st_mode):
+                trees.append(path)
+            else:
+                report.fail(path, error)
+        if trees and method == "auto":
+            used = "exec"
+
+    if trees and used == "exec":
+        report.check_cancelled(trees[0])
+        try:
+            status, error = delete_exec(conn.exec_command, trees, report)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            status, error = -1, str(e)
+        if status != 0:
+            # rm 不可用或部分条目删不掉：还在的目录交给 SFTP 逐个处理，或如实报告失败
+            remaining = [path for path, attr in zip(trees, sftp_lstat_many(sftp, trees)) if attr is not None]
+            error = error or f"rm 退出码 {status}"
+            if method == "exec":
+                for path in remaining:
+                    report.fail(path, error)
+                remaining = []
+            else:
+                logger.warning(f"[bulk_delete] rm -rf failed (exit {status}), using sftp: {error}")
+                used = "sftp"
+            trees = remaining
+        else:
+            trees = []
+    if trees:
+        delete_sftp_trees(sftp, trees, report)
+
+    result = report.to_dict()
+    result["method"] = used
+    logger.info(f"[bulk_delete] remote delete done: method={used} files={report.files} dirs={report.dirs} "
+                f"bytes={report.bytes} failed={len(report.failed)}")
+    return result
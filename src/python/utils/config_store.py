@@ -0,0 +1,172 @@
+"""
+配置存储
+
+config.json 只在首次访问和文件发生变化（mtime/inode/size）时解析，
+其余请求直接读取内存中的配置快照；写入通过临时文件 + rename 原子替换。
+"""
+
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl  # 仅 POSIX 可用，用于多进程间的写锁
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from .constants import CONFIG_FILE
+from .log_util import default_logger as logger
+
+# 两次检查文件是否变化的最小间隔（秒），避免每个请求都 stat 一次
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+class ConfigStore:
+    """
+    config.json 的内存缓存
+
+    get() 返回的配置是只读快照，修改必须通过 update()，
+    update() 在副本上修改后整体写回文件并替换快照，已取出的旧快照不受影响。
+    """
+
+    def __init__(self, path=CONFIG_FILE, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._config: Optional[Dict[str, Any]] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._last_check = 0.0
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._by_host: Dict[str, Dict[str, Any]] = {}
+
+    def _file_signature(self) -> Tuple[int, int, int]:
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _load_locked(self, signature: Tuple[int, int, int]):
+        with open(self.path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self._install_locked(config, signature)
+        logger.info(f"[ConfigStore] loaded config: {self.path}")
+
+    def _install_locked(self, config: Dict[str, Any], signature: Tuple[int, int, int]):
+        by_name = {}
+        by_host = {}
+        for remote in config.get("remote_server_list", []):
+            if remote.get("server_name"):
+                by_name[remote["server_name"]] = remote
+            host_ip = remote.get("config", {}).get("host_ip")
+            if host_ip and host_ip not in by_host:
+                by_host[host_ip] = remote
+        self._config = config
+        self._signature = signature
+        self._by_name = by_name
+        self._by_host = by_host
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._config is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if self._config is not None and now - self._last_check < self.check_interval:
+                return
+            try:
+                signature = self._file_signature()
+            except OSError as e:
+                if self._config is None:
+                    raise
+                # 文件暂时不可读（例如被外部编辑器替换中）时继续使用旧配置
+                logger.warning(f"[ConfigStore] stat failed, keep cached config: {e}")
+                return
+            if signature != self._signature:
+                self._load_locked(signature)
+            self._last_check = now
+
+    def get(self) -> Dict[str, Any]:
+        """获取当前配置快照（只读）"""
+        self._refresh()
+        return self._config
+
+    def get_remote_servers(self) -> List[Dict[str, Any]]:
+        return self.get().get("remote_server_list", [])
+
+    def get_server(self, server_name: Optional[str] = None, host_ip: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """按 server_name 或 host_ip 查找服务器配置，找不到返回 None"""
+        self._refresh()
+        if server_name is not None:
+            return self._by_name.get(server_name)
+        if host_ip is not None:
+            return self._by_host.get(host_ip)
+        return None
+
+    def update(self, mutator: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        修改配置并原子写回
+
+        Args:
+            mutator: 接收配置副本并就地修改的函数
+
+        Returns:
+            Dict[str, Any]: 写入后的新配置快照
+        """
+        with self._lock, self._file_lock():
+            # 以磁盘上的最新内容为基础，避免覆盖外部修改
+            self._last_check = 0.0
+            self._refresh()
+            config = copy.deepcopy(self._config)
+            mutator(config)
+            self._write_atomic(config)
+            self._install_locked(config, self._file_signature())
+            self._last_check = time.monotonic()
+            return config
+
+    def _write_atomic(self, config: Dict[str, Any]):
+        directory = self.path.parent
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.path.exists():
+                os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _file_lock(self):
+        return _FileLock(self.path.with_name(self.path.name + ".lock"))
+
+
+class _FileLock:
+    """基于 flock 的进程间互斥锁，不支持 flock 的平台退化为空操作"""
+
+    def __init__(self, lock_path: Path):
+        self.lock_path = lock_path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        return False
+
+
+# 提供默认实例
+default_config_store = ConfigStore()
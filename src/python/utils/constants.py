@@ -17,4 +17,7 @@ CONFIG_FILE = PROJECT_ROOT / "config.json"
 FRONT_DIR = PROJECT_ROOT / "front"
 
 # 日志文件路径
-LOG_FILE = PROJECT_ROOT / "logs" / "app.log"
\ No newline at end of file
+LOG_FILE = PROJECT_ROOT / "logs" / "app.log"
+
+# 缓存目录（目录同步清单等）
+CACHE_DIR = PROJECT_ROOT / "cache"
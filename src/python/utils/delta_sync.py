@@ -0,0 +1,400 @@
+"""
+rsync 式增量传输
+
+接收方（持有旧文件的一端）把旧文件按固定大小分块，为每块计算弱校验（Adler-32）和强校验
+（BLAKE2b），即“签名”；发送方（持有新文件的一端）用可滚动的 Adler-32 在新文件上逐字节
+滑动寻找与旧块相同的内容，只把找不到的字节作为字面数据发出，其余用“复制第 i 块”指令代替；
+接收方按指令从旧文件拼出新文件，并用整文件摘要校验。
+
+本模块只依赖标准库且兼容 Python 3.6，可以整个上传到远程主机作为辅助脚本执行：
+
+    python3 delta_sync.py signature PATH BLOCK_SIZE      签名写到 stdout
+    python3 delta_sync.py delta PATH                     从 stdin 读签名，增量写到 stdout
+    python3 delta_sync.py patch BASIS TARGET             从 stdin 读增量，生成 TARGET，结果 JSON 写到 stdout
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from contextlib import contextmanager
+
+SIGNATURE_MAGIC = b"DTS1"
+DELTA_MAGIC = b"DTD1"
+STRONG_SIZE = 16
+DIGEST_SIZE = 32
+
+MIN_BLOCK_SIZE = 8 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+LITERAL_CHUNK = 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+# 逐字节滚动在纯 Python 中较慢：连续 ROLL_BLOCKS 块都没有匹配时改为只检查块对齐位置，
+# 间隔一段再完整滚动一块以便在插入/删除后重新对齐；间隔从 ROLL_EVERY 块起随不匹配区域
+# 增长（约为其 1/ROLL_SPREAD），完全不同的文件也只有很少一部分字节需要逐字节滚动
+ROLL_BLOCKS = 16
+ROLL_EVERY = 8
+ROLL_SPREAD = 8
+
+_ADLER_MOD = 65521
+_SIG_HEADER = struct.Struct(">4sIQI")
+_SIG_ENTRY = struct.Struct(">I%ds" % STRONG_SIZE)
+_DELTA_HEADER = struct.Struct(">4sI")
+_COPY = struct.Struct(">QI")
+_LITERAL = struct.Struct(">I")
+_END = struct.Struct(">Q%ds" % DIGEST_SIZE)
+OP_COPY = b"C"
+OP_LITERAL = b"L"
+OP_END = b"E"
+
+
+def choose_block_size(size):
+    """块大小取文件大小平方根附近的 2 的幂，并限制在 [MIN_BLOCK_SIZE, MAX_BLOCK_SIZE]"""
+    block = MIN_BLOCK_SIZE
+    while block * block < size and block < MAX_BLOCK_SIZE:
+        block *= 2
+    return block
+
+
+def strong_checksum(data):
+    return hashlib.blake2b(data, digest_size=STRONG_SIZE).digest()
+
+
+def roll_adler32(weak, out_byte, in_byte, length):
+    """窗口右移一个字节后的 Adler-32：移出 out_byte、移入 in_byte"""
+    a = weak & 0xffff
+    b = weak >> 16
+    a = (a - out_byte + in_byte) % _ADLER_MOD
+    b = (b - length * out_byte + a - 1) % _ADLER_MOD
+    return (b << 16) | a
+
+
+class Signature:
+    """旧文件的块签名"""
+
+    def __init__(self, block_size, file_size, weak, strong):
+        self.block_size = block_size
+        self.file_size = file_size
+        self.weak = weak
+        self.strong = strong
+
+    @property
+    def count(self):
+        return len(self.weak)
+
+    def block_length(self, index):
+        if index == self.count - 1:
+            return self.file_size - index * self.block_size
+        return self.block_size
+
+    def to_bytes(self):
+        parts = [_SIG_HEADER.pack(SIGNATURE_MAGIC, self.block_size, self.file_size, self.count)]
+        parts.extend(_SIG_ENTRY.pack(w, s) for w, s in zip(self.weak, self.strong))
+        return b"".join(parts)
+
+
+def build_signature(stream, block_size):
+    """按块读取 stream 计算签名"""
+    weak = []
+    strong = []
+    size = 0
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        # 管道等流式输入可能一次读不满一块
+        while len(block) < block_size:
+            more = stream.read(block_size - len(block))
+            if not more:
+                break
+            block += more
+        weak.append(zlib.adler32(block))
+        strong.append(strong_checksum(block))
+        size += len(block)
+    return Signature(block_size, size, weak, strong)
+
+
+def _read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("增量数据不完整")
+        data += chunk
+    return data
+
+
+def read_signature(stream):
+    magic, block_size, file_size, count = _SIG_HEADER.unpack(_read_exact(stream, _SIG_HEADER.size))
+    if magic != SIGNATURE_MAGIC:
+        raise ValueError("签名格式错误")
+    body = _read_exact(stream, count * _SIG_ENTRY.size)
+    weak = []
+    strong = []
+    for w, s in _SIG_ENTRY.iter_unpack(body):
+        weak.append(w)
+        strong.append(s)
+    return Signature(block_size, file_size, weak, strong)
+
+
+class DeltaStats:
+    """一次增量计算的统计"""
+
+    def __init__(self):
+        self.matched_bytes = 0
+        self.literal_bytes = 0
+        self.delta_bytes = 0
+
+    def to_dict(self):
+        return {
+            "matched_bytes": self.matched_bytes,
+            "literal_bytes": self.literal_bytes,
+            "delta_bytes": self.delta_bytes,
+        }
+
+
+class _Matcher:
+    def __init__(self, data, signature):
+        self.data = data
+        self.sig = signature
+        self.table = {}
+        for index, weak in enumerate(signature.weak):
+            self.table.setdefault(weak, []).append(index)
+
+    def verify(self, pos, length, weak):
+        """弱校验命中后用强校验确认，返回旧块序号或 None"""
+        candidates = self.table.get(weak)
+        if not candidates:
+            return None
+        digest = None
+        for index in candidates:
+            if self.sig.block_length(index) != length:
+                continue
+            if digest is None:
+                digest = strong_checksum(self.data[pos:pos + length])
+            if self.sig.strong[index] == digest:
+                return index
+        return None
+
+    def scan(self, pos, end, weak):
+        """从 pos 起逐字节滚动到 end（不含），返回首个匹配的 (位置, 块序号)"""
+        data = self.data
+        table = self.table
+        block = self.sig.block_size
+        # roll_adler32 的内联版本，这是逐字节执行的热循环
+        a = weak & 0xffff
+        b = weak >> 16
+        while True:
+            if weak in table:
+                index = self.verify(pos, block, weak)
+                if index is not None:
+                    return pos, index
+            if pos + 1 >= end:
+                return None, None
+            out_byte = data[pos]
+            a = (a - out_byte + data[pos + block]) % _ADLER_MOD
+            b = (b - block * out_byte + a - 1) % _ADLER_MOD
+            weak = (b << 16) | a
+            pos += 1
+
+
+def generate_delta(data, signature, stats=None):
+    """
+    对新文件内容 data（bytes 或 mmap）相对 signature 计算增量，逐段产出编码后的字节
+
+    Args:
+        stats: 可选的 DeltaStats，累计匹配和字面数据的字节数
+    """
+    stats = stats if stats is not None else DeltaStats()
+    block = signature.block_size
+    size = len(data)
+    matcher = _Matcher(data, signature)
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+    def _emit(chunk):
+        stats.delta_bytes += len(chunk)
+        return chunk
+
+    def _literal(start, stop):
+        while start < stop:
+            piece = data[start:min(stop, start + LITERAL_CHUNK)]
+            stats.literal_bytes += len(piece)
+            yield _emit(OP_LITERAL + _LITERAL.pack(len(piece)) + piece)
+            start += len(piece)
+
+    yield _emit(_DELTA_HEADER.pack(DELTA_MAGIC, block))
+    copy_start = copy_count = 0
+    literal_start = pos = 0
+    misses = next_roll = 0
+    tail = signature.count - 1 if signature.count else None
+    while pos < size:
+        remaining = size - pos
+        found = None
+        if remaining >= block:
+            weak = zlib.adler32(data[pos:pos + block])
+            index = matcher.verify(pos, block, weak)
+            if index is not None:
+                found = (pos, index)
+            elif misses < ROLL_BLOCKS or misses >= next_roll:
+                # 最多滚动一整块：插入或删除任意长度后，旧块边界必然落在这一块之内
+                end = min(size - block + 1, pos + block)
+                hit_pos, index = matcher.scan(pos, end, weak)
+                if hit_pos is not None:
+                    found = (hit_pos, index)
+                elif misses >= ROLL_BLOCKS:
+                    next_roll = misses + max(ROLL_EVERY, misses // ROLL_SPREAD)
+        elif tail is not None and remaining == signature.block_length(tail):
+            if matcher.verify(pos, remaining, zlib.adler32(data[pos:])) == tail:
+                found = (pos, tail)
+        else:
+            break
+
+        if found is None:
+            misses += 1
+            pos += block
+            continue
+        hit_pos, index = found
+        length = signature.block_length(index)
+        if hit_pos > literal_start:
+            if copy_count:
+                yield _emit(OP_COPY + _COPY.pack(copy_start, copy_count))
+                copy_count = 0
+            for chunk in _literal(literal_start, hit_pos):
+                yield chunk
+        if copy_count and index == copy_start + copy_count:
+            copy_count += 1
+        else:
+            if copy_count:
+                yield _emit(OP_COPY + _COPY.pack(copy_start, copy_count))
+            copy_start, copy_count = index, 1
+        stats.matched_bytes += length
+        pos = literal_start = hit_pos + length
+        misses = next_roll = 0
+
+    if copy_count:
+        yield _emit(OP_COPY + _COPY.pack(copy_start, copy_count))
+    for chunk in _literal(literal_start, size):
+        yield chunk
+    for start in range(0, size, READ_SIZE):
+        digest.update(data[start:start + READ_SIZE])
+    yield _emit(OP_END + _END.pack(size, digest.digest()))
+
+
+def apply_delta(basis, delta, out, progress=None):
+    """
+    按增量指令从旧文件 basis 拼出新文件写入 out
+
+    Args:
+        basis: 可 seek 的旧文件对象
+        delta: 增量数据流（只需支持 read）
+        out: 新文件写入对象
+        progress: 可选回调，每写出一段数据后以字节数调用
+
+    Returns:
+        新文件大小
+
+    Raises:
+        ValueError: 增量格式错误、不完整或结果校验失败
+    """
+    magic, block = _DELTA_HEADER.unpack(_read_exact(delta, _DELTA_HEADER.size))
+    if magic != DELTA_MAGIC:
+        raise ValueError("增量格式错误")
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    written = 0
+    while True:
+        op = delta.read(1)
+        if op == OP_COPY:
+            index, count = _COPY.unpack(_read_exact(delta, _COPY.size))
+            basis.seek(index * block)
+            remaining = count * block
+            while remaining > 0:
+                chunk = basis.read(min(remaining, READ_SIZE))
+                if not chunk:
+                    break
+                out.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+                remaining -= len(chunk)
+                if progress is not None:
+                    progress(len(chunk))
+        elif op == OP_LITERAL:
+            (length,) = _LITERAL.unpack(_read_exact(delta, _LITERAL.size))
+            chunk = _read_exact(delta, length)
+            out.write(chunk)
+            digest.update(chunk)
+            written += length
+            if progress is not None:
+                progress(length)
+        elif op == OP_END:
+            size, expected = _END.unpack(_read_exact(delta, _END.size))
+            if size != written or digest.digest() != expected:
+                raise ValueError("增量重建结果校验失败")
+            return written
+        elif not op:
+            raise ValueError("增量数据不完整")
+        else:
+            raise ValueError("未知的增量指令: %r" % op)
+
+
+@contextmanager
+def mapped_file(path):
+    """只读 mmap 打开本地文件；空文件返回 b""（mmap 不支持零长度映射）"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def patch_file(basis_path, target_path, delta, progress=None):
+    """
+    用增量重建文件：先写到 target 同目录下的临时文件，校验通过后原子替换 target，
+    并沿用 basis 的权限；失败时删除临时文件，target 保持不变
+    """
+    directory, name = os.path.split(os.path.abspath(target_path))
+    temp_path = os.path.join(directory, ".%s.delta-%d.part" % (name, os.getpid()))
+    try:
+        with open(basis_path, "rb") as basis, open(temp_path, "wb") as out:
+            size = apply_delta(basis, delta, out, progress)
+        os.chmod(temp_path, os.stat(basis_path).st_mode & 0o7777)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+def _main(argv):
+    command = argv[1] if len(argv) > 1 else None
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    if command == "signature" and len(argv) == 4:
+        with open(argv[2], "rb") as f:
+            stdout.write(build_signature(f, int(argv[3])).to_bytes())
+    elif command == "delta" and len(argv) == 3:
+        signature = read_signature(stdin)
+        with mapped_file(argv[2]) as data:
+            for chunk in generate_delta(data, signature):
+                stdout.write(chunk)
+    elif command == "patch" and len(argv) == 4:
+        size = patch_file(argv[2], argv[3], stdin)
+        stdout.write(json.dumps({"size": size}).encode("utf-8"))
+    else:
+        sys.stderr.write(__doc__)
+        return 2
+    stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
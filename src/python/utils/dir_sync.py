@@ -0,0 +1,370 @@
+"""
+本地目录与远程目录的镜像同步
+
+两端各生成一份清单（相对路径 -> 大小、修改时间，可选内容摘要）：本地用 os.scandir 遍历，
+远程只执行一次 find 递归列出整棵树。比较清单得出需要的上传/下载、建目录和删除操作，
+文件操作在线程池中并行执行。
+
+清单缓存记录上次同步后两端一致的文件（两端当时的大小和修改时间）以及算过的摘要，
+再次同步几乎没有变化的目录树时无需重新计算摘要，只需两次列表和一次内存比较。
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .constants import CACHE_DIR
+from .job_registry import Job, JobCancelled
+from .log_util import default_logger as logger
+
+SYNC_DIRECTIONS = ("push", "pull")  # push: 本地 -> 远程，pull: 远程 -> 本地
+DEFAULT_SYNC_WORKERS = 4
+DEFAULT_MANIFEST_CACHE_DIR = CACHE_DIR / "sync"
+HASH_READ_SIZE = 1024 * 1024
+
+# 一次 exec 列出整棵远程目录树：类型、大小、修改时间、相对路径，NUL 分隔以支持任意文件名
+REMOTE_MANIFEST_COMMAND = (
+    "cd -- {path} && find . -mindepth 1 \\( -type f -o -type d \\) -printf '%y\\t%s\\t%T@\\t%P\\0'"
+)
+# 批量计算远程文件摘要：stdin 为 NUL 分隔的相对路径，-z 输出 "摘要  路径\0" 且不转义文件名
+REMOTE_HASH_COMMAND = "cd -- {path} && xargs -0 md5sum -z --"
+
+OP_MKDIR = "mkdir"
+OP_COPY = "copy"
+OP_DELETE = "delete"
+OP_RMDIR = "rmdir"
+
+
+class Manifest:
+    """一侧目录树的清单：files 为 相对路径 -> (大小, 修改时间)，dirs 为目录相对路径集合"""
+
+    def __init__(self, files: Optional[Dict[str, Tuple[int, float]]] = None, dirs: Optional[Set[str]] = None):
+        self.files = files if files is not None else {}
+        self.dirs = dirs if dirs is not None else set()
+
+    @property
+    def total_size(self) -> int:
+        return sum(size for size, _ in self.files.values())
+
+
+def scan_local(root: str) -> Manifest:
+    """用 os.scandir 遍历本地目录（不跟随符号链接，跳过特殊文件）"""
+    manifest = Manifest()
+    if not os.path.isdir(root):
+        return manifest
+    pending = [("", root)]
+    while pending:
+        rel_dir, path = pending.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        manifest.dirs.add(rel)
+                        pending.append((rel, entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        manifest.files[rel] = (st.st_size, st.st_mtime)
+                except OSError as e:
+                    logger.warning(f"[dir_sync] scan skipped: path={entry.path} error={e}")
+    return manifest
+
+
+def parse_remote_manifest(output: bytes) -> Manifest:
+    """解析 REMOTE_MANIFEST_COMMAND 的输出"""
+    manifest = Manifest()
+    for record in output.split(b"\0"):
+        if not record:
+            continue
+        parts = record.split(b"\t", 3)
+        if len(parts) != 4:
+            continue
+        kind, size, mtime, rel = parts
+        rel = rel.decode("utf-8", errors="surrogateescape")
+        if kind == b"d":
+            manifest.dirs.add(rel)
+        elif kind == b"f":
+            manifest.files[rel] = (int(size), float(mtime))
+    return manifest
+
+
+def scan_remote_sftp(sftp, root: str) -> Manifest:
+    """远程没有 GNU find 时的兜底：用 SFTP 逐级列目录"""
+    manifest = Manifest()
+    pending = [("", root.rstrip("/") or "/")]
+    while pending:
+        rel_dir, path = pending.pop()
+        for attrs in sftp.listdir_attr(path):
+            rel = f"{rel_dir}/{attrs.filename}" if rel_dir else attrs.filename
+            if stat.S_ISDIR(attrs.st_mode):
+                manifest.dirs.add(rel)
+                pending.append((rel, f"{path.rstrip('/')}/{attrs.filename}"))
+            elif stat.S_ISREG(attrs.st_mode):
+                manifest.files[rel] = (attrs.st_size, float(attrs.st_mtime))
+    return manifest
+
+
+def hash_local_file(path: str) -> str:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_remote_hashes(output: bytes) -> Dict[str, str]:
+    """解析 md5sum -z 的输出为 相对路径 -> 摘要"""
+    hashes = {}
+    for record in output.split(b"\0"):
+        digest, sep, rel = record.partition(b"  ")
+        if sep and len(digest) == 32:
+            hashes[rel.decode("utf-8", errors="surrogateescape")] = digest.decode("ascii")
+    return hashes
+
+
+def same_mtime(a: float, b: float) -> bool:
+    """SFTP 只能设置整秒的修改时间，按整秒比较"""
+    return int(a) == int(b)
+
+
+class ManifestCache:
+    """
+    清单缓存，每对（服务器, 本地目录, 远程目录）一个 JSON 文件
+
+    pairs: 相对路径 -> [本地大小, 本地修改时间, 远程大小, 远程修改时间]，记录上次确认两端一致时的状态
+    hashes: {"local"|"remote": 相对路径 -> [大小, 修改时间, 摘要]}
+    """
+
+    def __init__(self, cache_dir, key_parts: Iterable[str]):
+        key = hashlib.sha1("\0".join(key_parts).encode("utf-8", errors="surrogateescape")).hexdigest()
+        self.path = Path(cache_dir) / f"{key}.json"
+        self.pairs: Dict[str, List[float]] = {}
+        self.hashes: Dict[str, Dict[str, List[Any]]] = {"local": {}, "remote": {}}
+        self._lock = threading.Lock()
+
+    def load(self) -> "ManifestCache":
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.pairs = data.get("pairs", {})
+            self.hashes = {side: data.get("hashes", {}).get(side, {}) for side in ("local", "remote")}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"[ManifestCache] ignoring unreadable cache {self.path}: {e}")
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with self._lock:
+            data = {"updated_at": time.time(), "pairs": self.pairs, "hashes": self.hashes}
+        temp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temp, self.path)
+
+    def in_sync(self, rel: str, local: Tuple[int, float], remote: Tuple[int, float]) -> bool:
+        pair = self.pairs.get(rel)
+        return pair is not None and pair == [local[0], local[1], remote[0], remote[1]]
+
+    def record_pair(self, rel: str, local: Tuple[int, float], remote: Tuple[int, float]):
+        with self._lock:
+            self.pairs[rel] = [local[0], local[1], remote[0], remote[1]]
+
+    def get_hash(self, side: str, rel: str, entry: Tuple[int, float]) -> Optional[str]:
+        cached = self.hashes[side].get(rel)
+        if cached and cached[0] == entry[0] and cached[1] == entry[1]:
+            return cached[2]
+        return None
+
+    def set_hash(self, side: str, rel: str, entry: Tuple[int, float], digest: str):
+        with self._lock:
+            self.hashes[side][rel] = [entry[0], entry[1], digest]
+
+    def prune(self, local: Manifest, remote: Manifest):
+        """丢弃已不存在的路径（pairs 要求两端都存在）"""
+        with self._lock:
+            self.pairs = {rel: v for rel, v in self.pairs.items() if rel in local.files and rel in remote.files}
+            self.hashes["local"] = {rel: v for rel, v in self.hashes["local"].items() if rel in local.files}
+            self.hashes["remote"] = {rel: v for rel, v in self.hashes["remote"].items() if rel in remote.files}
+
+
+class SyncPlan:
+    """同步计划：按执行顺序排列的操作，每项为 {"op", "path", "size", "reason"}"""
+
+    def __init__(self, direction: str):
+        self.direction = direction
+        self.actions: List[Dict[str, Any]] = []
+        self.conflicts: List[Dict[str, str]] = []
+        self.unchanged = 0
+
+    def add(self, op: str, path: str, size: int = 0, reason: Optional[str] = None):
+        self.actions.append({"op": op, "path": path, "size": size, "reason": reason})
+
+    def by_op(self, op: str) -> List[Dict[str, Any]]:
+        return [action for action in self.actions if action["op"] == op]
+
+    def summary(self) -> Dict[str, Any]:
+        copies = self.by_op(OP_COPY)
+        return {
+            "direction": self.direction,
+            "copy": len(copies),
+            "copy_bytes": sum(action["size"] for action in copies),
+            "mkdir": len(self.by_op(OP_MKDIR)),
+            "delete": len(self.by_op(OP_DELETE)),
+            "rmdir": len(self.by_op(OP_RMDIR)),
+            "unchanged": self.unchanged,
+            "conflicts": len(self.conflicts),
+        }
+
+
+def diff_manifests(local: Manifest, remote: Manifest, direction: str, cache: Optional[ManifestCache] = None,
+                   delete: bool = False, hashes: Optional[Dict[str, Tuple[Optional[str], Optional[str]]]] = None
+                   ) -> SyncPlan:
+    """
+    比较两端清单生成同步计划
+
+    文件视为一致的条件（依次判断）：缓存记录的两端状态未变；大小相同且修改时间（整秒）相同；
+    提供了 hashes（相对路径 -> (本地摘要, 远程摘要)）且摘要相同。
+
+    Args:
+        direction: push 以本地为准更新远程，pull 反之
+        delete: 同时删除目标端多余的文件和目录
+    """
+    if direction not in SYNC_DIRECTIONS:
+        raise ValueError(f"不支持的同步方向: {direction}")
+    source, target = (local, remote) if direction == "push" else (remote, local)
+    plan = SyncPlan(direction)
+    hashes = hashes or {}
+
+    for rel in sorted(source.dirs, key=lambda p: (p.count("/"), p)):
+        if rel in target.files:
+            plan.conflicts.append({"path": rel, "error": "目标端同名路径是文件"})
+        elif rel not in target.dirs:
+            plan.add(OP_MKDIR, rel)
+
+    for rel in sorted(source.files):
+        entry = source.files[rel]
+        if rel in target.dirs:
+            plan.conflicts.append({"path": rel, "error": "目标端同名路径是目录"})
+            continue
+        other = target.files.get(rel)
+        if other is None:
+            plan.add(OP_COPY, rel, entry[0], "new")
+            continue
+        local_entry, remote_entry = (entry, other) if direction == "push" else (other, entry)
+        if cache is not None and cache.in_sync(rel, local_entry, remote_entry):
+            plan.unchanged += 1
+        elif entry[0] == other[0] and same_mtime(entry[1], other[1]):
+            plan.unchanged += 1
+            if cache is not None:
+                cache.record_pair(rel, local_entry, remote_entry)
+        elif entry[0] == other[0] and rel in hashes and hashes[rel][0] and hashes[rel][0] == hashes[rel][1]:
+            plan.unchanged += 1
+            if cache is not None:
+                cache.record_pair(rel, local_entry, remote_entry)
+        else:
+            plan.add(OP_COPY, rel, entry[0], "modified")
+
+    if delete:
+        conflicted = {c["path"] for c in plan.conflicts}
+        for rel in sorted(set(target.files) - set(source.files) - conflicted):
+            plan.add(OP_DELETE, rel, target.files[rel][0])
+        # 目录从最深处开始删除
+        for rel in sorted(target.dirs - source.dirs - conflicted, key=lambda p: (-p.count("/"), p)):
+            plan.add(OP_RMDIR, rel)
+    return plan
+
+
+def hash_candidates(local: Manifest, remote: Manifest, cache: Optional[ManifestCache]) -> List[str]:
+    """大小相同但修改时间不同、且缓存不能确认一致的文件，需要比较摘要"""
+    candidates = []
+    for rel, entry in local.files.items():
+        other = remote.files.get(rel)
+        if other is None or other[0] != entry[0] or same_mtime(entry[1], other[1]):
+            continue
+        if cache is not None and cache.in_sync(rel, entry, other):
+            continue
+        candidates.append(rel)
+    return candidates
+
+
+def execute_plan(plan: SyncPlan, handlers: Dict[str, Callable[[Dict[str, Any]], Any]],
+                 job: Optional[Job] = None, workers: int = DEFAULT_SYNC_WORKERS) -> Dict[str, Any]:
+    """
+    执行同步计划：先逐级建目录，再并行复制和删除文件，最后由深到浅删除目录
+
+    Args:
+        handlers: 操作名 -> 处理函数(action)，缺少的操作跳过
+        job: 汇报进度；复制的字节进度由复制处理函数自行累加
+
+    Returns:
+        {"done": 成功的操作数, "failed": [{"op", "path", "error"}]}
+    """
+    failed: List[Dict[str, str]] = []
+    done = 0
+
+    def _run(action):
+        if job is not None:
+            job.check_cancelled()
+            job.current = action["path"]
+        handlers[action["op"]](action)
+        if job is not None:
+            job.file_done()
+
+    def _record(action, error):
+        logger.warning(f"[dir_sync] {action['op']} failed: path={action['path']} error={error}")
+        failed.append({"op": action["op"], "path": action["path"], "error": str(error)})
+
+    def _sequential(actions):
+        nonlocal done
+        for action in actions:
+            try:
+                _run(action)
+                done += 1
+            except JobCancelled:
+                raise
+            except Exception as e:
+                _record(action, e)
+
+    if job is not None:
+        job.add_total(nbytes=sum(a["size"] for a in plan.by_op(OP_COPY)),
+                      files=len([a for a in plan.actions if a["op"] in handlers]))
+    _sequential([a for a in plan.by_op(OP_MKDIR) if OP_MKDIR in handlers])
+
+    parallel = [a for a in plan.actions if a["op"] in (OP_COPY, OP_DELETE) and a["op"] in handlers]
+    # 大文件先开始，减少最后只剩一个大文件在传的尾部时间
+    parallel.sort(key=lambda a: -a["size"])
+    if parallel:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="sync") as executor:
+            futures = [(executor.submit(_run, action), action) for action in parallel]
+            cancelled = False
+            for future, action in futures:
+                try:
+                    future.result()
+                    done += 1
+                except JobCancelled:
+                    if not cancelled:
+                        cancelled = True
+                        for pending, _ in futures:
+                            pending.cancel()
+                except Exception as e:
+                    if not future.cancelled():
+                        _record(action, e)
+            if cancelled:
+                raise JobCancelled()
+
+    _sequential([a for a in plan.by_op(OP_RMDIR) if OP_RMDIR in handlers])
+    return {"done": done, "failed": failed}
+
+
+def join_rel(root: str, rel: str, sep: str = "/") -> str:
+    """把清单中的相对路径拼到根目录下"""
+    if sep == "/":
+        return posixpath.join(root, rel)
+    return os.path.join(root, *rel.split("/"))
@@ -0,0 +1,369 @@
+"""
+远程文件下载的本地磁盘缓存
+
+缓存文件以（服务器, 远程路径）的摘要命名，文件本身就是索引：大小和修改时间（设为远程文件的
+修改时间）用来校验缓存是否仍与远程一致，访问时间记录最近一次命中，启动后按访问时间恢复 LRU 顺序，
+不需要单独的索引文件。缓存文件被外部删除时只是下一次未命中。
+
+- 容量按总字节数限制，超出时从最久未访问的条目开始淘汰；单个文件超过 max_entry_bytes 不缓存
+- 填充不单独下载：完整的流式响应边发给客户端边写入同目录下的 .part 文件（CacheFill），
+  写完且大小一致才原子改名为缓存文件，读者不会看到写了一半的文件，首字节也不必等整个文件
+- 同一文件同时只有一个请求写缓存；其余请求跟随读取正在增长的 .part 文件（follow），
+  填充失败或长时间没有新数据时由调用方改为直接从远程读取剩余部分
+- 被淘汰的文件若正被读取，已打开的句柄不受影响（POSIX 上 unlink 只删除目录项）
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional
+
+from .constants import CACHE_DIR
+from .log_util import default_logger as logger
+
+DEFAULT_DOWNLOAD_CACHE_DIR = CACHE_DIR / "downloads"
+DEFAULT_DOWNLOAD_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+# 未完成的 .part 文件和下载临时文件超过该时长未修改视为残留，启动时清理
+STALE_TEMP_AGE = 3600
+# 跟随读取时超过该秒数没有新数据就放弃跟随（填充方的客户端可能读得很慢）
+FOLLOW_STALL_TIMEOUT = 10.0
+CACHE_READ_SIZE = 1024 * 1024
+PART_SUFFIX = ".part"
+
+
+def cleanup_temp_files(directory, prefix: str = "", suffix: str = "", max_age: float = STALE_TEMP_AGE) -> int:
+    """删除目录下符合前缀/后缀且超过 max_age 秒未修改的普通文件，返回删除的个数"""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not (entry.name.startswith(prefix) and entry.name.endswith(suffix)):
+            continue
+        try:
+            if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"[download_cache] remove stale temp file failed: path={entry.path} error={e}")
+    if removed:
+        logger.info(f"[download_cache] removed {removed} stale temp files from {directory}")
+    return removed
+
+
+class CachedFileStream:
+    """
+    读缓存文件的响应体，接口与 RemoteFileStream 一致（size/mtime/path/set_range/close）
+
+    path 为远程路径，用于生成下载文件名。
+    """
+
+    def __init__(self, file_obj: BinaryIO, path: str, size: int, mtime: int, chunk_size: int = CACHE_READ_SIZE):
+        self.file_obj = file_obj
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.chunk_size = chunk_size
+        self.start = 0
+        self.end = size
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    def set_range(self, start: int, end: int):
+        self.start = max(0, start)
+        self.end = min(end, self.size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            self.file_obj.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                data = self.file_obj.read(min(self.chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        finally:
+            self.close()
+
+    def close(self):
+        self.file_obj.close()
+
+
+class CacheFill:
+    """
+    一次进行中的缓存填充：调用方按顺序 write 数据，写满后 commit，任何失败 abort
+
+    跟随者通过 read_at 读取已写入的部分，新数据到达时被唤醒。
+    """
+
+    def __init__(self, cache: "DownloadCache", name: str, path: str, size: int, mtime: int):
+        self.cache = cache
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        fd, self.part = tempfile.mkstemp(prefix=f"{name}.", suffix=PART_SUFFIX, dir=cache.cache_dir)
+        self._fd: Optional[int] = fd
+        self.written = 0
+        self.finished = False
+        self._cond = threading.Condition()
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            n = os.write(self._fd, view)
+            view = view[n:]
+        with self._cond:
+            self.written += len(data)
+            self._cond.notify_all()
+
+    def commit(self):
+        """大小一致时改名为缓存文件并登记，否则视为失败"""
+        if self.written != self.size:
+            raise IOError(f"写入缓存的大小与远程不一致: {self.path} written={self.written} size={self.size}")
+        os.close(self._fd)
+        self._fd = None
+        os.utime(self.part, (time.time(), self.mtime))
+        self.cache._commit(self)
+        self._finish()
+        logger.info(f"[DownloadCache] filled: path={self.path} size={self.size}")
+
+    def abort(self):
+        if self.finished:
+            return
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        try:
+            os.remove(self.part)
+        except OSError:
+            pass
+        self.cache._unregister(self)
+        self._finish()
+        logger.info(f"[DownloadCache] fill aborted: path={self.path} written={self.written}/{self.size}")
+
+    def _finish(self):
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def read_at(self, fd: int, position: int, n: int, timeout: float = FOLLOW_STALL_TIMEOUT) -> bytes:
+        """
+        从跟随者自己打开的 fd 读取 position 处最多 n 字节，数据未写到时等待
+
+        填充已中止或 timeout 秒内没有新数据时返回 b""，调用方改从远程读取。
+        """
+        with self._cond:
+            if self.written <= position and not self.finished:
+                self._cond.wait(timeout)
+            available = self.written - position
+        if available <= 0:
+            return b""
+        return os.pread(fd, min(n, available), position)
+
+
+class DownloadCache:
+    """
+    按总字节数做 LRU 淘汰的下载缓存
+
+    max_bytes 为 0 时缓存关闭，fits() 总是返回 False。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_DOWNLOAD_CACHE_DIR, max_bytes: int = DEFAULT_DOWNLOAD_CACHE_BYTES,
+                 max_entry_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        # 默认单个文件不超过总容量的四分之一，避免一个大文件把缓存清空
+        self.max_entry_bytes = max_bytes // 4 if max_entry_bytes is None else min(max_entry_bytes, max_bytes)
+        # 文件名 -> 大小，按访问先后排列，最久未访问的在前；首次使用时从磁盘恢复
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._fills: Dict[str, CacheFill] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.bytes_served = 0
+        self.bytes_filled = 0
+
+    @staticmethod
+    def entry_name(server_key: Iterable[Any], path: str) -> str:
+        parts = [str(part) for part in server_key] + [path]
+        return hashlib.sha256("\0".join(parts).encode("utf-8", errors="surrogateescape")).hexdigest()
+
+    def fits(self, size: int) -> bool:
+        return self.max_bytes > 0 and 0 <= size <= self.max_entry_bytes
+
+    def load(self):
+        """扫描缓存目录：清理残留的 .part 文件，按访问时间恢复 LRU 顺序，超出容量的部分淘汰"""
+        with self._lock:
+            self._load_locked()
+
+    def _load_locked(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cleanup_temp_files(self.cache_dir, suffix=PART_SUFFIX)
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if len(entry.name) != 64 or not entry.is_file(follow_symlinks=False):
+                continue
+            st = entry.stat(follow_symlinks=False)
+            found.append((st.st_atime, entry.name, st.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total += size
+        self._evict_locked()
+        logger.info(f"[DownloadCache] loaded {len(self._entries)} entries ({self._total} bytes) from {self.cache_dir}")
+
+    def lookup(self, server_key: Iterable[Any], path: str, size: int, mtime: float) -> Optional[BinaryIO]:
+        """只查缓存：与远程 (size, mtime) 一致时打开并计一次命中，否则计一次未命中并返回 None"""
+        name = self.entry_name(server_key, path)
+        with self._lock:
+            self._load_locked()
+            file_obj = self._open_valid(name, size, int(mtime))
+            if file_obj is not None:
+                self.hits += 1
+                self.bytes_served += size
+            else:
+                self.misses += 1
+            return file_obj
+
+    def begin_fill(self, server_key: Iterable[Any], path: str, size: int, mtime: float) -> Optional[CacheFill]:
+        """
+        开始边下载边写缓存；该文件已有请求在填充时返回 None
+
+        调用方必须以 commit 或 abort 结束返回的 CacheFill。
+        """
+        name = self.entry_name(server_key, path)
+        with self._lock:
+            self._load_locked()
+            if name in self._fills:
+                return None
+            self._evict_locked(reserve=size)
+            fill = CacheFill(self, name, path, size, int(mtime))
+            self._fills[name] = fill
+            return fill
+
+    def follow(self, server_key: Iterable[Any], path: str, size: int, mtime: float,
+               chunk_size: int = CACHE_READ_SIZE, timeout: float = FOLLOW_STALL_TIMEOUT) -> Iterator[bytes]:
+        """
+        跟随同一文件正在进行的填充，从头按块产出已写入的数据
+
+        没有进行中的填充、或填充的 (size, mtime) 与远程不一致时直接结束；填充中止或停滞时
+        产出已有的部分后结束，调用方从已收到的字节数处改从远程读取剩余部分。
+        """
+        name = self.entry_name(server_key, path)
+        with self._lock:
+            fill = self._fills.get(name)
+            if fill is None or (fill.size, fill.mtime) != (size, int(mtime)):
+                return
+            # 在锁内打开，避免 .part 恰好被改名；打开后改名或删除都不影响读取
+            fd = os.open(fill.part, os.O_RDONLY)
+            self.shared += 1
+        logger.info(f"[DownloadCache] following concurrent fill: path={path}")
+        try:
+            position = 0
+            while position < size:
+                data = fill.read_at(fd, position, chunk_size, timeout)
+                if not data:
+                    logger.info(f"[DownloadCache] stopped following fill: path={path} position={position}")
+                    return
+                position += len(data)
+                with self._lock:
+                    self.bytes_served += len(data)
+                yield data
+        finally:
+            os.close(fd)
+
+    def _commit(self, fill: CacheFill):
+        with self._lock:
+            os.replace(fill.part, self.cache_dir / fill.name)
+            self._fills.pop(fill.name, None)
+            self._drop(fill.name)
+            self._entries[fill.name] = fill.size
+            self._total += fill.size
+            self.bytes_filled += fill.size
+            self._evict_locked()
+
+    def _unregister(self, fill: CacheFill):
+        with self._lock:
+            if self._fills.get(fill.name) is fill:
+                del self._fills[fill.name]
+
+    def _open_valid(self, name: str, size: int, mtime: int) -> Optional[BinaryIO]:
+        """缓存文件存在且大小、修改时间与远程一致时打开并记一次访问，不一致时删除"""
+        target = self.cache_dir / name
+        try:
+            file_obj = open(target, "rb")
+        except FileNotFoundError:
+            self._drop(name)
+            return None
+        st = os.fstat(file_obj.fileno())
+        if st.st_size == size and int(st.st_mtime) == mtime:
+            os.utime(target, (time.time(), st.st_mtime))
+            if name not in self._entries:
+                self._total += size
+            self._entries[name] = size
+            self._entries.move_to_end(name)
+            return file_obj
+        file_obj.close()
+        logger.info(f"[DownloadCache] stale entry discarded: name={name} cached=({st.st_size}, {int(st.st_mtime)}) "
+                    f"remote=({size}, {mtime})")
+        self._remove(name)
+        return None
+
+    def _drop(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total -= size
+
+    def _remove(self, name: str):
+        self._drop(name)
+        try:
+            os.remove(self.cache_dir / name)
+        except FileNotFoundError:
+            pass
+
+    def _evict_locked(self, reserve: int = 0):
+        while self._entries and self._total + reserve > self.max_bytes:
+            name = next(iter(self._entries))
+            self._remove(name)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._load_locked()
+            for name in list(self._entries):
+                self._remove(name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_bytes > 0,
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "filling": len(self._fills),
+                "bytes_served": self.bytes_served,
+                "bytes_filled": self.bytes_filled,
+            }
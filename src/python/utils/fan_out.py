@@ -0,0 +1,70 @@
+"""
+多服务器并发执行
+
+同一操作在多台服务器上并发执行，按完成先后逐个产出结果；每个任务单独计时，
+慢主机超时后直接报告超时，不会拖住其余主机。总耗时约等于最慢（或超时）的那台。
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator
+
+from .log_util import default_logger as logger
+
+DEFAULT_FAN_OUT_TIMEOUT = 30.0
+# 接口允许的单台服务器超时上限（秒）
+MAX_FAN_OUT_TIMEOUT = 300.0
+DEFAULT_FAN_OUT_WORKERS = 16
+
+
+def fan_out(
+    tasks: Dict[str, Callable[[], Any]],
+    timeout: float = DEFAULT_FAN_OUT_TIMEOUT,
+    max_workers: int = DEFAULT_FAN_OUT_WORKERS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    并发执行 tasks，按完成顺序产出 {"key", "elapsed", "result"} 或 {"key", "elapsed", "error"}
+
+    Args:
+        tasks: 键 -> 无参可调用对象
+        timeout: 单个任务从开始执行算起的超时秒数（排队时间不计入）
+        max_workers: 最大并发线程数
+
+    超时任务的线程无法被强行终止，会在后台自行结束，其结果被丢弃。
+    """
+    if not tasks:
+        return
+    started: Dict[str, float] = {}
+
+    def _run(key, func):
+        started[key] = time.monotonic()
+        return func()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))), thread_name_prefix="fan-out")
+    futures = {executor.submit(_run, key, func): key for key, func in tasks.items()}
+    pending = set(futures)
+    try:
+        while pending:
+            now = time.monotonic()
+            deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else timeout
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                key = futures[future]
+                elapsed = time.monotonic() - started.get(key, now)
+                try:
+                    yield {"key": key, "elapsed": elapsed, "result": future.result()}
+                except Exception as e:
+                    logger.warning(f"[fan_out] task failed: key={key} error={e}")
+                    yield {"key": key, "elapsed": elapsed, "error": str(e)}
+            now = time.monotonic()
+            for future in list(pending):
+                key = futures[future]
+                if key in started and now - started[key] >= timeout and not future.done():
+                    pending.discard(future)
+                    logger.warning(f"[fan_out] task timed out: key={key} timeout={timeout}")
+                    yield {"key": key, "elapsed": now - started[key], "error": f"超时（{timeout:g} 秒）"}
+    finally:
+        # 调用方提前停止迭代（如客户端断开）时取消尚未开始的任务
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,345 @@
+"""
+同一主机上的复制和移动，数据不离开它所在的主机
+
+本地：
+- 移动用 os.rename，跨文件系统（EXDEV）时先复制再删除源
+- 复制文件优先 os.copy_file_range，在支持的文件系统上为 reflink 或服务器端复制（btrfs、XFS、NFS 4.2 等），
+  不支持时退回 os.sendfile，最后才是普通读写；前两种数据都不经过用户态
+远程：
+- 移动用 SFTP rename，失败（如跨文件系统）时在远程执行 mv
+- 复制文件优先 SFTP copy-data 扩展（OpenSSH 9.0 起的 sftp-server 支持），由服务器在本机完成复制；
+  服务器不支持时在远程执行 cp --reflink=auto
+- 复制目录树优先一次 cp -a --reflink=auto，失败时经 SFTP 遍历，建目录、逐个文件 copy-data
+
+目标路径必须不存在，不覆盖已有文件；目录不能复制或移动到它自己里面。
+复制失败或被取消时删除已经写出的目标。
+"""
+
+import errno
+import os
+import posixpath
+import shlex
+import shutil
+import stat
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from paramiko import SFTPClient
+from paramiko.sftp import CMD_EXTENDED, CMD_STATUS, SFTP_OK, SFTP_OP_UNSUPPORTED, SFTPError, int64
+
+from .bulk_delete import delete_local, delete_remote
+from .job_registry import Job
+from .log_util import default_logger as logger
+from .remote_listing import request_reply
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# copy_file_range 对这些错误表示当前文件系统组合不支持，换 sendfile；sendfile 同理换普通读写
+COPY_FALLBACK_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM}
+COPY_DATA_EXTENSION = "copy-data"
+# 错误信息并入 stdout，一次读完
+CP_COMMAND = "cp -a --reflink=auto -- {src} {dst} 2>&1"
+MV_COMMAND = "mv -- {src} {dst} 2>&1"
+
+
+class CopyDataUnsupported(Exception):
+    """SFTP 服务器不支持 copy-data 扩展"""
+
+
+def _check_target(src: str, dst: str, src_is_dir: bool, dst_exists: bool, sep: str):
+    if dst_exists:
+        raise FileExistsError(f"目标已存在: {dst}")
+    if src_is_dir and (dst + sep).startswith(src.rstrip(sep) + sep):
+        raise ValueError("不能把目录复制或移动到它自己里面")
+
+
+def _progress(job: Optional[Job], nbytes: int):
+    if job is not None:
+        job.check_cancelled()
+        job.add_bytes(nbytes)
+
+
+def copy_fd(fd_in: int, fd_out: int, job: Optional[Job] = None) -> str:
+    """
+    把 fd_in 从当前位置到末尾的内容写到 fd_out，返回实际使用的方式
+
+    依次尝试 copy_file_range、sendfile、read/write，前一种在第一块就报不支持时换下一种。
+    """
+    methods = [name for name in ("copy_file_range", "sendfile") if hasattr(os, name)] + ["read"]
+    start_in = os.lseek(fd_in, 0, os.SEEK_CUR)
+    start_out = os.lseek(fd_out, 0, os.SEEK_CUR)
+    for method in methods:
+        copied = 0
+        try:
+            while True:
+                if method == "copy_file_range":
+                    n = os.copy_file_range(fd_in, fd_out, COPY_CHUNK_SIZE)
+                elif method == "sendfile":
+                    n = os.sendfile(fd_out, fd_in, None, COPY_CHUNK_SIZE)
+                else:
+                    n = os.write(fd_out, os.read(fd_in, COPY_CHUNK_SIZE))
+                if n == 0:
+                    return method
+                copied += n
+                _progress(job, n)
+        except OSError as e:
+            if copied or e.errno not in COPY_FALLBACK_ERRNOS or method == "read":
+                raise
+            os.lseek(fd_in, start_in, os.SEEK_SET)
+            os.lseek(fd_out, start_out, os.SEEK_SET)
+    return methods[-1]
+
+
+def copy_file_local(src: str, dst: str, job: Optional[Job] = None) -> str:
+    """复制单个文件及其权限和时间，dst 已存在时报错；返回 copy_fd 使用的方式"""
+    with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+        method = copy_fd(fsrc.fileno(), fdst.fileno(), job)
+    shutil.copystat(src, dst)
+    return method
+
+
+def copy_local(src: str, dst: str, job: Optional[Job] = None) -> Dict[str, Any]:
+    """
+    复制本地文件或目录树，符号链接复制为链接
+
+    Returns:
+        {"success", "path", "files", "bytes", "method"}
+    """
+    st = os.lstat(src)
+    is_dir = stat.S_ISDIR(st.st_mode)
+    _check_target(src, dst, is_dir, os.path.lexists(dst), os.sep)
+    dirs: List[Tuple[str, str]] = []
+    files: List[Tuple[str, str, int]] = []
+    if is_dir:
+        for dirpath, dirnames, filenames in os.walk(src):
+            target = os.path.join(dst, os.path.relpath(dirpath, src))
+            dirs.append((dirpath, os.path.normpath(target)))
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                child = os.lstat(path)
+                # 指向目录的链接也在 dirnames 中，os.walk 不进入它们，这里当作链接复制
+                if not stat.S_ISDIR(child.st_mode):
+                    size = child.st_size if stat.S_ISREG(child.st_mode) else 0
+                    files.append((path, os.path.join(target, name), size))
+    else:
+        files.append((src, dst, st.st_size))
+    if job is not None:
+        job.add_total(sum(size for _, _, size in files), len(files))
+
+    method = "copy_file_range"
+    copied = 0
+    try:
+        for _, target in dirs:
+            os.mkdir(target)
+        for path, target, size in files:
+            if job is not None:
+                job.current = path
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), target)
+            elif os.path.isfile(path):
+                method = copy_file_local(path, target, job)
+                copied += size
+            if job is not None:
+                job.file_done()
+        # 写入内容会改变目录的修改时间，最后由深到浅恢复
+        for path, target in reversed(dirs):
+            shutil.copystat(path, target)
+    except BaseException:
+        if os.path.lexists(dst):
+            delete_local([dst])
+        raise
+    logger.info(f"[file_copy] local copy done: {src} -> {dst} files={len(files)} bytes={copied} method={method}")
+    return {"success": True, "path": dst, "files": len(files), "bytes": copied, "method": method}
+
+
+def move_local(src: str, dst: str, job: Optional[Job] = None) -> Dict[str, Any]:
+    """移动本地文件或目录树：同一文件系统内 rename，否则复制后删除源"""
+    st = os.lstat(src)
+    _check_target(src, dst, stat.S_ISDIR(st.st_mode), os.path.lexists(dst), os.sep)
+    try:
+        os.rename(src, dst)
+        logger.info(f"[file_copy] local rename: {src} -> {dst}")
+        return {"success": True, "path": dst, "method": "rename"}
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    result = copy_local(src, dst, job)
+    deleted = delete_local([src])
+    if not deleted["success"]:
+        raise OSError(f"已复制到 {dst}，但删除源失败: {deleted['error']}")
+    result["method"] = "copy+delete"
+    return result
+
+
+def sftp_copy_data(sftp, src: str, dst: str, attrs=None):
+    """
+    用 copy-data 扩展在服务器上复制单个文件，dst 已存在时报错；attrs 为源文件属性，用于保留权限和时间
+
+    服务器不支持（或不是 paramiko 的 SFTPClient）时抛出 CopyDataUnsupported，不留下目标文件。
+    """
+    if not isinstance(sftp, SFTPClient):
+        raise CopyDataUnsupported()
+    attrs = attrs or sftp.stat(src)
+    with sftp.open(src, "rb") as fsrc:
+        # paramiko 的 x 只加 CREATE|EXCL，写权限要靠 w
+        with sftp.open(dst, "wx") as fdst:
+            # 读偏移 0、长度 0（到文件末尾），写偏移 0
+            t, msg = request_reply(sftp, CMD_EXTENDED, COPY_DATA_EXTENSION, fsrc.handle, int64(0), int64(0),
+                                   fdst.handle, int64(0))
+            error = None
+            if t != CMD_STATUS:
+                error = SFTPError(f"意外的 SFTP 应答: {t}")
+            else:
+                # 按状态码判断是否支持，错误描述由服务器给出，措辞因实现和语言而异
+                position = msg.packet.tell()
+                code = msg.get_int()
+                if code == SFTP_OP_UNSUPPORTED:
+                    error = CopyDataUnsupported()
+                elif code != SFTP_OK:
+                    msg.packet.seek(position)
+                    try:
+                        sftp._convert_status(msg)
+                    except (IOError, EOFError) as e:
+                        error = e
+        if error is not None:
+            sftp.remove(dst)
+            raise error
+    sftp.chmod(dst, stat.S_IMODE(attrs.st_mode))
+    sftp.utime(dst, (attrs.st_atime, attrs.st_mtime))
+
+
+def _exec(conn, command: str) -> Tuple[int, str]:
+    stdin, stdout, stderr = conn.exec_command(command)
+    channel = stdout.channel
+    try:
+        output = stdout.read().decode("utf-8", errors="replace").strip()
+        return channel.recv_exit_status(), output
+    finally:
+        channel.close()
+
+
+def _copy_sftp_tree(sftp, src: str, dst: str, job: Optional[Job]) -> int:
+    """经 SFTP 遍历复制目录树，文件内容由 copy-data 在服务器上复制；返回复制的字节数"""
+    dirs = [(src, dst, sftp.stat(src))]
+    files = []
+    pending = [(src, dst)]
+    while pending:
+        path, target = pending.pop()
+        for attr in sftp.listdir_attr(path):
+            child, child_target = posixpath.join(path, attr.filename), posixpath.join(target, attr.filename)
+            if stat.S_ISDIR(attr.st_mode):
+                dirs.append((child, child_target, attr))
+                pending.append((child, child_target))
+            elif stat.S_ISREG(attr.st_mode) or stat.S_ISLNK(attr.st_mode):
+                files.append((child, child_target, attr))
+    if job is not None:
+        job.add_total(sum(attr.st_size for _, _, attr in files if stat.S_ISREG(attr.st_mode)), len(files))
+    for _, target, _ in dirs:
+        sftp.mkdir(target)
+    copied = 0
+    for path, target, attr in files:
+        if job is not None:
+            job.check_cancelled()
+            job.current = path
+        if stat.S_ISLNK(attr.st_mode):
+            sftp.symlink(sftp.readlink(path), target)
+        else:
+            sftp_copy_data(sftp, path, target, attr)
+            copied += attr.st_size
+            _progress(job, attr.st_size)
+        if job is not None:
+            job.file_done()
+    for _, target, attr in reversed(dirs):
+        sftp.chmod(target, stat.S_IMODE(attr.st_mode))
+        sftp.utime(target, (attr.st_atime, attr.st_mtime))
+    return copied
+
+
+def _lexists_remote(sftp, path: str) -> bool:
+    try:
+        sftp.lstat(path)
+        return True
+    except IOError:
+        return False
+
+
+def _remove_partial(conn, dst: str):
+    """删除复制失败时留下的目标"""
+    if _lexists_remote(conn.sftp, dst):
+        delete_remote(conn, [dst], "sftp")
+
+
+def copy_remote(conn, src: str, dst: str, job: Optional[Job] = None,
+                no_copy_data: Optional[Set[Any]] = None) -> Dict[str, Any]:
+    """
+    在远程主机上复制文件或目录树
+
+    Args:
+        conn: 连接池中的连接，需要 sftp、exec_command 和 key
+        no_copy_data: 已知不支持 copy-data 的服务器（conn.key）集合，发现不支持时加入
+
+    Returns:
+        {"success", "path", "method"}，method 为 copy-data、cp 或 sftp
+    """
+    sftp = conn.sftp
+    attrs = sftp.lstat(src)
+    is_dir = stat.S_ISDIR(attrs.st_mode)
+    _check_target(src, dst, is_dir, _lexists_remote(sftp, dst), "/")
+    no_copy_data = no_copy_data if no_copy_data is not None else set()
+    if job is not None:
+        job.current = src
+
+    if stat.S_ISLNK(attrs.st_mode):
+        sftp.symlink(sftp.readlink(src), dst)
+        return {"success": True, "path": dst, "method": "sftp"}
+    if not is_dir and conn.key not in no_copy_data:
+        if job is not None:
+            job.add_total(attrs.st_size, 1)
+        try:
+            sftp_copy_data(sftp, src, dst, attrs)
+            _progress(job, attrs.st_size)
+            if job is not None:
+                job.file_done()
+            logger.info(f"[file_copy] remote copy-data: {conn.key} {src} -> {dst} bytes={attrs.st_size}")
+            return {"success": True, "path": dst, "method": "copy-data"}
+        except CopyDataUnsupported:
+            logger.warning(f"[file_copy] copy-data unsupported on {conn.key}, using cp")
+            no_copy_data.add(conn.key)
+
+    status, output = _exec(conn, CP_COMMAND.format(src=shlex.quote(src), dst=shlex.quote(dst)))
+    if status == 0:
+        logger.info(f"[file_copy] remote cp: {conn.key} {src} -> {dst}")
+        return {"success": True, "path": dst, "method": "cp"}
+    _remove_partial(conn, dst)
+    error = output or f"cp 退出码 {status}"
+    if not is_dir or conn.key in no_copy_data:
+        raise OSError(error)
+
+    logger.warning(f"[file_copy] cp failed (exit {status}), copying over sftp: {error}")
+    try:
+        copied = _copy_sftp_tree(sftp, src, dst, job)
+    except CopyDataUnsupported as e:
+        no_copy_data.add(conn.key)
+        _remove_partial(conn, dst)
+        raise OSError(f"{error}（服务器也不支持 {COPY_DATA_EXTENSION}）") from e
+    except BaseException:
+        _remove_partial(conn, dst)
+        raise
+    logger.info(f"[file_copy] remote sftp tree copy: {conn.key} {src} -> {dst} bytes={copied}")
+    return {"success": True, "path": dst, "bytes": copied, "method": "sftp"}
+
+
+def move_remote(conn, src: str, dst: str) -> Dict[str, Any]:
+    """在远程主机上移动文件或目录树：SFTP rename，失败时在远程执行 mv（可跨文件系统）"""
+    sftp = conn.sftp
+    attrs = sftp.lstat(src)
+    _check_target(src, dst, stat.S_ISDIR(attrs.st_mode), _lexists_remote(sftp, dst), "/")
+    try:
+        sftp.rename(src, dst)
+        logger.info(f"[file_copy] remote rename: {conn.key} {src} -> {dst}")
+        return {"success": True, "path": dst, "method": "rename"}
+    except IOError as e:
+        logger.warning(f"[file_copy] sftp rename failed, using mv: {src} -> {dst} error={e}")
+    status, output = _exec(conn, MV_COMMAND.format(src=shlex.quote(src), dst=shlex.quote(dst)))
+    if status != 0:
+        raise OSError(output or f"mv 退出码 {status}")
+    logger.info(f"[file_copy] remote mv: {conn.key} {src} -> {dst}")
+    return {"success": True, "path": dst, "method": "mv"}
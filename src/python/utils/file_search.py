@@ -0,0 +1,80 @@
+"""
+按文件名查找
+
+本地的 LocalFileService.search_files 直接调用 find；远程辅助进程（utils/remote_agent.py）在远程主机上
+调用同一个 find，结果格式相同，再由 search_result 转换为 search_files 的返回值。
+
+本模块只依赖标准库且兼容 Python 3.6，随辅助进程一起上传到远程主机。
+"""
+
+import fnmatch
+import os
+import stat
+
+DEFAULT_FIND_LIMIT = 1000
+MAX_FIND_LIMIT = 10000
+
+# search_files 的 kind 参数 -> find 的类型字符
+SEARCH_KINDS = {None: None, "file": "f", "dir": "d"}
+
+
+def entry_kind(st):
+    """stat 结果对应的类型字符：d 目录、l 符号链接、其余为 f"""
+    if stat.S_ISDIR(st.st_mode):
+        return "d"
+    if stat.S_ISLNK(st.st_mode):
+        return "l"
+    return "f"
+
+
+def stat_entry(entry):
+    """跟随符号链接的 stat，失效的链接返回链接自身的 lstat"""
+    try:
+        return entry.stat()
+    except OSError:
+        return entry.stat(follow_symlinks=False)
+
+
+def find(path, pattern, kind=None, limit=DEFAULT_FIND_LIMIT, ignore_case=True):
+    """
+    在目录树中按文件名通配符查找，返回 {"entries": [[相对路径, 类型字符, 大小, 修改时间]], "truncated": bool}
+
+    不进入指向目录的符号链接，避免循环；kind 为 "f" 或 "d" 时只返回该类型。
+    """
+    if ignore_case:
+        pattern = pattern.lower()
+    entries = []
+    pending = [("", path)]
+    while pending:
+        rel_dir, current = pending.pop()
+        try:
+            it = os.scandir(current)
+        except OSError:
+            continue
+        with it:
+            for entry in sorted(it, key=lambda e: e.name):
+                rel = rel_dir + "/" + entry.name if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    st = stat_entry(entry)
+                except OSError:
+                    continue
+                if is_dir:
+                    pending.append((rel, entry.path))
+                name = entry.name.lower() if ignore_case else entry.name
+                found_kind = entry_kind(st)
+                if fnmatch.fnmatchcase(name, pattern) and kind in (None, found_kind):
+                    if len(entries) >= limit:
+                        return {"entries": entries, "truncated": True}
+                    entries.append([rel, found_kind, st.st_size, int(st.st_mtime)])
+    return {"entries": entries, "truncated": False}
+
+
+def search_result(root, found, join):
+    """把 find 的结果转换为 search_files 的返回值，join 为所在一端的路径拼接函数"""
+    entries = [
+        {"path": join(root, rel), "name": rel.rsplit("/", 1)[-1], "type": "dir" if kind == "d" else "file",
+         "size": size, "mtime": mtime}
+        for rel, kind, size, mtime in found["entries"]
+    ]
+    return {"success": True, "path": root, "entries": entries, "truncated": found["truncated"]}
@@ -0,0 +1,226 @@
+"""
+远程服务器健康监测
+
+后台线程定期并发探测配置中的每台服务器：
+- TCP 连接耗时（约等于一次 RTT）
+- 收到 SSH 标识行的耗时（sshd 负载高、DNS 反查慢时明显变大）
+- 连接池里有空闲会话时，在其上发一次 keepalive 全局请求，测已认证会话的往返时间
+
+结果连同最近的失败记录、由实际传输估算的吞吐量一起通过 /api/remote_servers 返回。
+连续失败 HEALTH_DOWN_AFTER 次的服务器标记为 down，连接池新建连接时直接报错而不是等待连接超时。
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from .fan_out import fan_out
+from .log_util import default_logger as logger
+from .ssh_pool import server_key
+
+DEFAULT_HEALTH_INTERVAL = 30.0
+DEFAULT_PROBE_TIMEOUT = 5.0
+# 连续失败多少次判定为不可用
+HEALTH_DOWN_AFTER = 2
+# 每台服务器保留的最近失败记录数
+HEALTH_FAILURE_HISTORY = 10
+# RTT 与吞吐量的指数平滑系数（新样本的权重）
+HEALTH_SMOOTHING = 0.3
+# 小于该字节数的传输不参与吞吐量估算，握手和往返占比太大
+THROUGHPUT_MIN_BYTES = 1024 * 1024
+# SSH 标识行之前允许的其他行的总长度（RFC 4253 允许服务器先发送若干行文本）
+BANNER_MAX_BYTES = 8 * 1024
+
+HEALTH_UNKNOWN = "unknown"
+HEALTH_UP = "up"
+HEALTH_UNSTABLE = "unstable"
+HEALTH_DOWN = "down"
+
+
+def probe_ssh(host: str, port: int, timeout: float = DEFAULT_PROBE_TIMEOUT) -> Tuple[float, float, str]:
+    """
+    建立 TCP 连接并读取 SSH 标识行，不做密钥交换
+
+    Returns:
+        (TCP 连接耗时, 连接后收到标识行的耗时, 标识行)，耗时单位为秒
+    """
+    started = time.monotonic()
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        connected = time.monotonic()
+        data = b""
+        while True:
+            lines = data.split(b"\n")
+            for line in lines[:-1]:
+                if line.startswith(b"SSH-"):
+                    banner = line.rstrip(b"\r").decode("utf-8", errors="replace")
+                    return connected - started, time.monotonic() - connected, banner
+            if len(data) > BANNER_MAX_BYTES:
+                raise ConnectionError("未收到 SSH 标识")
+            chunk = sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("连接被关闭，未收到 SSH 标识")
+            data += chunk
+
+
+def _smooth(old: Optional[float], sample: float) -> float:
+    return sample if old is None else (1 - HEALTH_SMOOTHING) * old + HEALTH_SMOOTHING * sample
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class ServerHealth:
+    """单台服务器的探测结果"""
+
+    def __init__(self):
+        self.status = HEALTH_UNKNOWN
+        self.tcp_rtt: Optional[float] = None
+        self.banner_time: Optional[float] = None
+        self.session_rtt: Optional[float] = None
+        self.banner: Optional[str] = None
+        self.throughput: Optional[float] = None
+        self.last_probe: Optional[float] = None
+        self.last_ok: Optional[float] = None
+        self.consecutive_failures = 0
+        self.failures: Deque[Tuple[float, str]] = deque(maxlen=HEALTH_FAILURE_HISTORY)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "rtt_ms": _ms(self.tcp_rtt),
+            "banner_ms": _ms(self.banner_time),
+            "session_rtt_ms": _ms(self.session_rtt),
+            "banner": self.banner,
+            "bytes_per_sec": round(self.throughput, 1) if self.throughput is not None else None,
+            "last_probe": self.last_probe,
+            "last_ok": self.last_ok,
+            "consecutive_failures": self.consecutive_failures,
+            "recent_failures": [{"time": at, "error": error} for at, error in self.failures],
+        }
+
+
+class HealthMonitor:
+    """
+    定期探测所有配置的服务器
+
+    未调用 start() 时不做任何探测，所有服务器为 unknown，也不会拦截连接。
+    """
+
+    def __init__(self, config_store, pool=None, interval: float = DEFAULT_HEALTH_INTERVAL,
+                 timeout: float = DEFAULT_PROBE_TIMEOUT, session_probe: bool = True):
+        self.config_store = config_store
+        self.pool = pool
+        self.interval = interval
+        self.timeout = timeout
+        self.session_probe = session_probe
+        self._health: Dict[Tuple[str, int, str], ServerHealth] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="health-monitor", daemon=True)
+        self._thread.start()
+        logger.info(f"[HealthMonitor] started: interval={self.interval}s timeout={self.timeout}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout * 2)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.probe_all()
+            except Exception as e:
+                logger.error(f"[HealthMonitor] probe round failed: {e}")
+            self._stop.wait(self.interval)
+
+    def probe_all(self) -> Dict[str, Dict[str, Any]]:
+        """并发探测全部服务器，返回 snapshot()"""
+        servers = {}
+        for remote in self.config_store.get_remote_servers():
+            ssh_info = remote.get("config", {})
+            if ssh_info.get("host_ip") and ssh_info.get("user_name"):
+                servers.setdefault(server_key(ssh_info), ssh_info)
+        tasks = {key: partial(self.probe, ssh_info) for key, ssh_info in servers.items()}
+        # probe 自己记录结果；这里只处理卡住超时的探测
+        for item in fan_out(tasks, timeout=self.timeout * 3):
+            if "error" in item:
+                self._record_failure(item["key"], item["error"])
+        return self.snapshot()
+
+    def probe(self, ssh_info: Dict[str, Any]):
+        key = server_key(ssh_info)
+        host, port, _ = key
+        try:
+            tcp_rtt, banner_time, banner = probe_ssh(host, port, self.timeout)
+        except Exception as e:
+            self._record_failure(key, str(e) or type(e).__name__)
+            return
+        session_rtt = None
+        if self.session_probe and self.pool is not None:
+            try:
+                session_rtt = self.pool.ping_idle(ssh_info)
+            except Exception as e:
+                # 会话断开不代表主机不可用，连接池会丢弃这条连接
+                logger.warning(f"[HealthMonitor] session ping failed: {key} error={e}")
+        with self._lock:
+            health = self._health.setdefault(key, ServerHealth())
+            health.status = HEALTH_UP
+            health.tcp_rtt = _smooth(health.tcp_rtt, tcp_rtt)
+            health.banner_time = _smooth(health.banner_time, banner_time)
+            if session_rtt is not None:
+                health.session_rtt = _smooth(health.session_rtt, session_rtt)
+            health.banner = banner
+            health.last_probe = health.last_ok = time.time()
+            health.consecutive_failures = 0
+
+    def _record_failure(self, key: Tuple[str, int, str], error: str):
+        now = time.time()
+        with self._lock:
+            health = self._health.setdefault(key, ServerHealth())
+            health.consecutive_failures += 1
+            health.failures.append((now, error))
+            health.last_probe = now
+            health.status = HEALTH_DOWN if health.consecutive_failures >= HEALTH_DOWN_AFTER else HEALTH_UNSTABLE
+        logger.warning(f"[HealthMonitor] probe failed: {key} failures={health.consecutive_failures} error={error}")
+
+    def record_transfer(self, ssh_info: Dict[str, Any], stats):
+        """用一次完成的传输（TransferStats）更新吞吐量估算"""
+        if stats.bytes_transferred < THROUGHPUT_MIN_BYTES:
+            return
+        with self._lock:
+            health = self._health.setdefault(server_key(ssh_info), ServerHealth())
+            health.throughput = _smooth(health.throughput, stats.bytes_per_sec)
+
+    def unavailable_reason(self, key: Tuple[str, int, str]) -> Optional[str]:
+        """服务器被判定为 down 时返回最近一次失败原因，供连接池快速失败"""
+        if not self.running:
+            return None
+        with self._lock:
+            health = self._health.get(key)
+            if health is None or health.status != HEALTH_DOWN:
+                return None
+            return health.failures[-1][1]
+
+    def get(self, ssh_info: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            health = self._health.get(server_key(ssh_info))
+            return (health or ServerHealth()).to_dict()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {f"{user}@{host}:{port}": health.to_dict() for (host, port, user), health in self._health.items()}
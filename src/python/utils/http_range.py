@@ -0,0 +1,47 @@
+"""
+HTTP 条件请求与 Range 请求辅助函数
+
+ETag 只由文件大小和修改时间生成，校验断点续传时无需读取文件内容。
+"""
+
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+
+def make_etag(size: int, mtime: float) -> str:
+    """由大小和修改时间生成强 ETag（未加引号）"""
+    return f"{int(size):x}-{int(mtime):x}"
+
+
+def if_range_matches(if_range, etag: str, mtime: float) -> bool:
+    """If-Range 校验：缺省或与当前 ETag/修改时间一致时 Range 才生效"""
+    if if_range is None or (if_range.etag is None and if_range.date is None):
+        return True
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    modified = datetime.fromtimestamp(int(mtime), tz=timezone.utc)
+    return if_range.date == modified
+
+
+def resolve_range(request, size: int, etag: str, mtime: float) -> Optional[Tuple[int, int]]:
+    """
+    解析请求中的 Range
+
+    Returns:
+        (start, stop)：需要返回 206 的字节区间（stop 不含）；None 表示返回完整内容
+
+    Raises:
+        RequestedRangeNotSatisfiable: 区间超出文件范围
+    """
+    byte_range = request.range
+    if byte_range is None or byte_range.units != "bytes" or len(byte_range.ranges) != 1:
+        # 没有 Range、格式不支持或多段 Range 时按规范返回完整内容
+        return None
+    if not if_range_matches(request.if_range, etag, mtime):
+        return None
+    resolved = byte_range.range_for_length(size)
+    if resolved is None:
+        raise RequestedRangeNotSatisfiable(length=size)
+    return resolved
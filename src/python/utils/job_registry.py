@@ -0,0 +1,201 @@
+"""
+后台任务登记表
+
+耗时操作（服务器间传输、目录同步等）在后台线程执行，前端通过任务 ID 轮询进度、吞吐和结果，
+也可以请求取消。
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .log_util import default_logger as logger
+from .transfer_engine import format_rate
+
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_JOB_RETENTION = 3600  # 已结束任务保留的秒数
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobCancelled(Exception):
+    """任务被用户取消"""
+
+
+class Job:
+    """一个后台任务及其进度（计数方法线程安全）"""
+
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = JOB_PENDING
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.files_total = 0
+        self.files_done = 0
+        self.current: Optional[str] = None
+        self.message: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def add_total(self, nbytes: int = 0, files: int = 0):
+        with self._lock:
+            self.bytes_total += nbytes
+            self.files_total += files
+
+    def add_bytes(self, nbytes: int):
+        with self._lock:
+            self.bytes_done += nbytes
+
+    def file_done(self, count: int = 1):
+        with self._lock:
+            self.files_done += count
+
+    def reset_progress(self):
+        """换一种方式重试前清零进度"""
+        with self._lock:
+            self.bytes_total = self.bytes_done = 0
+            self.files_total = self.files_done = 0
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """在循环中调用，任务被取消时抛出 JobCancelled"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return max(end - self.started_at, 1e-6)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        rate = self.bytes_done / elapsed if elapsed else 0.0
+        progress = self.bytes_done / self.bytes_total if self.bytes_total else None
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "bytes_total": self.bytes_total,
+            "bytes_done": self.bytes_done,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "progress": round(progress, 4) if progress is not None else None,
+            "current": self.current,
+            "message": self.message,
+            "elapsed": round(elapsed, 3),
+            "bytes_per_sec": round(rate, 1),
+            "rate": format_rate(rate),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRegistry:
+    """
+    任务登记表：submit 把任务函数放到线程池执行，并记录其状态
+
+    任务函数签名为 func(job) -> dict，返回值作为 job.result；抛出 JobCancelled 视为已取消，
+    其他异常视为失败。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_JOB_WORKERS, retention: float = DEFAULT_JOB_RETENTION):
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, kind: str, func: Callable[[Job], Optional[Dict[str, Any]]],
+               params: Optional[Dict[str, Any]] = None) -> Job:
+        job = Job(kind, params)
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.job_id] = job
+        logger.info(f"[JobRegistry] submit: id={job.job_id} kind={kind} params={params}")
+        job.future = self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: Job, func):
+        if job.cancelled:
+            job.status = JOB_CANCELLED
+            job.finished_at = time.time()
+            return
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = func(job)
+            job.status = JOB_DONE
+        except JobCancelled:
+            job.status = JOB_CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = JOB_FAILED
+            logger.error(f"[JobRegistry] job failed: id={job.job_id} kind={job.kind} error={e}")
+        finally:
+            job.current = None
+            job.finished_at = time.time()
+        logger.info(
+            f"[JobRegistry] job {job.status}: id={job.job_id} kind={job.kind} "
+            f"bytes={job.bytes_done} elapsed={job.elapsed:.2f}s rate={format_rate(job.bytes_done / job.elapsed)}"
+        )
+
+    def _prune_locked(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED_STATES and job.finished_at and now - job.finished_at > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, kind: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            self._prune_locked()
+            jobs = list(self._jobs.values())
+        if kind:
+            jobs = [job for job in jobs if job.kind == kind]
+        return sorted(jobs, key=lambda job: job.created_at)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """等待任务结束（主要用于测试和命令行）"""
+        job = self.get(job_id)
+        if job is not None:
+            job.future.result(timeout=timeout)
+        return job
+
+
+default_job_registry = JobRegistry()
@@ -0,0 +1,122 @@
+"""
+流式解析 multipart/form-data 请求体
+
+Flask 的 request.files 会先把整个上传写入临时文件再交给视图函数，
+这里直接从 request.stream 增量读取，每个文件以数据块迭代器的形式交给调用方，
+内存占用只与单次读取的块大小有关。
+"""
+
+from typing import Iterator, Optional
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import (
+    Data,
+    Epilogue,
+    Field,
+    File,
+    MultipartDecoder,
+    NeedData,
+)
+
+# 每次从请求流读取的字节数
+UPLOAD_READ_SIZE = 256 * 1024
+
+
+class MultipartPart:
+    """
+    multipart 中的一个部分（文件或普通表单字段）
+
+    迭代得到该部分的数据块；必须在读取下一个部分之前消费，未消费的数据会被跳过。
+    """
+
+    def __init__(self, reader: "MultipartStreamReader", name: str, filename: Optional[str], headers: Headers):
+        self._reader = reader
+        self.name = name
+        self.filename = filename
+        self.headers = headers
+        self.finished = False
+
+    @property
+    def is_file(self) -> bool:
+        return self.filename is not None
+
+    def __iter__(self) -> Iterator[bytes]:
+        while not self.finished:
+            event = self._reader._next_event()
+            if not isinstance(event, Data):
+                raise ValueError("multipart 数据格式错误")
+            if not event.more_data:
+                self.finished = True
+            if event.data:
+                yield event.data
+
+    def read(self) -> bytes:
+        """读取整个部分，仅用于普通表单字段等小数据"""
+        return b"".join(self)
+
+    def text(self, encoding: str = "utf-8") -> str:
+        return self.read().decode(encoding)
+
+    def drain(self):
+        for _ in self:
+            pass
+
+
+class MultipartStreamReader:
+    """按顺序产出 MultipartPart 的读取器"""
+
+    def __init__(self, stream, content_type: str, read_size: int = UPLOAD_READ_SIZE):
+        mimetype, options = parse_options_header(content_type)
+        boundary = options.get("boundary")
+        if mimetype != "multipart/form-data" or not boundary:
+            raise ValueError("请求不是 multipart/form-data 格式")
+        self._stream = stream
+        self._read_size = read_size
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"))
+        self._eof = False
+
+    def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if not isinstance(event, NeedData):
+                return event
+            if self._eof:
+                raise ValueError("multipart 数据不完整")
+            data = self._stream.read(self._read_size)
+            if not data:
+                self._eof = True
+                self._decoder.receive_data(None)
+            else:
+                self._decoder.receive_data(data)
+
+    def __iter__(self) -> Iterator[MultipartPart]:
+        current = None
+        while True:
+            if current is not None and not current.finished:
+                current.drain()
+            event = self._next_event()
+            if isinstance(event, Epilogue):
+                return
+            if isinstance(event, File):
+                current = MultipartPart(self, event.name, event.filename, event.headers)
+                yield current
+            elif isinstance(event, Field):
+                current = MultipartPart(self, event.name, None, event.headers)
+                yield current
+            # Preamble 等事件直接跳过
+
+
+def iter_multipart(stream, content_type: str, read_size: int = UPLOAD_READ_SIZE) -> Iterator[MultipartPart]:
+    """从请求流中逐个读取 multipart 部分"""
+    return iter(MultipartStreamReader(stream, content_type, read_size))
+
+
+def iter_file_chunks(file_obj, chunk_size: int = UPLOAD_READ_SIZE) -> Iterator[bytes]:
+    """把 Werkzeug FileStorage 或普通文件对象按块读出"""
+    stream = getattr(file_obj, "stream", file_obj)
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        yield data
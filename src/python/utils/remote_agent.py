@@ -0,0 +1,379 @@
+"""
+远程辅助进程
+
+目录列表、目录大小、批量摘要、按名称查找等操作原本由逐条目的 SFTP 往返或 du/find 等命令的
+文本输出拼成。本模块上传到远程主机后作为常驻进程运行在一条 exec 通道上，逐条处理请求，
+在远程用 os.scandir 完成遍历和计算，只把结果传回。
+
+协议：双方都以帧通信，每帧为 4 字节大端长度 + UTF-8 JSON。
+- 启动后先发送握手帧 {"agent": PROTOCOL_VERSION, "pid": ..., "python": ...}
+- 请求 {"id": n, "op": 操作名, "args": {...}}
+- 应答 {"id": n, "ok": true, "result": ...} 或 {"id": n, "ok": false, "error": 信息, "errno": 错误码}
+文件名按 surrogateescape 解码，非 UTF-8 的字节经 JSON 的 \\udcxx 转义原样往返。
+
+本模块只依赖标准库且兼容 Python 3.6，与 file_search.py 一起上传到远程主机的同一目录后执行：
+
+    python3 remote_agent.py serve        在 stdin/stdout 上处理请求，stdin 关闭时退出
+
+RemoteAgent 是本地一侧的客户端，包装 exec_command 返回的 (stdin, stdout, stderr)。
+"""
+
+import hashlib
+import json
+import os
+import shlex
+import socket
+import stat
+import struct
+import sys
+import threading
+
+try:
+    from .file_search import entry_kind, find, stat_entry
+except ImportError:
+    # 在远程主机上作为脚本运行，file_search.py 与本文件上传在同一目录
+    from file_search import entry_kind, find, stat_entry
+
+PROTOCOL_VERSION = 1
+_FRAME_HEADER = struct.Struct(">I")
+# 单帧上限，防止通道上的异常数据被当作长度分配内存
+MAX_FRAME_SIZE = 512 * 1024 * 1024
+HASH_READ_SIZE = 1024 * 1024
+HASH_ALGORITHMS = ("md5", "sha1", "sha256")
+# 单个请求的等待上限（秒），远程进程卡住时通道读超时，调用方退回原有实现
+AGENT_CALL_TIMEOUT = 300
+# 保留辅助进程 stderr 的最后多少字节，用于错误信息
+STDERR_TAIL_SIZE = 4096
+STDERR_WAIT = 1.0
+
+
+class RemoteAgentError(Exception):
+    """辅助进程执行请求失败（如路径不存在），连接本身仍然可用"""
+
+    def __init__(self, message, errno=None):
+        super().__init__(message)
+        self.errno = errno
+
+
+def write_frame(stream, obj):
+    data = json.dumps(obj, separators=(",", ":")).encode("utf-8", errors="surrogatepass")
+    stream.write(_FRAME_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def read_frame(stream):
+    """读取一帧，对端在帧边界关闭时返回 None，帧不完整时抛出 EOFError"""
+    header = _read_exact(stream, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = _FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError("帧长度超出上限: %d" % length)
+    data = _read_exact(stream, length)
+    if data is None:
+        raise EOFError("帧数据不完整")
+    return json.loads(data.decode("utf-8", errors="surrogatepass"))
+
+
+def _read_exact(stream, size):
+    buf = b""
+    while len(buf) < size:
+        chunk = stream.read(size - len(buf))
+        if not chunk:
+            if buf:
+                raise EOFError("帧数据不完整")
+            return None
+        buf += chunk
+    return buf
+
+
+def list_dir(path):
+    """[名称, 类型字符, 大小, 修改时间]，跟随符号链接，失效的链接保持为 l（与 LIST_DIR_COMMAND 一致）"""
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                st = stat_entry(entry)
+            except OSError:
+                continue
+            entries.append([entry.name, entry_kind(st), st.st_size, int(st.st_mtime)])
+    return entries
+
+
+def _walk_size(path, follow_links, seen):
+    """
+    统计目录树的 (字节数, 文件数, 出错数)，对应 du -sb 与 find -type f | wc -l
+
+    目录自身的大小也计入，硬链接的字节数只计一次、文件数按名称计；follow_links 时进入指向目录的链接（du -L / find -L）。
+    """
+    total = files = errors = 0
+    pending = [path]
+    while pending:
+        current = pending.pop()
+        try:
+            it = os.scandir(current)
+        except OSError:
+            errors += 1
+            continue
+        with it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=follow_links)
+                except OSError:
+                    errors += 1
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    files += 1
+                key = (st.st_dev, st.st_ino)
+                if key in seen:
+                    continue
+                seen.add(key)
+                total += st.st_size
+                if stat.S_ISDIR(st.st_mode):
+                    pending.append(entry.path)
+    return total, files, errors
+
+
+def dir_size(path):
+    root = os.stat(path)
+    seen = {(root.st_dev, root.st_ino)}
+    total, files, errors = _walk_size(path, False, seen)
+    return {"total_size": root.st_size + total, "file_count": files, "errors": errors}
+
+
+def child_sizes(path):
+    """
+    目录总大小、文件数及每个子目录的大小和文件数，结构与 CHILD_SIZES_COMMAND 的解析结果相同
+
+    指向目录的符号链接跟随统计但不计入总数（du 不跟随链接）。
+    """
+    root = os.stat(path)
+    seen = {(root.st_dev, root.st_ino)}
+    total_size, file_count, errors = root.st_size, 0, 0
+    children = {}
+    links = []
+    with os.scandir(path) as it:
+        entries = list(it)
+    for entry in entries:
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            errors += 1
+            continue
+        if stat.S_ISLNK(st.st_mode):
+            total_size += st.st_size
+            if entry.is_dir():
+                links.append(entry)
+            continue
+        if stat.S_ISREG(st.st_mode):
+            file_count += 1
+        key = (st.st_dev, st.st_ino)
+        if key in seen:
+            continue
+        seen.add(key)
+        total_size += st.st_size
+        if stat.S_ISDIR(st.st_mode):
+            size, files, failed = _walk_size(entry.path, False, seen)
+            children[entry.name] = {"total_size": st.st_size + size, "file_count": files}
+            total_size += size
+            file_count += files
+            errors += failed
+    for entry in links:
+        try:
+            target = os.stat(entry.path)
+        except OSError:
+            errors += 1
+            continue
+        size, files, failed = _walk_size(entry.path, True, {(target.st_dev, target.st_ino)})
+        children[entry.name] = {"total_size": target.st_size + size, "file_count": files}
+        errors += failed
+    return {"total_size": total_size, "file_count": file_count, "children": children, "errors": errors}
+
+
+def hash_files(root, paths, algorithm="md5"):
+    """root 下各相对路径的摘要（十六进制），读不了的文件不出现在结果中"""
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError("不支持的摘要算法: %s" % algorithm)
+    result = {}
+    for rel in paths:
+        digest = hashlib.new(algorithm)
+        try:
+            with open(os.path.join(root, rel), "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                    digest.update(chunk)
+        except OSError:
+            continue
+        result[rel] = digest.hexdigest()
+    return result
+
+
+def manifest(root):
+    """目录树清单（不跟随符号链接，只含普通文件和目录），与 REMOTE_MANIFEST_COMMAND 相同"""
+    files = {}
+    dirs = []
+    pending = [("", root)]
+    while pending:
+        rel_dir, path = pending.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                rel = rel_dir + "/" + entry.name if rel_dir else entry.name
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    dirs.append(rel)
+                    pending.append((rel, entry.path))
+                elif stat.S_ISREG(st.st_mode):
+                    files[rel] = [st.st_size, st.st_mtime]
+    return {"files": files, "dirs": dirs}
+
+
+def ping():
+    return {"pid": os.getpid(), "python": sys.version.split()[0]}
+
+
+OPERATIONS = {
+    "ping": ping,
+    "list": list_dir,
+    "dir_size": dir_size,
+    "child_sizes": child_sizes,
+    "hash": hash_files,
+    "manifest": manifest,
+    "find": find,
+}
+
+
+def serve(stdin, stdout):
+    """逐条处理请求直到 stdin 关闭"""
+    write_frame(stdout, {"agent": PROTOCOL_VERSION, "pid": os.getpid(), "python": sys.version.split()[0]})
+    while True:
+        request = read_frame(stdin)
+        if request is None:
+            return
+        request_id = request.get("id")
+        handler = OPERATIONS.get(request.get("op"))
+        try:
+            if handler is None:
+                raise ValueError("未知的操作: %s" % request.get("op"))
+            response = {"id": request_id, "ok": True, "result": handler(**request.get("args", {}))}
+        except Exception as e:
+            response = {"id": request_id, "ok": False, "error": str(e) or type(e).__name__,
+                        "errno": getattr(e, "errno", None)}
+        write_frame(stdout, response)
+
+
+class RemoteAgent:
+    """
+    本地一侧的客户端：在一条 exec 通道上与远程的 serve() 通信
+
+    同一时间只有一个请求在途；通道出错（断开、协议错乱、等待超时）后 alive 为 False，需要重新启动。
+    """
+
+    def __init__(self, stdin, stdout, stderr=None, timeout=AGENT_CALL_TIMEOUT):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.channel = getattr(stdout, "channel", None)
+        self.alive = True
+        self.info = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stderr_tail = b""
+        self._stderr_drainer = None
+        settimeout = getattr(self.channel, "settimeout", None)
+        if settimeout is not None and timeout is not None:
+            settimeout(timeout)
+        # 远程进程写满 stderr 的窗口后会阻塞在写上，需要一直读走
+        if stderr is not None:
+            self._stderr_drainer = threading.Thread(target=self._drain_stderr, name="remote-agent-stderr", daemon=True)
+            self._stderr_drainer.start()
+
+    def _drain_stderr(self):
+        while True:
+            try:
+                chunk = self.stderr.read(4096)
+            except socket.timeout:
+                if self.alive:
+                    continue
+                return
+            except Exception:
+                return
+            if not chunk:
+                return
+            self._stderr_tail = (self._stderr_tail + chunk)[-STDERR_TAIL_SIZE:]
+
+    def stderr_tail(self):
+        """辅助进程 stderr 的最后几行"""
+        return self._stderr_tail.decode("utf-8", errors="replace").strip()
+
+    def _exited(self, message):
+        # 进程退出后 stderr 随即结束，稍等读完再取最后几行
+        if self._stderr_drainer is not None:
+            self._stderr_drainer.join(STDERR_WAIT)
+        tail = self.stderr_tail()
+        return EOFError("%s: %s" % (message, tail) if tail else message)
+
+    @classmethod
+    def start(cls, conn, script, timeout=AGENT_CALL_TIMEOUT):
+        """在连接上以 exec 启动辅助进程并完成握手；timeout 为每个请求（含握手）的等待上限"""
+        agent = cls(*conn.exec_command("python3 %s serve" % shlex.quote(script)), timeout=timeout)
+        try:
+            hello = read_frame(agent.stdout)
+            if not isinstance(hello, dict) or hello.get("agent") != PROTOCOL_VERSION:
+                raise agent._exited("辅助进程握手失败: %r" % (hello,))
+        except BaseException:
+            agent.close()
+            raise
+        agent.info = hello
+        return agent
+
+    def call(self, op, **args):
+        """
+        执行一个操作并返回结果
+
+        操作失败抛出 RemoteAgentError；通道故障或等待超时抛出 EOFError/OSError 等，此后 alive 为 False。
+        """
+        with self._lock:
+            if not self.alive:
+                raise EOFError("辅助进程已退出")
+            self._next_id += 1
+            request_id = self._next_id
+            try:
+                write_frame(self.stdin, {"id": request_id, "op": op, "args": args})
+                response = read_frame(self.stdout)
+                if response is None:
+                    raise self._exited("辅助进程已退出")
+                if response.get("id") != request_id:
+                    raise EOFError("辅助进程应答错乱")
+            except BaseException:
+                self.alive = False
+                raise
+        if not response.get("ok"):
+            raise RemoteAgentError(response.get("error"), response.get("errno"))
+        return response.get("result")
+
+    def close(self):
+        self.alive = False
+        for closer in (getattr(self.stdin, "close", None), getattr(self.channel, "close", None)):
+            try:
+                if closer is not None:
+                    closer()
+            except Exception:
+                pass
+
+
+def _main(argv):
+    if len(argv) == 2 and argv[1] == "serve":
+        serve(sys.stdin.buffer, sys.stdout.buffer)
+        return 0
+    sys.stderr.write(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
@@ -0,0 +1,205 @@
+"""
+远程目录列表的 exec 快速通道
+
+sftp.listdir_attr 每次 READDIR 往返只返回约一百个条目，并为每个条目构造 SFTPAttributes，
+几十万条目的目录既慢又占内存。exec 通道在远程运行一次 find -maxdepth 1 -printf，
+输出 NUL 分隔的记录，边接收边解析；往返次数与条目数无关。
+
+是否走 exec 由 ListingPlanner 按简单的代价模型决定：根据这次 stat 目录测得的往返时间、
+目录自身的大小（大致与条目数成正比）和上次列表得到的条目数估算两种方式的耗时。
+
+两种方式都跟随符号链接给出目标的类型、大小和修改时间（与本地列表一致），指向目录的链接可以继续浏览。
+sftp 方式下链接目标的 stat 请求在同一 SFTP 通道上流水线发出，总耗时接近一次往返。
+
+远程有 python3 时 RemoteFileService 优先交给常驻的远程辅助进程（utils/remote_agent.py）列目录。
+辅助进程把整个列表放在一帧里返回，两端都要先在内存里构造完整的列表，估算条目数超过
+AGENT_LIST_MAX_ENTRIES 的目录仍按上述选择走边接收边解析的 exec；辅助进程不可用时同样回到上述两种方式。
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from paramiko import SFTPAttributes, SFTPClient
+from paramiko.sftp import CMD_ATTRS, CMD_STAT
+
+LIST_BACKENDS = ("auto", "sftp", "exec", "agent")
+
+# %y 类型（d/f/...），%s 大小，%T@ 修改时间，%f 文件名；-L 使符号链接报告目标的信息，失效的链接仍为 l
+LIST_DIR_COMMAND = "cd -- {path} && find -L . -mindepth 1 -maxdepth 1 -printf '%y\\t%s\\t%T@\\t%f\\0'"
+LIST_READ_SIZE = 256 * 1024
+# 流水线 stat 时同时在途的请求数
+STAT_PIPELINE_DEPTH = 64
+
+# 代价模型参数（秒），取 benchmarks/bench_list_dir.py 测得的量级
+SFTP_READDIR_BATCH = 100        # OpenSSH sftp-server 每个 NAME 应答最多携带的条目数
+SFTP_ENTRY_COST = 8e-6          # paramiko 解析一个条目并构造 SFTPAttributes
+EXEC_ROUND_TRIPS = 3            # 打开通道、exec 请求、收尾
+EXEC_STARTUP = 0.01             # 远程启动 shell 和 find（本机约 5ms，远程登录 shell 更慢）
+EXEC_ENTRY_COST = 6e-6          # find 输出一条记录并在本地解析
+# 目录文件的大小与条目数的比例（ext4 每个条目约 24~40 字节），用于估算未列过的目录
+DIR_BYTES_PER_ENTRY = 32
+# 记住最近列过的多少个目录的条目数
+LIST_HISTORY_SIZE = 1024
+# auto 模式下交给远程辅助进程列出的目录的条目数上限，更大的目录走 exec 流式列表
+AGENT_LIST_MAX_ENTRIES = 50000
+
+# (名称, 类型字符, 大小, 修改时间)
+ListingEntry = Tuple[str, str, int, int]
+
+
+def parse_listing(chunks: Iterable[bytes]) -> Iterator[ListingEntry]:
+    """逐块解析 LIST_DIR_COMMAND 的输出，记录可能跨块；文件名中的制表符和换行原样保留"""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        records = pending.split(b"\0")
+        pending = records.pop()
+        for record in records:
+            entry = _parse_record(record)
+            if entry is not None:
+                yield entry
+    if pending:
+        entry = _parse_record(pending)
+        if entry is not None:
+            yield entry
+
+
+def _parse_record(record: bytes) -> Optional[ListingEntry]:
+    parts = record.split(b"\t", 3)
+    if len(parts) != 4:
+        return None
+    kind, size, mtime, name = parts
+    try:
+        return name.decode("utf-8", errors="replace"), kind.decode("ascii"), int(size), int(float(mtime))
+    except ValueError:
+        return None
+
+
+class _PipelinedReplies:
+    """
+    接收流水线请求的应答
+
+    paramiko 按请求号把应答分派给发请求时登记的对象；用它代替 type(None) 登记，
+    应答即使乱序到达也不会被丢弃。
+    """
+
+    def __init__(self):
+        self.replies: Dict[int, Tuple[int, Any]] = {}
+
+    def _async_response(self, t, msg, num):
+        self.replies[num] = (t, msg)
+
+
+def stat_many(sftp, paths: List[str], depth: int = STAT_PIPELINE_DEPTH) -> List[Optional[SFTPAttributes]]:
+    """
+    批量 stat（跟随符号链接），目标不存在或无权限的返回 None
+
+    paramiko 的 SFTPClient 上最多 depth 个请求同时在途，不逐个等待应答；
+    其他 SFTP 客户端对象退回逐个 stat。
+    """
+    if not isinstance(sftp, SFTPClient):
+        results = []
+        for path in paths:
+            try:
+                results.append(sftp.stat(path))
+            except IOError:
+                results.append(None)
+        return results
+
+    return [
+        SFTPAttributes._from_msg(msg) if t == CMD_ATTRS else None
+        for t, msg in pipeline_requests(sftp, CMD_STAT, paths, depth)
+    ]
+
+
+def request_reply(sftp: SFTPClient, cmd: int, *args) -> Tuple[int, Any]:
+    """
+    发出单个请求并返回原始的 (应答类型, 应答消息)
+
+    与 SFTPClient._request 不同，STATUS 应答不会被转换成异常，调用方可以直接读状态码。
+    """
+    replies = _PipelinedReplies()
+    num = sftp._async_request(replies, cmd, *args)
+    while num not in replies.replies:
+        sftp._read_response()
+    return replies.replies[num]
+
+
+def pipeline_requests(sftp: SFTPClient, cmd: int, paths: List[str],
+                      depth: int = STAT_PIPELINE_DEPTH) -> List[Tuple[int, Any]]:
+    """
+    在 paramiko 的 SFTPClient 上流水线发出以单个路径为参数的请求（stat、remove、rmdir 等）
+
+    最多 depth 个请求同时在途，按 paths 的顺序返回 (应答类型, 应答消息)，由调用方解析。
+    """
+    replies = _PipelinedReplies()
+    numbers: List[int] = []
+    for path in paths:
+        numbers.append(sftp._async_request(replies, cmd, path))
+        while len(numbers) - len(replies.replies) >= depth:
+            sftp._read_response()
+    while len(replies.replies) < len(numbers):
+        sftp._read_response()
+    return [replies.replies[num] for num in numbers]
+
+
+def estimate_sftp_cost(entries: int, rtt: float) -> float:
+    return rtt * max(1, math.ceil(entries / SFTP_READDIR_BATCH)) + entries * SFTP_ENTRY_COST
+
+
+def estimate_exec_cost(entries: int, rtt: float) -> float:
+    return rtt * EXEC_ROUND_TRIPS + EXEC_STARTUP + entries * EXEC_ENTRY_COST
+
+
+class ListingPlanner:
+    """
+    为每次目录列表选择 sftp 或 exec，以及 auto 模式下目录是否交给远程辅助进程
+
+    按服务器记录 exec 是否可用（远程 find 不支持 -printf 时记为不可用，之后一直用 sftp），
+    以及最近列过的目录的条目数。
+    """
+
+    def __init__(self, history_size: int = LIST_HISTORY_SIZE):
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict[Tuple[Hashable, str], int]" = OrderedDict()
+        self._exec_unsupported = set()
+
+    def estimate_entries(self, server: Hashable, path: str, dir_size: int) -> int:
+        """优先用上次列出的条目数：ext4 等文件系统删除条目后目录大小不会缩小"""
+        with self._lock:
+            known = self._counts.get((server, path))
+        return known if known is not None else dir_size // DIR_BYTES_PER_ENTRY
+
+    def choose(self, server: Hashable, path: str, dir_size: int, rtt: float) -> str:
+        """返回 "exec" 或 "sftp"；rtt 为本次 stat 目录的耗时"""
+        with self._lock:
+            if server in self._exec_unsupported:
+                return "sftp"
+        entries = self.estimate_entries(server, path, dir_size)
+        return "exec" if estimate_exec_cost(entries, rtt) < estimate_sftp_cost(entries, rtt) else "sftp"
+
+    def prefer_agent(self, server: Hashable, path: str, dir_size: int) -> bool:
+        """auto 模式下是否交给远程辅助进程：估算条目数不超过上限，或该服务器不能走 exec"""
+        with self._lock:
+            if server in self._exec_unsupported:
+                return True
+        return self.estimate_entries(server, path, dir_size) <= AGENT_LIST_MAX_ENTRIES
+
+    def record(self, server: Hashable, path: str, entries: int):
+        with self._lock:
+            key = (server, path)
+            self._counts[key] = entries
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.history_size:
+                self._counts.popitem(last=False)
+
+    def mark_exec_unsupported(self, server: Hashable):
+        with self._lock:
+            self._exec_unsupported.add(server)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"remembered_dirs": len(self._counts), "exec_unsupported": len(self._exec_unsupported)}
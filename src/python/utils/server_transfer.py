@@ -0,0 +1,220 @@
+"""
+服务器之间直接传输
+
+relay：在本进程内从源服务器的 SFTP 读、向目标服务器的 SFTP 写，读写分别在两个线程中进行，
+中间只有一个有界缓冲区，内存占用与文件大小无关，数据不经过浏览器也不落本地磁盘。
+
+direct：两台主机网络互通且源主机能免密登录目标主机时，在源主机上执行 rsync 直接推送，
+数据完全不经过本机。
+"""
+
+import posixpath
+import queue
+import re
+import shlex
+import stat
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from .job_registry import Job
+from .log_util import default_logger as logger
+
+RELAY_CHUNK_SIZE = 1024 * 1024
+RELAY_BUFFER_CHUNKS = 8  # 每个文件最多缓冲 8 个块
+RELAY_PREFETCH_REQUESTS = 64
+DIRECT_CONNECT_TIMEOUT = 10
+# rsync 失败时错误信息保留的最后几行输出
+DIRECT_ERROR_LINES = 20
+
+# rsync --info=progress2 的进度行，例如 "  1,234,567  45%   10.00MB/s    0:00:01"
+_RSYNC_PROGRESS = re.compile(r"^\s*([\d,]+)\s+(\d+)%")
+
+
+def plan_tree(sftp, path: str) -> Tuple[List[str], List[Tuple[str, Any]]]:
+    """
+    列出待传输的目录和普通文件（相对 path 的父目录），符号链接和特殊文件跳过
+
+    Returns:
+        (dirs, files)：dirs 按从上到下的顺序，files 为 (相对路径, 属性)
+    """
+    root_attrs = sftp.stat(path)
+    name = posixpath.basename(path.rstrip("/")) or "/"
+    if not stat.S_ISDIR(root_attrs.st_mode):
+        return [], [(name, root_attrs)]
+    dirs = [name]
+    files = []
+    pending = [(path, name)]
+    while pending:
+        current, rel = pending.pop()
+        for entry in sftp.listdir_attr(current):
+            child_rel = f"{rel}/{entry.filename}"
+            if stat.S_ISDIR(entry.st_mode):
+                dirs.append(child_rel)
+                pending.append((f"{current.rstrip('/')}/{entry.filename}", child_rel))
+            elif stat.S_ISREG(entry.st_mode):
+                files.append((child_rel, entry))
+    return dirs, files
+
+
+def pipe_file(src_file, dst_file, job: Optional[Job] = None,
+              chunk_size: int = RELAY_CHUNK_SIZE, buffer_chunks: int = RELAY_BUFFER_CHUNKS) -> int:
+    """
+    读线程从 src_file 读取、当前线程写 dst_file，两端通过有界队列衔接，读写互相重叠
+
+    Returns:
+        复制的字节数
+    """
+    buffer: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=buffer_chunks)
+    errors: List[BaseException] = []
+    stop = threading.Event()
+
+    def _reader():
+        try:
+            while not stop.is_set():
+                data = src_file.read(chunk_size)
+                buffer.put(data)
+                if not data:
+                    return
+        except Exception as e:
+            errors.append(e)
+            buffer.put(None)
+
+    reader = threading.Thread(target=_reader, name="relay-reader", daemon=True)
+    reader.start()
+    copied = 0
+    try:
+        while True:
+            data = buffer.get()
+            if data is None:
+                raise errors[0]
+            if not data:
+                break
+            dst_file.write(data)
+            copied += len(data)
+            if job is not None:
+                job.add_bytes(len(data))
+                job.check_cancelled()
+    finally:
+        stop.set()
+        # 写端提前退出时清空缓冲区，让阻塞在 put 上的读线程退出
+        while reader.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                reader.join(0.05)
+    return copied
+
+
+def relay_tree(src_sftp, src_path: str, dst_sftp, dst_dir: str, job: Optional[Job] = None) -> Dict[str, Any]:
+    """把源服务器上的文件或目录复制到目标服务器的 dst_dir 下，保留权限和修改时间"""
+    dirs, files = plan_tree(src_sftp, src_path)
+    if job is not None:
+        job.add_total(nbytes=sum(attrs.st_size for _, attrs in files), files=len(files))
+    src_parent = posixpath.dirname(src_path.rstrip("/")) or "/"
+    dst_dir = dst_dir.rstrip("/") or "/"
+
+    def _dst(rel):
+        return f"{dst_dir.rstrip('/')}/{rel}"
+
+    for rel in dirs:
+        try:
+            dst_sftp.mkdir(_dst(rel))
+        except IOError:
+            pass  # 已存在
+
+    copied = 0
+    for rel, attrs in files:
+        if job is not None:
+            job.check_cancelled()
+            job.current = rel
+        src = f"{src_parent.rstrip('/')}/{rel}"
+        dst = _dst(rel)
+        with src_sftp.open(src, "rb") as src_file:
+            src_file.prefetch(attrs.st_size, max_concurrent_requests=RELAY_PREFETCH_REQUESTS)
+            dst_file = dst_sftp.open(dst, "wb")
+            try:
+                dst_file.set_pipelined(True)
+                copied += pipe_file(src_file, dst_file, job)
+            except BaseException:
+                dst_file.close()
+                try:
+                    dst_sftp.remove(dst)
+                except Exception:
+                    pass
+                raise
+            dst_file.close()
+        try:
+            dst_sftp.chmod(dst, stat.S_IMODE(attrs.st_mode))
+            dst_sftp.utime(dst, (attrs.st_atime, attrs.st_mtime))
+        except Exception as e:
+            logger.warning(f"[server_transfer] keep attributes failed: path={dst} error={e}")
+        if job is not None:
+            job.file_done()
+    return {"path": _dst(dirs[0] if dirs else files[0][0]), "files": len(files), "bytes": copied}
+
+
+def rsync_push_command(src_path: str, dst_info: Dict[str, Any], dst_dir: str) -> str:
+    """在源主机上执行、把 src_path 推送到目标主机 dst_dir 下的 rsync 命令"""
+    ssh_command = (
+        f"ssh -p {int(dst_info.get('ssh_port', 22))} -o BatchMode=yes "
+        f"-o StrictHostKeyChecking=accept-new -o ConnectTimeout={DIRECT_CONNECT_TIMEOUT}"
+    )
+    target = f"{dst_info['user_name']}@{dst_info['host_ip']}:{dst_dir.rstrip('/')}/"
+    return (
+        f"rsync -a --partial --protect-args --info=progress2 --no-inc-recursive "
+        f"-e {shlex.quote(ssh_command)} -- {shlex.quote(src_path.rstrip('/') or '/')} {shlex.quote(target)}"
+    )
+
+
+def direct_push(src_conn, src_path: str, dst_info: Dict[str, Any], dst_dir: str,
+                job: Optional[Job] = None) -> Dict[str, Any]:
+    """
+    在源主机上运行 rsync 推送到目标主机，解析 rsync 的进度输出更新任务进度
+
+    Raises:
+        RuntimeError: rsync 不存在、目标不可达或认证失败
+    """
+    if job is not None:
+        dirs, files = plan_tree(src_conn.sftp, src_path)
+        job.add_total(nbytes=sum(attrs.st_size for _, attrs in files), files=len(files))
+    command = rsync_push_command(src_path, dst_info, dst_dir)
+    logger.info(f"[server_transfer] direct push: {command}")
+    stdin, stdout, stderr = src_conn.exec_command(command)
+    channel = stdout.channel
+    # stderr 并入 stdout 一起读：rsync 大量报错时不会因 stderr 的窗口写满而卡住
+    channel.set_combined_stderr(True)
+    messages = deque(maxlen=DIRECT_ERROR_LINES)
+    done = 0
+    pending = b""
+    while True:
+        # channel.recv 有多少返回多少，进度行可以及时处理
+        data = channel.recv(64 * 1024)
+        if not data:
+            break
+        pending += data
+        *lines, pending = re.split(rb"[\r\n]", pending)
+        for line in lines:
+            text = line.decode("utf-8", errors="replace")
+            match = _RSYNC_PROGRESS.match(text)
+            if match:
+                if job is not None:
+                    current = int(match.group(1).replace(",", ""))
+                    job.add_bytes(current - done)
+                    done = current
+            elif text.strip():
+                messages.append(text.strip())
+        if job is not None and job.cancelled:
+            channel.close()
+            job.check_cancelled()
+    if pending.strip():
+        messages.append(pending.decode("utf-8", errors="replace").strip())
+    status = channel.recv_exit_status()
+    if status != 0:
+        error = "\n".join(messages)
+        raise RuntimeError(f"rsync 退出码 {status}: {error}")
+    if job is not None:
+        job.add_bytes(job.bytes_total - job.bytes_done)
+        job.file_done(job.files_total - job.files_done)
+    name = posixpath.basename(src_path.rstrip("/"))
+    return {"path": f"{dst_dir.rstrip('/')}/{name}", "files": job.files_total if job else None, "bytes": done}
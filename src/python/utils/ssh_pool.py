@@ -0,0 +1,382 @@
+"""
+SSH/SFTP 连接池
+
+按服务器 (host, port, user) 缓存已认证的 SSH 会话，避免每次操作都重新握手。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import paramiko
+
+from .log_util import default_logger as logger
+from .ssh_tuning import connect_options
+
+# 池化连接默认参数
+DEFAULT_MAX_SIZE_PER_SERVER = 4
+DEFAULT_IDLE_TIMEOUT = 300  # 空闲超过该秒数的连接会被关闭
+DEFAULT_KEEPALIVE_INTERVAL = 30  # SSH keepalive 间隔（秒）
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_ACQUIRE_TIMEOUT = 30  # 连接池满时等待空闲连接的最长时间
+HEALTH_CHECK_AFTER_IDLE = 15  # 空闲超过该秒数再次借出前先做一次探活
+
+
+def server_key(ssh_info: Dict[str, Any]) -> Tuple[str, int, str]:
+    """连接池的键：同一主机、端口、用户共享连接"""
+    return (
+        ssh_info["host_ip"],
+        int(ssh_info.get("ssh_port", 22)),
+        ssh_info["user_name"],
+    )
+
+
+def open_ssh_client(
+    ssh_info: Dict[str, Any], timeout: float = DEFAULT_CONNECT_TIMEOUT, tuning: Optional[Dict[str, Any]] = None,
+) -> paramiko.SSHClient:
+    """
+    按服务器配置建立已认证的 SSH 连接
+
+    Args:
+        tuning: 传输调优配置，默认使用 ssh_info 中的 "tuning"
+    """
+    host, port, username = server_key(ssh_info)
+    password = ssh_info.get("user_pwd", "")
+    options = connect_options(ssh_info.get("tuning") if tuning is None else tuning)
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    if password:
+        ssh.connect(
+            host,
+            port=port,
+            username=username,
+            password=password,
+            allow_agent=False,
+            look_for_keys=False,
+            timeout=timeout,
+            **options,
+        )
+    else:
+        ssh.connect(
+            host,
+            port=port,
+            username=username,
+            allow_agent=True,
+            look_for_keys=True,
+            timeout=timeout,
+            **options,
+        )
+    return ssh
+
+
+class PooledConnection:
+    """
+    池中的一条 SSH 连接，SFTP 通道按需打开并随连接复用
+    """
+
+    def __init__(self, key: Tuple[str, int, str], ssh: paramiko.SSHClient):
+        self.key = key
+        self.ssh = ssh
+        self._sftp: Optional[paramiko.SFTPClient] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.broken = False
+        # 在这条连接上常驻的远程辅助进程（utils.remote_agent.RemoteAgent），随连接关闭
+        self.agent = None
+
+    @property
+    def sftp(self) -> paramiko.SFTPClient:
+        if self._sftp is None:
+            self._sftp = self.ssh.open_sftp()
+        return self._sftp
+
+    @property
+    def transport(self) -> Optional[paramiko.Transport]:
+        return self.ssh.get_transport()
+
+    def exec_command(self, command: str, **kwargs):
+        return self.ssh.exec_command(command, **kwargs)
+
+    def is_alive(self) -> bool:
+        if self.broken:
+            return False
+        transport = self.transport
+        return transport is not None and transport.is_active()
+
+    def check_health(self) -> bool:
+        """轻量探活：SFTP 通道执行一次 normalize，失败则视为不可用"""
+        if not self.is_alive():
+            return False
+        try:
+            if self._sftp is not None:
+                self._sftp.normalize(".")
+            else:
+                self.transport.send_ignore()
+            return True
+        except Exception as e:
+            logger.warning(f"[SSHConnectionPool] health check failed for {self.key}: {e}")
+            return False
+
+    def ping(self) -> float:
+        """在已认证的会话上做一次 keepalive 往返，返回耗时（秒）"""
+        if not self.is_alive():
+            raise ConnectionError("连接已断开")
+        started = time.monotonic()
+        # 服务器对未知的全局请求回复失败，同样是一次完整往返
+        self.transport.global_request("keepalive@openssh.com", wait=True)
+        if not self.is_alive():
+            raise ConnectionError("连接已断开")
+        return time.monotonic() - started
+
+    def close(self):
+        if self.agent is not None:
+            self.agent.close()
+            self.agent = None
+        try:
+            if self._sftp is not None:
+                self._sftp.close()
+        except Exception:
+            pass
+        try:
+            self.ssh.close()
+        except Exception:
+            pass
+        self._sftp = None
+
+
+class _ServerSlot:
+    """单个服务器的空闲连接与计数"""
+
+    def __init__(self):
+        self.idle: List[PooledConnection] = []
+        self.in_use = 0
+        self.connecting = 0
+
+    @property
+    def total(self) -> int:
+        return len(self.idle) + self.in_use + self.connecting
+
+
+class SSHConnectionPool:
+    """
+    线程安全的 SSH 连接池
+
+    - 每个服务器最多 max_size_per_server 条连接，满时等待归还
+    - 借出前检查连接存活，已断开的连接自动丢弃并重连
+    - 空闲超过 idle_timeout 的连接在下次访问连接池时关闭
+    """
+
+    def __init__(
+        self,
+        max_size_per_server: int = DEFAULT_MAX_SIZE_PER_SERVER,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        keepalive_interval: int = DEFAULT_KEEPALIVE_INTERVAL,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+    ):
+        self.max_size_per_server = max_size_per_server
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self._slots: Dict[Tuple[str, int, str], _ServerSlot] = {}
+        self._cond = threading.Condition()
+        # 新建连接前的检查：返回不可用原因时直接失败，不等待连接超时（由健康监测设置）
+        self.health_gate: Optional[Callable[[Tuple[str, int, str]], Optional[str]]] = None
+
+    def _connect(self, key: Tuple[str, int, str], ssh_info: Dict[str, Any]) -> PooledConnection:
+        host, port, username = key
+        ssh = open_ssh_client(ssh_info, self.connect_timeout)
+        transport = ssh.get_transport()
+        if transport is not None and self.keepalive_interval:
+            transport.set_keepalive(self.keepalive_interval)
+        tuned = " tuned" if ssh_info.get("tuning") else ""
+        logger.info(f"[SSHConnectionPool] new{tuned} connection: host={host} port={port} user={username}")
+        return PooledConnection(key, ssh)
+
+    def _reap_idle_locked(self, now: float) -> List[PooledConnection]:
+        """移出超时的空闲连接，调用方在锁外关闭"""
+        expired = []
+        for slot in self._slots.values():
+            keep = []
+            for conn in slot.idle:
+                if now - conn.last_used > self.idle_timeout:
+                    expired.append(conn)
+                else:
+                    keep.append(conn)
+            slot.idle = keep
+        return expired
+
+    def acquire(self, ssh_info: Dict[str, Any], timeout: Optional[float] = None) -> PooledConnection:
+        """
+        借出一条可用连接，用完必须调用 release
+
+        Args:
+            timeout: 连接池已满时的等待秒数，默认 acquire_timeout；为 0 时不等待直接抛出 TimeoutError
+        """
+        key = server_key(ssh_info)
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            candidate = None
+            create = False
+            with self._cond:
+                now = time.monotonic()
+                expired = self._reap_idle_locked(now)
+                slot = self._slots.setdefault(key, _ServerSlot())
+                while True:
+                    if slot.idle:
+                        candidate = slot.idle.pop()
+                        slot.in_use += 1
+                        break
+                    if slot.total < self.max_size_per_server:
+                        slot.connecting += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"等待SSH连接超时: {key[2]}@{key[0]}:{key[1]}")
+                    self._cond.wait(remaining)
+            for conn in expired:
+                conn.close()
+
+            if create:
+                try:
+                    reason = self.health_gate(key) if self.health_gate is not None else None
+                    if reason:
+                        raise ConnectionError(f"服务器不可用: {reason}")
+                    conn = self._connect(key, ssh_info)
+                except Exception:
+                    with self._cond:
+                        slot.connecting -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    slot.connecting -= 1
+                    slot.in_use += 1
+                conn.last_used = time.monotonic()
+                return conn
+
+            # 复用空闲连接前确认其仍然可用，否则丢弃后重新获取
+            idle_for = time.monotonic() - candidate.last_used
+            healthy = candidate.is_alive() and (
+                idle_for < HEALTH_CHECK_AFTER_IDLE or candidate.check_health()
+            )
+            if healthy:
+                candidate.last_used = time.monotonic()
+                return candidate
+            logger.info(f"[SSHConnectionPool] dropping stale connection: {key}")
+            self._discard(candidate)
+
+    def release(self, conn: PooledConnection):
+        """归还连接，已损坏的连接直接关闭"""
+        conn.last_used = time.monotonic()
+        if not conn.is_alive():
+            self._discard(conn)
+            return
+        with self._cond:
+            slot = self._slots.setdefault(conn.key, _ServerSlot())
+            slot.in_use -= 1
+            slot.idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn: PooledConnection):
+        with self._cond:
+            slot = self._slots.get(conn.key)
+            if slot is not None:
+                slot.in_use -= 1
+            self._cond.notify()
+        conn.close()
+
+    @contextmanager
+    def connection(self, ssh_info: Dict[str, Any]):
+        """
+        借用连接的上下文管理器
+
+        操作中途出现异常时检查连接状态，连接已断开则不再放回池中
+        """
+        conn = self.acquire(ssh_info)
+        try:
+            yield conn
+        except Exception:
+            if not conn.check_health():
+                conn.broken = True
+            raise
+        finally:
+            self.release(conn)
+
+    def run(self, ssh_info: Dict[str, Any], func, retries: int = 1):
+        """
+        在池化连接上执行 func(conn)
+
+        若执行失败且连接已断开（服务器重启、网络闪断），换一条新连接重试，
+        调用方无需关心重连。只应用于幂等操作。
+        """
+        attempt = 0
+        while True:
+            conn = self.acquire(ssh_info)
+            try:
+                return func(conn)
+            except Exception as e:
+                if conn.check_health() or attempt >= retries:
+                    if not conn.is_alive():
+                        conn.broken = True
+                    raise
+                conn.broken = True
+                attempt += 1
+                logger.warning(f"[SSHConnectionPool] connection lost, reconnecting: {conn.key} error={e}")
+            finally:
+                self.release(conn)
+
+    def ping_idle(self, ssh_info: Dict[str, Any]) -> Optional[float]:
+        """
+        在该服务器的一条空闲连接上做一次 keepalive 往返，没有空闲连接时返回 None
+
+        不会为探测新建连接；探测失败的连接标记为损坏，归还时关闭。
+        """
+        key = server_key(ssh_info)
+        with self._cond:
+            slot = self._slots.get(key)
+            if slot is None or not slot.idle:
+                return None
+            conn = slot.idle.pop()
+            slot.in_use += 1
+        try:
+            return conn.ping()
+        except Exception:
+            conn.broken = True
+            raise
+        finally:
+            # 探测不算使用，保持原来的空闲时间
+            last_used = conn.last_used
+            self.release(conn)
+            conn.last_used = last_used
+
+    def evict(self, ssh_info: Dict[str, Any]):
+        """关闭某个服务器的全部空闲连接（例如密码变更后）"""
+        key = server_key(ssh_info)
+        with self._cond:
+            slot = self._slots.get(key)
+            idle = slot.idle if slot else []
+            if slot:
+                slot.idle = []
+        for conn in idle:
+            conn.close()
+
+    def close_all(self):
+        with self._cond:
+            idle = [conn for slot in self._slots.values() for conn in slot.idle]
+            for slot in self._slots.values():
+                slot.idle = []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                f"{user}@{host}:{port}": {
+                    "idle": len(slot.idle),
+                    "in_use": slot.in_use,
+                }
+                for (host, port, user), slot in self._slots.items()
+            }
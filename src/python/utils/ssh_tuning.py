@@ -0,0 +1,122 @@
+"""
+SSH 传输调优
+
+remote_server_list 中服务器的 config 可带 "tuning"，作用于该服务器之后新建的连接：
+
+    "tuning": {
+        "ciphers": ["aes128-gcm@openssh.com", "aes128-ctr"],
+        "window_size": 67108864,
+        "max_packet_size": 32768,
+        "compress": false
+    }
+
+- ciphers: 优先协商的加密算法，排在 paramiko 默认顺序之前；paramiko 不支持的算法（如 chacha20-poly1305）跳过并记录警告
+- window_size / max_packet_size: 本端通告的通道接收窗口和最大包大小，SFTP 与 exec 通道都使用，决定下载方向能有多少数据在途
+- compress: 是否启用 SSH 层 zlib 压缩，只在慢速链路且数据可压缩时有利
+
+TUNING_PROFILES 是几组预设，RemoteFileService.benchmark_tuning 用新连接逐个测量吞吐量并可把最快的写回配置，
+命令行入口为 benchmarks/bench_ssh_tuning.py。
+"""
+
+from typing import Any, Dict, List, Optional
+
+import paramiko
+from paramiko.common import MAX_WINDOW_SIZE, MIN_PACKET_SIZE, MIN_WINDOW_SIZE
+
+from .log_util import default_logger as logger
+
+TUNING_KEYS = ("ciphers", "window_size", "max_packet_size", "compress")
+# 超过 OpenSSH 单个包的上限（256KB）没有意义
+MAX_PACKET_SIZE = 256 * 1024
+
+TUNING_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    # 低延迟高带宽：paramiko 的瓶颈在加解密，GCM 省掉单独的 MAC 计算
+    "lan": {"ciphers": ["aes128-gcm@openssh.com", "aes128-ctr"], "window_size": 64 * 1024 * 1024, "compress": False},
+    "lan-ctr": {"ciphers": ["aes128-ctr"], "window_size": 64 * 1024 * 1024, "compress": False},
+    # 高延迟链路：窗口要覆盖带宽时延积
+    "wan": {"ciphers": ["aes128-gcm@openssh.com"], "window_size": 32 * 1024 * 1024, "compress": False},
+    "wan-compress": {"ciphers": ["aes128-gcm@openssh.com"], "window_size": 32 * 1024 * 1024, "compress": True},
+}
+
+# 测量吞吐量时在远程生成数据的命令：random 不可压缩，text 近似日志/源码类可压缩数据
+BENCH_COMMANDS = {
+    "random": "head -c {size} /dev/urandom",
+    "text": "seq 1 1000000000 | head -c {size}",
+}
+BENCH_SIZE = 64 * 1024 * 1024
+BENCH_READ_SIZE = 256 * 1024
+
+
+def normalize_tuning(tuning: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """校验调优配置并返回副本，不合法时抛出 ValueError"""
+    if tuning is None:
+        return {}
+    if not isinstance(tuning, dict):
+        raise ValueError("tuning 必须是对象")
+    unknown = set(tuning) - set(TUNING_KEYS)
+    if unknown:
+        raise ValueError(f"未知的调优项: {', '.join(sorted(unknown))}")
+    result: Dict[str, Any] = {}
+    if "ciphers" in tuning:
+        ciphers = tuning["ciphers"]
+        if not isinstance(ciphers, list) or not all(isinstance(c, str) and c for c in ciphers):
+            raise ValueError("ciphers 必须是算法名称列表")
+        result["ciphers"] = list(ciphers)
+    for key, low, high in (("window_size", MIN_WINDOW_SIZE, MAX_WINDOW_SIZE),
+                           ("max_packet_size", MIN_PACKET_SIZE, MAX_PACKET_SIZE)):
+        if key in tuning:
+            value = tuning[key]
+            if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+                raise ValueError(f"{key} 必须是 {low} 到 {high} 之间的整数")
+            result[key] = value
+    if "compress" in tuning:
+        if not isinstance(tuning["compress"], bool):
+            raise ValueError("compress 必须是布尔值")
+        result["compress"] = tuning["compress"]
+    return result
+
+
+def preferred_ciphers(ciphers: List[str]) -> List[str]:
+    """把指定算法排到 paramiko 默认顺序之前，去掉 paramiko 不支持的"""
+    supported = paramiko.Transport._preferred_ciphers
+    chosen = [c for c in ciphers if c in supported]
+    skipped = [c for c in ciphers if c not in supported]
+    if skipped:
+        logger.warning(f"[SSHTuning] ciphers not supported by paramiko, skipped: {', '.join(skipped)}")
+    return chosen + [c for c in supported if c not in chosen]
+
+
+def connect_options(tuning: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    把调优配置转换为 SSHClient.connect 的参数
+
+    没有调优项时返回空字典，连接行为与 paramiko 默认完全相同。
+    """
+    tuning = normalize_tuning(tuning)
+    if not tuning:
+        return {}
+    options: Dict[str, Any] = {"compress": tuning.get("compress", False)}
+    transport_kwargs = {}
+    if "window_size" in tuning:
+        transport_kwargs["default_window_size"] = tuning["window_size"]
+    if "max_packet_size" in tuning:
+        transport_kwargs["default_max_packet_size"] = tuning["max_packet_size"]
+    ciphers = preferred_ciphers(tuning["ciphers"]) if tuning.get("ciphers") else None
+    if transport_kwargs or ciphers:
+        def transport_factory(sock, **kwargs):
+            transport = paramiko.Transport(sock, **transport_kwargs, **kwargs)
+            if ciphers:
+                transport.get_security_options().ciphers = ciphers
+            return transport
+
+        options["transport_factory"] = transport_factory
+    return options
+
+
+def pick_best(results: List[Dict[str, Any]]) -> Optional[str]:
+    """从 benchmark 结果中选出吞吐量最高的配置名，全部失败时返回 None"""
+    measured = [r for r in results if r.get("success")]
+    if not measured:
+        return None
+    return max(measured, key=lambda r: r["throughput"])["profile"]
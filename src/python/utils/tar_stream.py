@@ -0,0 +1,117 @@
+"""
+边接收边打包的 tar 流
+
+文件夹上传时把收到的文件逐个写成 tar 成员，整个流经一次 exec 交给远程的 tar -x 解包，
+省去逐文件的连接、stat、mkdir 和 open/close 往返。tar 头需要事先知道文件大小，
+因此调用方要提供每个成员的大小（由前端随请求发送的清单给出），实际数据长度不符时中止。
+"""
+
+import json
+import posixpath
+import tarfile
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+TAR_BLOCK_SIZE = 512
+# 合并小块后再写入 SSH 通道，避免每个小文件都产生若干个小数据包
+TAR_WRITE_SIZE = 256 * 1024
+DEFAULT_FILE_MODE = 0o644
+DEFAULT_DIR_MODE = 0o755
+
+# (成员名, 大小, 修改时间, 数据块迭代器)；数据块迭代器为 None 表示目录
+TarMember = Tuple[str, int, Optional[float], Iterable[bytes]]
+
+
+def safe_member_name(name: str) -> str:
+    """
+    规范化成员名为相对路径
+
+    Raises:
+        ValueError: 空名称、绝对路径或包含 ".."
+    """
+    name = (name or "").replace("\\", "/")
+    if name.startswith("/"):
+        raise ValueError(f"不允许绝对路径: {name}")
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if not parts:
+        raise ValueError("文件名为空")
+    if ".." in parts:
+        raise ValueError(f"文件名不能包含 ..: {name}")
+    return posixpath.join(*parts)
+
+
+def parse_manifest(text: str) -> List[Tuple[str, int, Optional[float]]]:
+    """
+    解析前端发送的文件清单 [{"name", "size", "mtime"?}]，返回 (规范化的名称, 大小, 修改时间) 列表
+
+    Raises:
+        ValueError: 清单格式错误或包含非法文件名
+    """
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"文件清单格式错误: {e}")
+    if not isinstance(entries, list):
+        raise ValueError("文件清单格式错误")
+    manifest = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError("文件清单格式错误")
+        size = entry.get("size")
+        if not isinstance(size, int) or size < 0:
+            raise ValueError(f"文件大小无效: {entry.get('name')}")
+        mtime = entry.get("mtime")
+        manifest.append((safe_member_name(entry.get("name")), size, float(mtime) if mtime else None))
+    return manifest
+
+
+def tar_header(name: str, size: int, mtime: Optional[float] = None, mode: int = DEFAULT_FILE_MODE,
+               type: bytes = tarfile.REGTYPE) -> bytes:
+    """普通文件（或目录）的 tar 头；PAX 格式支持长路径和非 ASCII 文件名"""
+    info = tarfile.TarInfo(safe_member_name(name))
+    info.size = size
+    info.mtime = int(mtime if mtime else time.time())
+    info.mode = mode
+    info.type = type
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+
+
+def iter_tar(members: Iterable[TarMember]) -> Iterator[bytes]:
+    """
+    把成员依次编码为 tar 流（含结尾的两个空块）
+
+    Raises:
+        ValueError: 某个成员的数据长度与声明的大小不符
+    """
+    for name, size, mtime, chunks in members:
+        if chunks is None:
+            yield tar_header(name, 0, mtime, DEFAULT_DIR_MODE, tarfile.DIRTYPE)
+            continue
+        yield tar_header(name, size, mtime)
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            if written > size:
+                raise ValueError(f"文件大小与清单不符: {name}")
+            yield chunk
+        if written != size:
+            raise ValueError(f"文件大小与清单不符: {name}（清单 {size}，实际 {written}）")
+        padding = -size % TAR_BLOCK_SIZE
+        if padding:
+            yield b"\0" * padding
+    yield b"\0" * (TAR_BLOCK_SIZE * 2)
+
+
+def coalesce(chunks: Iterable[bytes], size: int = TAR_WRITE_SIZE) -> Iterator[bytes]:
+    """把小块合并为约 size 字节的大块，大块原样透传"""
+    buffer = bytearray()
+    for chunk in chunks:
+        if not buffer and len(chunk) >= size:
+            yield chunk
+            continue
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
@@ -0,0 +1,575 @@
+"""
+SFTP 并行分块传输引擎
+
+单流 sftp.get/put 每次只有有限的请求在途，在高延迟链路上吞吐受 RTT 限制。
+这里把大文件切成多个区间，由多个 SFTP 通道/连接并行处理，每个通道内部再用
+readv/流水线写保持大量请求在途；区间大小与在途请求数根据实测 RTT 和吞吐自适应调整。
+"""
+
+import hashlib
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import paramiko
+from paramiko.sftp import CMD_STATUS
+
+from .log_util import default_logger as logger
+
+# SFTP 单个读写请求的大小（paramiko 的 max_request_size）
+SFTP_REQUEST_SIZE = 32 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+INITIAL_CHUNK_SIZE = 1024 * 1024
+MIN_INFLIGHT_REQUESTS = 16
+MAX_INFLIGHT_REQUESTS = 256
+DEFAULT_MAX_CHANNELS = 4
+# 小于该大小的文件不值得拆分，直接单通道传输
+PARALLEL_THRESHOLD = 8 * 1024 * 1024
+# RTT 低于该值（秒）时多通道收益有限，只开两路
+LOW_LATENCY_RTT = 0.005
+# 连接中断后的重连续传：最多重试次数，首次等待与最长等待（秒，指数退避）
+DEFAULT_RESUME_ATTEMPTS = 8
+RESUME_INITIAL_DELAY = 1.0
+RESUME_MAX_DELAY = 30.0
+# 续传前比对最后一个已确认区间尾部的字节数
+RESUME_VERIFY_BYTES = 64 * 1024
+
+
+def format_rate(bytes_per_sec: float) -> str:
+    units = ["B/s", "KB/s", "MB/s", "GB/s"]
+    i = 0
+    while bytes_per_sec >= 1024 and i < len(units) - 1:
+        bytes_per_sec /= 1024
+        i += 1
+    return f"{bytes_per_sec:.2f} {units[i]}"
+
+
+class TransferStats:
+    """一次传输的统计信息（线程安全）"""
+
+    def __init__(self, direction: str, path: str, total_bytes: int = 0):
+        self.direction = direction
+        self.path = path
+        self.total_bytes = total_bytes
+        self.bytes_transferred = 0
+        self.channels = 1
+        self.rtt: Optional[float] = None
+        self.resumes = 0
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, nbytes: int):
+        with self._lock:
+            self.bytes_transferred += nbytes
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(end - self.started_at, 1e-6)
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.bytes_transferred / self.elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "direction": self.direction,
+            "path": self.path,
+            "total_bytes": self.total_bytes,
+            "bytes_transferred": self.bytes_transferred,
+            "elapsed": round(self.elapsed, 3),
+            "bytes_per_sec": round(self.bytes_per_sec, 1),
+            "channels": self.channels,
+            "rtt_ms": round(self.rtt * 1000, 2) if self.rtt is not None else None,
+            "resumes": self.resumes,
+        }
+
+
+class AdaptiveTuner:
+    """
+    根据 RTT 与吞吐调整区间大小和每通道在途请求数
+
+    在途数据量按带宽时延积（吞吐 × RTT）估算，保证链路始终被填满；
+    区间大小取每通道约 0.5 秒的数据量，兼顾调度开销和负载均衡。
+    """
+
+    def __init__(self, rtt: float, chunk_size: int = INITIAL_CHUNK_SIZE):
+        self.rtt = max(rtt, 1e-4)
+        self.chunk_size = chunk_size
+        self.inflight = self._inflight_for(throughput=None)
+        self.throughput: Optional[float] = None  # 平滑后的单通道吞吐，bytes/s
+        self._lock = threading.Lock()
+
+    def _inflight_for(self, throughput: Optional[float]) -> int:
+        if throughput is None:
+            # 尚无吞吐数据时按每个 RTT 至少传输 1MB 估算
+            bdp = 1024 * 1024
+        else:
+            bdp = throughput * self.rtt * 2
+        requests = math.ceil(bdp / SFTP_REQUEST_SIZE)
+        return max(MIN_INFLIGHT_REQUESTS, min(MAX_INFLIGHT_REQUESTS, requests))
+
+    def record(self, nbytes: int, elapsed: float):
+        if nbytes <= 0 or elapsed <= 0:
+            return
+        sample = nbytes / elapsed
+        with self._lock:
+            if self.throughput is None:
+                self.throughput = sample
+            else:
+                self.throughput = 0.7 * self.throughput + 0.3 * sample
+            target = int(self.throughput * 0.5)
+            self.chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, target))
+            self.inflight = self._inflight_for(self.throughput)
+
+    def channels_for(self, size: int, max_channels: int) -> int:
+        if size < PARALLEL_THRESHOLD:
+            return 1
+        if self.rtt < LOW_LATENCY_RTT:
+            return min(2, max_channels)
+        return max(1, min(max_channels, math.ceil(size / MIN_CHUNK_SIZE)))
+
+
+class _RangeScheduler:
+    """
+    按当前自适应区间大小依次分配 (offset, length)
+
+    区间完成后调用 confirm 记为已确认；连接中断时未确认的区间经 give_back 退回，续传时优先重新分配。
+    """
+
+    def __init__(self, size: int, tuner: AdaptiveTuner):
+        self.size = size
+        self.tuner = tuner
+        self._offset = 0
+        self._returned: List[Tuple[int, int]] = []
+        self.confirmed: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+
+    def next_range(self) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            if self._returned:
+                return self._returned.pop()
+            if self._offset >= self.size:
+                return None
+            length = min(self.tuner.chunk_size, self.size - self._offset)
+            offset = self._offset
+            self._offset += length
+            return offset, length
+
+    def give_back(self, ranges: Iterable[Tuple[int, int]]):
+        with self._lock:
+            self._returned.extend(ranges)
+
+    def confirm(self, confirmed_range: Tuple[int, int]):
+        with self._lock:
+            self.confirmed.append(confirmed_range)
+
+    @property
+    def confirmed_bytes(self) -> int:
+        with self._lock:
+            return sum(length for _, length in self.confirmed)
+
+    def last_confirmed(self) -> Optional[Tuple[int, int]]:
+        """偏移最大的已确认区间，续传前用它的尾部校验远程数据"""
+        with self._lock:
+            return max(self.confirmed, default=None)
+
+    def reset(self):
+        """丢弃全部进度，从头开始"""
+        with self._lock:
+            self._offset = 0
+            self._returned = []
+            self.confirmed = []
+
+
+class _LocalWriter:
+    """支持并发按偏移写入的本地文件"""
+
+    def __init__(self, path: str, size: int):
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        os.ftruncate(self._fd, size)
+        self._lock = threading.Lock()
+
+    def write_at(self, offset: int, data: bytes):
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            while view:
+                n = os.pwrite(self._fd, view, offset)
+                view = view[n:]
+                offset += n
+        else:  # pragma: no cover - Windows
+            with self._lock:
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                os.write(self._fd, data)
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _LocalReader:
+    """支持并发按偏移读取的本地文件或可 seek 的文件对象"""
+
+    def __init__(self, source):
+        self._lock = threading.Lock()
+        self._fd = None
+        self._fileobj = None
+        if isinstance(source, (str, bytes, os.PathLike)):
+            self._fd = os.open(source, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        else:
+            self._fileobj = source
+
+    def read_at(self, offset: int, length: int) -> bytes:
+        if self._fd is not None and hasattr(os, "pread"):
+            chunks = []
+            while length > 0:
+                data = os.pread(self._fd, length, offset)
+                if not data:
+                    break
+                chunks.append(data)
+                offset += len(data)
+                length -= len(data)
+            return b"".join(chunks)
+        with self._lock:
+            if self._fd is not None:  # pragma: no cover - Windows
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                return os.read(self._fd, length)
+            self._fileobj.seek(offset)
+            return self._fileobj.read(length)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+
+
+class SFTPTransferEngine:
+    """
+    基于连接池的并行 SFTP 传输
+
+    额外的通道优先从连接池借独立连接（各自有独立的 TCP 窗口），
+    连接池已满时在主连接上再开 SFTP 通道。
+    """
+
+    def __init__(self, pool, max_channels: int = DEFAULT_MAX_CHANNELS,
+                 on_done: Optional[Callable[[Dict[str, Any], TransferStats], None]] = None,
+                 resume_attempts: int = DEFAULT_RESUME_ATTEMPTS):
+        self.pool = pool
+        self.max_channels = max_channels
+        self.resume_attempts = resume_attempts
+        # 每次传输完成后以 (ssh_info, stats) 调用，用于估算服务器吞吐量
+        self.on_done = on_done
+
+    @staticmethod
+    def measure_rtt(sftp) -> float:
+        """用一次 normalize 往返估算 RTT"""
+        start = time.monotonic()
+        sftp.normalize(".")
+        return time.monotonic() - start
+
+    def _open_channels(self, ssh_info: Dict[str, Any], primary, count: int):
+        """返回 [(sftp, 释放函数)]，第一个通道总是主连接的 SFTP"""
+        channels = [(primary.sftp, lambda: None)]
+        for _ in range(count - 1):
+            try:
+                conn = self.pool.acquire(ssh_info, timeout=0)
+                channels.append((conn.sftp, lambda c=conn: self.pool.release(c)))
+                continue
+            except TimeoutError:
+                pass
+            except Exception as e:
+                logger.warning(f"[TransferEngine] extra connection failed, use extra channel: {e}")
+            try:
+                extra = primary.ssh.open_sftp()
+                channels.append((extra, extra.close))
+            except Exception as e:
+                logger.warning(f"[TransferEngine] open extra sftp channel failed: {e}")
+                break
+        return channels
+
+    def _run_workers(self, channels, worker: Callable):
+        errors: List[BaseException] = []
+        threads = []
+        for sftp, _ in channels:
+            t = threading.Thread(target=self._guard, args=(worker, sftp, errors), daemon=True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        for _, release in channels:
+            try:
+                release()
+            except Exception:
+                pass
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def _guard(worker: Callable, sftp, errors: List[BaseException]):
+        try:
+            worker(sftp)
+        except BaseException as e:
+            errors.append(e)
+
+    def _transfer(self, ssh_info: Dict[str, Any], conn, channel_count: int, worker: Callable,
+                  stats: TransferStats, verify: Callable):
+        """
+        运行各通道的 worker，连接中断时退避重连并续传
+
+        Args:
+            verify: 续传前以新的主连接调用 verify(conn)，由它校验远程文件并决定从确认位置继续还是从头开始
+        """
+        primary = conn
+        owned = None
+        attempt = 0
+        try:
+            while True:
+                channels = self._open_channels(ssh_info, primary, channel_count)
+                stats.channels = max(stats.channels, len(channels))
+                try:
+                    self._run_workers(channels, worker)
+                    return
+                except Exception as e:
+                    if attempt >= self.resume_attempts or not is_connection_lost(e, primary):
+                        raise
+                    error = e
+                while True:
+                    attempt += 1
+                    stats.resumes += 1
+                    delay = resume_delay(attempt)
+                    logger.warning(
+                        f"[TransferEngine] {stats.direction} interrupted: path={stats.path} error={error} "
+                        f"attempt={attempt}/{self.resume_attempts} retry_in={delay:.1f}s"
+                    )
+                    time.sleep(delay)
+                    try:
+                        if not primary.check_health():
+                            primary.broken = True
+                            if owned is not None:
+                                self.pool.release(owned)
+                                owned = None
+                            owned = primary = self.pool.acquire(ssh_info)
+                        verify(primary)
+                        break
+                    except Exception as e:
+                        if attempt >= self.resume_attempts or not is_connection_lost(e, primary):
+                            raise
+                        error = e
+        finally:
+            if owned is not None:
+                self.pool.release(owned)
+            stats.finish()
+
+    def download(self, ssh_info: Dict[str, Any], conn, remote_path: str, local_path: str,
+                 size: Optional[int] = None, mtime: Optional[float] = None) -> TransferStats:
+        """
+        把远程文件并行下载到本地路径
+
+        连接中断时重连续传：远程文件的大小和修改时间未变则只补未完成的区间，变了则从头下载。
+
+        Args:
+            conn: 已借出的主连接，由调用方负责归还
+            size: 远程文件大小，未提供时先 stat
+            mtime: 远程文件修改时间，续传时用于判断文件是否变化；只提供 size 时续传只比较大小
+        """
+        if size is None:
+            attrs = conn.sftp.stat(remote_path)
+            size, mtime = attrs.st_size, attrs.st_mtime
+        stats = TransferStats("download", remote_path, size)
+        tuner = AdaptiveTuner(self.measure_rtt(conn.sftp))
+        stats.rtt = tuner.rtt
+        scheduler = _RangeScheduler(size, tuner)
+        writer = _LocalWriter(local_path, size)
+
+        def worker(sftp):
+            with sftp.open(remote_path, "rb") as remote_file:
+                while True:
+                    next_range = scheduler.next_range()
+                    if next_range is None:
+                        return
+                    offset, length = next_range
+                    started = time.monotonic()
+                    pieces = _split(offset, length, SFTP_REQUEST_SIZE)
+                    done = 0
+                    try:
+                        for (piece_offset, _), data in zip(
+                            pieces, remote_file.readv(pieces, max_concurrent_prefetch_requests=tuner.inflight)
+                        ):
+                            writer.write_at(piece_offset, data)
+                            done += len(data)
+                    except BaseException:
+                        # readv 按顺序返回，已写入的前缀保留，只退回剩余部分
+                        if done:
+                            scheduler.confirm((offset, done))
+                            stats.add(done)
+                        scheduler.give_back([(offset + done, length - done)])
+                        raise
+                    scheduler.confirm(next_range)
+                    stats.add(length)
+                    tuner.record(length, time.monotonic() - started)
+
+        def verify(primary):
+            current = primary.sftp.stat(remote_path)
+            if current.st_size != size or (mtime is not None and current.st_mtime != mtime):
+                logger.warning(f"[TransferEngine] remote file changed, restart download: path={remote_path}")
+                scheduler.reset()
+            else:
+                logger.info(f"[TransferEngine] resume download: path={remote_path} "
+                            f"confirmed={scheduler.confirmed_bytes}/{size}")
+
+        try:
+            self._transfer(ssh_info, conn, tuner.channels_for(size, self.max_channels), worker, stats, verify)
+        finally:
+            writer.close()
+        self._done(ssh_info, stats)
+        return stats
+
+    def upload(self, ssh_info: Dict[str, Any], conn, source, remote_path: str, size: int) -> TransferStats:
+        """
+        把本地文件（路径或可 seek 的文件对象）并行上传到远程路径
+
+        流水线写只有收到服务器确认的区间才算完成。连接中断时重连续传：远程文件不短于已确认的数据、
+        且最后一个已确认区间的尾部与本地一致时只补未确认的区间，否则从头上传。
+
+        Args:
+            conn: 已借出的主连接，由调用方负责归还
+        """
+        stats = TransferStats("upload", remote_path, size)
+        tuner = AdaptiveTuner(self.measure_rtt(conn.sftp))
+        stats.rtt = tuner.rtt
+        scheduler = _RangeScheduler(size, tuner)
+        reader = _LocalReader(source)
+        # 先创建（截断）目标文件，各通道再以读写模式按偏移写入
+        with conn.sftp.open(remote_path, "wb"):
+            pass
+
+        def worker(sftp):
+            # (区间, 该区间最后一个写请求号)，写确认到达前区间不算完成
+            unconfirmed: Deque[Tuple[Tuple[int, int], Optional[int]]] = deque()
+
+            def _confirm_oldest(remote_file):
+                done_range, last_request = unconfirmed[0]
+                _wait_writes(remote_file, last_request)
+                unconfirmed.popleft()
+                scheduler.confirm(done_range)
+                stats.add(done_range[1])
+
+            try:
+                with sftp.open(remote_path, "r+b") as remote_file:
+                    remote_file.set_pipelined(True)
+                    while True:
+                        next_range = scheduler.next_range()
+                        if next_range is None:
+                            break
+                        offset, length = next_range
+                        started = time.monotonic()
+                        unconfirmed.append((next_range, None))
+                        data = reader.read_at(offset, length)
+                        remote_file.seek(offset)
+                        remote_file.write(data)
+                        unconfirmed[-1] = (next_range, _last_request(remote_file))
+                        # 上一个区间的写确认此时通常已经到达，等它不会打断流水线
+                        while len(unconfirmed) > 1:
+                            _confirm_oldest(remote_file)
+                        tuner.record(len(data), time.monotonic() - started)
+                    while unconfirmed:
+                        _confirm_oldest(remote_file)
+                # 退出 with 时 close 等待其余写确认
+            except BaseException:
+                scheduler.give_back(r for r, _ in unconfirmed)
+                raise
+
+        def verify(primary):
+            sftp = primary.sftp
+            last = scheduler.last_confirmed()
+            try:
+                current = sftp.stat(remote_path)
+            except IOError:
+                current = None
+            intact = current is not None and (last is None or current.st_size >= last[0] + last[1])
+            if intact and last is not None:
+                tail = min(RESUME_VERIFY_BYTES, last[1])
+                tail_offset = last[0] + last[1] - tail
+                with sftp.open(remote_path, "rb") as remote_file:
+                    remote_file.seek(tail_offset)
+                    remote_tail = remote_file.read(tail)
+                intact = (hashlib.sha256(remote_tail).digest()
+                          == hashlib.sha256(reader.read_at(tail_offset, tail)).digest())
+            if intact:
+                logger.info(f"[TransferEngine] resume upload: path={remote_path} "
+                            f"confirmed={scheduler.confirmed_bytes}/{size}")
+                return
+            logger.warning(f"[TransferEngine] remote partial file does not match, restart upload: path={remote_path}")
+            scheduler.reset()
+            with sftp.open(remote_path, "wb"):
+                pass
+
+        try:
+            self._transfer(ssh_info, conn, tuner.channels_for(size, self.max_channels), worker, stats, verify)
+        finally:
+            reader.close()
+        self._done(ssh_info, stats)
+        return stats
+
+    def _done(self, ssh_info: Dict[str, Any], stats: TransferStats):
+        self._log_done(stats)
+        if self.on_done is not None:
+            try:
+                self.on_done(ssh_info, stats)
+            except Exception as e:
+                logger.warning(f"[TransferEngine] on_done callback failed: {e}")
+
+    @staticmethod
+    def _log_done(stats: TransferStats):
+        logger.info(
+            f"[TransferEngine] {stats.direction} done: path={stats.path} bytes={stats.bytes_transferred} "
+            f"elapsed={stats.elapsed:.2f}s rate={format_rate(stats.bytes_per_sec)} "
+            f"channels={stats.channels} rtt_ms={stats.to_dict()['rtt_ms']}"
+        )
+
+
+def is_connection_lost(error: BaseException, conn) -> bool:
+    """区分连接中断（值得重连续传）与文件不存在、无权限等普通错误"""
+    if isinstance(error, (EOFError, ConnectionError, socket.timeout, paramiko.SSHException)):
+        return True
+    return not conn.check_health()
+
+
+def resume_delay(attempt: int) -> float:
+    """第 attempt 次重连前的等待秒数，指数退避"""
+    return min(RESUME_MAX_DELAY, RESUME_INITIAL_DELAY * 2 ** (attempt - 1))
+
+
+def _last_request(remote_file) -> Optional[int]:
+    """paramiko 流水线写最后一个尚未确认的请求号；非流水线或已全部确认时为 None"""
+    requests = getattr(remote_file, "_reqs", None)
+    return requests[-1] if requests else None
+
+
+def _wait_writes(remote_file, last_request: Optional[int]):
+    """等待请求号不大于 last_request 的流水线写确认，写失败时抛出对应错误"""
+    requests = getattr(remote_file, "_reqs", None)
+    if last_request is None or not requests:
+        return
+    while requests and requests[0] <= last_request:
+        number = requests.popleft()
+        t, _ = remote_file.sftp._read_response(number)
+        if t != CMD_STATUS:
+            raise paramiko.SFTPError("Expected status")
+
+
+def _split(offset: int, length: int, piece: int) -> List[Tuple[int, int]]:
+    pieces = []
+    end = offset + length
+    while offset < end:
+        n = min(piece, end - offset)
+        pieces.append((offset, n))
+        offset += n
+    return pieces
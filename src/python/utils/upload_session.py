@@ -0,0 +1,162 @@
+"""
+分块上传会话
+
+客户端先创建会话，再以任意顺序、并发地上传编号分块，最后提交。
+会话只记录元数据（目标路径、临时文件、已收到的分块），分块数据由文件服务直接写到临时文件的对应偏移处。
+"""
+
+import math
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from .log_util import default_logger as logger
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_SESSION_TTL = 24 * 3600  # 超过该秒数无活动的会话视为放弃
+
+
+class UploadSession:
+    """一次分块上传"""
+
+    def __init__(self, upload_id: str, mode: str, path: str, temp_path: str, size: int, chunk_size: int,
+                 server: Optional[str] = None):
+        self.upload_id = upload_id
+        self.mode = mode
+        self.server = server  # 远程模式下创建会话时所选的服务器
+        self.path = path
+        self.temp_path = temp_path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.total_chunks = max(1, math.ceil(size / chunk_size))
+        self.received: Set[int] = set()
+        self.writing: Set[int] = set()
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def chunk_range(self, index: int):
+        """分块 index 在文件中的 (offset, length)"""
+        offset = index * self.chunk_size
+        return offset, max(0, min(self.chunk_size, self.size - offset))
+
+    def missing(self) -> List[int]:
+        return [i for i in range(self.total_chunks) if i not in self.received]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "upload_id": self.upload_id,
+            "mode": self.mode,
+            "server": self.server,
+            "path": self.path,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "total_chunks": self.total_chunks,
+            "received": sorted(self.received),
+        }
+
+
+class UploadSessionManager:
+    """
+    线程安全的上传会话表
+
+    同一分块同时只允许一个请求写入；过期会话通过 expire() 取出，由调用方清理临时文件。
+    """
+
+    def __init__(self, ttl: float = DEFAULT_SESSION_TTL):
+        self.ttl = ttl
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_chunk_size(chunk_size: Optional[int]) -> int:
+        if not chunk_size:
+            return DEFAULT_CHUNK_SIZE
+        return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, int(chunk_size)))
+
+    @staticmethod
+    def new_upload_id() -> str:
+        return uuid.uuid4().hex
+
+    def create(self, upload_id: str, mode: str, path: str, temp_path: str, size: int, chunk_size: int,
+               server: Optional[str] = None) -> UploadSession:
+        session = UploadSession(upload_id, mode, path, temp_path, size, chunk_size, server)
+        with self._lock:
+            self._sessions[session.upload_id] = session
+        logger.info(
+            f"[UploadSessionManager] create: id={session.upload_id} path={path} "
+            f"size={size} chunks={session.total_chunks}"
+        )
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        with self._lock:
+            return self._sessions.get(upload_id)
+
+    def begin_chunk(self, upload_id: str, index: int) -> UploadSession:
+        """
+        标记分块开始写入
+
+        Raises:
+            KeyError: 会话不存在
+            ValueError: 分块编号越界或该分块正在写入
+        """
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            if index < 0 or index >= session.total_chunks:
+                raise ValueError(f"分块编号越界: {index}")
+            if index in session.writing:
+                raise ValueError(f"分块正在上传: {index}")
+            session.writing.add(index)
+            session.updated_at = time.time()
+            return session
+
+    def end_chunk(self, upload_id: str, index: int, ok: bool):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                return
+            session.writing.discard(index)
+            if ok:
+                session.received.add(index)
+            session.updated_at = time.time()
+
+    def pop_if_complete(self, upload_id: str) -> Optional[UploadSession]:
+        """
+        所有分块均已收到时移除并返回会话，用于提交
+
+        Raises:
+            KeyError: 会话不存在
+        """
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            if session.writing or len(session.received) < session.total_chunks:
+                return None
+            return self._sessions.pop(upload_id)
+
+    def restore(self, session: UploadSession):
+        """提交失败时放回会话，客户端可以重试提交"""
+        with self._lock:
+            self._sessions[session.upload_id] = session
+
+    def remove(self, upload_id: str) -> Optional[UploadSession]:
+        with self._lock:
+            return self._sessions.pop(upload_id, None)
+
+    def expire(self) -> List[UploadSession]:
+        """移除并返回过期会话"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                s for s in self._sessions.values()
+                if not s.writing and now - s.updated_at > self.ttl
+            ]
+            for session in expired:
+                del self._sessions[session.upload_id]
+        return expired